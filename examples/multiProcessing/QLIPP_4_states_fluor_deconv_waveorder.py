@@ -110,7 +110,7 @@ def process_on_single_cpu(pos_start, pos_end):
         bf_result = []
         for t in range(N_time):
             fluor_result.append(fluor_setup.deconvolve_fluor_3D(np.transpose(np_array[t,fluor_channel_idx],(0,2,3,1)).astype('float32'), bg, reg=flu_reg, autotune=False))
-            S_image_recon = QLIPP_setup.Stokes_recon(np.transpose(np_array[t,QLIPP_channel_idx],(0,2,3,1)))
+            S_image_recon = QLIPP_setup.Stokes_recon(np_array[t,QLIPP_channel_idx], layout='CZYX', output_layout='CYXZ')
             S_image_tm = QLIPP_setup.Stokes_transform(S_image_recon)
             poly_order = 2
             bg_estimator = BackgroundEstimator2D()
@@ -71,6 +71,21 @@ def test_2D_QLIPP_recon():
     S_image_tm = setup.Stokes_transform(S_image_recon)
     Recon_para = setup.Polarization_recon(S_image_tm) # Without accounting for diffraction
 
+    # single-pass polarization reconstruction in chunks of rows
+    Recon_para_fused = setup.Polarization_recon_fused(I_meas, chunk_size=100)
+    assert np.allclose(Recon_para_fused, Recon_para)
+
+    # Stokes parameters computed on the (C, Z, Y, X) reader layout, written into a preallocated array
+    S_image_native = np.empty((setup.N_Stokes, len(z_defocus), N, M))
+    setup.Stokes_recon(np.moveaxis(I_meas, -1, 1), layout='CZYX', out=S_image_native)
+    assert np.allclose(S_image_native, np.moveaxis(S_image_recon, -1, 1))
+
+    # a new instrument matrix replaces the cached inverse
+    A_matrix = 2*setup.A_matrix
+    setup.instrument_matrix_setup(A_matrix)
+    assert np.allclose(setup.Stokes_recon(I_meas), S_image_recon/2)
+    assert np.allclose(setup.Polarization_recon_fused(I_meas, chunk_size=100), Recon_para*np.array([1, 1, 0.5, 1])[:, None, None, None])
+
 
     # Tikhonov regularizer for phase
     reg_u = 1e-5
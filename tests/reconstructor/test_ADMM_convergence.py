@@ -0,0 +1,131 @@
+import numpy as np
+
+import waveorder as wo
+
+
+def test_ADMM_TV_convergence():
+
+    """
+    Test that the ADMM TV solvers report their residuals and stop early once converged
+
+    """
+
+    N, M      = 32, 32
+    z_defocus = (np.r_[:5]-2)*0.5
+    S0_stack  = 1 + 0.1*np.random.rand(N, M, len(z_defocus))
+
+    setup = wo.waveorder_microscopy((N, M), 0.532, 6.5/40, 0.55, 0.4, z_defocus, chi=0.1, phase_deconv='2D')
+
+    # without a tolerance, the statistics do not change the reconstruction
+    mu_sample, phi_sample = setup.Phase_recon(S0_stack, method='TV', itr=10, verbose=False)
+    mu_stats, phi_stats, stats = setup.Phase_recon(S0_stack, method='TV', itr=10, verbose=False, output_stats=True)
+    assert np.array_equal(phi_stats, phi_sample) and np.array_equal(mu_stats, mu_sample)
+    assert stats['iterations'] == 10 and not stats['converged']
+    assert len(stats['primal_residual']) == len(stats['dual_residual']) == len(stats['rho']) == 10
+
+    # residual balancing converges well before the iteration budget
+    _, _, stats = setup.Phase_recon(S0_stack, method='TV', itr=300, verbose=False, tol=1e-3, adaptive_rho=True, output_stats=True)
+    assert stats['converged'] and stats['iterations'] < 300
+    assert stats['rho'][-1] > stats['rho'][0]
+
+    setup_3D = wo.waveorder_microscopy((N, M), 0.532, 6.5/40, 0.55, 0.4, z_defocus, chi=0.1, phase_deconv='3D')
+    f_real, stats = setup_3D.Phase_recon_3D(S0_stack, method='TV', itr=300, verbose=False, tol=1e-3, adaptive_rho=True, output_stats=True)
+    assert stats['converged'] and stats['iterations'] < 300
+    assert f_real.shape == (N, M, len(z_defocus))
+
+
+def test_ADMM_TV_workspace():
+
+    """
+    Test that the ADMM TV solvers reuse the buffers of a workspace across solves without changing the results
+
+    """
+
+    N, M      = 32, 30
+    z_defocus = (np.r_[:5]-2)*0.5
+    S0_stack  = 1 + 0.1*np.random.rand(N, M, len(z_defocus))
+
+    setup = wo.waveorder_microscopy((N, M), 0.532, 6.5/40, 0.55, 0.4, z_defocus, chi=0.1, phase_deconv='3D')
+
+    f_real = setup.Phase_recon_3D(S0_stack, method='TV', itr=5, verbose=False)
+    buffers = dict(setup.ADMM_workspace.buffers)
+    assert setup.ADMM_workspace.nbytes > 0
+
+    # a second solve of the same size runs in the same buffers
+    f_real_reuse = setup.Phase_recon_3D(S0_stack, method='TV', itr=5, verbose=False)
+    assert all(setup.ADMM_workspace.buffers[name] is buffer for name, buffer in buffers.items())
+    assert np.array_equal(f_real_reuse, f_real)
+
+    H_eff = setup.H_re
+    S0_pad = wo.inten_normalization_3D(S0_stack)
+    assert np.allclose(wo.Single_variable_ADMM_TV_deconv_3D(S0_pad, H_eff, 1e-5, 1e-4, 1e-3, 5, False), 
+                       wo.Single_variable_ADMM_TV_deconv_3D(S0_pad, H_eff, 1e-5, 1e-4, 1e-3, 5, False, workspace=setup.ADMM_workspace))
+
+    setup.clear_solver_cache()
+    assert setup.ADMM_workspace.nbytes == 0
+
+
+def test_PD_TV():
+
+    """
+    Test that the primal-dual TV solver converges to the ADMM solution, stops early and starts warm
+
+    """
+
+    N, M      = 32, 30
+    z_defocus = (np.r_[:5]-2)*0.5
+    S0_stack  = 1 + 0.1*np.random.rand(N, M, len(z_defocus))
+
+    setup = wo.waveorder_microscopy((N, M), 0.532, 6.5/40, 0.55, 0.4, z_defocus, chi=0.1, phase_deconv='2D')
+
+    TV_params = dict(rho=1e-3, lambda_u=1e-4, lambda_p=1e-4, verbose=False)
+    _, phi_ADMM = setup.Phase_recon(S0_stack, method='TV', itr=400, **TV_params)
+    _, phi_PD, stats = setup.Phase_recon(S0_stack, method='TV-PD', itr=5000, tol=1e-4, output_stats=True, **TV_params)
+    assert stats['converged'] and stats['iterations'] < 5000
+    assert np.linalg.norm(phi_PD - phi_ADMM) < 2e-2*np.linalg.norm(phi_ADMM)
+
+    # warm start from the solution of a similar frame
+    S0_f = np.fft.fft2(wo.inten_normalization(S0_stack), axes=(0,1))
+    AHA = [np.sum(np.abs(setup.Hu)**2, axis=2) + 1e-6, np.sum(np.conj(setup.Hu)*setup.Hp, axis=2), 
+           np.sum(np.conj(setup.Hp)*setup.Hu, axis=2), np.sum(np.abs(setup.Hp)**2, axis=2) + 1e-6]
+    b_vec = [np.sum(np.conj(setup.Hu)*S0_f, axis=2), np.sum(np.conj(setup.Hp)*S0_f, axis=2)]
+    mu_sample, phi_sample = wo.Dual_variable_PD_TV_deconv_2D(AHA, b_vec, 1e-3, 1e-4, 1e-4, 2000, False, tol=1e-3)
+
+    b_vec_next = [1.001*b_k for b_k in b_vec]
+    _, _, stats_cold = wo.Dual_variable_PD_TV_deconv_2D(AHA, b_vec_next, 1e-3, 1e-4, 1e-4, 2000, False, tol=1e-3, output_stats=True)
+    _, _, stats_warm = wo.Dual_variable_PD_TV_deconv_2D(AHA, b_vec_next, 1e-3, 1e-4, 1e-4, 2000, False, tol=1e-3, output_stats=True, 
+                                                        initial_guess=(mu_sample, phi_sample))
+    assert stats_warm['iterations'] < stats_cold['iterations']
+
+
+def test_TV_warm_start():
+
+    """
+    Test that the TV reconstructions of a time series start from the solver state of the previous time point
+
+    """
+
+    N, M      = 32, 32
+    z_defocus = (np.r_[:6]-3)*0.4
+    setup = wo.waveorder_microscopy((N, M), 0.532, 6.5/40, 0.55, 0.4, z_defocus, chi=0.1, phase_deconv='3D')
+
+    yy, xx, zz = np.meshgrid(np.r_[:N]-N/2, np.r_[:M]-M/2, np.r_[:6]-3, indexing='ij')
+    f_sample = 1.0*(yy**2 + xx**2 + 4*zz**2 < 60)
+    S0_stack = 1 + np.real(np.fft.ifftn(setup.H_re*np.fft.fftn(f_sample))) + 2e-4*np.random.randn(N, M, 6)
+    S0_next  = S0_stack + 2e-5*np.random.randn(N, M, 6)
+
+    TV_params = dict(rho=1e-5, reg_re=1e-6, lambda_re=1e-6, itr=2000, tol=1e-4, verbose=False, output_stats=True)
+
+    for method in ['TV', 'TV-PD']:
+        state = {}
+        setup.Phase_recon_3D(S0_stack, method=method, state=state, **TV_params)
+        assert state
+
+        f_cold, stats_cold = setup.Phase_recon_3D(S0_next, method=method, **TV_params)
+        f_warm, stats_warm = setup.Phase_recon_3D(S0_next, method=method, state=state, **TV_params)
+        assert stats_warm['converged'] and stats_warm['iterations'] < stats_cold['iterations']
+        assert np.linalg.norm(f_warm - f_cold) < 1e-2*np.linalg.norm(f_cold)
+
+        # the state of the converged frame is a fixed point
+        _, stats_same = setup.Phase_recon_3D(S0_next, method=method, state=state, **TV_params)
+        assert stats_same['iterations'] == 1
@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+
+import waveorder as wo
+
+
+def test_Hermitian_batched_cholesky_solve():
+
+    """
+    Test that the chunked Cholesky solver matches a direct solve of the regularized 7 x 7 systems
+
+    """
+
+    N, M, Nz = 6, 5, 4
+    rng = np.random.default_rng(0)
+
+    H = rng.standard_normal((9, 7, N, M, Nz)) + 1j*rng.standard_normal((9, 7, N, M, Nz))
+    AHA = np.einsum('ki...,kj...->ij...', np.conj(H), H)
+    AHA[..., 0, 0, 0] = 0 # singular matrix without regularization
+    b_vec = rng.standard_normal((7, N, M, Nz)) + 1j*rng.standard_normal((7, N, M, Nz))
+    reg_diag = 1e-1*np.ones((7,))
+
+    L_packed = wo.Hermitian_batched_cholesky(AHA, reg_diag, chunk_size=16)
+    x_vec = wo.Hermitian_batched_cholesky_solve(L_packed, b_vec, chunk_size=7)
+
+    AHA_reg = np.transpose(AHA, (2,3,4,0,1)) + np.diag(reg_diag)
+    x_ref = np.moveaxis(np.linalg.solve(AHA_reg, np.moveaxis(b_vec, 0, -1)[..., np.newaxis])[..., 0], -1, 0)
+
+    assert L_packed.shape == (28, N, M, Nz)
+    assert np.allclose(x_vec, x_ref)
+
+    # singular matrices are still factorized with diagonal loading
+    x_vec = wo.Hermitian_batched_cholesky_solve(wo.Hermitian_batched_cholesky(AHA), b_vec)
+    assert np.all(np.isfinite(x_vec))
+
+
+def test_Hermitian_batched_cholesky_mixed_batch():
+
+    """
+    Test that only the singular matrices of a chunk receive diagonal loading, and just enough of it
+
+    """
+
+    N_batch = 50
+    rng = np.random.default_rng(1)
+
+    H = rng.standard_normal((9, 7, N_batch)) + 1j*rng.standard_normal((9, 7, N_batch))
+    AHA = np.einsum('ki...,kj...->ij...', np.conj(H), H)
+    singular = [3, 17, 18, 41]
+    AHA[..., singular[:2]] = 0 # zero matrices
+    AHA[..., singular[2:]] = np.einsum('i...,j...->ij...', np.conj(H[0][..., singular[2:]]), H[0][..., singular[2:]]) # rank-one matrices
+
+    L_packed = wo.Hermitian_batched_cholesky(AHA, chunk_size=32)
+    L = np.zeros((N_batch, 7, 7), dtype=AHA.dtype)
+    L[:, np.tril_indices(7)[0], np.tril_indices(7)[1]] = L_packed.T
+    LLH = np.einsum('bij,bkj->bik', L, np.conj(L))
+
+    healthy = np.setdiff1d(np.r_[:N_batch], singular)
+    assert np.array_equal(L[healthy], np.linalg.cholesky(np.moveaxis(AHA[..., healthy], -1, 0)))
+
+    # the loading of the singular matrices is small relative to their diagonal and not accumulated over the retries
+    A = np.moveaxis(AHA, -1, 0)
+    diag_scale = np.maximum(np.mean(np.abs(np.diagonal(A, axis1=1, axis2=2)), axis=1), 1e-12)
+    loading = np.abs(LLH - A).max(axis=(1,2))/diag_scale
+    assert np.all(np.isfinite(L)) and np.all(loading[singular] > 0) and np.all(loading[singular] < 1e-6)
+
+
+def test_inc_AHA_factor_cache():
+
+    """
+    Test that the factorized AHA of the 3D vectorial reconstruction is cached per reg_inc and reused
+
+    """
+
+    N, M        = 16, 16
+    ps          = 6.5/40
+    lambda_illu = 0.532
+    z_defocus   = (np.r_[:4]-2)*0.4
+
+    setup = wo.waveorder_microscopy((N, M), lambda_illu, ps, 0.55, 0.4, z_defocus, 0.1, inc_recon='3D', lazy=True)
+
+    S_image_recon = np.random.rand(setup.N_Stokes, 1, N, M, len(z_defocus)).astype('float32')
+    f_tensor = setup.scattering_potential_tensor_recon_3D_vec(S_image_recon, reg_inc=1e-1*np.ones((7,)))
+    AHA_factor = setup.inc_AHA_factorize(1e-1*np.ones((7,)))
+    assert setup.inc_AHA_factorize(1e-1*np.ones((7,))) is AHA_factor
+
+    # a new regularization replaces the cached factors
+    assert setup.inc_AHA_factorize(1e-2*np.ones((7,))) is not AHA_factor
+    assert setup.inc_AHA_factorize(1e-1*np.ones((7,))) is not AHA_factor
+
+    f_tensor_reuse = setup.scattering_potential_tensor_recon_3D_vec(S_image_recon, AHA_factor=AHA_factor)
+    assert np.allclose(f_tensor, f_tensor_reuse)
+
+
+def test_Hermitian_batched_CG_solve():
+
+    """
+    Test that the matrix-free CG solver matches a direct solve and the Cholesky-based 3D vectorial reconstruction
+
+    """
+
+    N, M, Nz = 6, 5, 4
+    rng = np.random.default_rng(0)
+
+    H = rng.standard_normal((9, 7, N, M, Nz)) + 1j*rng.standard_normal((9, 7, N, M, Nz))
+    b_vec = rng.standard_normal((7, N, M, Nz)) + 1j*rng.standard_normal((7, N, M, Nz))
+    reg_diag = 1e-1*np.ones((7,))
+
+    AHA_operator = lambda x: np.einsum('ki...,k...->i...', np.conj(H), np.einsum('kj...,j...->k...', H, x)) + reg_diag[:, np.newaxis, np.newaxis, np.newaxis]*x
+    preconditioner = 1/(np.sum(np.abs(H)**2, axis=0) + reg_diag[:, np.newaxis, np.newaxis, np.newaxis])
+    x_vec, stats = wo.Hermitian_batched_CG_solve(AHA_operator, b_vec, preconditioner, tol=1e-10, itr=50, output_stats=True)
+
+    AHA_reg = np.einsum('ki...,kj...->...ij', np.conj(H), H) + np.diag(reg_diag)
+    x_ref = np.moveaxis(np.linalg.solve(AHA_reg, np.moveaxis(b_vec, 0, -1)[..., np.newaxis])[..., 0], -1, 0)
+
+    assert stats['converged'] and stats['iterations'] < 50
+    assert np.allclose(x_vec, x_ref)
+
+    # 3D uPTI reconstruction without forming the 7 x 7 AHA volumes
+    z_defocus = (np.r_[:4]-2)*0.4
+    setup = wo.waveorder_microscopy((16, 16), 0.532, 6.5/40, 0.55, 0.4, z_defocus, 0.1, inc_recon='3D')
+    setup_CG = wo.waveorder_microscopy((16, 16), 0.532, 6.5/40, 0.55, 0.4, z_defocus, 0.1, inc_recon='3D', inc_solver='CG')
+    assert not hasattr(setup_CG, 'inc_AHA_3D_vec') and setup_CG.inc_AHA_3D_vec_diag.shape == (7, 16, 16, 4)
+
+    S_image_recon = np.random.rand(setup.N_Stokes, 1, 16, 16, len(z_defocus)).astype('float32')
+    f_tensor = setup.scattering_potential_tensor_recon_3D_vec(S_image_recon, reg_inc=1e-1*np.ones((7,)))
+    f_tensor_CG = setup_CG.scattering_potential_tensor_recon_3D_vec(S_image_recon, reg_inc=1e-1*np.ones((7,)), cg_tol=1e-6)
+    assert np.linalg.norm(f_tensor_CG - f_tensor) < 1e-3*np.linalg.norm(f_tensor)
+
+    with pytest.raises(ValueError):
+        wo.waveorder_microscopy((16, 16), 0.532, 6.5/40, 0.55, 0.4, z_defocus, 0.1, inc_recon='3D', inc_solver='cg')
@@ -0,0 +1,53 @@
+import numpy as np
+
+import waveorder as wo
+
+
+def test_Tikhonov_L_curve_spectral():
+
+    """
+    Test that the spectral L curve matches the norms of explicitly formed Tikhonov reconstructions
+
+    """
+
+    rng = np.random.default_rng(0)
+    S0_stack_f = np.fft.fftn(rng.random((16, 16, 8)))
+    H_eff = rng.standard_normal((16, 16, 8)) + 1j*rng.standard_normal((16, 16, 8))
+    reg_coeff = np.array([1e-3, 1e-1, 1e1])
+
+    data_norm, reg_norm = wo.Tikhonov_L_curve_spectral(np.abs(S0_stack_f)**2, np.abs(H_eff)**2, reg_coeff, chunk_size=100)
+
+    for i, reg in enumerate(reg_coeff):
+        f_real_f = S0_stack_f*np.conj(H_eff)/(np.abs(H_eff)**2 + reg)
+        assert np.isclose(data_norm[i], np.log(np.linalg.norm(H_eff*f_real_f - S0_stack_f)**2/S0_stack_f.size))
+        assert np.isclose(reg_norm[i], np.log(np.linalg.norm(f_real_f)**2/S0_stack_f.size))
+
+    # the chunks cover every frequency, also when the weighted number of frequencies is smaller (frequencies masked out)
+    mask = np.zeros((16, 16, 8))
+    mask[..., 4:] = 1
+    data_norm, reg_norm = wo.Tikhonov_L_curve_spectral(np.abs(S0_stack_f)**2, np.abs(H_eff)**2, reg_coeff, weights=mask, chunk_size=100)
+    data_norm_ref, reg_norm_ref = wo.Tikhonov_L_curve_spectral(np.abs(S0_stack_f[..., 4:])**2, np.abs(H_eff[..., 4:])**2, reg_coeff)
+    assert np.allclose(data_norm, data_norm_ref) and np.allclose(reg_norm, reg_norm_ref)
+
+
+def test_Phase_recon_3D_multi_reg():
+
+    """
+    Test that the regularization sweep matches separate 3D phase reconstructions, stacked or streamed
+
+    """
+
+    N, M      = 32, 32
+    z_defocus = (np.r_[:8]-4)*0.3
+    reg_list  = [1e-4, 1e-2]
+
+    setup = wo.waveorder_microscopy((N, M), 0.532, 6.5/40, 0.55, 0.4, z_defocus, chi=0.1, phase_deconv='3D', pad_z=2)
+    S0_stack = 1 + 0.1*np.random.rand(N, M, len(z_defocus))
+
+    phase_sweep = np.zeros((len(reg_list), N, M, len(z_defocus)))
+    assert setup.Phase_recon_3D_multi_reg(S0_stack.copy(), reg_list, out=phase_sweep) is phase_sweep
+
+    for (reg_re, phase_stream), phase in zip(setup.Phase_recon_3D_multi_reg(S0_stack.copy(), reg_list, stream=True), phase_sweep):
+        phase_ref = setup.Phase_recon_3D(S0_stack.copy(), reg_re=reg_re, verbose=False)
+        assert np.allclose(phase, phase_ref)
+        assert np.allclose(phase_stream, phase_ref)
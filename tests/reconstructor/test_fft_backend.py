@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+import waveorder as wo
+
+
+def test_fft_backend():
+
+    """
+    Test that the multi-threaded scipy FFT backend reproduces the numpy FFT reconstruction
+
+    """
+
+    N, M      = 32, 32
+    z_defocus = (np.r_[:5]-2)*0.5
+    S0_stack  = 1 + 0.1*np.random.rand(N, M, len(z_defocus))
+
+    setup = wo.waveorder_microscopy((N, M), 0.532, 6.5/40, 0.55, 0.4, z_defocus, chi=0.1, phase_deconv='3D')
+    phase = setup.Phase_recon_3D(S0_stack.copy(), reg_re=1e-3, verbose=False)
+
+    try:
+        wo.set_fft_backend('scipy', workers=2)
+        assert wo.get_fft_backend()['name'] == 'scipy'
+        phase_scipy = setup.Phase_recon_3D(S0_stack.copy(), reg_re=1e-3, verbose=False)
+        assert wo.get_fft_backend()['plans'] == 0 # scipy.fft does not plan
+    finally:
+        wo.set_fft_backend('numpy')
+
+    assert np.allclose(phase, phase_scipy)
+
+    with pytest.raises(ValueError):
+        wo.set_fft_backend('mkl')
+
+
+def test_array_backend():
+
+    """
+    Test the numpy array backend shared by the CPU and GPU code paths
+
+    """
+
+    backend = wo.array_backend(use_gpu=False)
+    assert backend.xp is np
+
+    x = np.random.rand(8, 6)
+    x_dev = backend.asarray(x)
+    assert np.allclose(backend.fft.ifft2(backend.fft.fft2(x_dev)).real, x)
+    assert backend.asnumpy(x_dev) is x
+    assert backend.asarray(x, dtype='float32').dtype == np.float32
@@ -0,0 +1,128 @@
+import sys
+import types
+import numpy as np
+import pytest
+
+import waveorder as wo
+
+
+@pytest.fixture
+def numpy_cupy(monkeypatch):
+
+    # numpy-backed stand-in of the cupy module, to run the use_gpu code paths without a GPU
+    
+    cupy = types.ModuleType('cupy')
+    cupy.__dict__.update({name: getattr(np, name) for name in dir(np) if not name.startswith('__')})
+    cupy.asnumpy = lambda x: np.array(x)
+    cupy.cuda = types.SimpleNamespace(Device=lambda gpu_id=0: types.SimpleNamespace(use=lambda: None))
+    cupy.get_default_memory_pool = lambda: types.SimpleNamespace(free_all_blocks=lambda: None)
+    monkeypatch.setitem(sys.modules, 'cupy', cupy)
+    
+    return cupy
+
+
+def test_gpu_branches(numpy_cupy):
+
+    """
+    Test that the use_gpu code paths of the reconstructor run and match the CPU ones
+
+    """
+
+    N, M      = 32, 30
+    z_defocus = (np.r_[:4]-2)*0.4
+    args      = ((N, M), 0.532, 6.5/40, 0.55, 0.4, z_defocus, 0.1)
+    kwargs    = dict(phase_deconv='3D', bire_in_plane_deconv='3D', inc_recon='3D')
+
+    setup     = wo.waveorder_microscopy(*args, **kwargs)
+    setup_gpu = wo.waveorder_microscopy(*args, use_gpu=True, **kwargs)
+
+    I_meas = 1 + 0.1*np.random.rand(setup.N_channel, N, M, len(z_defocus))
+    S_image_recon = setup.Stokes_recon(I_meas)
+    assert np.allclose(setup_gpu.Stokes_recon(I_meas), S_image_recon)
+
+    S_image_tm = setup.Stokes_transform(S_image_recon)
+    S_bg_tm = setup.Stokes_transform(np.mean(S_image_recon, axis=-1))
+    S_cpu = setup.Polscope_bg_correction(S_image_tm.copy(), S_bg_tm)
+    assert np.allclose(setup_gpu.Polscope_bg_correction(S_image_tm.copy(), S_bg_tm), S_cpu)
+    assert np.allclose(setup_gpu.Polarization_recon(S_cpu), setup.Polarization_recon(S_cpu))
+
+    for method in ['Tikhonov', 'TV']:
+        retardance, azimuth = setup.Birefringence_recon_3D(S_cpu[1], S_cpu[2], method=method, itr=3, verbose=False)
+        retardance_gpu, azimuth_gpu = setup_gpu.Birefringence_recon_3D(S_cpu[1], S_cpu[2], method=method, itr=3, verbose=False)
+        assert np.allclose(retardance_gpu, retardance, rtol=1e-3, atol=1e-6)
+
+        f_real = setup.Phase_recon_3D(S_cpu[0], method=method, itr=3, verbose=False)
+        assert np.allclose(setup_gpu.Phase_recon_3D(S_cpu[0], method=method, itr=3, verbose=False), f_real, rtol=1e-3, atol=1e-6)
+
+    S_inc = 0.1*np.random.rand(setup.N_Stokes, 1, N, M, len(z_defocus)).astype('float32')
+    f_tensor = setup.scattering_potential_tensor_recon_3D_vec(S_inc)
+    # the float32 determinants of the GPU solve (Cramer's rule) underflow for AHA of this size, only the code path is checked
+    for cupy_det in [False, True]:
+        f_tensor_gpu = setup_gpu.scattering_potential_tensor_recon_3D_vec(S_inc, cupy_det=cupy_det)
+        assert f_tensor_gpu.shape == f_tensor.shape
+
+        # the regularized AHA and its determinant are reused from the solver cache
+        inc_AHA_3D_vec, setup_gpu.inc_AHA_3D_vec = setup_gpu.inc_AHA_3D_vec, None
+        assert np.array_equal(setup_gpu.scattering_potential_tensor_recon_3D_vec(S_inc, cupy_det=cupy_det), f_tensor_gpu, equal_nan=True)
+        setup_gpu.inc_AHA_3D_vec = inc_AHA_3D_vec
+
+    orientation = setup.scattering_potential_tensor_to_3D_orientation(f_tensor, S_inc, material_type='unknown', itr=3, verbose=False)
+    for fast_gpu_mode in [False, True]:
+        orientation_gpu = setup_gpu.scattering_potential_tensor_to_3D_orientation(f_tensor, S_inc, material_type='unknown', itr=3, 
+                                                                                  verbose=False, fast_gpu_mode=fast_gpu_mode)
+        assert all(np.allclose(x_gpu, x, rtol=1e-3, atol=1e-6) for x_gpu, x in zip(orientation_gpu, orientation))
+
+    setup_2D     = wo.waveorder_microscopy(*args, phase_deconv='2D', bire_in_plane_deconv='2D')
+    setup_2D_gpu = wo.waveorder_microscopy(*args, phase_deconv='2D', bire_in_plane_deconv='2D', use_gpu=True)
+
+    S0_stack = 1 + 0.1*np.random.rand(N, M, len(z_defocus))
+
+    for method in ['Tikhonov', 'TV']:
+        retardance, azimuth = setup_2D.Birefringence_recon_2D(S_cpu[1], S_cpu[2], method=method, itr=3, verbose=False)
+        retardance_gpu, azimuth_gpu = setup_2D_gpu.Birefringence_recon_2D(S_cpu[1], S_cpu[2], method=method, itr=3, verbose=False)
+        assert np.allclose(retardance_gpu, retardance, rtol=1e-3, atol=1e-6)
+
+        # the background filter of the GPU path (FFT-based uniform filter) differs from scipy's at the boundaries
+        mu_sample, phi_sample = setup_2D.Phase_recon(S0_stack, method=method, itr=3, verbose=False, bg_filter=False)
+        mu_sample_gpu, phi_sample_gpu = setup_2D_gpu.Phase_recon(S0_stack, method=method, itr=3, verbose=False, bg_filter=False)
+        assert np.allclose(phi_sample_gpu, phi_sample, rtol=1e-3, atol=1e-6)
+
+    # matrix-free CG solve of the 3D uPTI reconstruction
+    setup_CG     = wo.waveorder_microscopy(*args, inc_recon='3D', inc_solver='CG')
+    setup_CG_gpu = wo.waveorder_microscopy(*args, inc_recon='3D', inc_solver='CG', use_gpu=True)
+    f_tensor_CG = setup_CG.scattering_potential_tensor_recon_3D_vec(S_inc, cg_tol=1e-6)
+    assert np.allclose(setup_CG_gpu.scattering_potential_tensor_recon_3D_vec(S_inc, cg_tol=1e-6), f_tensor_CG, rtol=1e-3, atol=1e-6)
+
+
+def test_simulator_gpu_branches(numpy_cupy):
+
+    """
+    Test that the use_gpu code paths of the simulator run and match the CPU ones
+
+    """
+
+    N, M      = 16, 16
+    z_defocus = (np.r_[:4]-2)*0.2
+    n_media   = 1.33
+    args      = ((N, M), 0.532, 6.5/40, 0.55, 0.1, z_defocus, 0.1)
+
+    simulator     = wo.waveorder_microscopy_simulator(*args, n_media=n_media)
+    simulator_gpu = wo.waveorder_microscopy_simulator(*args, n_media=n_media, use_gpu=True)
+
+    yy, xx, zz = np.meshgrid(np.r_[:N]-N/2, np.r_[:M]-M/2, np.r_[:4]-2, indexing='ij')
+    sphere = 1.0*(yy**2 + xx**2 + 4*zz**2 < 16)
+
+    t_obj = np.exp(1j*0.1*sphere)
+    assert np.allclose(simulator_gpu.simulate_3D_scalar_measurements(t_obj), simulator.simulate_3D_scalar_measurements(t_obj))
+
+    RI_map = n_media + 0.02*sphere
+    I_meas = simulator.simulate_3D_scalar_measurements_SEAGLE(RI_map, itr_max=20)
+    assert np.allclose(simulator_gpu.simulate_3D_scalar_measurements_SEAGLE(RI_map, itr_max=20), I_meas)
+
+    epsilon_tensor = np.zeros((3, 3, N, M, len(z_defocus)))
+    for i in range(3):
+        epsilon_tensor[i, i] = RI_map**2
+    epsilon_tensor[0, 1] = epsilon_tensor[1, 0] = 0.0002*sphere
+    I_meas, Stokes = simulator.simulate_3D_vectorial_measurements_SEAGLE(epsilon_tensor, itr_max=20)
+    I_meas_gpu, Stokes_gpu = simulator_gpu.simulate_3D_vectorial_measurements_SEAGLE(epsilon_tensor, itr_max=20)
+    assert np.allclose(I_meas_gpu, I_meas) and np.allclose(Stokes_gpu, Stokes)
@@ -0,0 +1,94 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+import waveorder as wo
+
+
+def test_out_of_core_3D_vec_recon(tmp_path):
+
+    """
+    Test that the kz-slab out-of-core 3D uPTI reconstruction matches the in-memory one
+
+    """
+
+    N, M        = 24, 26
+    ps          = 6.5/40
+    lambda_illu = 0.532
+    NA_obj      = 0.55
+    z_defocus   = (np.r_[:6]-3)*0.4
+
+    _, _, fxx, fyy = wo.gen_coordinate((N, M), ps)
+    Source = np.array(wo.gen_sector_Pupil(fxx, fyy, NA_obj, lambda_illu, 90, [0, 90, 180, 270]))
+    Source_PolState = np.zeros((len(Source), 2), complex)
+    Source_PolState[:, 0] = 1
+    Source_PolState[:, 1] = 1j
+
+    setup = wo.waveorder_microscopy((N, M), lambda_illu, ps, NA_obj, NA_obj, z_defocus, chi=0.1, inc_recon='3D',
+                                    illu_mode='Arbitrary', Source=Source, Source_PolState=Source_PolState)
+
+    S_image_recon = 0.1*np.random.rand(setup.N_Stokes, len(Source), N, M, len(z_defocus)).astype('float32')
+    reg_inc = 1e-1*np.ones((7,))
+
+    f_tensor = setup.scattering_potential_tensor_recon_3D_vec(S_image_recon, reg_inc=reg_inc)
+
+    ooc_dir = str(tmp_path / 'uPTI_ooc')
+    f_tensor_ooc = setup.scattering_potential_tensor_recon_3D_vec_out_of_core(S_image_recon, ooc_dir, reg_inc=reg_inc,
+                                                                             kz_slab=4, n_threads=2, verbose=False)
+    assert np.allclose(f_tensor_ooc, f_tensor, atol=1e-5*np.abs(f_tensor).max())
+    assert os.listdir(ooc_dir) == [setup.tf_cache_key]
+    assert sorted(os.listdir(os.path.join(ooc_dir, setup.tf_cache_key))) == ['H_dyadic_OTF_kz.npy', 'inc_AHA_3D_vec_diag_mean.npy', 
+                                                                             'inc_AHA_3D_vec_kz.npy']
+
+    # the exported kz-major transfer functions are reused
+    f_tensor_ooc = setup.scattering_potential_tensor_recon_3D_vec_out_of_core(S_image_recon, ooc_dir, reg_inc=reg_inc,
+                                                                             kz_slab=3, verbose=False)
+    assert np.allclose(f_tensor_ooc, f_tensor, atol=1e-5*np.abs(f_tensor).max())
+
+    # a microscope with different optics (same array sizes) exports its own kz-major transfer functions
+    setup_NA = wo.waveorder_microscopy((N, M), lambda_illu, ps, 0.8*NA_obj, NA_obj, z_defocus, chi=0.1, inc_recon='3D',
+                                       illu_mode='Arbitrary', Source=Source, Source_PolState=Source_PolState)
+    f_tensor_NA = setup_NA.scattering_potential_tensor_recon_3D_vec(S_image_recon, reg_inc=reg_inc)
+    f_tensor_ooc = setup_NA.scattering_potential_tensor_recon_3D_vec_out_of_core(S_image_recon, ooc_dir, reg_inc=reg_inc,
+                                                                                kz_slab=4, verbose=False)
+    assert np.allclose(f_tensor_ooc, f_tensor_NA, atol=1e-5*np.abs(f_tensor_NA).max())
+    assert sorted(os.listdir(ooc_dir)) == sorted([setup.tf_cache_key, setup_NA.tf_cache_key])
+
+
+def test_out_of_core_3D_vec_recon_lazy_pad_z(tmp_path):
+
+    """
+    Test that a lazy microscope streams the kz-major export without building the in-core transfer functions,
+    that the reflection padding along z matches the in-memory reconstruction and that concurrent reconstructions share ooc_dir
+
+    """
+
+    N, M      = 16, 18
+    z_defocus = (np.r_[:6]-3)*0.4
+    args      = ((N, M), 0.532, 6.5/40, 0.55, 0.4, z_defocus)
+
+    setup = wo.waveorder_microscopy(*args, chi=0.1, inc_recon='3D', pad_z=2)
+    setup_lazy = wo.waveorder_microscopy(*args, chi=0.1, inc_recon='3D', pad_z=2, lazy=True)
+
+    rng = np.random.default_rng(0)
+    S_image_recon = [0.1*rng.random((setup.N_Stokes, 1, N, M, len(z_defocus))).astype('float32') for _ in range(2)]
+    f_tensor = [setup.scattering_potential_tensor_recon_3D_vec(S) for S in S_image_recon]
+
+    ooc_dir = str(tmp_path / 'uPTI_ooc')
+    f_tensor_ooc = setup_lazy.scattering_potential_tensor_recon_3D_vec_out_of_core(S_image_recon[0], ooc_dir, kz_slab=3, verbose=False)
+    assert np.allclose(f_tensor_ooc, f_tensor[0], atol=1e-5*np.abs(f_tensor[0]).max())
+    assert not hasattr(setup_lazy, 'H_dyadic_OTF') and not hasattr(setup_lazy, 'inc_AHA_3D_vec')
+
+    # the streamed export matches the transposed in-core transfer functions
+    ooc_dir_in_core = str(tmp_path / 'uPTI_ooc_in_core')
+    setup.scattering_potential_tensor_recon_3D_vec_out_of_core(S_image_recon[0], ooc_dir_in_core, verbose=False)
+    for name in ['H_dyadic_OTF_kz.npy', 'inc_AHA_3D_vec_kz.npy', 'inc_AHA_3D_vec_diag_mean.npy']:
+        exported = [np.load(os.path.join(d, setup.tf_cache_key, name)) for d in [ooc_dir, ooc_dir_in_core]]
+        assert np.allclose(exported[0], exported[1], rtol=1e-4, atol=1e-6*np.abs(exported[1]).max())
+
+    with ThreadPoolExecutor(2) as executor:
+        f_tensor_ooc = list(executor.map(lambda S: setup_lazy.scattering_potential_tensor_recon_3D_vec_out_of_core(S, ooc_dir, verbose=False),
+                                         S_image_recon))
+    for f_ooc, f in zip(f_tensor_ooc, f_tensor):
+        assert np.allclose(f_ooc, f, atol=1e-5*np.abs(f).max())
+    assert os.listdir(ooc_dir) == [setup.tf_cache_key]
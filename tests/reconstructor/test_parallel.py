@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+import waveorder as wo
+from waveorder import parallel
+from waveorder.io.writer import WaveorderWriter
+
+
+class _array_reader:
+
+    # in-memory stand-in of WaveorderReader, data is (P, T, C, Z, Y, X)
+
+    def __init__(self, data):
+        self.data = data
+
+    def get_num_positions(self):
+        return self.data.shape[0]
+
+    def get_zarr(self, position=0):
+        return self.data[position]
+
+
+class _stokes_recipe:
+
+    def __init__(self, setup):
+        self.setup = setup
+
+    def __call__(self, data, p, t):
+        return self.setup.Stokes_recon(data, layout='CZYX')
+
+
+def test_parallel_reconstruction(tmp_path):
+
+    """
+    Test that the process pool reconstructs and writes every (position, time) item like a serial loop
+
+    """
+
+    N, M      = 16, 18
+    z_defocus = (np.r_[:3]-1)*0.5
+    setup = wo.waveorder_microscopy((N, M), 0.532, 6.5/40, 0.55, 0.4, z_defocus, chi=0.1)
+
+    data = 1 + np.random.rand(2, 3, setup.N_channel, len(z_defocus), N, M)
+    reader = _array_reader(data)
+
+    writer = WaveorderWriter(str(tmp_path), hcs=False, hcs_meta=None, verbose=False)
+    writer.create_zarr_root('parallel.zarr')
+    for p in range(2):
+        writer.init_array(p, (3, setup.N_Stokes, len(z_defocus), N, M), (1, 1, 1, N, M),
+                          ['S%d'%(i) for i in range(setup.N_Stokes)], dtype='float64')
+
+    timings = wo.parallel_reconstruction(reader, _stokes_recipe(setup), writer, n_workers=3, verbose=False)
+    assert sorted((p, t) for p, t, _ in timings) == [(p, t) for p in range(2) for t in range(3)]
+
+    for p in range(2):
+        writer.sub_writer.open_position(p)
+        result = writer.sub_writer.current_pos_group['arr_0'][:]
+        for t in range(3):
+            assert np.allclose(result[t], setup.Stokes_recon(data[p, t], layout='CZYX'))
+
+    # concurrent writers of time points sharing a chunk are rejected before any item is dispatched
+    writer.create_zarr_root('parallel_chunks.zarr')
+    writer.init_array(0, (3, setup.N_Stokes, len(z_defocus), N, M), (2, 1, 1, N, M),
+                      ['S%d'%(i) for i in range(setup.N_Stokes)], dtype='float64')
+    with pytest.raises(ValueError):
+        wo.parallel_reconstruction(reader, _stokes_recipe(setup), writer, positions=[0], n_workers=2, verbose=False)
+
+
+def test_worker_fft_backend(monkeypatch):
+
+    """
+    Test that the workers select the FFT backend of the calling process, with its FFTW wisdom file
+
+    """
+
+    calls = []
+    monkeypatch.setattr(parallel, 'set_fft_backend', lambda *args, **kwargs: calls.append((args, kwargs)))
+
+    try:
+        parallel._init_worker(None, None, None, ('pyfftw', 2, 'FFTW_PATIENT', 'fftw_wisdom.pkl'))
+        assert calls == [(('pyfftw',), dict(workers=2, planner_effort='FFTW_PATIENT', wisdom_file='fftw_wisdom.pkl'))]
+    finally:
+        parallel._worker_state.clear()
+
+
+def test_pipelined_reconstruction(tmp_path):
+
+    """
+    Test that the prefetch / write-behind pipeline reconstructs and writes every (position, time) item in order
+
+    """
+
+    N, M      = 16, 18
+    z_defocus = (np.r_[:3]-1)*0.5
+    setup = wo.waveorder_microscopy((N, M), 0.532, 6.5/40, 0.55, 0.4, z_defocus, chi=0.1)
+
+    data = 1 + np.random.rand(2, 3, setup.N_channel, len(z_defocus), N, M)
+    reader = _array_reader(data)
+
+    writer = WaveorderWriter(str(tmp_path), hcs=False, hcs_meta=None, verbose=False)
+    writer.create_zarr_root('pipeline.zarr')
+    for p in range(2):
+        writer.init_array(p, (3, setup.N_Stokes, len(z_defocus), N, M), (1, 1, 1, N, M),
+                          ['S%d'%(i) for i in range(setup.N_Stokes)], dtype='float64')
+
+    timings = wo.pipelined_reconstruction(reader, _stokes_recipe(setup), writer, positions=[1, 0], n_prefetch=3,
+                                          write_queue_size=1, verbose=False)
+    assert [(p, t) for p, t, _ in timings] == [(p, t) for p in (1, 0) for t in range(3)]
+
+    for p in range(2):
+        writer.sub_writer.open_position(p)
+        result = writer.sub_writer.current_pos_group['arr_0'][:]
+        for t in range(3):
+            assert np.allclose(result[t], setup.Stokes_recon(data[p, t], layout='CZYX'))
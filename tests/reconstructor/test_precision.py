@@ -0,0 +1,52 @@
+import numpy as np
+
+import waveorder as wo
+
+
+def test_single_precision_reconstruction():
+
+    """
+    Test that single precision keeps the transfer functions and reconstructions in float32/complex64
+    and matches the double precision phase, birefringence and fluorescence reconstructions
+
+    """
+
+    N, M      = 32, 30
+    ps        = 6.5/40
+    z_defocus = (np.r_[:5]-2)*0.5
+
+    S0_stack = 1 + 0.1*np.random.rand(N, M, len(z_defocus))
+    S1_stack = 0.1*np.random.rand(N, M, len(z_defocus))
+    S2_stack = 0.1*np.random.rand(N, M, len(z_defocus))
+
+    kwargs = dict(chi=0.1, phase_deconv='3D', bire_in_plane_deconv='2D', pad_z=1)
+    setup = wo.waveorder_microscopy((N, M), 0.532, ps, 0.55, 0.4, z_defocus, **kwargs)
+    setup_single = wo.waveorder_microscopy((N, M), 0.532, ps, 0.55, 0.4, z_defocus, precision='single', **kwargs)
+    assert setup_single.H_re.dtype == np.complex64
+    assert setup_single.H_dyadic_2D_OTF_in_plane.dtype == np.complex64
+
+    phase = setup.Phase_recon_3D(S0_stack.copy(), reg_re=1e-3, verbose=False)
+    phase_single = setup_single.Phase_recon_3D(S0_stack.copy(), reg_re=1e-3, verbose=False)
+    assert phase_single.dtype == np.float32
+    assert np.allclose(phase, phase_single, atol=1e-5*np.abs(phase).max())
+
+    retardance, azimuth = setup.Birefringence_recon_2D(S1_stack, S2_stack, reg_br=1e-2)
+    retardance_single, azimuth_single = setup_single.Birefringence_recon_2D(S1_stack, S2_stack, reg_br=1e-2)
+    assert retardance_single.dtype == np.float32
+    assert np.allclose(retardance, retardance_single, atol=1e-5*retardance.max())
+
+    fluor_setup = wo.fluorescence_microscopy((N, M, len(z_defocus)), [0.52], ps, 0.3, 1.2, n_media=1.33, pad_z=1)
+    fluor_setup_single = wo.fluorescence_microscopy((N, M, len(z_defocus)), [0.52], ps, 0.3, 1.2, n_media=1.33, pad_z=1,
+                                                    precision='single')
+
+    I_fluor = 100 + 10*np.random.rand(N, M, len(z_defocus))
+    I_fluor_deconv = fluor_setup.deconvolve_fluor_3D(I_fluor, [90], [1e-2], verbose=False)
+    I_fluor_deconv_single = fluor_setup_single.deconvolve_fluor_3D(I_fluor, [90], [1e-2], verbose=False)
+    assert I_fluor_deconv_single.dtype == np.float32
+    assert np.allclose(I_fluor_deconv, I_fluor_deconv_single, atol=1e-5*I_fluor_deconv.max())
+
+    # the AHA matrices of the uPTI reconstructions follow the precision as well
+    args = ((16, 18), 0.532, ps, 0.55, 0.4, z_defocus)
+    for precision, float_dtype, complex_dtype in [('double', np.float64, np.complex128), ('single', np.float32, np.complex64)]:
+        assert wo.waveorder_microscopy(*args, chi=0.1, inc_recon='3D', precision=precision).inc_AHA_3D_vec.dtype == complex_dtype
+        assert wo.waveorder_microscopy(*args, chi=0.1, inc_recon='3D', inc_solver='CG', precision=precision).inc_AHA_3D_vec_diag.dtype == float_dtype
@@ -0,0 +1,40 @@
+import numpy as np
+
+import waveorder as wo
+
+
+def test_real_fft_reconstruction():
+
+    """
+    Test that the real-to-complex FFT mode reproduces the full spectrum phase, birefringence and fluorescence reconstructions
+
+    """
+
+    N, M      = 32, 30
+    ps        = 6.5/40
+    z_defocus = (np.r_[:5]-2)*0.5
+
+    S0_stack = 1 + 0.1*np.random.rand(N, M, len(z_defocus))
+    S1_stack = 0.1*np.random.rand(N, M, len(z_defocus))
+    S2_stack = 0.1*np.random.rand(N, M, len(z_defocus))
+
+    kwargs = dict(chi=0.1, phase_deconv='3D', bire_in_plane_deconv='2D', pad_z=1)
+    setup = wo.waveorder_microscopy((N, M), 0.532, ps, 0.55, 0.4, z_defocus, **kwargs)
+    setup_rfft = wo.waveorder_microscopy((N, M), 0.532, ps, 0.55, 0.4, z_defocus, real_fft=True, **kwargs)
+    assert setup_rfft.H_re.shape == (N, M, (len(z_defocus)+2)//2+1)
+
+    phase = setup.Phase_recon_3D(S0_stack.copy(), reg_re=1e-3, verbose=False)
+    phase_rfft = setup_rfft.Phase_recon_3D(S0_stack.copy(), reg_re=1e-3, verbose=False)
+    assert np.allclose(phase, phase_rfft)
+
+    retardance, azimuth = setup.Birefringence_recon_2D(S1_stack, S2_stack, reg_br=1e-2)
+    retardance_rfft, azimuth_rfft = setup_rfft.Birefringence_recon_2D(S1_stack, S2_stack, reg_br=1e-2)
+    assert np.allclose(retardance, retardance_rfft, atol=1e-5*retardance.max())
+
+    fluor_setup = wo.fluorescence_microscopy((N, M, len(z_defocus)), [0.52], ps, 0.3, 1.2, n_media=1.33, pad_z=1)
+    fluor_setup_rfft = wo.fluorescence_microscopy((N, M, len(z_defocus)), [0.52], ps, 0.3, 1.2, n_media=1.33, pad_z=1, real_fft=True)
+
+    I_fluor = 100 + 10*np.random.rand(N, M, len(z_defocus))
+    I_fluor_deconv = fluor_setup.deconvolve_fluor_3D(I_fluor, [90], [1e-2], verbose=False)
+    I_fluor_deconv_rfft = fluor_setup_rfft.deconvolve_fluor_3D(I_fluor, [90], [1e-2], verbose=False)
+    assert np.allclose(I_fluor_deconv, I_fluor_deconv_rfft)
@@ -0,0 +1,125 @@
+import os
+import pickle
+import numpy as np
+
+import waveorder as wo
+
+
+def test_transfer_function_cache(tmp_path):
+
+    """
+    Test that transfer functions are reloaded from the on-disk cache and match the computed ones
+
+    """
+
+    N, M        = 32, 32
+    ps          = 6.5/40
+    lambda_illu = 0.532
+    NA_obj      = 0.55
+    NA_illu     = 0.4
+    z_defocus   = (np.r_[:6]-3)*0.5
+    chi         = 0.03*2*np.pi
+    cache_dir   = str(tmp_path / 'tf_cache')
+
+    kwargs = dict(chi=chi, phase_deconv='3D', bire_in_plane_deconv='2D', pad_z=1, tf_cache_dir=cache_dir)
+
+    setup = wo.waveorder_microscopy((N, M), lambda_illu, ps, NA_obj, NA_illu, z_defocus, **kwargs)
+    assert len(os.listdir(cache_dir)) == 1
+
+    setup_cached = wo.waveorder_microscopy((N, M), lambda_illu, ps, NA_obj, NA_illu, z_defocus, **kwargs)
+    assert setup_cached.tf_cache_path == setup.tf_cache_path
+    assert isinstance(setup_cached.H_re, np.memmap)
+    assert np.array_equal(setup_cached.H_re, setup.H_re)
+    assert np.array_equal(setup_cached.H_im, setup.H_im)
+    assert np.array_equal(setup_cached.H_dyadic_2D_OTF_in_plane, setup.H_dyadic_2D_OTF_in_plane)
+
+    # a different set of parameters gets its own cache entry
+    wo.waveorder_microscopy((N, M), lambda_illu, ps, NA_obj, 0.3, z_defocus, **kwargs)
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_lazy_transfer_function_setup():
+
+    """
+    Test that lazily constructed transfer functions are computed on first use and match the eager ones
+
+    """
+
+    N, M        = 32, 32
+    ps          = 6.5/40
+    lambda_illu = 0.532
+    z_defocus   = (np.r_[:6]-3)*0.5
+
+    kwargs = dict(chi=0.1, phase_deconv='3D', bire_in_plane_deconv='3D', pad_z=1)
+
+    setup = wo.waveorder_microscopy((N, M), lambda_illu, ps, 0.55, 0.4, z_defocus, **kwargs)
+    setup_lazy = wo.waveorder_microscopy((N, M), lambda_illu, ps, 0.55, 0.4, z_defocus, lazy=True, **kwargs)
+    assert not hasattr(setup_lazy, 'H_re')
+    assert not hasattr(setup_lazy, 'Hz_det_3D')
+
+    S0_stack = 1 + 0.1*np.random.rand(N, M, len(z_defocus))
+    phase = setup.Phase_recon_3D(S0_stack, reg_re=1e-3)
+    phase_lazy = setup_lazy.Phase_recon_3D(S0_stack, reg_re=1e-3)
+    assert np.allclose(phase_lazy, phase)
+    assert not hasattr(setup_lazy, 'H_dyadic_OTF_in_plane')
+
+    setup_lazy.prepare('bire_in_plane')
+    assert np.array_equal(setup_lazy.H_dyadic_OTF_in_plane, setup.H_dyadic_OTF_in_plane)
+
+
+def test_phase_solver_cache():
+
+    """
+    Test that the AHA terms of the 2D phase reconstruction are cached per (method, reg) and give identical results
+
+    """
+
+    N, M        = 32, 32
+    z_defocus   = (np.r_[:5]-2)*0.5
+
+    setup = wo.waveorder_microscopy((N, M), 0.532, 6.5/40, 0.55, 0.4, z_defocus, chi=0.1, phase_deconv='2D')
+
+    S0_stack = 1 + 0.1*np.random.rand(N, M, len(z_defocus))
+    mu_sample, phi_sample = setup.Phase_recon(S0_stack.copy(), reg_u=1e-3, reg_p=1e-3)
+    AHA, determinant = setup._solver_cache['phase_2D'][('Tikhonov', 1e-3, 1e-3)]
+
+    mu_sample_cached, phi_sample_cached = setup.Phase_recon(S0_stack.copy(), reg_u=1e-3, reg_p=1e-3)
+    assert setup._solver_cache['phase_2D'][('Tikhonov', 1e-3, 1e-3)][1] is determinant
+    assert np.array_equal(phi_sample, phi_sample_cached)
+
+    # the TV solver must not modify the cached AHA terms
+    setup.Phase_recon(S0_stack.copy(), method='TV', reg_u=1e-3, reg_p=1e-3, itr=2, verbose=False)
+    AHA_TV, _ = setup._solver_cache['phase_2D'][('TV', 1e-3, 1e-3)]
+    AHA_TV_0 = AHA_TV[0].copy()
+    setup.Phase_recon(S0_stack.copy(), method='TV', reg_u=1e-3, reg_p=1e-3, itr=2, verbose=False)
+    assert np.array_equal(AHA_TV[0], AHA_TV_0)
+
+
+def test_shared_transfer_functions():
+
+    """
+    Test that shared transfer functions are pickled by reference and give the same reconstruction
+
+    """
+
+    N, M        = 32, 32
+    z_defocus   = (np.r_[:5]-2)*0.5
+
+    setup = wo.waveorder_microscopy((N, M), 0.532, 6.5/40, 0.55, 0.4, z_defocus, chi=0.1, phase_deconv='3D', pad_z=1)
+
+    S0_stack = 1 + 0.1*np.random.rand(N, M, len(z_defocus))
+    phase = setup.Phase_recon_3D(S0_stack.copy(), reg_re=1e-3, verbose=False)
+
+    pickle_size = len(pickle.dumps(setup))
+    handle = setup.share_transfer_functions()
+    assert 'H_re' in handle and not setup.H_re.flags.writeable
+
+    setup_worker = pickle.loads(pickle.dumps(setup))
+    assert len(pickle.dumps(setup)) < pickle_size - setup.H_re.nbytes - setup.H_im.nbytes
+    assert np.array_equal(setup_worker.H_re, setup.H_re)
+    assert np.array_equal(setup_worker.Phase_recon_3D(S0_stack.copy(), reg_re=1e-3, verbose=False), phase)
+
+    setup_worker.unshare_transfer_functions()
+    setup.unshare_transfer_functions()
+    assert setup.H_re.flags.writeable
+    assert np.array_equal(setup.Phase_recon_3D(S0_stack.copy(), reg_re=1e-3, verbose=False), phase)
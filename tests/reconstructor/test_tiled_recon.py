@@ -0,0 +1,98 @@
+import time
+import numpy as np
+import zarr
+
+import waveorder as wo
+
+
+def test_tiled_recon():
+
+    """
+    Test that tiles reconstructed with tile-sized transfer functions are blended back into the full field of view
+
+    """
+
+    N, M           = 40, 36
+    N_full, M_full = 100, 90
+    z_defocus      = (np.r_[:3]-1)*0.5
+
+    setup = wo.waveorder_microscopy((N, M), 0.532, 6.5/40, 0.55, 0.4, z_defocus, chi=0.1)
+    setup_full = wo.waveorder_microscopy((N_full, M_full), 0.532, 6.5/40, 0.55, 0.4, z_defocus, chi=0.1)
+
+    ns, ms = wo.generate_tile_coordinates((N_full, M_full), (N, M), (8, 8))
+    assert ns[-1] + N == N_full and ms[-1] + M == M_full
+
+    # (T, C, Z, Y, X) data blended into a chunked zarr array, a pointwise reconstruction must match the full-FOV one
+    I_full = 1 + np.random.rand(2, setup.N_channel, len(z_defocus), N_full, M_full)
+    out = zarr.zeros((2, setup.N_Stokes, len(z_defocus), N_full, M_full), chunks=(1, 1, 1, 32, 32))
+
+    setup.Tiled_recon(I_full, lambda I_tile: setup.Stokes_recon(I_tile, layout='CZYX'), out, 8,
+                      in_index=(1,), out_index=(1,), n_workers=2, verbose=False)
+    assert np.allclose(out[1], setup_full.Stokes_recon(I_full[1], layout='CZYX'))
+    assert np.all(out[0] == 0)
+
+    # the transfer functions of a lazy microscope are ready before the tiles are reconstructed on several threads,
+    # and the solver terms shared by the tiles are computed once
+    setup_lazy = wo.waveorder_microscopy((N, M), 0.532, 6.5/40, 0.55, 0.4, z_defocus, chi=0.1, phase_deconv='2D', lazy=True)
+    n_setups = []
+
+    def recon_func(I_tile):
+        assert 'phase' in setup_lazy._transfer_function_ready
+        def AHA_setup():
+            time.sleep(0.01)
+            n_setups.append(1)
+        setup_lazy.solver_cache_lookup('tile', (0,), AHA_setup)
+        return I_tile
+
+    setup_lazy.Tiled_recon(I_full, recon_func, np.zeros_like(I_full), 8, n_workers=4, verbose=False)
+    assert len(n_setups) == 1
+
+
+def test_slab_recon():
+
+    """
+    Test that axial slabs reconstructed with slab-sized 3D transfer functions are blended back into the full z-stack
+
+    """
+
+    N, M      = 32, 32
+    N_z_full  = 30
+    N_slab    = 12
+    z_defocus = -np.r_[:N_z_full]*0.25
+
+    setup = wo.waveorder_microscopy((N, M), 0.532, 6.5/40, 0.55, 0.4, z_defocus[:N_slab], chi=0.1, phase_deconv='3D', pad_z=4)
+    assert setup.H_re.shape == (N, M, N_slab+8)
+
+    S0_stack = 1 + 0.1*np.random.rand(N, M, N_z_full)
+
+    # a pointwise reconstruction is stitched exactly
+    out = np.zeros((N, M, N_z_full))
+    setup.Slab_recon(S0_stack, lambda I_slab: 3*I_slab, out, 4, verbose=False)
+    assert np.allclose(out, 3*S0_stack)
+
+    phase = setup.Slab_recon(S0_stack, lambda I_slab: setup.Phase_recon_3D(I_slab, reg_re=1e-2, verbose=False), 
+                             np.zeros((N, M, N_z_full), dtype='float32'), 4, verbose=False)
+    assert np.all(np.isfinite(phase)) and np.any(phase != 0)
+
+
+def test_tiled_recon_TV_threads():
+
+    """
+    Test that concurrent TV reconstructions of the tiles (sharing the ADMM workspace of the microscope) match serial ones
+
+    """
+
+    N, M           = 32, 32
+    N_full, M_full = 96, 96
+    z_defocus      = (np.r_[:3]-1)*0.5
+
+    setup = wo.waveorder_microscopy((N, M), 0.532, 6.5/40, 0.55, 0.4, z_defocus, chi=0.1, phase_deconv='2D')
+
+    S0_full = 1 + 0.1*np.random.rand(N_full, M_full, len(z_defocus))
+    recon_func = lambda S0_tile: setup.Phase_recon(S0_tile, method='TV', itr=20, verbose=False)[1]
+
+    phase = setup.Tiled_recon(S0_full, recon_func, np.zeros((N_full, M_full)), 8, in_yx_axes=(0, 1), out_yx_axes=(0, 1), 
+                              n_workers=1, verbose=False)
+    phase_threads = setup.Tiled_recon(S0_full, recon_func, np.zeros((N_full, M_full)), 8, in_yx_axes=(0, 1), out_yx_axes=(0, 1), 
+                                      n_workers=4, verbose=False)
+    assert np.allclose(phase_threads, phase)
@@ -0,0 +1,36 @@
+import numpy as np
+
+import waveorder as wo
+
+
+def test_WOTF_vec_compute():
+
+    """
+    Test that the shared-FFT vectorial transfer functions match the pairwise transfer function computation
+
+    """
+
+    N, M, Nz    = 32, 32, 8
+    ps          = 6.5/40
+    psz         = 0.4
+    lambda_illu = 0.532
+
+    xx, yy, fxx, fyy = wo.gen_coordinate((N, M), ps)
+    Pupil = wo.gen_Pupil(fxx, fyy, 0.55, lambda_illu).astype('complex64')
+    Source = wo.gen_Pupil(fxx, fyy, 0.4, lambda_illu).astype('float32')
+    z = np.fft.ifftshift((np.r_[:Nz]-Nz//2)*psz)
+    Hz_det = wo.gen_Hz_stack(fxx, fyy, Pupil, lambda_illu, z).astype('complex64')
+    G_fun_z = wo.gen_Greens_function_z(fxx, fyy, Pupil, lambda_illu, z).astype('complex64')
+
+    Source_terms = {'A': Source.astype('complex64'), 'B': (Source*np.exp(1j*fxx)).astype('complex64')}
+    G_terms = {'xx': G_fun_z, 'yy': 2*G_fun_z}
+    OTF_terms = {0: wo.parse_OTF_terms('A_Gxx_re - B_Gyy_re'), 1: wo.parse_OTF_terms('A_Gxx_im + B_Gyy_im')}
+
+    H_vec = np.zeros((2, N, M, Nz), dtype='complex64')
+    wo.WOTF_vec_compute(Source, Source_terms, Pupil, Hz_det, G_terms, OTF_terms, H_vec, psz=psz)
+
+    A_re, A_im = wo.WOTF_3D_compute(Source, Source_terms['A'], Pupil, Hz_det, G_terms['xx'], psz)
+    B_re, B_im = wo.WOTF_3D_compute(Source, Source_terms['B'], Pupil, Hz_det, G_terms['yy'], psz)
+
+    assert np.allclose(H_vec[0], A_re - B_re, atol=1e-4*np.abs(A_re).max())
+    assert np.allclose(H_vec[1], A_im + B_im, atol=1e-4*np.abs(A_im).max())
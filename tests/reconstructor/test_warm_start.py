@@ -0,0 +1,73 @@
+import numpy as np
+
+import waveorder as wo
+
+
+def test_SEAGLE_warm_start():
+
+    """
+    Test that the SEAGLE simulations of a time series start from the converged fields of the previous time point
+
+    """
+
+    N, M      = 16, 16
+    z_defocus = (np.r_[:6]-3)*0.2
+    n_media   = 1.33
+
+    simulator = wo.waveorder_microscopy_simulator((N, M), 0.532, 6.5/40, 0.55, 0.1, z_defocus, 0.1, n_media=n_media)
+
+    yy, xx, zz = np.meshgrid(np.r_[:N]-N/2, np.r_[:M]-M/2, np.r_[:6]-3, indexing='ij')
+    sphere = 1.0*(yy**2 + xx**2 + 4*zz**2 < 16)
+
+    def epsilon_tensor(dn):
+        epsilon = np.zeros((3, 3, N, M, len(z_defocus)))
+        for i in range(3):
+            epsilon[i, i] = (n_media + dn*sphere)**2
+        epsilon[0, 1] = epsilon[1, 0] = 0.01*dn*sphere
+        return epsilon
+
+    simulations = [(simulator.simulate_3D_scalar_measurements_SEAGLE, lambda dn: n_media + dn*sphere, (N, M, len(z_defocus))),
+                   (simulator.simulate_3D_vectorial_measurements_SEAGLE, epsilon_tensor, (3, N, M, len(z_defocus)))]
+
+    for simulate, sample, field_shape in simulations:
+        state = {}
+        simulate(sample(0.02), itr_max=100, tolerance=1e-6, state=state)
+        assert list(state['fields']) == [(0, 0)] and state['fields'][(0, 0)].shape == field_shape
+
+        cold_state = {}
+        I_cold = simulate(sample(0.0202), itr_max=100, tolerance=1e-6, state=cold_state)
+        I_warm = simulate(sample(0.0202), itr_max=100, tolerance=1e-6, state=state)
+        assert state['iterations'][(0, 0)] < cold_state['iterations'][(0, 0)]
+        assert all(np.allclose(I_w, I_c, rtol=1e-3, atol=1e-3*np.abs(I_c).max()) for I_w, I_c in zip(I_warm, I_cold))
+
+        # the converged field of the same sample is a fixed point
+        simulate(sample(0.0202), itr_max=100, tolerance=1e-6, state=state)
+        assert state['iterations'][(0, 0)] == 1
+
+
+def test_optic_sign_warm_start():
+
+    """
+    Test that the optic sign retrieval continues from the material maps of the previous call
+
+    """
+
+    N, M      = 16, 16
+    z_defocus = (np.r_[:4]-2)*0.4
+
+    setup = wo.waveorder_microscopy((N, M), 0.532, 6.5/40, 0.55, 0.4, z_defocus, 0.1, inc_recon='3D')
+
+    S_image_recon = 0.1*np.random.default_rng(0).random((setup.N_Stokes, 1, N, M, len(z_defocus))).astype('float32')
+    f_tensor = setup.scattering_potential_tensor_recon_3D_vec(S_image_recon)
+
+    orientation = setup.scattering_potential_tensor_to_3D_orientation(f_tensor, S_image_recon, material_type='unknown', itr=5, verbose=False)
+
+    # 3 iterations followed by 2 warm-started ones reach the material maps of 5 iterations
+    state = {}
+    setup.scattering_potential_tensor_to_3D_orientation(f_tensor, S_image_recon, material_type='unknown', itr=3, verbose=False, state=state)
+    assert state['x_map'].shape == state['y_map'].shape == f_tensor.shape[1:]
+
+    orientation_warm = setup.scattering_potential_tensor_to_3D_orientation(f_tensor, S_image_recon, material_type='unknown', itr=2,
+                                                                           verbose=False, state=state)
+    assert np.allclose(orientation_warm[3], orientation[3])
+    assert np.array_equal(state['x_map'], orientation_warm[3][0]) and np.array_equal(state['y_map'], orientation_warm[3][1])
@@ -1,6 +1,11 @@
+__version__ = '1.0.0-beta'
+
 from .visual import *
 from .waveorder_reconstructor import *
 from .waveorder_simulator import *
 from .util import *
 from .optics import *
 from .background_estimator import *
+from .fft_backend import *
+from .array_backend import *
+from .parallel import *
@@ -0,0 +1,177 @@
+import numpy as np
+
+from .fft_backend import fft_module
+
+
+_precision_dtypes = {'single': (np.dtype('float32'), np.dtype('complex64')),
+                     'double': (np.dtype('float64'), np.dtype('complex128'))}
+
+
+class array_backend:
+
+    '''
+
+    array namespace shared by the numpy (CPU) and cupy (GPU) code paths of the waveorder kernels
+
+    a kernel written against array_backend.xp and array_backend.fft runs unchanged on CPU and GPU,
+    the CPU FFTs go through the FFT backend selected with set_fft_backend
+
+    Parameters
+    ----------
+        use_gpu   : bool
+                    option to use gpu or not
+
+        gpu_id    : int
+                    number refering to which gpu will be used
+
+        precision : str
+                    'double' for float64/complex128 arrays (default)
+                    'single' for float32/complex64 arrays, the FFTs then return complex64/float32 as well
+
+    Attributes
+    ----------
+        xp            : module
+                        numpy or cupy
+
+        fft           : module
+                        FFT functions matching xp (fft_module(use_gpu))
+
+        float_dtype   : numpy.dtype
+                        real dtype of the precision (float32 or float64)
+
+        complex_dtype : numpy.dtype
+                        complex dtype of the precision (complex64 or complex128)
+
+    '''
+
+    def __init__(self, use_gpu=False, gpu_id=0, precision='double'):
+
+        if precision not in _precision_dtypes:
+            raise ValueError("precision must be 'single' or 'double'")
+
+        self.use_gpu   = use_gpu
+        self.gpu_id    = gpu_id
+        self.precision = precision
+        self.float_dtype, self.complex_dtype = _precision_dtypes[precision]
+
+        if use_gpu:
+            globals()['cp'] = __import__("cupy")
+            cp.cuda.Device(gpu_id).use()
+            self.xp = cp
+        else:
+            self.xp = np
+
+        self.fft = fft_module(use_gpu)
+
+        # numpy.fft always computes in double precision, cupy.fft and scipy.fft keep single precision inputs
+        if precision == 'single' and not use_gpu:
+            self.fft = _single_precision_fft(self.fft)
+
+
+    def __reduce__(self):
+
+        # modules cannot be pickled, the backend is rebuilt from its arguments (e.g. in worker processes)
+        return (array_backend, (self.use_gpu, self.gpu_id, self.precision))
+
+
+    def asarray(self, x, dtype=None):
+
+        '''
+
+        move an array to the device of the backend (no copy if it is already there with the right dtype)
+
+        Parameters
+        ----------
+            x     : numpy.ndarray or cupy.ndarray
+                    input array
+
+            dtype : str or numpy.dtype
+                    dtype of the output array, None to keep the dtype of x
+
+        Returns
+        -------
+            x_dev : numpy.ndarray or cupy.ndarray
+                    array on the device of the backend
+
+        '''
+
+        return self.xp.asarray(x, dtype=dtype)
+
+
+    def cast(self, x):
+
+        '''
+
+        cast a floating point array to the precision of the backend (integer arrays and double precision backends are left untouched)
+
+        Parameters
+        ----------
+            x        : numpy.ndarray or cupy.ndarray
+                       input array
+
+        Returns
+        -------
+            x_cast   : numpy.ndarray or cupy.ndarray
+                       array in float_dtype (real input) or complex_dtype (complex input)
+
+        '''
+
+        if self.precision == 'double' or x.dtype.kind not in 'fc':
+            return x
+
+        return x.astype(self.complex_dtype if x.dtype.kind == 'c' else self.float_dtype, copy=False)
+
+
+    def asnumpy(self, x):
+
+        '''
+
+        move an array of the backend to the host memory
+
+        Parameters
+        ----------
+            x      : numpy.ndarray or cupy.ndarray
+                     input array
+
+        Returns
+        -------
+            x_host : numpy.ndarray
+                     array in the host memory
+
+        '''
+
+        if self.use_gpu:
+            return cp.asnumpy(x)
+        else:
+            return x
+
+
+    def free_memory(self):
+
+        '''
+
+        release the cached blocks of the device memory pool (no-op on CPU)
+
+        '''
+
+        if self.use_gpu:
+            cp.get_default_memory_pool().free_all_blocks()
+
+
+
+class _single_precision_fft:
+
+    # FFT functions of a module with the outputs cast to complex64 (forward, inverse) or float32 (inverse real-to-complex)
+
+    def __init__(self, module):
+        self._module = module
+
+    def __getattr__(self, name):
+
+        func = getattr(self._module, name)
+
+        def fft_func(*args, **kwargs):
+            out = func(*args, **kwargs)
+            return out.astype('complex64' if out.dtype.kind == 'c' else 'float32', copy=False)
+
+        return fft_func
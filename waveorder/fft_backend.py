@@ -0,0 +1,225 @@
+import os
+import sys
+import atexit
+import pickle
+import numpy as np
+
+from numpy.fft import fftshift, ifftshift
+
+
+_fft_functions = ['fft', 'ifft', 'fft2', 'ifft2', 'fftn', 'ifftn', 'rfft2', 'irfft2', 'rfftn', 'irfftn']
+
+_fft_backend = {'name'           : 'numpy',
+                'workers'        : 1,
+                'planner_effort' : 'FFTW_MEASURE',
+                'wisdom_file'    : None,
+                'functions'      : {func: getattr(np.fft, func) for func in _fft_functions}}
+
+_plan_keys = set()
+
+
+
+def set_fft_backend(backend='numpy', workers=None, planner_effort='FFTW_MEASURE', wisdom_file=None, keepalive_time=600):
+
+    '''
+
+    select the library executing the CPU FFTs of waveorder (GPU computation always uses cupy.fft)
+
+    Parameters
+    ----------
+        backend        : str
+                         options: 'numpy'  : single-threaded numpy.fft (default)
+                                  'scipy'  : multi-threaded scipy.fft (requires scipy 1.4 or later)
+                                  'pyfftw' : multi-threaded FFTW with planning and wisdom (requires pyFFTW)
+
+        workers        : int
+                         number of threads used by the 'scipy' and 'pyfftw' backends
+                         (None: all available cpus, negative values count back from the number of cpus as in scipy.fft)
+
+        planner_effort : str
+                         FFTW planner effort of the 'pyfftw' backend ('FFTW_ESTIMATE', 'FFTW_MEASURE', 'FFTW_PATIENT' or 'FFTW_EXHAUSTIVE')
+
+        wisdom_file    : str
+                         path of the file persisting the FFTW wisdom of the 'pyfftw' backend
+                         the wisdom is loaded here if the file exists and saved back at exit
+
+        keepalive_time : float
+                         time in seconds that unused FFTW plans are kept in the plan cache of the 'pyfftw' backend
+
+    '''
+
+    if workers is None:
+        workers = os.cpu_count()
+    elif workers < 0:
+        workers = max(os.cpu_count() + 1 + workers, 1)
+
+    if backend == 'numpy':
+        functions = {func: getattr(np.fft, func) for func in _fft_functions}
+
+    elif backend == 'scipy':
+        try:
+            import scipy.fft
+        except ImportError:
+            raise ImportError('scipy 1.4 or later (scipy.fft) is required for the scipy FFT backend')
+
+        functions = {func: _scipy_fft_function(getattr(scipy.fft, func), workers) for func in _fft_functions}
+
+    elif backend == 'pyfftw':
+        try:
+            import pyfftw
+            import pyfftw.interfaces.numpy_fft
+        except ImportError:
+            raise ImportError('pyFFTW is required for the pyfftw FFT backend')
+
+        # FFTW plans are kept per shape, dtype and transform by the interfaces cache
+        pyfftw.interfaces.cache.enable()
+        pyfftw.interfaces.cache.set_keepalive_time(keepalive_time)
+
+        if wisdom_file is not None and os.path.exists(wisdom_file):
+            with open(wisdom_file, 'rb') as f:
+                pyfftw.import_wisdom(pickle.load(f))
+
+        functions = {func: _pyfftw_fft_function(getattr(pyfftw.interfaces.numpy_fft, func), workers, planner_effort) \
+                     for func in _fft_functions}
+
+    else:
+        raise ValueError('Unsupported FFT backend: %s (options: numpy, scipy, pyfftw)'%(backend))
+
+    _fft_backend['name']           = backend
+    _fft_backend['workers']        = workers if backend != 'numpy' else 1
+    _fft_backend['planner_effort'] = planner_effort
+    _fft_backend['wisdom_file']    = wisdom_file if backend == 'pyfftw' else None
+    _fft_backend['functions']      = functions
+    _plan_keys.clear()
+
+
+
+def get_fft_backend():
+
+    '''
+
+    return the name and the number of threads of the current FFT backend
+
+    Returns
+    -------
+        backend : dict
+                  {'name': backend name, 'workers': number of threads, 
+                   'plans': number of (shape, dtype, transform) planned by the 'pyfftw' backend (0 for 'numpy' and 'scipy', which do not plan)}
+
+    '''
+
+    return {'name': _fft_backend['name'], 'workers': _fft_backend['workers'], 'plans': len(_plan_keys)}
+
+
+
+def save_fft_wisdom(wisdom_file=None):
+
+    '''
+
+    save the accumulated FFTW wisdom of the 'pyfftw' backend so that later sessions skip the planning
+
+    Parameters
+    ----------
+        wisdom_file : str
+                      path of the wisdom file (defaults to the wisdom_file given to set_fft_backend)
+
+    '''
+
+    if _fft_backend['name'] != 'pyfftw':
+        return
+
+    wisdom_file = _fft_backend['wisdom_file'] if wisdom_file is None else wisdom_file
+    if wisdom_file is None:
+        raise ValueError('no wisdom_file to save the FFTW wisdom to')
+
+    import pyfftw
+
+    with open(wisdom_file, 'wb') as f:
+        pickle.dump(pyfftw.export_wisdom(), f)
+
+
+@atexit.register
+def _save_fft_wisdom_at_exit():
+
+    if _fft_backend['wisdom_file'] is not None:
+        try:
+            save_fft_wisdom()
+        except OSError:
+            print('Failed to save the FFTW wisdom to %s'%(_fft_backend['wisdom_file']))
+
+
+
+def fft_module(use_gpu=False):
+
+    '''
+
+    return the module providing the FFT functions for the array module in use (cupy.fft on GPU, the backend dispatching functions on CPU)
+
+    Parameters
+    ----------
+        use_gpu : bool
+                  option to use gpu or not
+
+    Returns
+    -------
+        module  : module
+                  module with numpy.fft-compatible fft, ifft, fft2, ifft2, fftn, ifftn, rfft2, irfft2, rfftn and irfftn
+
+    '''
+
+    if use_gpu:
+        return __import__("cupy").fft
+    else:
+        return sys.modules[__name__]
+
+
+
+def _scipy_fft_function(func, workers):
+
+    def fft_func(a, *args, **kwargs):
+        return func(a, *args, workers=workers, **kwargs)
+
+    return fft_func
+
+
+def _pyfftw_fft_function(func, workers, planner_effort):
+
+    def fft_func(a, *args, **kwargs):
+        _plan_keys.add((func.__name__, np.shape(a), np.asarray(a).dtype.str, args, tuple(sorted(kwargs.items()))))
+        return func(a, *args, threads=workers, planner_effort=planner_effort, **kwargs)
+
+    return fft_func
+
+
+
+# FFT entry points used throughout waveorder, dispatched to the selected backend
+
+def fft(a, n=None, axis=-1, norm=None):
+    return _fft_backend['functions']['fft'](a, n=n, axis=axis, norm=norm)
+
+def ifft(a, n=None, axis=-1, norm=None):
+    return _fft_backend['functions']['ifft'](a, n=n, axis=axis, norm=norm)
+
+def fft2(a, s=None, axes=(-2, -1), norm=None):
+    return _fft_backend['functions']['fft2'](a, s=s, axes=axes, norm=norm)
+
+def ifft2(a, s=None, axes=(-2, -1), norm=None):
+    return _fft_backend['functions']['ifft2'](a, s=s, axes=axes, norm=norm)
+
+def fftn(a, s=None, axes=None, norm=None):
+    return _fft_backend['functions']['fftn'](a, s=s, axes=axes, norm=norm)
+
+def ifftn(a, s=None, axes=None, norm=None):
+    return _fft_backend['functions']['ifftn'](a, s=s, axes=axes, norm=norm)
+
+def rfft2(a, s=None, axes=(-2, -1), norm=None):
+    return _fft_backend['functions']['rfft2'](a, s=s, axes=axes, norm=norm)
+
+def irfft2(a, s=None, axes=(-2, -1), norm=None):
+    return _fft_backend['functions']['irfft2'](a, s=s, axes=axes, norm=norm)
+
+def rfftn(a, s=None, axes=None, norm=None):
+    return _fft_backend['functions']['rfftn'](a, s=s, axes=axes, norm=norm)
+
+def irfftn(a, s=None, axes=None, norm=None):
+    return _fft_backend['functions']['irfftn'](a, s=s, axes=axes, norm=norm)
@@ -2,7 +2,8 @@ import numpy as np
 import matplotlib.pyplot as plt
 import gc
 import itertools
-from numpy.fft import fft, ifft, fft2, ifft2, fftn, ifftn, fftshift, ifftshift
+from .fft_backend import fft, ifft, fft2, ifft2, fftn, ifftn, fftshift, ifftshift
+from .array_backend import array_backend
 
 
 def Jones_sample(Ein, t, sa):
@@ -60,26 +61,13 @@ def Jones_to_Stokes(Ein, use_gpu=False, gpu_id=0):
     
     '''
     
-    if use_gpu:
-        
-        globals()['cp'] = __import__("cupy")
-        cp.cuda.Device(gpu_id).use()
-        
-        S0 = (cp.abs(Ein[0])**2 + cp.abs(Ein[1])**2)[cp.newaxis,...]
-        S1 = (cp.abs(Ein[0])**2 - cp.abs(Ein[1])**2)[cp.newaxis,...]
-        S2 = (cp.real(Ein[0].conj()*Ein[1] + Ein[0]*Ein[1].conj()))[cp.newaxis,...]
-        S3 = (cp.real(-1j*(Ein[0].conj()*Ein[1] - Ein[0]*Ein[1].conj())))[cp.newaxis,...]
-        Stokes = cp.concatenate((S0,S1,S2,S3), axis=0)
-        
-    else:
-        Stokes = []
-        Stokes.append(np.abs(Ein[0])**2 + np.abs(Ein[1])**2)                        # S0
-        Stokes.append(np.abs(Ein[0])**2 - np.abs(Ein[1])**2)                        # S1
-        Stokes.append(np.real(Ein[0].conj()*Ein[1] + Ein[0]*Ein[1].conj()))         # S2
-        Stokes.append(np.real(-1j*(Ein[0].conj()*Ein[1] - Ein[0]*Ein[1].conj())))   # S3
-        Stokes = np.array(Stokes)
-    
+    xp = array_backend(use_gpu, gpu_id).xp
     
+    S0 = (xp.abs(Ein[0])**2 + xp.abs(Ein[1])**2)[xp.newaxis,...]
+    S1 = (xp.abs(Ein[0])**2 - xp.abs(Ein[1])**2)[xp.newaxis,...]
+    S2 = (xp.real(Ein[0].conj()*Ein[1] + Ein[0]*Ein[1].conj()))[xp.newaxis,...]
+    S3 = (xp.real(-1j*(Ein[0].conj()*Ein[1] - Ein[0]*Ein[1].conj())))[xp.newaxis,...]
+    Stokes = xp.concatenate((S0,S1,S2,S3), axis=0)
     
     return Stokes
 
@@ -532,7 +520,7 @@ def gen_dyadic_Greens_tensor(G_real, ps, psz, lambda_in, space='real'):
 
 
 
-def WOTF_2D_compute(Source, Pupil, use_gpu=False, gpu_id=0):
+def WOTF_2D_compute(Source, Pupil, use_gpu=False, gpu_id=0, precision='double'):
     
     '''
     
@@ -540,55 +528,46 @@ def WOTF_2D_compute(Source, Pupil, use_gpu=False, gpu_id=0):
     
     Parameters
     ----------
-        Source  : numpy.ndarray
-                  illumination source pattern with the size of (Ny, Nx)
+        Source    : numpy.ndarray
+                    illumination source pattern with the size of (Ny, Nx)
                  
-        Pupil   : numpy.ndarray
-                  pupil function with the size of (Ny, Nx)
+        Pupil     : numpy.ndarray
+                    pupil function with the size of (Ny, Nx)
                  
-        use_gpu : bool
-                  option to use gpu or not
+        use_gpu   : bool
+                    option to use gpu or not
         
-        gpu_id  : int
-                  number refering to which gpu will be used
+        gpu_id    : int
+                    number refering to which gpu will be used
+        
+        precision : str
+                    'single' for float32/complex64 computation, 'double' for float64/complex128 computation
     
     Returns
     -------
-        Hu      : numpy.ndarray
-                  absorption transfer function with size of (Ny, Nx) 
+        Hu        : numpy.ndarray
+                    absorption transfer function with size of (Ny, Nx) 
                  
-        Hp      : numpy.ndarray
-                  phase transfer function with size of (Ny, Nx)
+        Hp        : numpy.ndarray
+                    phase transfer function with size of (Ny, Nx)
     
     '''
     
-    if use_gpu:
-        globals()['cp'] = __import__("cupy")
-        cp.cuda.Device(gpu_id).use()
-        
-        Source = cp.array(Source)
-        Pupil  = cp.array(Pupil)
-        
-        H1 = cp.fft.ifft2(cp.conj(cp.fft.fft2(Source * Pupil))*cp.fft.fft2(Pupil))
-        H2 = cp.fft.ifft2(cp.fft.fft2(Source * Pupil)*cp.conj(cp.fft.fft2(Pupil)))
-        I_norm = cp.sum(Source * Pupil * cp.conj(Pupil))
-        Hu = (H1 + H2)/I_norm
-        Hp = 1j*(H1-H2)/I_norm
-        
-        Hu = cp.asnumpy(Hu)
-        Hp = cp.asnumpy(Hp)
-        
-    else:
+    backend = array_backend(use_gpu, gpu_id, precision=precision)
+    xp, xp_fft = backend.xp, backend.fft
+    
+    Source = backend.cast(backend.asarray(Source))
+    Pupil  = backend.cast(backend.asarray(Pupil))
     
-        H1 = ifft2(fft2(Source * Pupil).conj()*fft2(Pupil))
-        H2 = ifft2(fft2(Source * Pupil)*fft2(Pupil).conj())
-        I_norm = np.sum(Source * Pupil * Pupil.conj())
-        Hu = (H1 + H2)/I_norm
-        Hp = 1j*(H1-H2)/I_norm
+    H1 = xp_fft.ifft2(xp_fft.fft2(Source * Pupil).conj()*xp_fft.fft2(Pupil))
+    H2 = xp_fft.ifft2(xp_fft.fft2(Source * Pupil)*xp_fft.fft2(Pupil).conj())
+    I_norm = xp.sum(Source * Pupil * Pupil.conj())
+    Hu = backend.asnumpy((H1 + H2)/I_norm)
+    Hp = backend.asnumpy(1j*(H1-H2)/I_norm)
     
     return Hu, Hp
 
-def WOTF_semi_3D_compute(Source_support, Source, Pupil, Hz_det, G_fun_z, use_gpu=False, gpu_id=0):
+def WOTF_semi_3D_compute(Source_support, Source, Pupil, Hz_det, G_fun_z, use_gpu=False, gpu_id=0, precision='double'):
     
     '''
     
@@ -616,6 +595,9 @@ def WOTF_semi_3D_compute(Source_support, Source, Pupil, Hz_det, G_fun_z, use_gpu
         
         gpu_id         : int
                          number refering to which gpu will be used
+        
+        precision      : str
+                         'single' for float32/complex64 computation, 'double' for float64/complex128 computation
     
     Returns
     -------
@@ -627,37 +609,25 @@ def WOTF_semi_3D_compute(Source_support, Source, Pupil, Hz_det, G_fun_z, use_gpu
     
     '''
     
-    if use_gpu:
-        globals()['cp'] = __import__("cupy")
-        cp.cuda.Device(gpu_id).use()
-        
-        Source = cp.array(Source)
-        Source_support = cp.array(Source_support)
-        Pupil  = cp.array(Pupil)        
-        Hz_det = cp.array(Hz_det)
-        G_fun_z = cp.array(G_fun_z)
-        
-        H1 = cp.fft.ifft2(cp.conj(cp.fft.fft2(Source * Pupil * Hz_det))*cp.fft.fft2(Pupil * G_fun_z))
-        H2 = cp.fft.ifft2(cp.fft.fft2(Source * Pupil * Hz_det)*cp.conj(cp.fft.fft2(Pupil * G_fun_z)))
-        I_norm = cp.sum(Source_support * Pupil * cp.conj(Pupil))
-        Hu = (H1 + H2)/I_norm
-        Hp = 1j*(H1-H2)/I_norm
-        
-        Hu = cp.asnumpy(Hu)
-        Hp = cp.asnumpy(Hp)
-        
-    else:
+    backend = array_backend(use_gpu, gpu_id, precision=precision)
+    xp, xp_fft = backend.xp, backend.fft
+    
+    Source = backend.cast(backend.asarray(Source))
+    Source_support = backend.cast(backend.asarray(Source_support))
+    Pupil  = backend.cast(backend.asarray(Pupil))
+    Hz_det = backend.cast(backend.asarray(Hz_det))
+    G_fun_z = backend.cast(backend.asarray(G_fun_z))
     
-        H1 = ifft2(fft2(Source * Pupil * Hz_det).conj()*fft2(Pupil * G_fun_z))
-        H2 = ifft2(fft2(Source * Pupil * Hz_det)*fft2(Pupil * G_fun_z).conj())
-        I_norm = np.sum(Source_support * Pupil * Pupil.conj())
-        Hu = (H1 + H2)/I_norm
-        Hp = 1j*(H1-H2)/I_norm
+    H1 = xp_fft.ifft2(xp_fft.fft2(Source * Pupil * Hz_det).conj()*xp_fft.fft2(Pupil * G_fun_z))
+    H2 = xp_fft.ifft2(xp_fft.fft2(Source * Pupil * Hz_det)*xp_fft.fft2(Pupil * G_fun_z).conj())
+    I_norm = xp.sum(Source_support * Pupil * Pupil.conj())
+    Hu = backend.asnumpy((H1 + H2)/I_norm)
+    Hp = backend.asnumpy(1j*(H1-H2)/I_norm)
     
     return Hu, Hp
 
 
-def WOTF_3D_compute(Source_support, Source, Pupil, Hz_det, G_fun_z, psz, use_gpu=False, gpu_id=0):
+def WOTF_3D_compute(Source_support, Source, Pupil, Hz_det, G_fun_z, psz, use_gpu=False, gpu_id=0, precision='double'):
     
     
     '''
@@ -690,6 +660,9 @@ def WOTF_3D_compute(Source_support, Source, Pupil, Hz_det, G_fun_z, psz, use_gpu
         gpu_id         : int
                          number refering to which gpu will be used
         
+        precision      : str
+                         'single' for float32/complex64 computation, 'double' for float64/complex128 computation
+        
     Returns
     -------
         H_re           : numpy.ndarray
@@ -705,53 +678,205 @@ def WOTF_3D_compute(Source_support, Source, Pupil, Hz_det, G_fun_z, psz, use_gpu
     
     window = ifftshift(np.hanning(Nz)).astype('float32')
     
-    if use_gpu:
-        globals()['cp'] = __import__("cupy")
-        cp.cuda.Device(gpu_id).use()
-        
-        Source = cp.array(Source)
-        Source_support = cp.array(Source_support)
-        Pupil  = cp.array(Pupil)
-        Hz_det = cp.array(Hz_det)
-        G_fun_z = cp.array(G_fun_z)
-        window = cp.array(window)
-        
-        H1 = cp.fft.ifft2(cp.conj(cp.fft.fft2((Source * Pupil)[:,:,cp.newaxis] * Hz_det, axes=(0,1)))*\
-                   cp.fft.fft2(Pupil[:,:,cp.newaxis] * G_fun_z, axes=(0,1)), axes=(0,1))
-        H1 = H1*window[cp.newaxis,cp.newaxis,:]
-        H1 = cp.fft.fft(H1, axis=2)*psz
-        H2 = cp.fft.ifft2(cp.fft.fft2((Source * Pupil)[:,:,cp.newaxis] * Hz_det, axes=(0,1))*\
-                   cp.conj(cp.fft.fft2(Pupil[:,:,cp.newaxis] * G_fun_z, axes=(0,1))), axes=(0,1))
-        H2 = H2*window[cp.newaxis,cp.newaxis,:]
-        H2 = cp.fft.fft(H2, axis=2)*psz
+    backend = array_backend(use_gpu, gpu_id, precision=precision)
+    xp, xp_fft = backend.xp, backend.fft
     
+    Source = backend.cast(backend.asarray(Source))
+    Source_support = backend.cast(backend.asarray(Source_support))
+    Pupil  = backend.cast(backend.asarray(Pupil))
+    Hz_det = backend.cast(backend.asarray(Hz_det))
+    G_fun_z = backend.cast(backend.asarray(G_fun_z))
+    window = backend.asarray(window)
+
+    H1 = xp_fft.ifft2(xp_fft.fft2((Source * Pupil)[:,:,xp.newaxis] * Hz_det, axes=(0,1)).conj()*\
+                      xp_fft.fft2(Pupil[:,:,xp.newaxis] * G_fun_z, axes=(0,1)), axes=(0,1))
+    H1 = H1*window[xp.newaxis,xp.newaxis,:]
+    H1 = xp_fft.fft(H1, axis=2)*psz
+    H2 = xp_fft.ifft2(xp_fft.fft2((Source * Pupil)[:,:,xp.newaxis] * Hz_det, axes=(0,1))*\
+                      xp_fft.fft2(Pupil[:,:,xp.newaxis] * G_fun_z, axes=(0,1)).conj(), axes=(0,1))
+    H2 = H2*window[xp.newaxis,xp.newaxis,:]
+    H2 = xp_fft.fft(H2, axis=2)*psz
 
-        I_norm = cp.sum(Source_support * Pupil * cp.conj(Pupil))
-        H_re = (H1 + H2)/I_norm
-        H_im = 1j*(H1-H2)/I_norm
+    I_norm = xp.sum(Source_support * Pupil * Pupil.conj())
+    H_re = backend.asnumpy((H1 + H2)/I_norm)
+    H_im = backend.asnumpy(1j*(H1-H2)/I_norm)
+    
+    
+    return H_re, H_im
+
+
+
+# vectorial transfer functions as signed sums of the real (re) or imaginary (im) parts of the intermediate 
+# transfer functions, named as <source term>_<Green's tensor term>_<part>, for each (Stokes parameter, scattering potential component)
+dyadic_OTF_terms = {(0,0): 'ExEx_Gxx_re + ExEy_Gxy_re + ExEz_Gxz_re + EyEx_Gyx_re + EyEy_Gyy_re + EyEz_Gyz_re',
+                    (0,1): 'ExEx_Gxx_im + ExEy_Gxy_im + ExEz_Gxz_im + EyEx_Gyx_im + EyEy_Gyy_im + EyEz_Gyz_im',
+                    (0,2): 'ExEx_Gxx_re - ExEy_Gxy_re + EyEx_Gyx_re - EyEy_Gyy_re',
+                    (0,3): 'ExEx_Gxy_re + ExEy_Gxx_re + EyEx_Gyy_re + EyEy_Gyx_re',
+                    (0,4): 'ExEx_Gxz_re + ExEz_Gxx_re + EyEx_Gyz_re + EyEz_Gyx_re',
+                    (0,5): 'ExEy_Gxz_re + ExEz_Gxy_re + EyEy_Gyz_re + EyEz_Gyy_re',
+                    (0,6): 'ExEz_Gxz_re + EyEz_Gyz_re',
+                    
+                    (1,0): 'ExEx_Gxx_re + ExEy_Gxy_re + ExEz_Gxz_re - EyEx_Gyx_re - EyEy_Gyy_re - EyEz_Gyz_re',
+                    (1,1): 'ExEx_Gxx_im + ExEy_Gxy_im + ExEz_Gxz_im - EyEx_Gyx_im - EyEy_Gyy_im - EyEz_Gyz_im',
+                    (1,2): 'ExEx_Gxx_re - ExEy_Gxy_re - EyEx_Gyx_re + EyEy_Gyy_re',
+                    (1,3): 'ExEx_Gxy_re + ExEy_Gxx_re - EyEx_Gyy_re - EyEy_Gyx_re',
+                    (1,4): 'ExEx_Gxz_re + ExEz_Gxx_re - EyEx_Gyz_re - EyEz_Gyx_re',
+                    (1,5): 'ExEy_Gxz_re + ExEz_Gxy_re - EyEy_Gyz_re - EyEz_Gyy_re',
+                    (1,6): 'ExEz_Gxz_re - EyEz_Gyz_re',
+                    
+                    (2,0): 'ExEx_Gxy_re + ExEy_Gyy_re + ExEz_Gyz_re + EyEx_Gxx_re + EyEy_Gyx_re + EyEz_Gxz_re',
+                    (2,1): 'ExEx_Gxy_im + ExEy_Gyy_im + ExEz_Gyz_im + EyEx_Gxx_im + EyEy_Gyx_im + EyEz_Gxz_im',
+                    (2,2): 'ExEx_Gxy_re - ExEy_Gyy_re + EyEx_Gxx_re - EyEy_Gyx_re',
+                    (2,3): 'ExEx_Gyy_re + ExEy_Gxy_re + EyEx_Gyx_re + EyEy_Gxx_re',
+                    (2,4): 'ExEx_Gyz_re + ExEz_Gxy_re + EyEx_Gxz_re + EyEz_Gxx_re',
+                    (2,5): 'ExEy_Gyz_re + ExEz_Gyy_re + EyEy_Gxz_re + EyEz_Gyx_re',
+                    (2,6): 'ExEz_Gyz_re + EyEz_Gxz_re',
+                    
+                    (3,0): '- ExEx_Gxy_im - ExEy_Gyy_im - ExEz_Gyz_im + EyEx_Gxx_im + EyEy_Gyx_im + EyEz_Gxz_im',
+                    (3,1): 'ExEx_Gxy_re + ExEy_Gyy_re + ExEz_Gyz_re - EyEx_Gxx_re - EyEy_Gyx_re - EyEz_Gxz_re',
+                    (3,2): '- ExEx_Gxy_im + ExEy_Gyy_im + EyEx_Gxx_im - EyEy_Gyx_im',
+                    (3,3): '- ExEx_Gyy_im - ExEy_Gxy_im + EyEx_Gyx_im + EyEy_Gxx_im',
+                    (3,4): '- ExEx_Gyz_im - ExEz_Gxy_im + EyEx_Gxz_im + EyEz_Gxx_im',
+                    (3,5): '- ExEy_Gyz_im - ExEz_Gyy_im + EyEy_Gxz_im + EyEz_Gyx_im',
+                    (3,6): '- ExEz_Gyz_im + EyEz_Gxz_im'}
+
+# in-plane vectorial transfer functions for 2D birefringence deconvolution (S1, S2) x (in-plane scattering potential components)
+dyadic_OTF_in_plane_terms = {(0,0): 'ExEx_Gxx_re - ExEy_Gxy_re - EyEx_Gyx_re + EyEy_Gyy_re',
+                             (0,1): 'ExEx_Gxy_re + ExEy_Gxx_re - EyEx_Gyy_re - EyEy_Gyx_re',
+                             (1,0): 'ExEx_Gxy_re - ExEy_Gyy_re + EyEx_Gxx_re - EyEy_Gyx_re',
+                             (1,1): 'ExEx_Gyy_re + ExEy_Gxy_re + EyEx_Gyx_re + EyEy_Gxx_re'}
+
+
+def parse_OTF_terms(expression):
+    
+    '''
+    
+    parse a signed sum of intermediate transfer functions (e.g. 'ExEx_Gxx_re - EyEy_Gyy_re')
+    
+    Parameters
+    ----------
+        expression : str
+                     signed sum of intermediate transfer functions named as <source term>_<Green's tensor term>_<part>
+    
+    Returns
+    -------
+        terms      : list
+                     list of (sign, source term, Green's tensor term, part) tuples
+    
+    '''
+    
+    terms = []
+    sign = 1
+    for token in expression.split():
+        if token in ('+', '-'):
+            sign = 1 if token == '+' else -1
+        else:
+            source_term, G_term, part = token.split('_')
+            terms.append((sign, source_term, G_term[1:], part))
+            sign = 1
+    
+    return terms
+
+
+def WOTF_vec_compute(Source_support, Source_terms, Pupil, Hz_det, G_terms, OTF_terms, out, psz=None, use_gpu=False, gpu_id=0, precision='double'):
+    
+    '''
+    
+    compute a set of vectorial weak object transfer functions, each being a signed sum of intermediate transfer functions
+    that pair a source term with a Green's tensor term
+    
+    the 2D Fourier transform of every distinct source and Green's tensor term is computed once and shared by all pairings,
+    the pairings of one output are summed in the Fourier domain, followed by a single inverse 2D FFT 
+    (and a single windowed axial FFT for 3D transfer functions) per output
+    
+    Parameters
+    ----------
+        Source_support : numpy.ndarray
+                         illumination source pattern support with the size of (Ny, Nx)
+                         
+        Source_terms   : dict
+                         sources with spatial frequency modulation with the size of (Ny, Nx), keyed by the source term name
+                         
+        Pupil          : numpy.ndarray
+                         pupil function with the size of (Ny, Nx)
+                         
+        Hz_det         : numpy.ndarray
+                         propagation kernel with size of (Ny, Nx, Nz)
+                         
+        G_terms        : dict
+                         2D Fourier transform of Green's tensor components in xy-dimension with size of (Ny, Nx, Nz), 
+                         keyed by the Green's tensor term name
+                         
+        OTF_terms      : dict
+                         output transfer functions keyed by their index in out, 
+                         each given as a list of (sign, source term, Green's tensor term, part) tuples (see parse_OTF_terms)
+                         
+        out            : numpy.ndarray
+                         array-like to write the transfer functions with the size of (Ny, Nx, Nz) into, indexed by the keys of OTF_terms
+        
+        psz            : float
+                         pixel size in the z-dimension for 3D transfer functions
+                         None for semi-3D transfer functions computed independently for each z-slice
+        
+        use_gpu        : bool
+                         option to use gpu or not
         
-        H_re = cp.asnumpy(H_re)
-        H_im = cp.asnumpy(H_im)
+        gpu_id         : int
+                         number refering to which gpu will be used
         
+        precision      : str
+                         'single' for float32/complex64 computation, 'double' for float64/complex128 computation
+        
+    '''
+    
+    Ny, Nx, Nz = Hz_det.shape
+    
+    backend = array_backend(use_gpu, gpu_id, precision=precision)
+    xp, xp_fft = backend.xp, backend.fft
+    
+    if precision == 'single':
+        dtype = backend.complex_dtype
     else:
+        dtype = np.result_type(Pupil, Hz_det, *Source_terms.values(), *G_terms.values())
     
-        
-
-        H1 = ifft2(fft2((Source * Pupil)[:,:,np.newaxis] * Hz_det, axes=(0,1)).conj()*\
-                   fft2(Pupil[:,:,np.newaxis] * G_fun_z, axes=(0,1)), axes=(0,1))
-        H1 = H1*window[np.newaxis,np.newaxis,:]
-        H1 = fft(H1, axis=2)*psz
-        H2 = ifft2(fft2((Source * Pupil)[:,:,np.newaxis] * Hz_det, axes=(0,1))*\
-                   fft2(Pupil[:,:,np.newaxis] * G_fun_z, axes=(0,1)).conj(), axes=(0,1))
-        H2 = H2*window[np.newaxis,np.newaxis,:]
-        H2 = fft(H2, axis=2)*psz
-
-        I_norm = np.sum(Source_support * Pupil * Pupil.conj())
-        H_re = (H1 + H2)/I_norm
-        H_im = 1j*(H1-H2)/I_norm
+    used_source_terms = set(term[1] for terms in OTF_terms.values() for term in terms)
+    used_G_terms = set(term[2] for terms in OTF_terms.values() for term in terms)
     
+    Pupil = backend.cast(backend.asarray(Pupil))
+    Hz_det = backend.cast(backend.asarray(Hz_det))
     
-    return H_re, H_im
+    # shared 2D Fourier transforms of the source and Green's tensor terms
+    Source_f = {}
+    for name in used_source_terms:
+        Source_f[name] = xp_fft.fft2((backend.cast(backend.asarray(Source_terms[name])) * Pupil)[:,:,xp.newaxis] * Hz_det, 
+                                     axes=(0,1)).astype(dtype)
+    
+    G_f = {}
+    for name in used_G_terms:
+        G_f[name] = xp_fft.fft2(Pupil[:,:,xp.newaxis] * backend.cast(backend.asarray(G_terms[name])), axes=(0,1)).astype(dtype)
+    
+    I_norm = xp.sum(backend.cast(backend.asarray(Source_support)) * Pupil * xp.conj(Pupil))
+    
+    if psz is not None:
+        window = backend.asarray(ifftshift(np.hanning(Nz)).astype('float32'))
+    
+    for idx, terms in OTF_terms.items():
+        
+        # H1 + H2 = ifft2(2*Re(conj(Source_f)*G_f)), 1j*(H1 - H2) = ifft2(-2*Im(conj(Source_f)*G_f))
+        H_f = xp.zeros((Ny, Nx, Nz), dtype=Source_f[terms[0][1]].real.dtype)
+        for sign, source_term, G_term, part in terms:
+            pair = xp.conj(Source_f[source_term]) * G_f[G_term]
+            if part == 're':
+                H_f += (2*sign) * pair.real
+            else:
+                H_f -= (2*sign) * pair.imag
+        
+        H = xp_fft.ifft2(H_f, axes=(0,1))/I_norm
+        
+        if psz is not None:
+            H = xp_fft.fft(H*window[xp.newaxis,xp.newaxis,:], axis=2)*psz
+        
+        out[idx] = backend.asnumpy(H)
 
 
 
@@ -806,7 +931,7 @@ def gen_geometric_inc_matrix(incident_theta, incident_phi, Source):
 
 
 
-def SEAGLE_vec_forward(E_tot, f_scat_tensor, G_tensor, use_gpu=False, gpu_id=0):
+def SEAGLE_vec_forward(E_tot, f_scat_tensor, G_tensor, use_gpu=False, gpu_id=0, precision='double'):
     
     '''
     
@@ -829,6 +954,9 @@ def SEAGLE_vec_forward(E_tot, f_scat_tensor, G_tensor, use_gpu=False, gpu_id=0):
         gpu_id        : int 
                         number refering to which gpu will be used
         
+        precision     : str
+                        'single' for float32/complex64 computation, 'double' for float64/complex128 computation
+        
     Returns
     -------
         E_in_est      : numpy.ndarray
@@ -838,46 +966,29 @@ def SEAGLE_vec_forward(E_tot, f_scat_tensor, G_tensor, use_gpu=False, gpu_id=0):
     
     N, M, L = E_tot.shape[1:]
     
-    if use_gpu:
-        globals()['cp'] = __import__("cupy")
-        cp.cuda.Device(gpu_id).use()
-        
-        pad_convolve_G = lambda x, y, z: cp.fft.ifftn(cp.fft.fftn(cp.pad(x,((N//2,N//2),(M//2,M//2),(L//2,L//2)), \
-                                                       mode='constant', constant_values=y))*z)[N//2:-N//2,M//2:-M//2,L//2:-L//2]
-        E_interact = cp.zeros((3, N, M, L), complex)
-        E_in_est = cp.zeros_like(E_tot, complex)
-
-
-        for p, q in itertools.product(range(3), range(3)):
-            E_interact[p] += f_scat_tensor[p,q]*E_tot[q]
-
-        for p, q in itertools.product(range(3), range(3)):     
-            E_in_est[p] += pad_convolve_G(E_interact[q], cp.asnumpy(cp.abs(cp.mean(E_interact[q]))), G_tensor[p,q])
-            if p == q:
-                E_in_est[p] +=  E_tot[p]
-        
-    else: 
+    backend = array_backend(use_gpu, gpu_id, precision=precision)
+    xp, xp_fft = backend.xp, backend.fft
     
-        pad_convolve_G = lambda x, y, z: ifftn(fftn(np.pad(x,((N//2,),(M//2,),(L//2,)), \
-                                                           mode='constant', constant_values=y))*z)[N//2:-N//2,M//2:-M//2,L//2:-L//2]
-        E_interact = np.zeros((3, N, M, L), complex)
-        E_in_est = np.zeros_like(E_tot, complex)
+    pad_convolve_G = lambda x, y, z: xp_fft.ifftn(xp_fft.fftn(xp.pad(x,((N//2,N//2),(M//2,M//2),(L//2,L//2)), \
+                                                   mode='constant', constant_values=y))*z)[N//2:-N//2,M//2:-M//2,L//2:-L//2]
+    E_interact = xp.zeros((3, N, M, L), backend.complex_dtype)
+    E_in_est = xp.zeros_like(E_tot, backend.complex_dtype)
 
 
-        for p, q in itertools.product(range(3), range(3)):
-            E_interact[p] += f_scat_tensor[p,q]*E_tot[q]
+    for p, q in itertools.product(range(3), range(3)):
+        E_interact[p] += f_scat_tensor[p,q]*E_tot[q]
 
-        for p, q in itertools.product(range(3), range(3)):     
-            E_in_est[p] += pad_convolve_G(E_interact[q], np.abs(np.mean(E_interact[q])), G_tensor[p,q])
-            if p == q:
-                E_in_est[p] +=  E_tot[p]
+    for p, q in itertools.product(range(3), range(3)):     
+        E_in_est[p] += pad_convolve_G(E_interact[q], float(xp.abs(xp.mean(E_interact[q]))), G_tensor[p,q])
+        if p == q:
+            E_in_est[p] +=  E_tot[p]
     
         
     return E_in_est
 
 
 
-def SEAGLE_vec_backward(E_diff, f_scat_tensor, G_tensor, use_gpu=False, gpu_id=0):
+def SEAGLE_vec_backward(E_diff, f_scat_tensor, G_tensor, use_gpu=False, gpu_id=0, precision='double'):
     
     '''
     
@@ -900,6 +1011,9 @@ def SEAGLE_vec_backward(E_diff, f_scat_tensor, G_tensor, use_gpu=False, gpu_id=0
         gpu_id        : int
                         gpu_id for computation
         
+        precision     : str
+                        'single' for float32/complex64 computation, 'double' for float64/complex128 computation
+        
     Returns
     -------
         grad_E        : numpy.ndarray
@@ -909,46 +1023,25 @@ def SEAGLE_vec_backward(E_diff, f_scat_tensor, G_tensor, use_gpu=False, gpu_id=0
     
     N, M, L = E_diff.shape[1:]
     
-    if use_gpu:
-        globals()['cp'] = __import__("cupy")
-        cp.cuda.Device(gpu_id).use()
-        
-        pad_convolve_G = lambda x, y, z: cp.fft.ifftn(cp.fft.fftn(cp.pad(x,((N//2,N//2),(M//2,M//2),(L//2,L//2)), \
-                                                       mode='constant', constant_values=y))*z)[N//2:-N//2,M//2:-M//2,L//2:-L//2]
-        
-        E_diff_conv = cp.zeros_like(E_diff, complex)
-        grad_E = cp.zeros_like(E_diff, complex)
-
-
-        for p, q in itertools.product(range(3), range(3)):
-            E_diff_conv[p] += pad_convolve_G(E_diff[q], cp.asnumpy(cp.abs(cp.mean(E_diff[p]))), G_tensor[p,q].conj())
-
-
-        for p in range(3):
-            E_interact = cp.zeros((N,M,L), complex)
-            for q in range(3):
-                E_interact += f_scat_tensor[q,p].conj()*E_diff_conv[q]
-            grad_E[p] = E_diff[p] + E_interact
-        
-    else:
+    backend = array_backend(use_gpu, gpu_id, precision=precision)
+    xp, xp_fft = backend.xp, backend.fft
     
+    pad_convolve_G = lambda x, y, z: xp_fft.ifftn(xp_fft.fftn(xp.pad(x,((N//2,N//2),(M//2,M//2),(L//2,L//2)), \
+                                                   mode='constant', constant_values=y))*z)[N//2:-N//2,M//2:-M//2,L//2:-L//2]
     
-        pad_convolve_G = lambda x, y, z: ifftn(fftn(np.pad(x,((N//2,),(M//2,),(L//2,)), \
-                                                           mode='constant', constant_values=y))*z)[N//2:-N//2,M//2:-M//2,L//2:-L//2]
-
-        E_diff_conv = np.zeros_like(E_diff, complex)
-        grad_E = np.zeros_like(E_diff, complex)
+    E_diff_conv = xp.zeros_like(E_diff, backend.complex_dtype)
+    grad_E = xp.zeros_like(E_diff, backend.complex_dtype)
 
 
-        for p, q in itertools.product(range(3), range(3)):
-            E_diff_conv[p] += pad_convolve_G(E_diff[q], np.abs(np.mean(E_diff[p])), G_tensor[p,q].conj())
+    for p, q in itertools.product(range(3), range(3)):
+        E_diff_conv[p] += pad_convolve_G(E_diff[q], float(xp.abs(xp.mean(E_diff[p]))), G_tensor[p,q].conj())
 
 
-        for p in range(3):
-            E_interact = np.zeros((N,M,L), complex)
-            for q in range(3):
-                E_interact += f_scat_tensor[q,p].conj()*E_diff_conv[q]
-            grad_E[p] = E_diff[p] + E_interact
+    for p in range(3):
+        E_interact = xp.zeros((N,M,L), backend.complex_dtype)
+        for q in range(3):
+            E_interact += f_scat_tensor[q,p].conj()*E_diff_conv[q]
+        grad_E[p] = E_diff[p] + E_interact
         
     return grad_E
 
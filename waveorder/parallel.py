@@ -0,0 +1,288 @@
+import os
+import time
+import queue
+import threading
+import collections
+import multiprocessing as mp
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from .fft_backend import set_fft_backend, _fft_backend
+
+
+# reader, recipe and writer of the worker process, set once by the pool initializer
+_worker_state = {}
+
+
+
+def parallel_reconstruction(reader, recipe, writer, positions=None, time_points=None, n_workers=None,
+                            threads_per_worker=1, max_items_per_worker=None, start_method=None, verbose=True):
+
+    '''
+
+    reconstruct all (position, time) items of a dataset on a pool of processes
+
+    the items are handed out one at a time to the next free worker (dynamic load balancing), and every worker
+    reads, reconstructs and writes a single (C, Z, Y, X) volume at a time (the memory is bounded by n_workers volumes)
+    the recipe, with the waveorder_microscopy / fluorescence_microscopy setups and their transfer functions,
+    is built once in the calling process and shared with the workers (inherited with 'fork', pickled once per worker otherwise)
+    (with waveorder_microscopy.share_transfer_functions, all workers read a single copy of the transfer functions)
+    the workers write their volumes concurrently without locking, which is safe only when no two items share a zarr chunk,
+    so the arrays of the writer must have a chunk size of 1 along T (checked before the items are dispatched)
+
+    Parameters
+    ----------
+        reader               : WaveorderReader
+                               reader of the raw data, reader.get_zarr(p)[t] returns the (C, Z, Y, X) volume of (p, t)
+
+        recipe               : callable
+                               recipe(data, p, t) reconstructs the (C, Z, Y, X) volume data of position p and time t
+                               and returns the reconstruction with the size of (C_out, Z_out, Y, X)
+
+        writer               : WaveorderWriter
+                               writer with the arrays of the positions initialized (init_array) to (T, C_out, Z_out, Y, X),
+                               chunked with a chunk size of 1 along T (e.g. (1, 1, 1, Y, X)) when n_workers > 1
+
+        positions            : list
+                               position indices to reconstruct (None: all positions of the reader)
+
+        time_points          : list
+                               time indices to reconstruct (None: all time points of each position)
+
+        n_workers            : int
+                               number of worker processes (None: all available cpus, 1: reconstruct in the calling process)
+
+        threads_per_worker   : int
+                               number of FFT threads of each worker for the 'scipy' and 'pyfftw' FFT backends
+
+        max_items_per_worker : int
+                               number of items after which a worker process is replaced by a fresh one (None: never)
+
+        start_method         : str
+                               multiprocessing start method ('fork', 'spawn' or 'forkserver', None: 'fork' where available)
+
+        verbose              : bool
+                               option to print the progress of the reconstruction
+
+    Returns
+    -------
+        timings              : list
+                               (p, t, reconstruction time in seconds) of every item, in order of completion
+
+    '''
+
+    items = _work_items(reader, positions, time_points)
+
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    n_workers = max(min(n_workers, len(items)), 1)
+
+    fft_backend = (_fft_backend['name'], threads_per_worker, _fft_backend['planner_effort'], _fft_backend['wisdom_file'])
+    timings = []
+
+    if verbose:
+        print('Reconstructing %d items on %d workers'%(len(items), n_workers))
+
+    if n_workers == 1:
+        _init_worker(reader, recipe, writer, None)
+        try:
+            for item in items:
+                timings.append(_reconstruct_item(item))
+                if verbose:
+                    print('Finished position %d, time point %d (%d / %d)'%(timings[-1][0], timings[-1][1], len(timings), len(items)))
+        finally:
+            _worker_state.clear()
+
+        return timings
+
+    _check_writer_chunks(writer, sorted(set(p for p, _ in items)))
+
+    if start_method is None:
+        start_method = 'fork' if 'fork' in mp.get_all_start_methods() else 'spawn'
+
+    ctx = mp.get_context(start_method)
+    with ctx.Pool(n_workers, initializer=_init_worker, initargs=(reader, recipe, writer, fft_backend),
+                  maxtasksperchild=max_items_per_worker) as pool:
+        for timing in pool.imap_unordered(_reconstruct_item, items, chunksize=1):
+            timings.append(timing)
+            if verbose:
+                print('Finished position %d, time point %d (%d / %d)'%(timing[0], timing[1], len(timings), len(items)))
+
+    return timings
+
+
+
+def pipelined_reconstruction(reader, recipe, writer, positions=None, time_points=None, n_prefetch=2, n_io_threads=2,
+                             write_queue_size=2, verbose=True):
+
+    '''
+
+    reconstruct all (position, time) items of a dataset in the calling process, overlapping the reconstruction with the I/O
+
+    the upcoming (C, Z, Y, X) volumes are read (and decompressed) ahead on I/O threads while the current one is reconstructed,
+    and the reconstructions are handed to a write-behind thread, so that the cpu does not sit idle during the zarr
+    decompression and compression; reading and writing block when n_prefetch volumes are read ahead
+    or write_queue_size reconstructions wait to be written (back-pressure)
+
+    Parameters
+    ----------
+        reader           : WaveorderReader
+                           reader of the raw data, reader.get_zarr(p)[t] returns the (C, Z, Y, X) volume of (p, t)
+
+        recipe           : callable
+                           recipe(data, p, t) reconstructs the (C, Z, Y, X) volume data of position p and time t
+                           and returns the reconstruction with the size of (C_out, Z_out, Y, X)
+
+        writer           : WaveorderWriter
+                           writer with the arrays of the positions initialized (init_array) to (T, C_out, Z_out, Y, X)
+
+        positions        : list
+                           position indices to reconstruct (None: all positions of the reader)
+
+        time_points      : list
+                           time indices to reconstruct (None: all time points of each position)
+
+        n_prefetch       : int
+                           maximum number of volumes read ahead of the reconstruction
+
+        n_io_threads     : int
+                           number of threads reading the volumes
+
+        write_queue_size : int
+                           maximum number of reconstructions waiting for the write-behind thread
+
+        verbose          : bool
+                           option to print the progress of the reconstruction
+
+    Returns
+    -------
+        timings          : list
+                           (p, t, reconstruction time in seconds) of every item, in order of reconstruction
+
+    '''
+
+    if n_prefetch < 1 or n_io_threads < 1 or write_queue_size < 1:
+        raise ValueError('n_prefetch, n_io_threads and write_queue_size must be at least 1')
+
+    items = _work_items(reader, positions, time_points)
+    timings = []
+
+    write_queue = queue.Queue(maxsize=write_queue_size)
+    write_errors = []
+
+    def write_behind():
+        while True:
+            entry = write_queue.get()
+            if entry is None:
+                return
+            p, t, result = entry
+            try:
+                if not write_errors:
+                    writer.write(result, p=p, t=t, c=slice(0, result.shape[0]), z=slice(0, result.shape[1]))
+            except Exception as e:
+                write_errors.append(e)
+
+    write_thread = threading.Thread(target=write_behind, daemon=True)
+    write_thread.start()
+
+    try:
+        with ThreadPoolExecutor(n_io_threads) as io_pool:
+            pending = collections.deque()
+            next_item = 0
+
+            for p, t in items:
+
+                # keep up to n_prefetch volumes in flight
+                while next_item < len(items) and len(pending) < n_prefetch:
+                    p_next, t_next = items[next_item]
+                    pending.append(io_pool.submit(_read_item, reader, p_next, t_next))
+                    next_item += 1
+
+                data = pending.popleft().result()
+
+                t_start = time.time()
+                result = np.asarray(recipe(data, p, t))
+                if result.ndim != 4:
+                    raise ValueError('recipe must return an array with the size of (C_out, Z_out, Y, X), got %s'%(str(result.shape)))
+                timings.append((p, t, time.time() - t_start))
+
+                if write_errors:
+                    raise write_errors[0]
+                write_queue.put((p, t, result))
+
+                if verbose:
+                    print('Finished position %d, time point %d (%d / %d)'%(p, t, len(timings), len(items)))
+    finally:
+        write_queue.put(None)
+        write_thread.join()
+
+    if write_errors:
+        raise write_errors[0]
+
+    return timings
+
+
+
+def _work_items(reader, positions, time_points):
+
+    # (p, t) items of the positions and time points, all of them by default
+    if positions is None:
+        positions = range(reader.get_num_positions())
+
+    items = []
+    for p in positions:
+        N_time = reader.get_zarr(p).shape[0]
+        for t in (range(N_time) if time_points is None else time_points):
+            items.append((p, t))
+
+    return items
+
+
+
+def _check_writer_chunks(writer, positions):
+
+    # concurrent writes of different time points are independent only if they never touch the same chunk
+    for p in positions:
+        writer.sub_writer.open_position(p)
+        chunks = writer.sub_writer.current_pos_group['arr_0'].chunks
+        if chunks[0] != 1:
+            raise ValueError('parallel_reconstruction requires the arrays of the writer to have a chunk size of 1 along T, '
+                             'got chunks %s at position %d'%(str(chunks), p))
+
+
+
+def _read_item(reader, p, t):
+
+    return np.asarray(reader.get_zarr(p)[t])
+
+
+
+def _init_worker(reader, recipe, writer, fft_backend):
+
+    # one FFT thread per worker by default, the pool itself saturates the cpus
+    if fft_backend is not None and fft_backend[0] != 'numpy':
+        set_fft_backend(fft_backend[0], workers=fft_backend[1], planner_effort=fft_backend[2], wisdom_file=fft_backend[3])
+
+        # the workers start from the FFTW wisdom of the calling process, which alone saves it back at exit
+        _fft_backend['wisdom_file'] = None
+
+    _worker_state['reader'] = reader
+    _worker_state['recipe'] = recipe
+    _worker_state['writer'] = writer
+
+
+
+def _reconstruct_item(item):
+
+    p, t = item
+    t_start = time.time()
+
+    data = _read_item(_worker_state['reader'], p, t)
+    result = np.asarray(_worker_state['recipe'](data, p, t))
+
+    if result.ndim != 4:
+        raise ValueError('recipe must return an array with the size of (C_out, Z_out, Y, X), got %s'%(str(result.shape)))
+
+    _worker_state['writer'].write(result, p=p, t=t, c=slice(0, result.shape[0]), z=slice(0, result.shape[1]))
+
+    return p, t, time.time() - t_start
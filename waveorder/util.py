@@ -2,11 +2,17 @@ import numpy as np
 import matplotlib.pyplot as plt
 import pywt
 import time
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
 
-from numpy.fft import fft, ifft, fft2, ifft2, fftn, ifftn, fftshift, ifftshift
+from .fft_backend import fft, ifft, fft2, ifft2, fftn, ifftn, rfft2, irfft2, rfftn, irfftn, fftshift, ifftshift
 from scipy.ndimage import uniform_filter
 from collections import namedtuple
 from .optics import scattering_potential_tensor_to_3D_orientation_PN
+from .array_backend import array_backend
 
 import re
 numbers = re.compile(r'(\d+)')
@@ -304,14 +310,10 @@ def softTreshold(x, threshold, use_gpu=False, gpu_id=0):
                       
     '''
     
-    if use_gpu:
-        globals()['cp'] = __import__("cupy")
-        cp.cuda.Device(gpu_id).use()
-        magnitude = cp.abs(x)
-        ratio = cp.maximum(0, magnitude-threshold) / (magnitude+1e-16)
-    else:
-        magnitude = np.abs(x)
-        ratio = np.maximum(0, magnitude-threshold) / (magnitude+1e-16)
+    xp = array_backend(use_gpu, gpu_id).xp
+    
+    magnitude = xp.abs(x)
+    ratio = xp.maximum(0, magnitude-threshold) / (magnitude+1e-16)
         
     x_threshold = x*ratio
     
@@ -497,7 +499,247 @@ def array_based_7x7_det(a):
           a[0,6]*array_based_6x6_det(a[1:,[0,1,2,3,4,5]])
     
     return det
+
+
+def Hermitian_batched_cholesky(AHA, reg_diag=None, chunk_size=2**16):
+    
+    '''
+    
+    compute the Cholesky factorization of a stack of Hermitian positive definite matrices (e.g. regularized AHA at each spatial frequency)
+    the stack is processed in chunks of the flattened frequency grid to bound the memory usage
+    matrices that fail to factorize (singular or ill-conditioned) receive a small relative diagonal loading,
+    they are located by bisecting the failing chunks such that the other matrices are factorized without loading
+    
+    Parameters
+    ----------
+        AHA        : numpy.ndarray
+                     Hermitian matrices in the nD space with the shape of (n, n, Ny, Nx, Nz, ...)
+                     
+        reg_diag   : numpy.ndarray
+                     values added to the diagonal of every matrix with the size of (n,) (Tikhonov regularization)
+                     
+        chunk_size : int
+                     number of matrices factorized at once
+        
+    Returns
+    -------
+        L_packed   : numpy.ndarray
+                     lower triangle of the Cholesky factors (row-major packed) with the shape of (n*(n+1)/2, Ny, Nx, Nz, ...)
+    
+    '''
+    
+    n = AHA.shape[0]
+    spatial_shape = AHA.shape[2:]
+    AHA_flat = AHA.reshape((n, n, -1))
+    N_batch = AHA_flat.shape[-1]
+    
+    tril_row, tril_col = np.tril_indices(n)
+    diag_idx = np.r_[:n]
+    diag_shift = np.zeros((n,)) if reg_diag is None else np.asarray(reg_diag)
+    
+    L_packed = np.zeros((len(tril_row), N_batch), dtype=AHA.dtype)
+    
+    def factorize(A, diag_scale):
+        
+        try:
+            return np.linalg.cholesky(A)
+        except np.linalg.LinAlgError:
+            if len(A) > 1:
+                half = len(A)//2
+                return np.concatenate([factorize(A[:half], diag_scale[:half]), factorize(A[half:], diag_scale[half:])])
+        
+        # a single failing matrix: smallest relative diagonal loading (of the unloaded matrix) that factorizes it
+        jitter = 10*np.finfo(A.real.dtype).eps
+        while True:
+            A_loaded = A.copy()
+            A_loaded[:, diag_idx, diag_idx] += jitter*diag_scale[:, np.newaxis]
+            try:
+                return np.linalg.cholesky(A_loaded)
+            except np.linalg.LinAlgError:
+                if jitter > 1e-2:
+                    raise
+                jitter *= 10
+    
+    for start in range(0, N_batch, chunk_size):
+        
+        chunk = slice(start, min(start+chunk_size, N_batch))
+        A = np.transpose(AHA_flat[..., chunk], (2,0,1)).copy()
+        A[:, diag_idx, diag_idx] += diag_shift
+        
+        eps = np.finfo(A.real.dtype).eps
+        diag_scale = np.mean(np.abs(A[:, diag_idx, diag_idx]), axis=1)
+        diag_scale = np.maximum(diag_scale, eps*max(np.max(diag_scale), 1))
+        
+        L = factorize(A, diag_scale)
+        L_packed[:, chunk] = np.transpose(L[:, tril_row, tril_col])
+        
+    return L_packed.reshape((len(tril_row),)+spatial_shape)
+
+
+
+def Hermitian_batched_cholesky_solve(L_packed, b_vec, chunk_size=2**16):
+    
+    '''
+    
+    solve a stack of Hermitian linear systems (A x = b) with their Cholesky factors by forward and backward substitution
+    the stack is processed in chunks of the flattened frequency grid to bound the memory usage
+    
+    Parameters
+    ----------
+        L_packed   : numpy.ndarray
+                     lower triangle of the Cholesky factors from Hermitian_batched_cholesky with the shape of (n*(n+1)/2, Ny, Nx, Nz, ...)
+                     
+        b_vec      : numpy.ndarray
+                     right hand side of the systems with the shape of (n, Ny, Nx, Nz, ...)
+                     
+        chunk_size : int
+                     number of systems solved at once
+        
+    Returns
+    -------
+        x_vec      : numpy.ndarray
+                     solution of the systems with the shape of (n, Ny, Nx, Nz, ...)
+    
+    '''
+    
+    n = b_vec.shape[0]
+    b_flat = b_vec.reshape((n, -1))
+    L_flat = L_packed.reshape((L_packed.shape[0], -1))
+    N_batch = b_flat.shape[-1]
+    
+    idx = lambda i, k: i*(i+1)//2 + k
+    
+    x_vec = np.zeros(b_flat.shape, dtype=np.result_type(L_packed, b_vec))
+    
+    for start in range(0, N_batch, chunk_size):
+        
+        chunk = slice(start, min(start+chunk_size, N_batch))
+        L = L_flat[:, chunk]
+        y = x_vec[:, chunk]
+        y[:] = b_flat[:, chunk]
+        
+        # forward substitution: L y = b
+        for i in range(n):
+            for k in range(i):
+                y[i] -= L[idx(i,k)]*y[k]
+            y[i] /= L[idx(i,i)].real
+        
+        # backward substitution: L^H x = y
+        for i in reversed(range(n)):
+            for k in range(i+1, n):
+                y[i] -= np.conj(L[idx(k,i)])*y[k]
+            y[i] /= L[idx(i,i)].real
+            
+    return x_vec.reshape(b_vec.shape)
+    
+
+
+def Hermitian_batched_CG_solve(AHA_operator, b_vec, preconditioner=None, tol=1e-4, itr=50, verbose=False, use_gpu=False, gpu_id=0,
+                               output_stats=False):
+    
+    '''
+    
+    solve a stack of Hermitian positive definite linear systems (A x = b) with the matrix-free (preconditioned) conjugate gradient method
+    the systems are independent (e.g. one per spatial frequency) and are iterated together, each with its own step sizes,
+    until the residual of every system is below its tolerance (a system of size n converges in at most n steps in exact arithmetic)
+    
+    Parameters
+    ----------
+        AHA_operator   : callable
+                         function applying the stacked matrices to a stack of vectors, AHA_operator(x) = A x with x of the shape of b_vec
     
+        b_vec          : numpy.ndarray
+                         right hand side of the systems with the shape of (n, Ny, Nx, Nz, ...)
+    
+        preconditioner : numpy.ndarray
+                         inverse of a (diagonal) approximation of the matrices with the shape of b_vec (e.g. Jacobi), None for no preconditioning
+    
+        tol            : float
+                         relative tolerance of the residual of each system (||b - A x|| <= tol*||b||)
+    
+        itr            : int
+                         maximum number of iterations
+    
+        verbose        : bool
+                         option to display the largest relative residual in each iteration
+    
+        use_gpu        : bool
+                         option to use gpu or not
+    
+        gpu_id         : int
+                         number refering to which gpu will be used
+    
+        output_stats   : bool
+                         option to return the iteration statistics as well
+    
+    Returns
+    -------
+        x_vec          : numpy.ndarray (or cupy.ndarray in the gpu mode)
+                         solution of the systems with the shape of (n, Ny, Nx, Nz, ...)
+    
+        stats          : dict
+                         iteration statistics (if output_stats is True) with 'iterations', 'converged',
+                         and the per-iteration largest relative 'residual' of the systems
+    
+    '''
+    
+    backend = array_backend(use_gpu, gpu_id)
+    xp = backend.xp
+    
+    # inner products of the vectors of each system
+    inner = lambda u, v: xp.real(xp.sum(xp.conj(u)*v, axis=0))
+    
+    b_vec = backend.asarray(b_vec)
+    if preconditioner is not None:
+        preconditioner = backend.asarray(preconditioner)
+    x_vec = xp.zeros_like(b_vec)
+    r_vec = b_vec.copy()
+    z_vec = r_vec*preconditioner if preconditioner is not None else r_vec
+    p_vec = z_vec.copy()
+    rz    = inner(r_vec, z_vec)
+    
+    b_norm    = xp.sqrt(inner(b_vec, b_vec))
+    threshold = tol*b_norm
+    active    = b_norm > threshold
+    
+    stats = {'iterations': 0, 'converged': False, 'residual': []}
+    
+    for i in range(itr):
+    
+        if not bool(xp.any(active)):
+            break
+    
+        Ap_vec = AHA_operator(p_vec)
+        pAp    = inner(p_vec, Ap_vec)
+    
+        # converged systems are frozen with a zero step
+        alpha  = xp.where(active & (pAp > 0), rz/xp.where(pAp > 0, pAp, 1), 0).astype(b_norm.dtype)
+        x_vec += alpha*p_vec
+        r_vec -= alpha*Ap_vec
+        del Ap_vec
+    
+        r_norm = xp.sqrt(inner(r_vec, r_vec))
+        active = r_norm > threshold
+    
+        stats['iterations'] += 1
+        stats['residual'].append(float(xp.max(r_norm/xp.where(b_norm > 0, b_norm, 1))))
+        if verbose:
+            print('Number of iteration computed (%d / %d), relative residual: %.3e'%(i+1, itr, stats['residual'][-1]))
+    
+        z_vec  = r_vec*preconditioner if preconditioner is not None else r_vec
+        rz_new = inner(r_vec, z_vec)
+        beta   = xp.where(rz > 0, rz_new/xp.where(rz > 0, rz, 1), 0).astype(b_norm.dtype)
+        p_vec *= beta
+        p_vec += z_vec
+        rz     = rz_new
+    
+    stats['converged'] = not bool(xp.any(active))
+    
+    if output_stats:
+        return x_vec, stats
+    
+    return x_vec
+
 
 
 def uniform_filter_2D(image, size, use_gpu=False, gpu_id=0):
@@ -536,13 +778,16 @@ def uniform_filter_2D(image, size, use_gpu=False, gpu_id=0):
         # filter in y direction
         
         image_cp = cp.array(image)
+        
+        # single precision images are filtered in single precision
+        dtype = 'float32' if image_cp.dtype == cp.float32 else 'float64'
     
-        kernel_y = cp.zeros((3*N,))
+        kernel_y = cp.zeros((3*N,), dtype=dtype)
         kernel_y[3*N//2-size//2:3*N//2+size//2] = 1
         kernel_y /= cp.sum(kernel_y)
         kernel_y = cp.fft.fft(cp.fft.ifftshift(kernel_y))
 
-        image_bound_y = cp.zeros((3*N,M))
+        image_bound_y = cp.zeros((3*N,M), dtype=dtype)
         image_bound_y[N:2*N,:] = image_cp.copy()
         image_bound_y[0:N,:] = cp.flipud(image_cp)
         image_bound_y[2*N:3*N,:] = cp.flipud(image_cp)
@@ -551,12 +796,12 @@ def uniform_filter_2D(image, size, use_gpu=False, gpu_id=0):
         
         # filter in x direction
         
-        kernel_x = cp.zeros((3*M,))
+        kernel_x = cp.zeros((3*M,), dtype=dtype)
         kernel_x[3*M//2-size//2:3*M//2+size//2] = 1
         kernel_x /= cp.sum(kernel_x)
         kernel_x = cp.fft.fft(cp.fft.ifftshift(kernel_x))
 
-        image_bound_x = cp.zeros((N,3*M))
+        image_bound_x = cp.zeros((N,3*M), dtype=dtype)
         image_bound_x[:,M:2*M] = filtered_y.copy()
         image_bound_x[:,0:M] = cp.fliplr(filtered_y)
         image_bound_x[:,2*M:3*M] = cp.fliplr(filtered_y)
@@ -601,33 +846,19 @@ def inten_normalization(img_stack, bg_filter=True, use_gpu=False, gpu_id=0):
     '''
         
     N,M, Nimg = img_stack.shape
+    
+    backend = array_backend(use_gpu, gpu_id)
+    
+    img_stack = backend.asarray(img_stack)
+    img_norm_stack = backend.xp.zeros_like(img_stack)
 
-    if use_gpu:
-        
-        globals()['cp'] = __import__("cupy")
-        cp.cuda.Device(gpu_id).use()
-        
-        img_stack = cp.array(img_stack)
-        img_norm_stack = cp.zeros_like(img_stack)
-
-        for i in range(Nimg):
-            if bg_filter:
-                img_norm_stack[:,:,i] = img_stack[:,:,i]/uniform_filter_2D(img_stack[:,:,i], size=N//2, use_gpu=True, gpu_id=gpu_id)
-            else:
-                img_norm_stack[:,:,i] = img_stack[:,:,i].copy()
-            img_norm_stack[:,:,i] /= img_norm_stack[:,:,i].mean()
-            img_norm_stack[:,:,i] -= 1
-
-    else:
-        img_norm_stack = np.zeros_like(img_stack)
-
-        for i in range(Nimg):
-            if bg_filter:
-                img_norm_stack[:,:,i] = img_stack[:,:,i]/uniform_filter(img_stack[:,:,i], size=N//2)
-            else:
-                img_norm_stack[:,:,i] = img_stack[:,:,i].copy()
-            img_norm_stack[:,:,i] /= img_norm_stack[:,:,i].mean()
-            img_norm_stack[:,:,i] -= 1
+    for i in range(Nimg):
+        if bg_filter:
+            img_norm_stack[:,:,i] = img_stack[:,:,i]/uniform_filter_2D(img_stack[:,:,i], size=N//2, use_gpu=use_gpu, gpu_id=gpu_id)
+        else:
+            img_norm_stack[:,:,i] = img_stack[:,:,i].copy()
+        img_norm_stack[:,:,i] /= img_norm_stack[:,:,i].mean()
+        img_norm_stack[:,:,i] -= 1
 
     return img_norm_stack
 
@@ -659,7 +890,78 @@ def inten_normalization_3D(img_stack):
     return img_norm_stack
 
 
-def Dual_variable_Tikhonov_deconv_2D(AHA, b_vec, determinant=None, use_gpu=False, gpu_id=0, move_cpu=True):
+def half_spectrum_weights(n, use_gpu=False, gpu_id=0):
+    
+    '''
+    
+    multiplicity of the frequencies of a real-to-complex (rfft) half spectrum along its halved axis in the full Hermitian spectrum
+    
+    Parameters
+    ----------
+        n       : int
+                  length of the full (real space) axis
+        
+        use_gpu : bool
+                  option to use gpu or not
+        
+        gpu_id  : int
+                  number refering to which gpu will be used
+        
+    Returns
+    -------
+        weights : numpy.ndarray
+                  weights of the half spectrum frequencies with the size of (n//2+1,)
+    
+    '''
+    
+    weights = 2*np.ones((n//2+1,))
+    weights[0] = 1
+    if n%2 == 0:
+        weights[-1] = 1
+        
+    return array_backend(use_gpu, gpu_id).asarray(weights)
+
+
+
+def half_spectrum_mean(x, n, axis=-1, use_gpu=False, gpu_id=0):
+    
+    '''
+    
+    compute the mean of a Hermitian-symmetric spectral quantity over the full spectrum from its rfft half spectrum
+    
+    Parameters
+    ----------
+        x       : numpy.ndarray
+                  half spectrum quantity with n//2+1 frequencies along axis
+        
+        n       : int
+                  length of the full (real space) axis
+        
+        axis    : int
+                  halved axis of x
+        
+        use_gpu : bool
+                  option to use gpu or not
+        
+        gpu_id  : int
+                  number refering to which gpu will be used
+        
+    Returns
+    -------
+        x_mean  : float
+                  mean of x over the full spectrum
+    
+    '''
+    
+    weights_shape = [1]*x.ndim
+    weights_shape[axis] = n//2+1
+    weights = half_spectrum_weights(n, use_gpu=use_gpu, gpu_id=gpu_id).reshape(weights_shape)
+    
+    return (x*weights).sum() / (x.size // (n//2+1) * n)
+
+
+
+def Dual_variable_Tikhonov_deconv_2D(AHA, b_vec, determinant=None, use_gpu=False, gpu_id=0, move_cpu=True, rfft_shape=None, precision='double'):
     
     '''
     
@@ -688,6 +990,12 @@ def Dual_variable_Tikhonov_deconv_2D(AHA, b_vec, determinant=None, use_gpu=False
                      
         move_cpu    : bool
                       option to move the array from gpu to cpu
+                      
+        rfft_shape  : tuple
+                      real space shape of the reconstruction if AHA and b_vec are real-to-complex (rfft) half spectra, None for full spectra
+        
+        precision   : str
+                      'single' for float32/complex64 computation, 'double' for float64/complex128 computation
     
     Returns
     -------
@@ -704,179 +1012,517 @@ def Dual_variable_Tikhonov_deconv_2D(AHA, b_vec, determinant=None, use_gpu=False
     mu_sample_f = (b_vec[0]*AHA[3] - b_vec[1]*AHA[1]) / determinant
     phi_sample_f = (b_vec[1]*AHA[0] - b_vec[0]*AHA[2]) / determinant
 
-    if use_gpu:
-        
-        globals()['cp'] = __import__("cupy")
-        cp.cuda.Device(gpu_id).use()
-        
-        mu_sample = cp.real(cp.fft.ifft2(mu_sample_f))
-        phi_sample = cp.real(cp.fft.ifft2(phi_sample_f))
-        
-        if move_cpu:
-            mu_sample = cp.asnumpy(mu_sample)
-            phi_sample = cp.asnumpy(phi_sample)
-        
+    backend = array_backend(use_gpu, gpu_id, precision=precision)
+    
+    if rfft_shape is None:
+        mu_sample = backend.xp.real(backend.fft.ifft2(mu_sample_f))
+        phi_sample = backend.xp.real(backend.fft.ifft2(phi_sample_f))
     else:
-        mu_sample = np.real(ifft2(mu_sample_f))
-        phi_sample = np.real(ifft2(phi_sample_f))
+        mu_sample = backend.fft.irfft2(mu_sample_f, s=rfft_shape)
+        phi_sample = backend.fft.irfft2(phi_sample_f, s=rfft_shape)
+    
+    if move_cpu:
+        mu_sample = backend.asnumpy(mu_sample)
+        phi_sample = backend.asnumpy(phi_sample)
 
     return mu_sample, phi_sample
 
 
 
 
-def Dual_variable_ADMM_TV_deconv_2D(AHA, b_vec, rho, lambda_u, lambda_p, itr, verbose, use_gpu=False, gpu_id=0):
+class ADMM_TV_workspace:
     
     '''
     
-    2D TV deconvolution to solve for phase and absorption with weak object transfer function
+    preallocated buffers of the ADMM and primal-dual TV solvers (splitting / dual variables, finite differences, right-hand sides and temporaries)
     
-    ADMM formulation:
+    the solvers run their iterations in these buffers in place, and a workspace passed to repeated solves of the same size
+    (e.g. across time points) reuses them instead of allocating new volumes
+    buffers are reallocated when the size, dtype or array module (numpy / cupy) of a solve changes
+    
+    every thread has its own set of buffers, so one workspace can be shared by concurrent solves (e.g. the tiles of Tiled_recon)
+    
+    '''
+    
+    def __init__(self):
         
-        0.5 * || A*x - b ||_2^2 + lambda * || z ||_1 + 0.5 * rho * || D*x - z + u ||_2^2
+        self._local = threading.local()
     
-    Parameters
-    ----------
-        AHA        : list
-                     A^H times A matrix stored with a list of 4 2D numpy array (4 diagonal matrices)
-                     | AHA[0]  AHA[1] |
-                     | AHA[2]  AHA[3] |
-                  
-        b_vec      : list
-                     measured intensity stored with a list of 2 2D numpy array (2 vectors)
-                     | b_vec[0] |
-                     | b_vec[1] |
-                     
-        rho        : float
-                     ADMM rho parameter
+    
+    def __reduce__(self):
+        
+        # thread-local storage cannot be pickled, the workspace is rebuilt empty (e.g. in worker processes)
+        return (ADMM_TV_workspace, ())
+    
+    
+    @property
+    def buffers(self):
         
-        lambda_u   : float
-                     TV regularization parameter for absorption
+        # buffers of the calling thread
+        if not hasattr(self._local, 'buffers'):
+            self._local.buffers = {}
         
-        lambda_p   : float
-                     TV regularization parameter for phase
+        return self._local.buffers
+    
+    
+    def get(self, name, shape, dtype, xp=np):
         
-        itr        : int
-                     number of iterations of ADMM algorithm
+        '''
         
-        verbose    : bool
-                     option to display progress of the computation
+        buffer of the given name, reused if its size and dtype match (contents are not initialized)
         
-        use_gpu    : bool
-                     option to use gpu or not
+        Parameters
+        ----------
+            name  : str
+                    name of the buffer
+            
+            shape : tuple
+                    size of the buffer
+            
+            dtype : numpy.dtype
+                    data type of the buffer
+            
+            xp    : module
+                    array module of the buffer (numpy or cupy)
         
-        gpu_id     : int
-                     number refering to which gpu will be used
+        Returns
+        -------
+            buffer : numpy.ndarray
+                     buffer with the requested size and dtype
+        
+        '''
+        
+        buffer = self.buffers.get(name)
+        
+        if buffer is None or not isinstance(buffer, xp.ndarray) or buffer.shape != tuple(shape) or buffer.dtype != dtype:
+            self.buffers[name] = None    # release the old buffer before allocating the new one
+            buffer = xp.empty(shape, dtype=dtype)
+            self.buffers[name] = buffer
+        
+        return buffer
     
-    Returns
-    -------
-        mu_sample  : numpy.ndarray
-                     2D absorption reconstruction with the size of (Ny, Nx)
-                  
-        phi_sample : numpy.ndarray
-                     2D phase reconstruction with the size of (Ny, Nx)
-    '''
-
-    # ADMM deconvolution with anisotropic TV regularization
     
-    N, M = b_vec[0].shape
-    Dx = np.zeros((N, M)); Dx[0,0] = 1; Dx[0,-1] = -1;
-    Dy = np.zeros((N, M)); Dy[0,0] = 1; Dy[-1,0] = -1;
-
-    if use_gpu:
+    @property
+    def nbytes(self):
         
-        globals()['cp'] = __import__("cupy")
-        cp.cuda.Device(gpu_id).use()
+        return sum(buffer.nbytes for buffer in self.buffers.values())
+    
+    
+    def clear(self):
         
-        Dx = cp.fft.fft2(cp.array(Dx));
-        Dy = cp.fft.fft2(cp.array(Dy));
-
-        rho_term = rho*(cp.conj(Dx)*Dx + cp.conj(Dy)*Dy)
-
-        z_para = cp.zeros((4, N, M))
-        u_para = cp.zeros((4, N, M))
-        D_vec = cp.zeros((4, N, M))
-
-
-    else:
-        Dx = fft2(Dx);
-        Dy = fft2(Dy);
-
-        rho_term = rho*(np.conj(Dx)*Dx + np.conj(Dy)*Dy)
-
-        z_para = np.zeros((4, N, M))
-        u_para = np.zeros((4, N, M))
-        D_vec = np.zeros((4, N, M))
-
+        '''
+        
+        release all buffers (of all threads)
+        
+        '''
+        
+        self._local = threading.local()
 
-    AHA[0] = AHA[0] + rho_term
-    AHA[3] = AHA[3] + rho_term
 
-    determinant = AHA[0]*AHA[3] - AHA[1]*AHA[2]
 
+def _forward_difference(f, axis, out):
+    
+    # out = f - roll(f, -1, axis) without the rolled copy
+    
+    head = [slice(None)]*f.ndim; head[axis] = slice(None, -1)
+    tail = [slice(None)]*f.ndim; tail[axis] = slice(1, None)
+    last = [slice(None)]*f.ndim; last[axis] = -1
+    first = [slice(None)]*f.ndim; first[axis] = 0
+    
+    out[tuple(head)] = f[tuple(head)]
+    out[tuple(head)] -= f[tuple(tail)]
+    out[tuple(last)] = f[tuple(last)]
+    out[tuple(last)] -= f[tuple(first)]
+    
+    return out
 
-    for i in range(itr):
 
+def _softThreshold_inplace(xp, x, threshold, magnitude, ratio):
+    
+    # softTreshold of x in place, with magnitude and ratio buffers of the size of x
+    
+    xp.abs(x, out=magnitude)
+    xp.subtract(magnitude, threshold, out=ratio)
+    xp.maximum(0, ratio, out=ratio)
+    magnitude += 1e-16
+    ratio /= magnitude
+    x *= ratio
+    
+    return x
 
-        if use_gpu:
 
-            v_para = cp.fft.fft2(z_para - u_para)
-            b_vec_new = [b_vec[0] + rho*(cp.conj(Dx)*v_para[0] + cp.conj(Dy)*v_para[1]),\
-                         b_vec[1] + rho*(cp.conj(Dx)*v_para[2] + cp.conj(Dy)*v_para[3])]
+def _ADMM_TV_rhs(xp, fft_xp, b_vec, D_conj, z_para, u_para, rho, diff, out):
+    
+    # out = b_vec + rho * sum_k conj(D_k) * F(z_k - u_k), one gradient component at a time
+    
+    for k in range(len(D_conj)):
+        xp.subtract(z_para[k], u_para[k], out=diff)
+        v_para = fft_xp(diff)
+        if k == 0:
+            xp.multiply(D_conj[k], v_para, out=out)
+        else:
+            v_para *= D_conj[k]
+            out += v_para
+    
+    out *= rho
+    out += b_vec
+    
+    return out
 
-            mu_sample, phi_sample = Dual_variable_Tikhonov_deconv_2D(AHA, b_vec_new, determinant=determinant, \
-                                                                     use_gpu=use_gpu, gpu_id=gpu_id, move_cpu=not use_gpu)
-            
 
-            D_vec[0] = mu_sample - cp.roll(mu_sample, -1, axis=1)
-            D_vec[1] = mu_sample - cp.roll(mu_sample, -1, axis=0)
-            D_vec[2] = phi_sample - cp.roll(phi_sample, -1, axis=1)
-            D_vec[3] = phi_sample - cp.roll(phi_sample, -1, axis=0)
+def _ADMM_TV_update(xp, D_vec, z_para, u_para, thresholds, magnitude, ratio):
+    
+    # z = softThreshold(D*x + u) for each group of gradient components, u += D*x - z, in place
+    
+    xp.add(D_vec, u_para, out=z_para)
+    
+    group = len(D_vec)//len(thresholds)
+    for g, threshold in enumerate(thresholds):
+        _softThreshold_inplace(xp, z_para[g*group:(g+1)*group], threshold, magnitude[g*group:(g+1)*group], ratio[g*group:(g+1)*group])
+    
+    xp.subtract(D_vec, z_para, out=magnitude)
+    u_para += magnitude
 
 
-            z_para = D_vec + u_para
+def _Dual_variable_solve_inplace(xp, AHA, b_vec, determinant, out):
+    
+    # Dual_variable_Tikhonov_deconv spectra in the buffers out, b_vec is overwritten
+    # out[0] = (b_vec[0]*AHA[3] - b_vec[1]*AHA[1]) / determinant, out[1] = (b_vec[1]*AHA[0] - b_vec[0]*AHA[2]) / determinant
+    
+    xp.multiply(b_vec[0], AHA[3], out=out[0])
+    xp.multiply(b_vec[1], AHA[1], out=out[1])
+    out[0] -= out[1]
+    out[0] /= determinant
+    
+    xp.multiply(b_vec[1], AHA[0], out=out[1])
+    b_vec[0] *= AHA[2]
+    out[1] -= b_vec[0]
+    out[1] /= determinant
+    
+    return out[0], out[1]
 
-            z_para[:2,:,:] = softTreshold(z_para[:2,:,:], lambda_u/rho, use_gpu=True, gpu_id=gpu_id)
-            z_para[2:,:,:] = softTreshold(z_para[2:,:,:], lambda_p/rho, use_gpu=True, gpu_id=gpu_id)
 
-            u_para += D_vec - z_para
+def _ADMM_TV_residuals(xp, D_vec, z_para, z_prev, u_para, rho, roll_axes):
+    
+    # primal residual ||D*x - z||, dual residual rho*||D^T*(z - z_prev)|| and their relative scales max(||D*x||, ||z||), rho*||D^T*u||
+    # (D^T of the forward differences w - roll(w, 1) summed over the gradient components of each variable)
+    # and the round-off floor sqrt(n)*eps of the residuals (absolute tolerance)
+    
+    def D_adjoint_norm(w):
+        norm_square = 0
+        for start in range(0, len(roll_axes), len(set(roll_axes))):
+            adjoint = 0
+            for k in range(start, start+len(set(roll_axes))):
+                adjoint = adjoint + w[k] - xp.roll(w[k], 1, axis=roll_axes[k])
+            norm_square += float(xp.sum(adjoint**2))
+        return norm_square**0.5
+    
+    primal_residual = float(xp.linalg.norm((D_vec - z_para).ravel()))
+    dual_residual   = rho*D_adjoint_norm(z_para - z_prev)
+    primal_scale    = max(float(xp.linalg.norm(D_vec.ravel())), float(xp.linalg.norm(z_para.ravel())))
+    dual_scale      = rho*D_adjoint_norm(u_para)
+    round_off       = D_vec.size**0.5*float(xp.finfo(D_vec.dtype).eps)
+    
+    return primal_residual, dual_residual, primal_scale, dual_scale, round_off
 
-            if i == itr-1:
-                mu_sample  = cp.asnumpy(mu_sample)
-                phi_sample = cp.asnumpy(phi_sample)
 
+def _ADMM_TV_convergence(stats, residuals, rho, tol, adaptive_rho, mu=10, tau=2):
+    
+    # record the residuals of one iteration, test the stopping criterion and balance the residuals with rho (Boyd et al. 2011, 3.3 & 3.4.1)
+    # returns (converged, rho scaling factor)
+    
+    primal_residual, dual_residual, primal_scale, dual_scale, round_off = residuals
+    stats['iterations'] += 1
+    stats['primal_residual'].append(primal_residual)
+    stats['dual_residual'].append(dual_residual)
+    stats['rho'].append(rho)
+    
+    converged = tol is not None and primal_residual <= tol*primal_scale + round_off and dual_residual <= tol*dual_scale + round_off
+    stats['converged'] = converged
+    
+    rho_scale = 1
+    if adaptive_rho and not converged:
+        if primal_residual > mu*dual_residual:
+            rho_scale = tau
+        elif dual_residual > mu*primal_residual:
+            rho_scale = 1/tau
+    
+    return converged, rho_scale
 
 
+def _ADMM_TV_load_state(backend, state, z_para, u_para, rho):
 
-        else:
+    # warm start of the splitting variable z and the scaled dual variable u = y/rho from the state of a previous solve
+    # (a state of another size, e.g. from another reconstruction, is ignored)
 
-            v_para = fft2(z_para - u_para)
-            b_vec_new = [b_vec[0] + rho*(np.conj(Dx)*v_para[0] + np.conj(Dy)*v_para[1]),\
-                         b_vec[1] + rho*(np.conj(Dx)*v_para[2] + np.conj(Dy)*v_para[3])]
-            
-            mu_sample, phi_sample = Dual_variable_Tikhonov_deconv_2D(AHA, b_vec_new, determinant=determinant)
-            
-            D_vec[0] = mu_sample - np.roll(mu_sample, -1, axis=1)
-            D_vec[1] = mu_sample - np.roll(mu_sample, -1, axis=0)
-            D_vec[2] = phi_sample - np.roll(phi_sample, -1, axis=1)
-            D_vec[3] = phi_sample - np.roll(phi_sample, -1, axis=0)
+    if state is None or state.get('z') is None or tuple(state['z'].shape) != z_para.shape:
+        return False
 
+    z_para[...] = backend.asarray(state['z'], dtype=z_para.dtype)
+    u_para[...] = backend.asarray(state['y'], dtype=u_para.dtype)
+    u_para /= rho
 
-            z_para = D_vec + u_para
+    return True
 
-            z_para[:2,:,:] = softTreshold(z_para[:2,:,:], lambda_u/rho)
-            z_para[2:,:,:] = softTreshold(z_para[2:,:,:], lambda_p/rho)
 
-            u_para += D_vec - z_para
+def _ADMM_TV_save_state(state, z_para, u_para, rho):
 
-        if verbose:
-            print('Number of iteration computed (%d / %d)'%(i+1,itr))
+    # store z and the unscaled dual variable y = rho*u, so that the next solve can start from them with its own rho
+
+    if state is not None:
+        state['z'] = z_para.copy()
+        state['y'] = rho*u_para
+
+
+def Dual_variable_ADMM_TV_deconv_2D(AHA, b_vec, rho, lambda_u, lambda_p, itr, verbose, use_gpu=False, gpu_id=0, rfft_shape=None, precision='double', \
+                                    tol=None, adaptive_rho=False, output_stats=False, workspace=None, state=None):
+    
+    '''
+    
+    2D TV deconvolution to solve for phase and absorption with weak object transfer function
+    
+    ADMM formulation:
+        
+        0.5 * || A*x - b ||_2^2 + lambda * || z ||_1 + 0.5 * rho * || D*x - z + u ||_2^2
+    
+    Parameters
+    ----------
+        AHA          : list
+                       A^H times A matrix stored with a list of 4 2D numpy array (4 diagonal matrices)
+                       | AHA[0]  AHA[1] |
+                       | AHA[2]  AHA[3] |
+                  
+        b_vec        : list
+                       measured intensity stored with a list of 2 2D numpy array (2 vectors)
+                       | b_vec[0] |
+                       | b_vec[1] |
+                     
+        rho          : float
+                       ADMM rho parameter
+        
+        lambda_u     : float
+                       TV regularization parameter for absorption
+        
+        lambda_p     : float
+                       TV regularization parameter for phase
+        
+        itr          : int
+                       number of iterations of ADMM algorithm
+        
+        verbose      : bool
+                       option to display progress of the computation
+        
+        use_gpu      : bool
+                       option to use gpu or not
+        
+        gpu_id       : int
+                       number refering to which gpu will be used
+                     
+        rfft_shape   : tuple
+                       real space shape of the reconstruction if AHA and b_vec are real-to-complex (rfft) half spectra, None for full spectra
+        
+        precision    : str
+                       'single' for float32/complex64 computation, 'double' for float64/complex128 computation
+        
+        tol          : float
+                       relative tolerance of the primal and dual residuals to stop the iterations early
+                       (||D*x - z|| <= tol*max(||D*x||, ||z||) and rho*||D^T*(z - z_prev)|| <= tol*rho*||D^T*u||), None to run itr iterations
+        
+        adaptive_rho : bool
+                       option to balance the primal and dual residuals by scaling rho (x2 or /2 when one residual exceeds the other 10 times)
+        
+        output_stats : bool
+                       option to return the iteration statistics as well
+        
+        workspace    : ADMM_TV_workspace
+                       preallocated buffers of the iterations, reused across solves of the same size (None: allocated for this solve)
+        
+        state        : dict
+                       solver state carried across solves of the same size (e.g. from one time point to the next), None to start cold;
+                       the iterations start from the splitting and dual variables ('z', 'y') of a filled state and store the final ones in it
+    
+    Returns
+    -------
+        mu_sample    : numpy.ndarray
+                       2D absorption reconstruction with the size of (Ny, Nx)
+                  
+        phi_sample   : numpy.ndarray
+                       2D phase reconstruction with the size of (Ny, Nx)
+        
+        stats        : dict
+                       iteration statistics (if output_stats is True) with 'iterations', 'converged',
+                       and the per-iteration 'primal_residual', 'dual_residual' and 'rho'
+    '''
+
+    # ADMM deconvolution with anisotropic TV regularization
+    
+    N, M = b_vec[0].shape if rfft_shape is None else rfft_shape
+    Dx = np.zeros((N, M)); Dx[0,0] = 1; Dx[0,-1] = -1;
+    Dy = np.zeros((N, M)); Dy[0,0] = 1; Dy[-1,0] = -1;
+
+    backend = array_backend(use_gpu, gpu_id, precision=precision)
+    xp = backend.xp
+    
+    fft2_xp = backend.fft.fft2 if rfft_shape is None else backend.fft.rfft2
+    
+    Dx = fft2_xp(backend.asarray(Dx, dtype=backend.float_dtype));
+    Dy = fft2_xp(backend.asarray(Dy, dtype=backend.float_dtype));
+
+    DTD = xp.conj(Dx)*Dx + xp.conj(Dy)*Dy
+    rho_term = rho*DTD
+
+    if workspace is None:
+        workspace = ADMM_TV_workspace()
+
+    z_para    = workspace.get('z_para', (4, N, M), backend.float_dtype, xp); z_para[...] = 0
+    u_para    = workspace.get('u_para', (4, N, M), backend.float_dtype, xp); u_para[...] = 0
+    D_vec     = workspace.get('D_vec', (4, N, M), backend.float_dtype, xp)
+    magnitude = workspace.get('magnitude', (4, N, M), backend.float_dtype, xp)
+    ratio     = workspace.get('ratio', (4, N, M), backend.float_dtype, xp)
+    b_vec_new = [workspace.get('b_vec_new_%d'%(k), Dx.shape, backend.complex_dtype, xp) for k in range(2)]
+    f_temp    = [workspace.get('f_temp_%d'%(k), Dx.shape, backend.complex_dtype, xp) for k in range(2)]
+    D_conj    = workspace.get('D_conj', (2,) + Dx.shape, backend.complex_dtype, xp)
+    xp.conj(Dx, out=D_conj[0]); xp.conj(Dy, out=D_conj[1])
+
+
+    AHA[0] = AHA[0] + rho_term
+    AHA[3] = AHA[3] + rho_term
+
+    determinant = AHA[0]*AHA[3] - AHA[1]*AHA[2]
+
+    _ADMM_TV_load_state(backend, state, z_para, u_para, rho)
+
+    track = tol is not None or adaptive_rho or output_stats
+    stats = {'iterations': 0, 'converged': False, 'primal_residual': [], 'dual_residual': [], 'rho': []}
+    if track:
+        z_prev = workspace.get('z_prev', z_para.shape, backend.float_dtype, xp)
+
+
+    for i in range(itr):
+
+        _ADMM_TV_rhs(xp, fft2_xp, b_vec[0], D_conj, z_para[:2], u_para[:2], rho, ratio[0], b_vec_new[0])
+        _ADMM_TV_rhs(xp, fft2_xp, b_vec[1], D_conj, z_para[2:], u_para[2:], rho, ratio[0], b_vec_new[1])
+
+        mu_sample, phi_sample = _Dual_variable_solve_inplace(xp, AHA, b_vec_new, determinant, f_temp)
+
+        if rfft_shape is None:
+            mu_sample = xp.real(backend.fft.ifft2(mu_sample))
+            phi_sample = xp.real(backend.fft.ifft2(phi_sample))
+        else:
+            mu_sample = backend.fft.irfft2(mu_sample, s=rfft_shape)
+            phi_sample = backend.fft.irfft2(phi_sample, s=rfft_shape)
+        
+
+        _forward_difference(mu_sample, 1, D_vec[0])
+        _forward_difference(mu_sample, 0, D_vec[1])
+        _forward_difference(phi_sample, 1, D_vec[2])
+        _forward_difference(phi_sample, 0, D_vec[3])
+
+
+        if track:
+            xp.copyto(z_prev, z_para)
+
+        _ADMM_TV_update(xp, D_vec, z_para, u_para, (lambda_u/rho, lambda_p/rho), magnitude, ratio)
+
+        if verbose:
+            print('Number of iteration computed (%d / %d)'%(i+1,itr))
+
+        if track:
+            residuals = _ADMM_TV_residuals(xp, D_vec, z_para, z_prev, u_para, rho, (1, 0, 1, 0))
+            converged, rho_scale = _ADMM_TV_convergence(stats, residuals, rho, tol, adaptive_rho)
+            if verbose:
+                print('primal residual: %.3e, dual residual: %.3e, rho: %.3e'%(residuals[0], residuals[1], rho))
+            if converged:
+                break
+            if rho_scale != 1:
+                AHA[0] = AHA[0] + (rho_scale-1)*rho*DTD
+                AHA[3] = AHA[3] + (rho_scale-1)*rho*DTD
+                determinant = AHA[0]*AHA[3] - AHA[1]*AHA[2]
+                rho *= rho_scale
+                u_para /= rho_scale
+
+    _ADMM_TV_save_state(state, z_para, u_para, rho)
+
+    if output_stats:
+        return backend.asnumpy(mu_sample), backend.asnumpy(phi_sample), stats
+    
+    return backend.asnumpy(mu_sample), backend.asnumpy(phi_sample)
+
+
+def Tikhonov_L_curve_spectral(S0_f_abs_square, H_eff_abs_square, reg_coeff, weights=None, chunk_size=2**18, use_gpu=False, gpu_id=0):
+    
+    '''
+    
+    evaluate the L curve of the single variable Tikhonov deconvolution for many regularization parameters at once
+    from the spectral sufficient statistics |S0_f|^2 and |H_eff|^2 (no reconstruction is formed)
+    
+        data norm: sum(|S0_f|^2 * (reg/(|H_eff|^2+reg))^2)
+        reg norm:  sum(|S0_f|^2 * |H_eff|^2/(|H_eff|^2+reg)^2)
+    
+    Parameters
+    ----------
+        S0_f_abs_square  : numpy.ndarray
+                           squared magnitude of the Fourier transform of the measurement with size of (Ny, Nx, Nz)
+                  
+        H_eff_abs_square : numpy.ndarray
+                           squared magnitude of the effective transfer function with size of (Ny, Nx, Nz)
+                     
+        reg_coeff        : numpy.ndarray
+                           Tikhonov regularization parameters with size of (N_reg,)
+        
+        weights          : numpy.ndarray
+                           multiplicity of each frequency in the full spectrum broadcastable to the size of S0_f_abs_square
+                           (e.g. half_spectrum_weights for rfft half spectra), None for full spectra
+        
+        chunk_size       : int
+                           number of spatial frequencies processed at once
+        
+        use_gpu          : bool
+                           option to use gpu or not
+        
+        gpu_id           : int
+                           number refering to which gpu will be used
+    
+    Returns
+    -------
+        data_norm        : numpy.ndarray
+                           log of the normalized squared data residual norm for each regularization parameter with size of (N_reg,)
+        
+        reg_norm         : numpy.ndarray
+                           log of the normalized squared reconstruction norm for each regularization parameter with size of (N_reg,)
+    '''
+    
+    xp = array_backend(use_gpu, gpu_id).xp
+    
+    if weights is None:
+        N_total = S0_f_abs_square.size
+    else:
+        N_total = int(xp.broadcast_to(weights, S0_f_abs_square.shape).sum())
+        S0_f_abs_square = S0_f_abs_square*weights
+    
+    w = S0_f_abs_square.reshape(-1)
+    h = H_eff_abs_square.reshape(-1)
+    reg_coeff = xp.atleast_1d(xp.asarray(reg_coeff, dtype='float64'))
+    
+    data_sum = xp.zeros(reg_coeff.shape)
+    reg_sum = xp.zeros(reg_coeff.shape)
+    
+    for start in range(0, w.size, chunk_size):
+        w_chunk = w[start:start+chunk_size].astype('float64')
+        h_chunk = h[start:start+chunk_size].astype('float64')
+        inv_denom_square = 1/(h_chunk[:,xp.newaxis] + reg_coeff[xp.newaxis,:])**2
+        data_sum += w_chunk @ inv_denom_square
+        reg_sum += (w_chunk*h_chunk) @ inv_denom_square
+    
+    data_norm = xp.log(reg_coeff**2 * data_sum / N_total)
+    reg_norm = xp.log(reg_sum / N_total)
+    
+    return data_norm, reg_norm
 
-    return mu_sample, phi_sample
 
 
 def Single_variable_Tikhonov_deconv_3D(S0_stack, H_eff, reg_re, use_gpu=False, gpu_id=0, autotune=False,
-                                       epsilon_auto=0.5, output_lambda = False, search_range_auto=6, verbose=True):
+                                       epsilon_auto=0.5, output_lambda = False, search_range_auto=6, verbose=True, real_fft=False, precision='double'):
     
     '''
     
@@ -901,6 +1547,7 @@ def Single_variable_Tikhonov_deconv_3D(S0_stack, H_eff, reg_re, use_gpu=False, g
         
         autotune         :  bool
                            option to use L-curve to automatically choose regularization parameter
+                           (the L curve is evaluated from the spectral statistics |S0_f|^2 and |H_eff|^2 with Tikhonov_L_curve_spectral)
         
         output_lambda   : bool
                           option to return the optimal L-curve value after assessment
@@ -913,6 +1560,12 @@ def Single_variable_Tikhonov_deconv_3D(S0_stack, H_eff, reg_re, use_gpu=False, g
                            
         verbose          : bool
                            option to display detailed progress of computations or not
+        
+        real_fft         : bool
+                           option to use real-to-complex FFTs, H_eff is then the rfft half spectrum with size of (Ny, Nx, Nz//2+1)
+        
+        precision        : str
+                           'single' for float32/complex64 computation, 'double' for float64/complex128 computation
     
     Returns
     -------
@@ -920,20 +1573,26 @@ def Single_variable_Tikhonov_deconv_3D(S0_stack, H_eff, reg_re, use_gpu=False, g
                            3D unscaled phase reconstruction with the size of (Ny, Nx, Nz)
                            (if using autotune) reconstruction for the automatically chosen parameter, plus two others around that parameter value, size (3, Ny, Nx, Nz)
     '''
-    if use_gpu:     
-        globals()['cp'] = __import__("cupy")
-        cp.cuda.Device(gpu_id).use()
-        S0_stack = cp.array(S0_stack.astype('float32'))
-        H_eff = cp.array(H_eff.astype('complex64'))
-        xp = cp
-    else:
-        xp = np
+    backend = array_backend(use_gpu, gpu_id, precision=precision)
+    xp = backend.xp
+    xp_fft = backend.fft
     
-    S0_stack_f = xp.fft.fftn(S0_stack, axes=(-3,-2,-1))
-    N,M,L = S0_stack_f.shape
+    if use_gpu:
+        S0_stack = S0_stack.astype('float32')
+        H_eff = H_eff.astype('complex64')
+    
+    S0_stack = backend.cast(backend.asarray(S0_stack))
+    H_eff = backend.cast(backend.asarray(H_eff))
+    
+    N,M,L = S0_stack.shape
+    S0_stack_f = xp_fft.rfftn(S0_stack, axes=(-3,-2,-1)) if real_fft else xp_fft.fftn(S0_stack, axes=(-3,-2,-1))
     H_eff_abs_square = xp.abs(H_eff)**2
     H_eff_conj = xp.conj(H_eff)
     
+    # spectral sufficient statistics of the L curve (the L curve is evaluated without forming reconstructions)
+    S0_f_abs_square = xp.abs(S0_stack_f)**2 if autotune else None
+    spectral_weights = half_spectrum_weights(L, use_gpu=use_gpu, gpu_id=gpu_id) if real_fft else None
+    
     # a "named tuple" representing a point on the L curve
         # allows for dot notation to access attributes
     Point_L_curve = namedtuple("Point_L_curve", "reg_x reg data_norm reg_norm f_real_f")
@@ -959,37 +1618,34 @@ def Single_variable_Tikhonov_deconv_3D(S0_stack, H_eff, reg_re, use_gpu=False, g
 
         # FT{f} (f=scattering potential (whose real part is (scaled) phase))
         f_real_f = S0_stack_f * H_eff_conj / (H_eff_abs_square + reg_coeff)
-        if use_gpu:
-            cp.get_default_memory_pool().free_all_blocks()
+        backend.free_memory()
         
         return f_real_f
     
-    # evaluate the L curve at a specific lambda
-        # returns a new Point_L_curve() tuple.
+    # evaluate the L curve at a set of lambdas in one pass over the spectral statistics
+        # returns a list of new Point_L_curve() tuples.
         # this function is the only place where new points are instantiated
-    def eval_L_curve(reg_x, keep_f_real_f=False):
-        f_real_f = compute_f_real_f(reg_x)
-        S0_est_stack_f = H_eff * f_real_f # Ax (put estimate through forward model)
+    def eval_L_curve_multi(reg_x_list):
+        reg_x_list = [float(reg_x) for reg_x in reg_x_list]
+        data_norm_eval, reg_norm_eval = Tikhonov_L_curve_spectral(S0_f_abs_square, H_eff_abs_square, 
+                                                                  10**xp.array(reg_x_list), weights=spectral_weights,
+                                                                  use_gpu=use_gpu, gpu_id=gpu_id)
 
-        data_norm_eval = xp.log(xp.linalg.norm(S0_est_stack_f - S0_stack_f)**2 /N/M/L)
-        reg_norm_eval = xp.log(xp.linalg.norm(f_real_f)**2 /N/M/L)
-        
-        if not keep_f_real_f:
-            f_real_f = None
-        if use_gpu:
-            cp.get_default_memory_pool().free_all_blocks()
-
-        return Point_L_curve(reg_x, 10**reg_x, data_norm_eval, reg_norm_eval, f_real_f)
+        return [Point_L_curve(reg_x, 10**reg_x, data_norm_eval[i], reg_norm_eval[i], None) for i, reg_x in enumerate(reg_x_list)]
+    
+    # evaluate the L curve at a specific lambda
+    def eval_L_curve(reg_x):
+        return eval_L_curve_multi([reg_x])[0]
 
     # creates return value of the whole function
         # (scaled) phase = real part of inverse FT {scattering potential}
     def ifft_f_real(f_real_f):
-        f_real = xp.real(xp.fft.ifftn(f_real_f, axes=(-3,-2,-1)))
-        if use_gpu:
-            cp.get_default_memory_pool().free_all_blocks()
-            return cp.asnumpy(f_real)
+        if real_fft:
+            f_real = xp_fft.irfftn(f_real_f, s=(N,M,L), axes=(-3,-2,-1))
         else:
-            return f_real
+            f_real = xp.real(xp_fft.ifftn(f_real_f, axes=(-3,-2,-1)))
+        backend.free_memory()
+        return backend.asnumpy(f_real)
     
     def calc_golden_x(a, b):
         gs_ratio = (1+xp.sqrt(5))/2
@@ -1005,9 +1661,7 @@ def Single_variable_Tikhonov_deconv_3D(S0_stack, H_eff, reg_re, use_gpu=False, g
         reg_x[2] = reg_x[0] + (reg_x[3]-reg_x[1])
 
         # holds the 4 current points
-        curr_pts = []
-        for i in range(4):
-            curr_pts.append(eval_L_curve(reg_x[i]))
+        curr_pts = eval_L_curve_multi(reg_x)
         
         last_opt = None # only save the last point to save GPU memory
         itr = 0
@@ -1073,7 +1727,7 @@ def Single_variable_Tikhonov_deconv_3D(S0_stack, H_eff, reg_re, use_gpu=False, g
 #     return f_real, opt_list # if wanted some kind of plotting option, could save all points visited
 
 
-def Dual_variable_Tikhonov_deconv_3D(AHA, b_vec, determinant=None, use_gpu=False, gpu_id=0, move_cpu=True):
+def Dual_variable_Tikhonov_deconv_3D(AHA, b_vec, determinant=None, use_gpu=False, gpu_id=0, move_cpu=True, rfft_shape=None, precision='double'):
     
     '''
     
@@ -1102,6 +1756,12 @@ def Dual_variable_Tikhonov_deconv_3D(AHA, b_vec, determinant=None, use_gpu=False
                      
         move_cpu    : bool
                       option to move the array from gpu to cpu
+                      
+        rfft_shape  : tuple
+                      real space shape of the reconstruction if AHA and b_vec are real-to-complex (rfft) half spectra, None for full spectra
+        
+        precision   : str
+                      'single' for float32/complex64 computation, 'double' for float64/complex128 computation
     
     Returns
     -------
@@ -1118,323 +1778,926 @@ def Dual_variable_Tikhonov_deconv_3D(AHA, b_vec, determinant=None, use_gpu=False
     f_real_f = (b_vec[0]*AHA[3] - b_vec[1]*AHA[1]) / determinant
     f_imag_f = (b_vec[1]*AHA[0] - b_vec[0]*AHA[2]) / determinant
 
+    backend = array_backend(use_gpu, gpu_id, precision=precision)
+    
+    if rfft_shape is None:
+        f_real = backend.xp.real(backend.fft.ifftn(f_real_f))
+        f_imag = backend.xp.real(backend.fft.ifftn(f_imag_f))
+    else:
+        f_real = backend.fft.irfftn(f_real_f, s=rfft_shape)
+        f_imag = backend.fft.irfftn(f_imag_f, s=rfft_shape)
+    
+    if move_cpu:
+        f_real = backend.asnumpy(f_real)
+        f_imag = backend.asnumpy(f_imag)
+
+    return f_real, f_imag
+
+
+
+def Single_variable_Tikhonov_deconv_3D_multi_reg(S0_stack, H_eff, reg_list, use_gpu=False, gpu_id=0, real_fft=False, precision='double'):
+    
+    '''
+    
+    Single variable 3D Tikhonov deconvolution for a list of regularization parameters.
+    The forward FFT of the stack and |H_eff|^2 are computed once and shared by all the regularization parameters,
+    the reconstructions are yielded one by one to bound the memory usage.
+    
+    Parameters
+    ----------
+        S0_stack         : numpy.ndarray
+                           S0 z-stack for 3D phase deconvolution with size of (Ny, Nx, Nz)
+                  
+        H_eff            : numpy.ndarray
+                           effective transfer function with size of (Ny, Nx, Nz)
+                     
+        reg_list         : list or numpy.ndarray
+                           Tikhonov regularization parameters with size of (N_reg,)
+        
+        use_gpu          : bool
+                           option to use gpu or not
+        
+        gpu_id           : int
+                           number refering to which gpu will be used
+        
+        real_fft         : bool
+                           option to use real-to-complex FFTs, H_eff is then the rfft half spectrum with size of (Ny, Nx, Nz//2+1)
+        
+        precision        : str
+                           'single' for float32/complex64 computation, 'double' for float64/complex128 computation
+    
+    Yields
+    ------
+        f_real           : numpy.ndarray
+                           3D unscaled phase reconstruction with the size of (Ny, Nx, Nz) for each regularization parameter in order
+    '''
+    
+    backend = array_backend(use_gpu, gpu_id, precision=precision)
+    xp = backend.xp
+    xp_fft = backend.fft
+    
     if use_gpu:
+        S0_stack = S0_stack.astype('float32')
+        H_eff = H_eff.astype('complex64')
+    
+    S0_stack = backend.cast(backend.asarray(S0_stack))
+    H_eff = backend.cast(backend.asarray(H_eff))
+    
+    S0_stack_f = xp_fft.rfftn(S0_stack, axes=(-3,-2,-1)) if real_fft else xp_fft.fftn(S0_stack, axes=(-3,-2,-1))
+    H_eff_abs_square = xp.abs(H_eff)**2
+    AH_S0_f = xp.conj(H_eff) * S0_stack_f
+    del S0_stack_f
+    
+    for reg in reg_list:
+        if real_fft:
+            f_real = xp_fft.irfftn(AH_S0_f / (H_eff_abs_square + reg), s=S0_stack.shape[-3:], axes=(-3,-2,-1))
+        else:
+            f_real = xp.real(xp_fft.ifftn(AH_S0_f / (H_eff_abs_square + reg), axes=(-3,-2,-1)))
         
-        globals()['cp'] = __import__("cupy")
-        cp.cuda.Device(gpu_id).use()
+        f_real = backend.asnumpy(f_real)
+        backend.free_memory()
+        
+        yield f_real
+    
+
+
+def Single_variable_ADMM_TV_deconv_3D(S0_stack, H_eff, rho, reg_re, lambda_re, itr, verbose, use_gpu=False, gpu_id=0, real_fft=False, precision='double', \
+                                      tol=None, adaptive_rho=False, output_stats=False, workspace=None, state=None):
+    
+    '''
+    
+    3D TV deconvolution to solve for phase with weak object transfer function
+    
+    ADMM formulation:
+        
+        0.5 * || A*x - b ||_2^2 + lambda * || z ||_1 + 0.5 * rho * || D*x - z + u ||_2^2
+    
+    Parameters
+    ----------
+        S0_stack     : numpy.ndarray
+                       S0 z-stack for 3D phase deconvolution with size of (Ny, Nx, Nz)
+                  
+        H_eff        : numpy.ndarray
+                       effective transfer function with size of (Ny, Nx, Nz)
+                     
+        reg_re       : float
+                       Tikhonov regularization parameter
+                     
+        rho          : float
+                       ADMM rho parameter
+        
+        lambda_re    : float
+                       TV regularization parameter for phase
+        
+        itr          : int
+                       number of iterations of ADMM algorithm
+        
+        verbose      : bool
+                       option to display progress of the computation
+        
+        use_gpu      : bool
+                       option to use gpu or not
+        
+        gpu_id       : int
+                       number refering to which gpu will be used
+                    
+        real_fft     : bool
+                       option to use real-to-complex FFTs, H_eff is then the rfft half spectrum with size of (Ny, Nx, Nz//2+1)
+        
+        precision    : str
+                       'single' for float32/complex64 computation, 'double' for float64/complex128 computation
+        
+        tol          : float
+                       relative tolerance of the primal and dual residuals to stop the iterations early
+                       (||D*x - z|| <= tol*max(||D*x||, ||z||) and rho*||D^T*(z - z_prev)|| <= tol*rho*||D^T*u||), None to run itr iterations
+        
+        adaptive_rho : bool
+                       option to balance the primal and dual residuals by scaling rho (x2 or /2 when one residual exceeds the other 10 times)
+        
+        output_stats : bool
+                       option to return the iteration statistics as well
+        
+        workspace    : ADMM_TV_workspace
+                       preallocated buffers of the iterations, reused across solves of the same size (None: allocated for this solve)
+        
+        state        : dict
+                       solver state carried across solves of the same size (e.g. from one time point to the next), None to start cold;
+                       the iterations start from the splitting and dual variables ('z', 'y') of a filled state and store the final ones in it
+    
+    Returns
+    -------
+        f_real       : numpy.ndarray
+                       3D unscaled phase reconstruction with the size of (Ny, Nx, Nz)
+        
+        stats        : dict
+                       iteration statistics (if output_stats is True) with 'iterations', 'converged',
+                       and the per-iteration 'primal_residual', 'dual_residual' and 'rho'
+    '''
+    
+    N, M, N_defocus = S0_stack.shape
+    
+    Dx = np.zeros((N, M, N_defocus)); Dx[0,0,0] = 1; Dx[0,-1,0] = -1;
+    Dy = np.zeros((N, M, N_defocus)); Dy[0,0,0] = 1; Dy[-1,0,0] = -1;
+    Dz = np.zeros((N, M, N_defocus)); Dz[0,0,0] = 1; Dz[0,0,-1] = -1;
+    
+    backend = array_backend(use_gpu, gpu_id, precision=precision)
+    xp = backend.xp
+    
+    if use_gpu:
+        S0_stack = S0_stack.astype('float32')
+        H_eff = H_eff.astype('complex64')
+    
+    fftn_xp = backend.fft.rfftn if real_fft else backend.fft.fftn
+    
+    S0_stack_f = fftn_xp(backend.cast(backend.asarray(S0_stack)), axes=(0,1,2))
+    H_eff = backend.cast(backend.asarray(H_eff))
+    
+    Dx = fftn_xp(backend.asarray(Dx, dtype=backend.float_dtype),axes=(0,1,2))
+    Dy = fftn_xp(backend.asarray(Dy, dtype=backend.float_dtype),axes=(0,1,2))
+    Dz = fftn_xp(backend.asarray(Dz, dtype=backend.float_dtype),axes=(0,1,2))
+
+    DTD      = xp.conj(Dx)*Dx + xp.conj(Dy)*Dy + xp.conj(Dz)*Dz
+    rho_term = rho*DTD+reg_re
+    AHA      = xp.abs(H_eff)**2 + rho_term
+    b_vec    = S0_stack_f * xp.conj(H_eff)
+
+    if workspace is None:
+        workspace = ADMM_TV_workspace()
+
+    z_para    = workspace.get('z_para', (3, N, M, N_defocus), backend.float_dtype, xp); z_para[...] = 0
+    u_para    = workspace.get('u_para', (3, N, M, N_defocus), backend.float_dtype, xp); u_para[...] = 0
+    D_vec     = workspace.get('D_vec', (3, N, M, N_defocus), backend.float_dtype, xp)
+    magnitude = workspace.get('magnitude', (3, N, M, N_defocus), backend.float_dtype, xp)
+    ratio     = workspace.get('ratio', (3, N, M, N_defocus), backend.float_dtype, xp)
+    b_vec_new = workspace.get('b_vec_new_0', b_vec.shape, backend.complex_dtype, xp)
+    D_conj    = workspace.get('D_conj', (3,) + b_vec.shape, backend.complex_dtype, xp)
+    xp.conj(Dx, out=D_conj[0]); xp.conj(Dy, out=D_conj[1]); xp.conj(Dz, out=D_conj[2])
+
+    _ADMM_TV_load_state(backend, state, z_para, u_para, rho)
+
+    track = tol is not None or adaptive_rho or output_stats
+    stats = {'iterations': 0, 'converged': False, 'primal_residual': [], 'dual_residual': [], 'rho': []}
+    if track:
+        z_prev = workspace.get('z_prev', (3, N, M, N_defocus), backend.float_dtype, xp)
+
+
+    for i in range(itr):
+        _ADMM_TV_rhs(xp, fftn_xp, b_vec, D_conj, z_para, u_para, rho, ratio[0], b_vec_new)
+        b_vec_new /= AHA
+
+
+        if real_fft:
+            f_real = backend.fft.irfftn(b_vec_new, s=(N, M, N_defocus), axes=(0,1,2))
+        else:
+            f_real = xp.real(backend.fft.ifftn(b_vec_new, axes=(0,1,2)))
+
+        _forward_difference(f_real, 1, D_vec[0])
+        _forward_difference(f_real, 0, D_vec[1])
+        _forward_difference(f_real, 2, D_vec[2])
+
+
+        if track:
+            xp.copyto(z_prev, z_para)
+
+        _ADMM_TV_update(xp, D_vec, z_para, u_para, (lambda_re/rho,), magnitude, ratio)
+
+        if verbose:
+            print('Number of iteration computed (%d / %d)'%(i+1,itr))
+
+        if track:
+            residuals = _ADMM_TV_residuals(xp, D_vec, z_para, z_prev, u_para, rho, (1, 0, 2))
+            converged, rho_scale = _ADMM_TV_convergence(stats, residuals, rho, tol, adaptive_rho)
+            if verbose:
+                print('primal residual: %.3e, dual residual: %.3e, rho: %.3e'%(residuals[0], residuals[1], rho))
+            if converged:
+                break
+            if rho_scale != 1:
+                AHA = AHA + (rho_scale-1)*rho*DTD
+                rho *= rho_scale
+                u_para /= rho_scale
+
+    _ADMM_TV_save_state(state, z_para, u_para, rho)
+
+    if output_stats:
+        return backend.asnumpy(f_real), stats
+                
+    return backend.asnumpy(f_real)
+
+
+def Dual_variable_ADMM_TV_deconv_3D(AHA, b_vec, rho, lambda_re, lambda_im, itr, verbose, use_gpu=False, gpu_id=0, rfft_shape=None, precision='double', \
+                                    tol=None, adaptive_rho=False, output_stats=False, workspace=None, state=None):
+    
+    '''
+    
+    3D TV deconvolution to solve for phase and absorption with weak object transfer function
+    
+    ADMM formulation:
+        
+        0.5 * || A*x - b ||_2^2 + lambda * || z ||_1 + 0.5 * rho * || D*x - z + u ||_2^2
+    
+    Parameters
+    ----------
+        AHA          : list
+                       A^H times A matrix stored with a list of 4 3D numpy array (4 diagonal matrices)
+                       | AHA[0]  AHA[1] |
+                       | AHA[2]  AHA[3] |
+                  
+        b_vec        : list
+                       measured intensity stored with a list of 2 3D numpy array (2 vectors)
+                       | b_vec[0] |
+                       | b_vec[1] |
+                     
+        rho          : float
+                       ADMM rho parameter
+        
+        lambda_re    : float
+                       TV regularization parameter for phase
+        
+        lambda_im    : float
+                       TV regularization parameter for absorption
+        
+        itr          : int
+                       number of iterations of ADMM algorithm
+        
+        verbose      : bool
+                       option to display progress of the computation
+        
+        use_gpu      : bool
+                       option to use gpu or not
+        
+        gpu_id       : int
+                       number refering to which gpu will be used
+                     
+        rfft_shape   : tuple
+                       real space shape of the reconstruction if AHA and b_vec are real-to-complex (rfft) half spectra, None for full spectra
+        
+        precision    : str
+                       'single' for float32/complex64 computation, 'double' for float64/complex128 computation
+        
+        tol          : float
+                       relative tolerance of the primal and dual residuals to stop the iterations early
+                       (||D*x - z|| <= tol*max(||D*x||, ||z||) and rho*||D^T*(z - z_prev)|| <= tol*rho*||D^T*u||), None to run itr iterations
+        
+        adaptive_rho : bool
+                       option to balance the primal and dual residuals by scaling rho (x2 or /2 when one residual exceeds the other 10 times)
+        
+        output_stats : bool
+                       option to return the iteration statistics as well
+        
+        workspace    : ADMM_TV_workspace
+                       preallocated buffers of the iterations, reused across solves of the same size (None: allocated for this solve)
+        
+        state        : dict
+                       solver state carried across solves of the same size (e.g. from one time point to the next), None to start cold;
+                       the iterations start from the splitting and dual variables ('z', 'y') of a filled state and store the final ones in it
+    
+    Returns
+    -------
+        f_real       : numpy.ndarray
+                       3D real scattering potential (unscaled phase) reconstruction with the size of (Ny, Nx, Nz)
+                  
+        f_imag       : numpy.ndarray
+                       3D imaginary scattering potential (unscaled absorption) reconstruction with the size of (Ny, Nx, Nz)
+        
+        stats        : dict
+                       iteration statistics (if output_stats is True) with 'iterations', 'converged',
+                       and the per-iteration 'primal_residual', 'dual_residual' and 'rho'
+    '''
+    
+
+    # ADMM deconvolution with anisotropic TV regularization
+    
+    N, M, L = b_vec[0].shape if rfft_shape is None else rfft_shape
+    Dx = np.zeros((N, M, L)); Dx[0,0,0] = 1; Dx[0,-1,0] = -1;
+    Dy = np.zeros((N, M, L)); Dy[0,0,0] = 1; Dy[-1,0,0] = -1;
+    Dz = np.zeros((N, M, L)); Dz[0,0,0] = 1; Dz[0,0,-1] = -1;
+    
+    backend = array_backend(use_gpu, gpu_id, precision=precision)
+    xp = backend.xp
+    
+    fftn_xp = backend.fft.fftn if rfft_shape is None else backend.fft.rfftn
+    
+    Dx = fftn_xp(backend.asarray(Dx, dtype=backend.float_dtype));
+    Dy = fftn_xp(backend.asarray(Dy, dtype=backend.float_dtype));
+    Dz = fftn_xp(backend.asarray(Dz, dtype=backend.float_dtype));
+
+    DTD = xp.conj(Dx)*Dx + xp.conj(Dy)*Dy + xp.conj(Dz)*Dz
+    rho_term = rho*DTD
+
+    if workspace is None:
+        workspace = ADMM_TV_workspace()
+
+    z_para    = workspace.get('z_para', (6, N, M, L), backend.float_dtype, xp); z_para[...] = 0
+    u_para    = workspace.get('u_para', (6, N, M, L), backend.float_dtype, xp); u_para[...] = 0
+    D_vec     = workspace.get('D_vec', (6, N, M, L), backend.float_dtype, xp)
+    magnitude = workspace.get('magnitude', (6, N, M, L), backend.float_dtype, xp)
+    ratio     = workspace.get('ratio', (6, N, M, L), backend.float_dtype, xp)
+    b_vec_new = [workspace.get('b_vec_new_%d'%(k), Dx.shape, backend.complex_dtype, xp) for k in range(2)]
+    f_temp    = [workspace.get('f_temp_%d'%(k), Dx.shape, backend.complex_dtype, xp) for k in range(2)]
+    D_conj    = workspace.get('D_conj', (3,) + Dx.shape, backend.complex_dtype, xp)
+    xp.conj(Dx, out=D_conj[0]); xp.conj(Dy, out=D_conj[1]); xp.conj(Dz, out=D_conj[2])
+
+
+    AHA[0] = AHA[0] + rho_term
+    AHA[3] = AHA[3] + rho_term
+
+    determinant = AHA[0]*AHA[3] - AHA[1]*AHA[2]
+
+    _ADMM_TV_load_state(backend, state, z_para, u_para, rho)
+
+    track = tol is not None or adaptive_rho or output_stats
+    stats = {'iterations': 0, 'converged': False, 'primal_residual': [], 'dual_residual': [], 'rho': []}
+    if track:
+        z_prev = workspace.get('z_prev', z_para.shape, backend.float_dtype, xp)
+
+
+    for i in range(itr):
+
+        _ADMM_TV_rhs(xp, fftn_xp, b_vec[0], D_conj, z_para[:3], u_para[:3], rho, ratio[0], b_vec_new[0])
+        _ADMM_TV_rhs(xp, fftn_xp, b_vec[1], D_conj, z_para[3:], u_para[3:], rho, ratio[0], b_vec_new[1])
+
+        f_real, f_imag = _Dual_variable_solve_inplace(xp, AHA, b_vec_new, determinant, f_temp)
+
+        if rfft_shape is None:
+            f_real = xp.real(backend.fft.ifftn(f_real))
+            f_imag = xp.real(backend.fft.ifftn(f_imag))
+        else:
+            f_real = backend.fft.irfftn(f_real, s=rfft_shape)
+            f_imag = backend.fft.irfftn(f_imag, s=rfft_shape)
+        
+
+        _forward_difference(f_real, 1, D_vec[0])
+        _forward_difference(f_real, 0, D_vec[1])
+        _forward_difference(f_real, 2, D_vec[2])
+        _forward_difference(f_imag, 1, D_vec[3])
+        _forward_difference(f_imag, 0, D_vec[4])
+        _forward_difference(f_imag, 2, D_vec[5])
+
+
+        if track:
+            xp.copyto(z_prev, z_para)
+
+        _ADMM_TV_update(xp, D_vec, z_para, u_para, (lambda_re/rho, lambda_im/rho), magnitude, ratio)
+
+        if verbose:
+            print('Number of iteration computed (%d / %d)'%(i+1,itr))
+
+        if track:
+            residuals = _ADMM_TV_residuals(xp, D_vec, z_para, z_prev, u_para, rho, (1, 0, 2, 1, 0, 2))
+            converged, rho_scale = _ADMM_TV_convergence(stats, residuals, rho, tol, adaptive_rho)
+            if verbose:
+                print('primal residual: %.3e, dual residual: %.3e, rho: %.3e'%(residuals[0], residuals[1], rho))
+            if converged:
+                break
+            if rho_scale != 1:
+                AHA[0] = AHA[0] + (rho_scale-1)*rho*DTD
+                AHA[3] = AHA[3] + (rho_scale-1)*rho*DTD
+                determinant = AHA[0]*AHA[3] - AHA[1]*AHA[2]
+                rho *= rho_scale
+                u_para /= rho_scale
+
+    _ADMM_TV_save_state(state, z_para, u_para, rho)
+
+    if output_stats:
+        return backend.asnumpy(f_real), backend.asnumpy(f_imag), stats
+
+    return backend.asnumpy(f_real), backend.asnumpy(f_imag)
+
+
+def _D_forward(xp, x, diff_axes):
+    
+    # finite differences of the stacked variables x, (n_var*n_dim, ...) components
+    
+    return xp.stack([x_k - xp.roll(x_k, -1, axis=axis) for x_k in x for axis in diff_axes])
+
+
+def _D_adjoint(xp, y, diff_axes, out):
+    
+    # adjoint of _D_forward in the buffer out (n_var, ...), one component at a time
+    
+    n_dim = len(diff_axes)
+    for k in range(len(out)):
+        out[k] = 0
+        for d, axis in enumerate(diff_axes):
+            y_k = y[k*n_dim + d]
+            first = [slice(None)]*y_k.ndim; first[axis] = 0
+            last  = [slice(None)]*y_k.ndim; last[axis] = -1
+            head  = [slice(None)]*y_k.ndim; head[axis] = slice(None, -1)
+            tail  = [slice(None)]*y_k.ndim; tail[axis] = slice(1, None)
+            out[k] += y_k
+            out[k][tuple(tail)] -= y_k[tuple(head)]
+            out[k][tuple(first)] -= y_k[tuple(last)]
+    
+    return out
+
+
+def _PD_TV_iterations(backend, AHA, b_vec, lambdas, shape, diff_axes, rho, itr, verbose, fft_xp, ifft_xp, 
+                      tol=None, adaptive_rho=False, output_stats=False, initial_guess=None, workspace=None, state=None):
+    
+    # Chambolle-Pock primal-dual iterations (Chambolle & Pock 2011, algorithm 1) of 
+    #     min_x 0.5 * x^H*AHA*x - Re(b^H*x) + sum_g lambda_g * || D*x_g ||_1
+    # with the exact spectral prox of the quadratic term and the finite differences D applied in real space:
+    #     x     = (I + tau*AHA)^-1 * (x - tau*D^T*y + tau*b)
+    #     y     = clip(y + sigma*D*(2*x - x_prev), -lambda, lambda)
+    # sigma = rho and tau = 1/(rho*||D||^2) (the step sizes of ADMM applied to the dual problem), ||D||^2 <= 4*n_dim
+    
+    xp     = backend.xp
+    n_var  = len(b_vec)
+    n_dim  = len(diff_axes)
+    sigma  = rho
+    tau    = 1/(rho*4*n_dim)
+    
+    if workspace is None:
+        workspace = ADMM_TV_workspace()
+    
+    x      = workspace.get('PD_x', (n_var,) + shape, backend.float_dtype, xp)
+    x_prev = workspace.get('PD_x_prev', (n_var,) + shape, backend.float_dtype, xp)
+    y      = workspace.get('PD_y', (n_var*n_dim,) + shape, backend.float_dtype, xp); y[...] = 0
+    D_x    = workspace.get('PD_D_x', (n_var*n_dim,) + shape, backend.float_dtype, xp)
+    temp   = workspace.get('PD_temp', (n_var,) + shape, backend.float_dtype, xp)
+    x_f    = [workspace.get('PD_x_f_%d'%(k), b_vec[0].shape, backend.complex_dtype, xp) for k in range(n_var)]
+    
+    # warm start from the primal and dual variables of a previous solve of the same size, or from an initial guess of x
+    warm_state = state is not None and state.get('x') is not None and tuple(state['y'].shape) == y.shape
+    if warm_state:
+        y[...] = backend.asarray(state['y'], dtype=y.dtype)
+    
+    if initial_guess is not None:
+        for k in range(n_var):
+            x[k] = backend.asarray(initial_guess[k])
+    elif warm_state:
+        x[...] = backend.asarray(state['x'], dtype=x.dtype)
+    else:
+        x[...] = 0
+    
+    def system_inverse(tau):
+        # (I + tau*AHA)^-1 per spatial frequency
+        if n_var == 1:
+            return [1/(1 + tau*AHA[0])]
+        determinant = (1 + tau*AHA[0])*(1 + tau*AHA[3]) - tau**2*AHA[1]*AHA[2]
+        return [(1 + tau*AHA[3])/determinant, -tau*AHA[1]/determinant, -tau*AHA[2]/determinant, (1 + tau*AHA[0])/determinant]
+    
+    inverse = system_inverse(tau)
+    
+    track = tol is not None or adaptive_rho or output_stats
+    stats = {'iterations': 0, 'converged': False, 'primal_residual': [], 'dual_residual': [], 'rho': []}
+    if track:
+        y_prev    = workspace.get('PD_y_prev', y.shape, backend.float_dtype, xp)
+        AHb_norm  = sum(float(xp.sum(ifft_xp(b_k)**2)) for b_k in b_vec)**0.5
+        round_off = y.size**0.5*float(xp.finfo(backend.float_dtype).eps)
+        alpha     = 0.5
+    
+    
+    for i in range(itr):
+        
+        xp.copyto(x_prev, x)
+        if track:
+            xp.copyto(y_prev, y)
+        
+        # primal step: x = (I + tau*AHA)^-1 * (x - tau*D^T*y + tau*b)
+        _D_adjoint(xp, y, diff_axes, temp)
+        temp *= tau
+        x -= temp
+        
+        v_f = [fft_xp(x[k]) for k in range(n_var)]
+        for k in range(n_var):
+            xp.multiply(b_vec[k], tau, out=x_f[k])
+            v_f[k] += x_f[k]
+        
+        if n_var == 1:
+            v_f[0] *= inverse[0]
+        else:
+            xp.multiply(inverse[0], v_f[0], out=x_f[0])
+            xp.multiply(inverse[1], v_f[1], out=x_f[1])
+            x_f[0] += x_f[1]
+            v_f[1] *= inverse[3]
+            v_f[0] *= inverse[2]
+            v_f[1] += v_f[0]
+            v_f[0] = x_f[0]
+        
+        for k in range(n_var):
+            x[k] = ifft_xp(v_f[k])
+        
+        # dual step: y = clip(y + sigma*D*(2*x - x_prev), -lambda, lambda)
+        xp.multiply(x, 2, out=temp)
+        temp -= x_prev
+        for k in range(n_var):
+            for d, axis in enumerate(diff_axes):
+                _forward_difference(temp[k], axis, D_x[k*n_dim + d])
+        D_x *= sigma
+        y += D_x
+        
+        for g, lambda_g in enumerate(lambdas):
+            xp.clip(y[g*n_dim:(g+1)*n_dim], -lambda_g, lambda_g, out=y[g*n_dim:(g+1)*n_dim])
+        
+        if verbose:
+            print('Number of iteration computed (%d / %d)'%(i+1,itr))
+        
+        if track:
+            # primal and dual residuals of the optimality conditions (Goldstein et al. 2015)
+            x_prev -= x
+            y_prev -= y
+            
+            _D_adjoint(xp, y_prev, diff_axes, temp)
+            primal_residual = float(xp.linalg.norm((x_prev/tau - temp).ravel()))
+            dual_residual   = float(xp.linalg.norm((y_prev/sigma - _D_forward(xp, x_prev, diff_axes)).ravel()))
+            primal_scale    = max(float(xp.linalg.norm(_D_adjoint(xp, y, diff_axes, temp).ravel())), AHb_norm)
+            dual_scale      = float(xp.linalg.norm(_D_forward(xp, x, diff_axes).ravel()))
+            
+            residuals = (primal_residual, dual_residual, primal_scale, dual_scale, round_off)
+            converged, _ = _ADMM_TV_convergence(stats, residuals, sigma, tol, False)
+            if verbose:
+                print('primal residual: %.3e, dual residual: %.3e, rho: %.3e'%(primal_residual, dual_residual, sigma))
+            if converged:
+                break
+            primal_relative, dual_relative = primal_residual/(primal_scale + round_off), dual_residual/(dual_scale + round_off)
+            if adaptive_rho and max(primal_relative, dual_relative) > 1.5*min(primal_relative, dual_relative):
+                # balancing of the relative residuals with decaying adaptivity (Goldstein et al. 2015), 
+                # a dominating primal residual calls for longer primal steps
+                step_scale = 1/(1 - alpha) if primal_relative > dual_relative else 1 - alpha
+                alpha     *= 0.95
+                tau       *= step_scale
+                sigma     /= step_scale
+                inverse    = system_inverse(tau)
+    
+    if state is not None:
+        state['x'] = x.copy()
+        state['y'] = y.copy()
+    
+    return [x[k].copy() for k in range(n_var)], stats
+
+
+
+def Dual_variable_PD_TV_deconv_2D(AHA, b_vec, rho, lambda_u, lambda_p, itr, verbose, use_gpu=False, gpu_id=0, rfft_shape=None, precision='double', \
+                                  tol=None, adaptive_rho=False, output_stats=False, initial_guess=None, workspace=None, state=None):
+    
+    '''
+    
+    2D TV deconvolution to solve for phase and absorption with weak object transfer function
+    with the primal-dual (Chambolle-Pock) algorithm, which runs 2 FFTs per variable and iteration (ADMM: 3)
+    
+    primal-dual formulation:
+        
+        min_x max_y 0.5 * || A*x - b ||_2^2 + < D*x, y > - I(|y| <= lambda)
+    
+    Parameters
+    ----------
+        AHA          : list
+                       A^H times A matrix stored with a list of 4 2D numpy array (4 diagonal matrices)
+                       | AHA[0]  AHA[1] |
+                       | AHA[2]  AHA[3] |
+                  
+        b_vec        : list
+                       measured intensity stored with a list of 2 2D numpy array (2 vectors)
+                       | b_vec[0] |
+                       | b_vec[1] |
+                     
+        rho          : float
+                       dual step size (the primal step size is 1/(8*rho)), equivalent to the ADMM rho parameter
+        
+        lambda_u     : float
+                       TV regularization parameter for absorption
+        
+        lambda_p     : float
+                       TV regularization parameter for phase
+        
+        itr          : int
+                       number of iterations of the primal-dual algorithm
+        
+        verbose      : bool
+                       option to display progress of the computation
+        
+        use_gpu      : bool
+                       option to use gpu or not
+        
+        gpu_id       : int
+                       number refering to which gpu will be used
+                     
+        rfft_shape   : tuple
+                       real space shape of the reconstruction if AHA and b_vec are real-to-complex (rfft) half spectra, None for full spectra
+        
+        precision    : str
+                       'single' for float32/complex64 computation, 'double' for float64/complex128 computation
+        
+        tol          : float
+                       relative tolerance of the primal and dual residuals to stop the iterations early
+                       (||(x_prev - x)/tau - D^T*(y_prev - y)|| <= tol*max(||D^T*y||, ||A^H*b||) and 
+                       ||(y_prev - y)/rho - D*(x_prev - x)|| <= tol*||D*x||), None to run itr iterations
+        
+        adaptive_rho : bool
+                       option to balance the primal and dual residuals by scaling the step sizes (with a decaying adaptivity)
+        
+        output_stats : bool
+                       option to return the iteration statistics as well
+        
+        initial_guess: tuple
+                       reconstruction(s) to start the iterations from (warm start, e.g. the solution of the previous time point), None to start from zeros
         
-        f_real = cp.real(cp.fft.ifftn(f_real_f))
-        f_imag = cp.real(cp.fft.ifftn(f_imag_f))
+        workspace    : ADMM_TV_workspace
+                       preallocated buffers of the iterations, reused across solves of the same size (None: allocated for this solve)
         
-        if move_cpu:
-            f_real = cp.asnumpy(f_real)
-            f_imag = cp.asnumpy(f_imag)
+        state        : dict
+                       solver state carried across solves of the same size (e.g. from one time point to the next), None to start cold;
+                       the iterations start from the primal and dual variables ('x', 'y') of a filled state (initial_guess takes precedence for x)
+                       and store the final ones in it
+    
+    Returns
+    -------
+        mu_sample    : numpy.ndarray
+                       2D absorption reconstruction with the size of (Ny, Nx)
+                  
+        phi_sample   : numpy.ndarray
+                       2D phase reconstruction with the size of (Ny, Nx)
         
+        stats        : dict
+                       iteration statistics (if output_stats is True) with 'iterations', 'converged',
+                       and the per-iteration 'primal_residual', 'dual_residual' and 'rho' (dual step size)
+    '''
+    
+    backend = array_backend(use_gpu, gpu_id, precision=precision)
+    
+    AHA   = [backend.cast(backend.asarray(AHA_k)) for AHA_k in AHA]
+    b_vec = [backend.cast(backend.asarray(b_k)) for b_k in b_vec]
+    
+    if rfft_shape is None:
+        shape   = b_vec[0].shape
+        fft_xp  = backend.fft.fft2
+        ifft_xp = lambda f_f: backend.xp.real(backend.fft.ifft2(f_f))
     else:
-        f_real = np.real(ifftn(f_real_f))
-        f_imag = np.real(ifftn(f_imag_f))
-
-    return f_real, f_imag
+        shape   = tuple(rfft_shape)
+        fft_xp  = backend.fft.rfft2
+        ifft_xp = lambda f_f: backend.fft.irfft2(f_f, s=shape)
+    
+    (mu_sample, phi_sample), stats = _PD_TV_iterations(backend, AHA, b_vec, (lambda_u, lambda_p), shape, (1, 0), rho, itr, verbose, 
+                                                       fft_xp, ifft_xp, tol=tol, adaptive_rho=adaptive_rho, output_stats=output_stats, 
+                                                       initial_guess=initial_guess, workspace=workspace, state=state)
+    
+    if output_stats:
+        return backend.asnumpy(mu_sample), backend.asnumpy(phi_sample), stats
+    
+    return backend.asnumpy(mu_sample), backend.asnumpy(phi_sample)
 
 
 
-def Single_variable_ADMM_TV_deconv_3D(S0_stack, H_eff, rho, reg_re, lambda_re, itr, verbose, use_gpu=False, gpu_id=0):
+def Single_variable_PD_TV_deconv_3D(S0_stack, H_eff, rho, reg_re, lambda_re, itr, verbose, use_gpu=False, gpu_id=0, real_fft=False, precision='double', \
+                                    tol=None, adaptive_rho=False, output_stats=False, initial_guess=None, workspace=None, state=None):
     
     '''
     
     3D TV deconvolution to solve for phase with weak object transfer function
+    with the primal-dual (Chambolle-Pock) algorithm, which runs 2 FFTs per iteration (ADMM: 4)
     
-    ADMM formulation:
+    primal-dual formulation:
         
-        0.5 * || A*x - b ||_2^2 + lambda * || z ||_1 + 0.5 * rho * || D*x - z + u ||_2^2
+        min_x max_y 0.5 * || A*x - b ||_2^2 + 0.5 * reg_re * || x ||_2^2 + < D*x, y > - I(|y| <= lambda)
     
     Parameters
     ----------
-        S0_stack  : numpy.ndarray
-                    S0 z-stack for 3D phase deconvolution with size of (Ny, Nx, Nz)
+        S0_stack     : numpy.ndarray
+                       S0 z-stack for 3D phase deconvolution with size of (Ny, Nx, Nz)
                   
-        H_eff     : numpy.ndarray
-                    effective transfer function with size of (Ny, Nx, Nz)
-                     
-        reg_re    : float
-                    Tikhonov regularization parameter
+        H_eff        : numpy.ndarray
+                       effective transfer function with size of (Ny, Nx, Nz)
                      
-        rho       : float
-                    ADMM rho parameter
+        rho          : float
+                       dual step size (the primal step size is 1/(12*rho)), equivalent to the ADMM rho parameter
         
-        lambda_re : float
-                    TV regularization parameter for phase
+        reg_re       : float
+                       Tikhonov regularization parameter
         
-        itr       : int
-                    number of iterations of ADMM algorithm
+        lambda_re    : float
+                       TV regularization parameter for phase
         
-        verbose   : bool
-                    option to display progress of the computation
+        itr          : int
+                       number of iterations of the primal-dual algorithm
         
-        use_gpu   : bool
-                    option to use gpu or not
+        verbose      : bool
+                       option to display progress of the computation
         
-        gpu_id    : int
-                    number refering to which gpu will be used
+        use_gpu      : bool
+                       option to use gpu or not
+        
+        gpu_id       : int
+                       number refering to which gpu will be used
+                    
+        real_fft     : bool
+                       option to use real-to-complex FFTs, H_eff is then the rfft half spectrum with size of (Ny, Nx, Nz//2+1)
+        
+        precision    : str
+                       'single' for float32/complex64 computation, 'double' for float64/complex128 computation
+        
+        tol          : float
+                       relative tolerance of the primal and dual residuals to stop the iterations early
+                       (||(x_prev - x)/tau - D^T*(y_prev - y)|| <= tol*max(||D^T*y||, ||A^H*b||) and 
+                       ||(y_prev - y)/rho - D*(x_prev - x)|| <= tol*||D*x||), None to run itr iterations
+        
+        adaptive_rho : bool
+                       option to balance the primal and dual residuals by scaling the step sizes (with a decaying adaptivity)
+        
+        output_stats : bool
+                       option to return the iteration statistics as well
+        
+        initial_guess: tuple
+                       reconstruction(s) to start the iterations from (warm start, e.g. the solution of the previous time point), None to start from zeros
+        
+        workspace    : ADMM_TV_workspace
+                       preallocated buffers of the iterations, reused across solves of the same size (None: allocated for this solve)
+        
+        state        : dict
+                       solver state carried across solves of the same size (e.g. from one time point to the next), None to start cold;
+                       the iterations start from the primal and dual variables ('x', 'y') of a filled state (initial_guess takes precedence for x)
+                       and store the final ones in it
     
     Returns
     -------
-        f_real    : numpy.ndarray
-                    3D unscaled phase reconstruction with the size of (Ny, Nx, Nz)
+        f_real       : numpy.ndarray
+                       3D unscaled phase reconstruction with the size of (Ny, Nx, Nz)
+        
+        stats        : dict
+                       iteration statistics (if output_stats is True) with 'iterations', 'converged',
+                       and the per-iteration 'primal_residual', 'dual_residual' and 'rho' (dual step size)
     '''
     
-    N, M, N_defocus = S0_stack.shape
-    
-    Dx = np.zeros((N, M, N_defocus)); Dx[0,0,0] = 1; Dx[0,-1,0] = -1;
-    Dy = np.zeros((N, M, N_defocus)); Dy[0,0,0] = 1; Dy[-1,0,0] = -1;
-    Dz = np.zeros((N, M, N_defocus)); Dz[0,0,0] = 1; Dz[0,0,-1] = -1;
+    backend = array_backend(use_gpu, gpu_id, precision=precision)
+    xp = backend.xp
     
     if use_gpu:
-        
-        globals()['cp'] = __import__("cupy")
-        cp.cuda.Device(gpu_id).use()
-        
-        S0_stack_f = cp.fft.fftn(cp.array(S0_stack.astype('float32')), axes=(0,1,2))
-        H_eff = cp.array(H_eff.astype('complex64'))
-        
-        Dx = cp.fft.fftn(cp.array(Dx),axes=(0,1,2))
-        Dy = cp.fft.fftn(cp.array(Dy),axes=(0,1,2))
-        Dz = cp.fft.fftn(cp.array(Dz),axes=(0,1,2))
-
-        rho_term = rho*(cp.conj(Dx)*Dx + cp.conj(Dy)*Dy + cp.conj(Dz)*Dz)+reg_re
-        AHA      = cp.abs(H_eff)**2 + rho_term
-        b_vec    = S0_stack_f * cp.conj(H_eff)
-
-        z_para = cp.zeros((3, N, M, N_defocus))
-        u_para = cp.zeros((3, N, M, N_defocus))
-        D_vec  = cp.zeros((3, N, M, N_defocus))
-
-
-
-
-        for i in range(itr):
-            v_para    = cp.fft.fftn(z_para - u_para, axes=(1,2,3))
-            b_vec_new = b_vec + rho*(cp.conj(Dx)*v_para[0] + cp.conj(Dy)*v_para[1] + cp.conj(Dz)*v_para[2])
-
-
-            f_real = cp.real(cp.fft.ifftn(b_vec_new / AHA, axes=(0,1,2)))
-
-            D_vec[0] = f_real - cp.roll(f_real, -1, axis=1)
-            D_vec[1] = f_real - cp.roll(f_real, -1, axis=0)
-            D_vec[2] = f_real - cp.roll(f_real, -1, axis=2)
-
-
-            z_para = D_vec + u_para
-
-            z_para = softTreshold(z_para, lambda_re/rho, use_gpu=True, gpu_id=gpu_id)
-
-            u_para += D_vec - z_para
-
-            if verbose:
-                print('Number of iteration computed (%d / %d)'%(i+1,itr))
-
-            if i == itr-1:
-                f_real = cp.asnumpy(f_real)
+        S0_stack = S0_stack.astype('float32')
+        H_eff = H_eff.astype('complex64')
     
+    shape = S0_stack.shape
+    
+    if real_fft:
+        fft_xp  = lambda f: backend.fft.rfftn(f, axes=(0,1,2))
+        ifft_xp = lambda f_f: backend.fft.irfftn(f_f, s=shape, axes=(0,1,2))
     else:
-        
-        S0_stack_f = fftn(S0_stack, axes=(0,1,2))
-        
-        Dx = fftn(Dx,axes=(0,1,2));
-        Dy = fftn(Dy,axes=(0,1,2));
-        Dz = fftn(Dz,axes=(0,1,2));
-
-        rho_term = rho*(np.conj(Dx)*Dx + np.conj(Dy)*Dy + np.conj(Dz)*Dz)+reg_re
-        AHA      = np.abs(H_eff)**2 + rho_term
-        b_vec    = S0_stack_f * np.conj(H_eff)
-
-        z_para = np.zeros((3, N, M, N_defocus))
-        u_para = np.zeros((3, N, M, N_defocus))
-        D_vec  = np.zeros((3, N, M, N_defocus))
-
-
-        for i in range(itr):
-            v_para    = fftn(z_para - u_para, axes=(1,2,3))
-            b_vec_new = b_vec + rho*(np.conj(Dx)*v_para[0] + np.conj(Dy)*v_para[1] + np.conj(Dz)*v_para[2])
-
-
-            f_real = np.real(ifftn(b_vec_new / AHA, axes=(0,1,2)))
-
-            D_vec[0] = f_real - np.roll(f_real, -1, axis=1)
-            D_vec[1] = f_real - np.roll(f_real, -1, axis=0)
-            D_vec[2] = f_real - np.roll(f_real, -1, axis=2)
-
-
-            z_para = D_vec + u_para
-
-            z_para = softTreshold(z_para, lambda_re/rho)
-
-            u_para += D_vec - z_para
+        fft_xp  = lambda f: backend.fft.fftn(f, axes=(0,1,2))
+        ifft_xp = lambda f_f: xp.real(backend.fft.ifftn(f_f, axes=(0,1,2)))
+    
+    H_eff = backend.cast(backend.asarray(H_eff))
+    AHA   = [xp.abs(H_eff)**2 + reg_re]
+    b_vec = [fft_xp(backend.cast(backend.asarray(S0_stack))) * xp.conj(H_eff)]
+    
+    (f_real,), stats = _PD_TV_iterations(backend, AHA, b_vec, (lambda_re,), shape, (1, 0, 2), rho, itr, verbose, 
+                                         fft_xp, ifft_xp, tol=tol, adaptive_rho=adaptive_rho, output_stats=output_stats, 
+                                         initial_guess=None if initial_guess is None else (initial_guess,), workspace=workspace, state=state)
+    
+    if output_stats:
+        return backend.asnumpy(f_real), stats
+    
+    return backend.asnumpy(f_real)
 
-            if verbose:
-                print('Number of iteration computed (%d / %d)'%(i+1,itr))
-                
-    return f_real
 
 
-def Dual_variable_ADMM_TV_deconv_3D(AHA, b_vec, rho, lambda_re, lambda_im, itr, verbose, use_gpu=False, gpu_id=0):
+def Dual_variable_PD_TV_deconv_3D(AHA, b_vec, rho, lambda_re, lambda_im, itr, verbose, use_gpu=False, gpu_id=0, rfft_shape=None, precision='double', \
+                                  tol=None, adaptive_rho=False, output_stats=False, initial_guess=None, workspace=None, state=None):
     
     '''
     
     3D TV deconvolution to solve for phase and absorption with weak object transfer function
+    with the primal-dual (Chambolle-Pock) algorithm, which runs 2 FFTs per variable and iteration (ADMM: 4)
     
-    ADMM formulation:
+    primal-dual formulation:
         
-        0.5 * || A*x - b ||_2^2 + lambda * || z ||_1 + 0.5 * rho * || D*x - z + u ||_2^2
+        min_x max_y 0.5 * || A*x - b ||_2^2 + < D*x, y > - I(|y| <= lambda)
     
     Parameters
     ----------
-        AHA        : list
-                     A^H times A matrix stored with a list of 4 3D numpy array (4 diagonal matrices)
-                     | AHA[0]  AHA[1] |
-                     | AHA[2]  AHA[3] |
+        AHA          : list
+                       A^H times A matrix stored with a list of 4 3D numpy array (4 diagonal matrices)
+                       | AHA[0]  AHA[1] |
+                       | AHA[2]  AHA[3] |
                   
-        b_vec      : list
-                     measured intensity stored with a list of 2 3D numpy array (2 vectors)
-                     | b_vec[0] |
-                     | b_vec[1] |
+        b_vec        : list
+                       measured intensity stored with a list of 2 3D numpy array (2 vectors)
+                       | b_vec[0] |
+                       | b_vec[1] |
                      
-        rho        : float
-                     ADMM rho parameter
+        rho          : float
+                       dual step size (the primal step size is 1/(12*rho)), equivalent to the ADMM rho parameter
         
-        lambda_re  : float
-                     TV regularization parameter for phase
+        lambda_re    : float
+                       TV regularization parameter for phase
         
-        lambda_im  : float
-                     TV regularization parameter for absorption
+        lambda_im    : float
+                       TV regularization parameter for absorption
         
-        itr        : int
-                     number of iterations of ADMM algorithm
+        itr          : int
+                       number of iterations of the primal-dual algorithm
         
-        verbose    : bool
-                     option to display progress of the computation
+        verbose      : bool
+                       option to display progress of the computation
         
-        use_gpu    : bool
-                     option to use gpu or not
+        use_gpu      : bool
+                       option to use gpu or not
         
-        gpu_id     : int
-                     number refering to which gpu will be used
+        gpu_id       : int
+                       number refering to which gpu will be used
+                     
+        rfft_shape   : tuple
+                       real space shape of the reconstruction if AHA and b_vec are real-to-complex (rfft) half spectra, None for full spectra
+        
+        precision    : str
+                       'single' for float32/complex64 computation, 'double' for float64/complex128 computation
+        
+        tol          : float
+                       relative tolerance of the primal and dual residuals to stop the iterations early
+                       (||(x_prev - x)/tau - D^T*(y_prev - y)|| <= tol*max(||D^T*y||, ||A^H*b||) and 
+                       ||(y_prev - y)/rho - D*(x_prev - x)|| <= tol*||D*x||), None to run itr iterations
+        
+        adaptive_rho : bool
+                       option to balance the primal and dual residuals by scaling the step sizes (with a decaying adaptivity)
+        
+        output_stats : bool
+                       option to return the iteration statistics as well
+        
+        initial_guess: tuple
+                       reconstruction(s) to start the iterations from (warm start, e.g. the solution of the previous time point), None to start from zeros
+        
+        workspace    : ADMM_TV_workspace
+                       preallocated buffers of the iterations, reused across solves of the same size (None: allocated for this solve)
+        
+        state        : dict
+                       solver state carried across solves of the same size (e.g. from one time point to the next), None to start cold;
+                       the iterations start from the primal and dual variables ('x', 'y') of a filled state (initial_guess takes precedence for x)
+                       and store the final ones in it
     
     Returns
     -------
-        f_real     : numpy.ndarray
-                     3D real scattering potential (unscaled phase) reconstruction with the size of (Ny, Nx, Nz)
+        f_real       : numpy.ndarray
+                       3D real scattering potential (unscaled phase) reconstruction with the size of (Ny, Nx, Nz)
                   
-        f_imag     : numpy.ndarray
-                     3D imaginary scattering potential (unscaled absorption) reconstruction with the size of (Ny, Nx, Nz)
+        f_imag       : numpy.ndarray
+                       3D imaginary scattering potential (unscaled absorption) reconstruction with the size of (Ny, Nx, Nz)
+        
+        stats        : dict
+                       iteration statistics (if output_stats is True) with 'iterations', 'converged',
+                       and the per-iteration 'primal_residual', 'dual_residual' and 'rho' (dual step size)
     '''
     
-
-    # ADMM deconvolution with anisotropic TV regularization
+    backend = array_backend(use_gpu, gpu_id, precision=precision)
     
-    N, M, L = b_vec[0].shape
-    Dx = np.zeros((N, M, L)); Dx[0,0,0] = 1; Dx[0,-1,0] = -1;
-    Dy = np.zeros((N, M, L)); Dy[0,0,0] = 1; Dy[-1,0,0] = -1;
-    Dz = np.zeros((N, M, L)); Dz[0,0,0] = 1; Dz[0,0,-1] = -1;
+    AHA   = [backend.cast(backend.asarray(AHA_k)) for AHA_k in AHA]
+    b_vec = [backend.cast(backend.asarray(b_k)) for b_k in b_vec]
     
-
-    if use_gpu:
-        
-        globals()['cp'] = __import__("cupy")
-        cp.cuda.Device(gpu_id).use()
-        
-        Dx = cp.fft.fftn(cp.array(Dx));
-        Dy = cp.fft.fftn(cp.array(Dy));
-        Dz = cp.fft.fftn(cp.array(Dz));
-
-        rho_term = rho*(cp.conj(Dx)*Dx + cp.conj(Dy)*Dy + cp.conj(Dz)*Dz)
-
-        z_para = cp.zeros((6, N, M, L))
-        u_para = cp.zeros((6, N, M, L))
-        D_vec = cp.zeros((6, N, M, L))
-
-
+    if rfft_shape is None:
+        shape   = b_vec[0].shape
+        fft_xp  = backend.fft.fftn
+        ifft_xp = lambda f_f: backend.xp.real(backend.fft.ifftn(f_f))
     else:
-        Dx = fftn(Dx);
-        Dy = fftn(Dy);
-        Dz = fftn(Dz);
-
-        rho_term = rho*(np.conj(Dx)*Dx + np.conj(Dy)*Dy + np.conj(Dz)*Dz)
-
-        z_para = np.zeros((6, N, M, L))
-        u_para = np.zeros((6, N, M, L))
-        D_vec = np.zeros((6, N, M, L))
-
-
-    AHA[0] = AHA[0] + rho_term
-    AHA[3] = AHA[3] + rho_term
-
-    determinant = AHA[0]*AHA[3] - AHA[1]*AHA[2]
-
-
-    for i in range(itr):
-
-
-        if use_gpu:
-
-            v_para = cp.fft.fftn(z_para - u_para,axes=(1,2,3))
-            b_vec_new = [b_vec[0] + rho*(cp.conj(Dx)*v_para[0] + cp.conj(Dy)*v_para[1] + cp.conj(Dz)*v_para[2]),\
-                         b_vec[1] + rho*(cp.conj(Dx)*v_para[3] + cp.conj(Dy)*v_para[4] + cp.conj(Dz)*v_para[5])]
-
-            f_real, f_imag = Dual_variable_Tikhonov_deconv_3D(AHA, b_vec_new, determinant=determinant, \
-                                                                     use_gpu=use_gpu, gpu_id=gpu_id, move_cpu=not use_gpu)
-            
-
-            D_vec[0] = f_real - cp.roll(f_real, -1, axis=1)
-            D_vec[1] = f_real - cp.roll(f_real, -1, axis=0)
-            D_vec[2] = f_real - cp.roll(f_real, -1, axis=2)
-            D_vec[3] = f_imag - cp.roll(f_imag, -1, axis=1)
-            D_vec[4] = f_imag - cp.roll(f_imag, -1, axis=0)
-            D_vec[5] = f_imag - cp.roll(f_imag, -1, axis=2)
-
-
-            z_para = D_vec + u_para
-
-            z_para[:3,:,:] = softTreshold(z_para[:3,:,:], lambda_re/rho, use_gpu=True, gpu_id=gpu_id)
-            z_para[3:,:,:] = softTreshold(z_para[3:,:,:], lambda_im/rho, use_gpu=True, gpu_id=gpu_id)
-
-            u_para += D_vec - z_para
-
-            if i == itr-1:
-                f_real  = cp.asnumpy(f_real)
-                f_imag = cp.asnumpy(f_imag)
-
-
-
-
-        else:
-            
-            v_para = fftn(z_para - u_para,axes=(1,2,3))
-            b_vec_new = [b_vec[0] + rho*(np.conj(Dx)*v_para[0] + np.conj(Dy)*v_para[1] + np.conj(Dz)*v_para[2]),\
-                         b_vec[1] + rho*(np.conj(Dx)*v_para[3] + np.conj(Dy)*v_para[4] + np.conj(Dz)*v_para[5])]
-
-            
-            f_real, f_imag = Dual_variable_Tikhonov_deconv_3D(AHA, b_vec_new, determinant=determinant)
-            
-            
-            D_vec[0] = f_real - np.roll(f_real, -1, axis=1)
-            D_vec[1] = f_real - np.roll(f_real, -1, axis=0)
-            D_vec[2] = f_real - np.roll(f_real, -1, axis=2)
-            D_vec[3] = f_imag - np.roll(f_imag, -1, axis=1)
-            D_vec[4] = f_imag - np.roll(f_imag, -1, axis=0)
-            D_vec[5] = f_imag - np.roll(f_imag, -1, axis=2)
-            
-            z_para = D_vec + u_para
-
-            z_para[:3,:,:] = softTreshold(z_para[:3,:,:], lambda_re/rho)
-            z_para[3:,:,:] = softTreshold(z_para[3:,:,:], lambda_im/rho)
-
-            u_para += D_vec - z_para
-
-        if verbose:
-            print('Number of iteration computed (%d / %d)'%(i+1,itr))
+        shape   = tuple(rfft_shape)
+        fft_xp  = backend.fft.rfftn
+        ifft_xp = lambda f_f: backend.fft.irfftn(f_f, s=shape)
+    
+    (f_real, f_imag), stats = _PD_TV_iterations(backend, AHA, b_vec, (lambda_re, lambda_im), shape, (1, 0, 2), rho, itr, verbose, 
+                                                fft_xp, ifft_xp, tol=tol, adaptive_rho=adaptive_rho, output_stats=output_stats, 
+                                                initial_guess=initial_guess, workspace=workspace, state=state)
+    
+    if output_stats:
+        return backend.asnumpy(f_real), backend.asnumpy(f_imag), stats
+    
+    return backend.asnumpy(f_real), backend.asnumpy(f_imag)
 
-    return f_real, f_imag
 
 
 def cylindrical_shell_local_orientation(VOI, ps, psz, scale, beta=0.5, c_para=0.5, evec_idx = 0):
@@ -1738,6 +3001,123 @@ def generate_sub_FOV_coordinates(img_size, img_space, overlap):
 
 
 
+def generate_tile_coordinates(img_size, tile_size, overlap):
+    
+    '''
+    
+    calculate the starting pixel indices of overlapping tiles covering the full image
+    (the last tile of each row/column is aligned to the image edge, so no pixel is left out)
+    
+    Parameters
+    ----------
+        img_size  : tuple or list
+                    the original size of the image in the format of (Ny, Nx)
+                            
+        tile_size : tuple or list
+                    the size of the tiles in the format of (Ny, Nx)
+        
+        overlap   : tuple or list
+                    the minimal number of overlapping pixels between neighboring tiles in the format of (Ny, Nx)
+        
+        
+    Returns
+    -------
+        ns        : numpy.ndarray
+                    the starting pixel indices of the tile rows in y direction
+                  
+        ms        : numpy.ndarray
+                    the starting pixel indices of the tile columns in x direction
+
+    '''
+    
+    ns = generate_tile_starts(img_size[0], tile_size[0], overlap[0])
+    ms = generate_tile_starts(img_size[1], tile_size[1], overlap[1])
+    
+    return ns, ms
+
+
+
+def generate_tile_starts(N_full, Ns, N_overlap):
+    
+    '''
+    
+    calculate the starting indices of overlapping tiles covering one axis of the full image
+    (the last tile is aligned to the image edge)
+    
+    Parameters
+    ----------
+        N_full    : int
+                    the original size of the image along the axis
+                            
+        Ns        : int
+                    the size of the tiles along the axis
+        
+        N_overlap : int
+                    the minimal number of overlapping pixels between neighboring tiles
+        
+        
+    Returns
+    -------
+        starts    : numpy.ndarray
+                    the starting indices of the tiles
+
+    '''
+    
+    if Ns > N_full:
+        raise ValueError('tile size %d is larger than the image size %d'%(Ns, N_full))
+    if N_overlap >= Ns:
+        raise ValueError('overlap %d must be smaller than the tile size %d'%(N_overlap, Ns))
+    
+    return np.array(list(range(0, N_full-Ns, Ns-N_overlap)) + [N_full-Ns])
+
+
+
+def tile_blending_weights(starts, Ns, N_full, N_overlap):
+    
+    '''
+    
+    calculate the alpha-blending weights of overlapping tiles along one axis (linear ramps over the overlaps),
+    normalized such that the weights of all the tiles add up to one at every pixel
+    
+    Parameters
+    ----------
+        starts    : numpy.ndarray
+                    the starting indices of the tiles (generate_tile_starts)
+                            
+        Ns        : int
+                    the size of the tiles along the axis
+        
+        N_full    : int
+                    the original size of the image along the axis
+        
+        N_overlap : int
+                    the number of pixels of the blending ramps
+        
+        
+    Returns
+    -------
+        weights   : list
+                    the blending weights of each tile with the size of (Ns,)
+
+    '''
+    
+    ramp_list = []
+    for start in starts:
+        ramp = np.ones(Ns)
+        if start > 0 and N_overlap > 0:
+            ramp[:N_overlap] = (np.r_[:N_overlap]+1)/(N_overlap+1)
+        if start+Ns < N_full and N_overlap > 0:
+            ramp[-N_overlap:] = np.minimum(ramp[-N_overlap:], (np.r_[N_overlap:0:-1])/(N_overlap+1))
+        ramp_list.append(ramp)
+    
+    ramp_sum = np.zeros(N_full)
+    for start, ramp in zip(starts, ramp_list):
+        ramp_sum[start:start+Ns] += ramp
+    
+    return [ramp/ramp_sum[start:start+Ns] for start, ramp in zip(starts, ramp_list)]
+
+
+
 def image_stitching(coord_list, overlap, file_loading_func, gen_ref_map=True, ref_stitch=None):
     
     '''
@@ -2081,4 +3461,107 @@ def orientation_3D_continuity_map(azimuth, theta, psz_ps_ratio=None, avg_px_size
     retardance_pr_avg /= np.max(retardance_pr_avg)
     
     
-    return retardance_pr_avg
\ No newline at end of file
+    return retardance_pr_avg
+
+def gen_transfer_function_cache_key(parameters):
+    
+    '''
+    
+    generate a content-addressed key for the transfer function cache from the system parameters
+    
+    Parameters
+    ----------
+        parameters : dict
+                     dictionary of the parameters determining the transfer functions
+                     (numbers, strings, None, tuples/lists or numpy.ndarray)
+        
+    Returns
+    -------
+        key        : str
+                     hexadecimal sha256 digest of the parameters and the waveorder version
+
+    '''
+    
+    from . import __version__
+    
+    hasher = hashlib.sha256()
+    hasher.update(('waveorder-' + __version__).encode())
+    
+    for name in sorted(parameters):
+        value = parameters[name]
+        hasher.update(name.encode())
+        if isinstance(value, np.ndarray) or isinstance(value, (list, tuple)):
+            value = np.ascontiguousarray(value)
+            hasher.update((str(value.dtype) + str(value.shape)).encode())
+            hasher.update(value.tobytes())
+        else:
+            hasher.update(repr(value).encode())
+    
+    return hasher.hexdigest()
+
+
+def save_transfer_function_cache(cache_path, transfer_functions):
+    
+    '''
+    
+    save transfer functions to the on-disk cache as one .npy file per array
+    the arrays are first written to a temporary directory that is renamed once complete,
+    such that concurrent writers never expose a partially written cache entry
+    
+    Parameters
+    ----------
+        cache_path         : str
+                             directory of the cache entry
+        
+        transfer_functions : dict
+                             dictionary of the transfer function arrays to save
+        
+    '''
+    
+    if os.path.isdir(cache_path):
+        return
+    
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix='.tmp_', dir=os.path.dirname(cache_path))
+    
+    try:
+        for name, array in transfer_functions.items():
+            np.save(os.path.join(tmp_path, name + '.npy'), array)
+        os.rename(tmp_path, cache_path)
+    except OSError:
+        # another process completed the same cache entry first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if not os.path.isdir(cache_path):
+            raise
+    
+    
+def load_transfer_function_cache(cache_path, mmap_mode='r'):
+    
+    '''
+    
+    load transfer functions from the on-disk cache
+    
+    Parameters
+    ----------
+        cache_path         : str
+                             directory of the cache entry
+        
+        mmap_mode          : str or None
+                             memory-map mode passed to numpy.load ('r' maps the arrays read-only, None loads them into memory)
+        
+    Returns
+    -------
+        transfer_functions : dict or None
+                             dictionary of the cached transfer function arrays, None if the cache entry does not exist
+
+    '''
+    
+    if not os.path.isdir(cache_path):
+        return None
+    
+    transfer_functions = {}
+    for file_name in sorted(os.listdir(cache_path)):
+        if file_name.endswith('.npy'):
+            transfer_functions[file_name[:-4]] = np.load(os.path.join(cache_path, file_name), mmap_mode=mmap_mode)
+    
+    return transfer_functions
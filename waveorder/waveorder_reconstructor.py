@@ -3,13 +3,17 @@ import matplotlib.pyplot as plt
 import itertools
 import time
 import os
-from numpy.fft import fft, ifft, fft2, ifft2, fftn, ifftn, fftshift, ifftshift
+import shutil
+import tempfile
+import threading
+from .fft_backend import fft, ifft, fft2, ifft2, fftn, ifftn, rfft2, irfft2, rfftn, irfftn, fftshift, ifftshift
 from IPython import display
 from scipy.ndimage import uniform_filter
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from .util import *
 from .optics import *
 from .background_estimator import *
+from .array_backend import array_backend
 
 def intensity_mapping(img_stack):
     img_stack_out = np.zeros_like(img_stack)
@@ -133,6 +137,34 @@ def instrument_matrix_calibration(I_cali_norm, I_meas):
 
 
 
+def _import_shared_memory():
+    
+    # multiprocessing.shared_memory only exists from Python 3.8, it is imported when the transfer functions are shared
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        raise ImportError('sharing the transfer functions requires multiprocessing.shared_memory (Python 3.8 or later)')
+    
+    return shared_memory
+
+
+
+class _kz_major_writer:
+    
+    # array-like receiving the (N, M, N_kz) transfer functions of one pattern, indexed by (Stokes index, component index),
+    # and writing them into the kz-major array H_kz with the size of (N_kz, N_Stokes, 7, N_pattern, N, M)
+    
+    def __init__(self, H_kz, pattern_idx):
+        
+        self.H_kz = H_kz
+        self.pattern_idx = pattern_idx
+    
+    def __setitem__(self, key, H):
+        
+        self.H_kz[(slice(None),)+tuple(key)+(self.pattern_idx,)] = np.moveaxis(H, -1, 0)
+
+
+
 
 class waveorder_microscopy:
     
@@ -306,6 +338,38 @@ class waveorder_microscopy:
         
         gpu_id               : int
                                number refering to which gpu will be used
+        
+        tf_cache_dir         : str
+                               directory of the on-disk transfer function cache
+                               transfer functions are stored under a hash of the system parameters and the waveorder version,
+                               and memory-mapped from disk when a microscope with identical parameters is constructed again
+                               None to disable the cache
+        
+        lazy                 : bool
+                               'True' to defer computing the transfer functions until the first call of the corresponding 
+                               reconstruction method (or an explicit call of prepare)
+                               'False' to compute all the transfer functions in the constructor
+        
+        solver_cache_size    : int
+                               number of regularization parameter sets for which the factorized (regularized) AHA of each
+                               reconstruction type is kept in memory, so that repeated reconstructions (timepoints, positions) 
+                               skip the solver setup
+                               0 to disable the cache
+        
+        real_fft             : bool
+                               option to run the phase and birefringence deconvolutions with real-to-complex FFTs (rfft2/rfftn)
+                               the transfer functions are then stored on the half grid (N, M//2+1) in 2D and (N, M, N_defocus_3D//2+1) in 3D
+        
+        precision            : str
+                               'double' to compute in float64/complex128 (default)
+                               'single' to keep the transfer functions, the solvers and the outputs in float32/complex64, 
+                               which halves the memory footprint and bandwidth of the 3D reconstructions (see README for the accuracy)
+        
+        inc_solver           : str
+                               solver of the 7x7 systems of the 3D uPTI reconstruction (inc_recon = '3D')
+                               'direct' to form the AHA matrices (inc_AHA_3D_vec, 7x7 volumes) and solve them by Cholesky factorization or determinants
+                               'CG' to solve them with the matrix-free preconditioned conjugate gradient method, which applies AHA through 
+                               H_dyadic_OTF in each iteration and only keeps the diagonal of AHA (7 volumes) as preconditioner
                   
     
     '''
@@ -315,7 +379,8 @@ class waveorder_microscopy:
                  A_matrix=None, QLIPP_birefringence_only = False, bire_in_plane_deconv=None, inc_recon=None,
                  phase_deconv=None, ph_deconv_layer = 5,
                  illu_mode='BF', NA_illu_in=None, Source=None, Source_PolState=np.array([1, 1j]),
-                 pad_z=0, use_gpu=False, gpu_id=0):
+                 pad_z=0, use_gpu=False, gpu_id=0, tf_cache_dir=None, lazy=False, solver_cache_size=1, real_fft=False,
+                 precision='double', inc_solver='direct'):
         
         '''
         
@@ -330,10 +395,11 @@ class waveorder_microscopy:
         self.use_gpu = use_gpu
         self.gpu_id = gpu_id
         self._A_matrix_inv_gpu_array = None
+        self.precision = precision
+        self.backend = array_backend(self.use_gpu, self.gpu_id, self.precision)
         
-        if self.use_gpu:
-            globals()['cp'] = __import__("cupy")
-            cp.cuda.Device(self.gpu_id).use()
+        if inc_solver not in ['direct', 'CG']:
+            raise ValueError("inc_solver must be 'direct' or 'CG'")
             
         
         # Basic parameter 
@@ -354,6 +420,22 @@ class waveorder_microscopy:
         self.cali                      = cali
         self.bg_option                 = bg_option
         self.phase_deconv              = phase_deconv
+        self.ph_deconv_layer           = ph_deconv_layer
+        self.bire_in_plane_deconv      = bire_in_plane_deconv
+        self.inc_recon                 = inc_recon
+        self.inc_solver                = inc_solver
+        self.tf_cache_dir              = tf_cache_dir
+        self.tf_cache_path             = None
+        self.tf_cache_key              = None
+        self._transfer_function_ready  = set()
+        self.solver_cache_size         = solver_cache_size
+        self._solver_cache             = {}
+        self._solver_cache_lock        = threading.RLock()
+        self.ADMM_workspace            = ADMM_TV_workspace()
+        self.real_fft                  = real_fft
+        self._shared_memory            = {}
+        self._shared_tf_handle         = {}
+        self._shared_memory_owner      = False
              
 
         if QLIPP_birefringence_only == False:
@@ -366,25 +448,28 @@ class waveorder_microscopy:
 
             self.illumination_setup(illu_mode, NA_illu_in, Source, Source_PolState)
 
-            # Defocus kernel initialization
-
-            self.Hz_det_setup(self.phase_deconv, ph_deconv_layer, bire_in_plane_deconv, inc_recon)
-
-            # select either 2D or 3D model for phase deconvolution
-
-            self.phase_deconv_setup(self.phase_deconv)
-
             # instrument matrix for polarization detection
 
             self.instrument_matrix_setup(A_matrix)
+            
+            # key of the transfer functions (on-disk transfer function cache and out-of-core transfer functions)
+            
+            tf_parameters = {'img_dim': img_dim, 'lambda_illu': lambda_illu, 'ps': ps, 'NA_obj': NA_obj, 'NA_illu': NA_illu,
+                             'z_defocus': z_defocus, 'n_media': n_media, 'N_Stokes': self.N_Stokes,
+                             'bire_in_plane_deconv': bire_in_plane_deconv, 'inc_recon': inc_recon,
+                             'phase_deconv': phase_deconv, 'ph_deconv_layer': ph_deconv_layer,
+                             'illu_mode': illu_mode, 'NA_illu_in': NA_illu_in, 'Source': self.Source,
+                             'Source_PolState': self.Source_PolState, 'pad_z': pad_z, 'precision': precision,
+                             'inc_solver': inc_solver}
+            self.tf_cache_key = gen_transfer_function_cache_key(tf_parameters)
+            
+            if self.tf_cache_dir is not None:
+                self.tf_cache_path = os.path.join(self.tf_cache_dir, self.tf_cache_key)
 
-            # select either 2D or 3D model for 2D birefringence deconvolution
-
-            self.bire_in_plane_deconv_setup(bire_in_plane_deconv)
-
-            # inclination reconstruction model selection
-
-            self.inclination_recon_setup(inc_recon)
+            # transfer functions (phase deconvolution, 2D birefringence deconvolution, inclination reconstruction model)
+            
+            if not lazy:
+                self.prepare()
 
         else:
 
@@ -397,6 +482,290 @@ class waveorder_microscopy:
         
 ##############   constructor function group   ##############
 
+    # transfer function attributes computed by each setup function
+    _transfer_function_attrs = {'phase'         : ('Hu', 'Hp', 'H_re', 'H_im'),
+                                'bire_in_plane' : ('H_dyadic_2D_OTF_in_plane', 'H_dyadic_OTF_in_plane'),
+                                'inc'           : ('geometric_inc_matrix', 'geometric_inc_matrix_inv', 'H_dyadic_2D_OTF', 
+                                                   'inc_AHA_2D_vec', 'H_dyadic_OTF', 'inc_AHA_3D_vec', 'inc_AHA_3D_vec_diag')}
+    
+    # halved axis of the transfer functions stored on the real-to-complex (rfft) half grid (real_fft=True)
+    _rfft_transfer_function_axes = {'phase'         : {'Hu': 1, 'Hp': 1, 'H_re': -1, 'H_im': -1},
+                                    'bire_in_plane' : {'H_dyadic_2D_OTF_in_plane': 3, 'H_dyadic_OTF_in_plane': -1}}
+    
+    def transfer_function_setup(self, tf_type):
+        
+        '''
+    
+        setup the transfer functions of one reconstruction type, 
+        loading them from the on-disk cache when available and saving them to the cache after computing otherwise
+        
+        Parameters
+        ----------
+            tf_type : str
+                      type of the transfer functions
+                      'phase' for the phase deconvolution (phase_deconv)
+                      'bire_in_plane' for the 2D birefringence deconvolution (bire_in_plane_deconv)
+                      'inc' for the uPTI reconstruction (inc_recon)
+                              
+        '''
+        
+        tf_options = {'phase': self.phase_deconv, 'bire_in_plane': self.bire_in_plane_deconv, 'inc': self.inc_recon}
+        
+        if tf_options[tf_type] is None or tf_type in self._transfer_function_ready:
+            return
+        
+        if self.tf_cache_path is not None:
+            cache_path = os.path.join(self.tf_cache_path, tf_type)
+            transfer_functions = load_transfer_function_cache(cache_path)
+            if transfer_functions is not None:
+                for name, array in transfer_functions.items():
+                    setattr(self, name, array)
+                self.rfft_transfer_function_setup(tf_type)
+                self._transfer_function_ready.add(tf_type)
+                return
+        
+        # Defocus kernel initialization (only the kernels needed by this type of transfer functions)
+        tf_options = {key: (value if key == tf_type else None) for key, value in tf_options.items()}
+        self.Hz_det_setup(tf_options['phase'], self.ph_deconv_layer, tf_options['bire_in_plane'], tf_options['inc'])
+        
+        if tf_type == 'phase':
+            self.phase_deconv_setup(self.phase_deconv)
+        elif tf_type == 'bire_in_plane':
+            self.bire_in_plane_deconv_setup(self.bire_in_plane_deconv)
+        elif tf_type == 'inc':
+            self.inclination_recon_setup(self.inc_recon)
+        
+        # transfer functions in the working precision (no-op in double precision)
+        for name in self._transfer_function_attrs[tf_type]:
+            if hasattr(self, name):
+                setattr(self, name, self.backend.cast(getattr(self, name)))
+        
+        if self.tf_cache_path is not None:
+            transfer_functions = {name: getattr(self, name) for name in self._transfer_function_attrs[tf_type] if hasattr(self, name)}
+            save_transfer_function_cache(cache_path, transfer_functions)
+        
+        self.rfft_transfer_function_setup(tf_type)
+        self._transfer_function_ready.add(tf_type)
+    
+    
+    def rfft_transfer_function_setup(self, tf_type):
+        
+        '''
+    
+        keep only the real-to-complex (rfft) half grid of the transfer functions of one reconstruction type when real_fft is True
+        (the transfer functions of real intensity measurements are Hermitian, the on-disk cache always holds the full grid)
+        
+        Parameters
+        ----------
+            tf_type : str
+                      type of the transfer functions ('phase', 'bire_in_plane', 'inc')
+                              
+        '''
+        
+        if not self.real_fft:
+            return
+        
+        for name, axis in self._rfft_transfer_function_axes.get(tf_type, {}).items():
+            if hasattr(self, name):
+                H = getattr(self, name)
+                half_idx = [slice(None)]*H.ndim
+                half_idx[axis] = slice(0, H.shape[axis]//2+1)
+                setattr(self, name, np.ascontiguousarray(H[tuple(half_idx)]))
+    
+    def prepare(self, *tf_types):
+        
+        '''
+    
+        compute (or load from the on-disk cache) the transfer functions ahead of the reconstruction, 
+        e.g. to warm up a reconstructor constructed with lazy=True
+        
+        Parameters
+        ----------
+            tf_types : str
+                       types of the transfer functions to prepare ('phase', 'bire_in_plane', 'inc'), all types if none is given
+                              
+        '''
+        
+        for tf_type in (tf_types or ('phase', 'bire_in_plane', 'inc')):
+            if tf_type not in self._transfer_function_attrs:
+                raise ValueError("tf_type must be 'phase', 'bire_in_plane' or 'inc'")
+            self.transfer_function_setup(tf_type)
+        
+    
+    def solver_cache_lookup(self, solver_type, key, compute):
+        
+        '''
+    
+        return the cached solver terms (e.g. factorized regularized AHA) of one reconstruction type for the given key, 
+        computing and caching them on a miss (the oldest entry of the type is dropped when the cache is full)
+        
+        Parameters
+        ----------
+            solver_type : str
+                          type of the reconstruction the solver terms belong to
+                          
+            key         : tuple
+                          hashable regularization parameters (and options) the solver terms depend on
+                          
+            compute     : function
+                          function without arguments that computes the solver terms on a cache miss
+                          
+        Returns
+        -------
+            terms       : object
+                          cached or computed solver terms
+                              
+        '''
+        
+        if self.solver_cache_size <= 0:
+            return compute()
+        
+        # reconstructions running on several threads (e.g. Tiled_recon) compute the terms of a key once
+        with self._solver_cache_lock:
+            cache = self._solver_cache.setdefault(solver_type, {})
+            
+            if key not in cache:
+                terms = compute()
+                while len(cache) >= self.solver_cache_size:
+                    cache.pop(next(iter(cache)))
+                cache[key] = terms
+            
+            return cache[key]
+    
+    
+    def clear_solver_cache(self):
+        
+        '''
+    
+        release the cached solver terms of all reconstruction types and the buffers of the ADMM TV solvers
+                              
+        '''
+        
+        with self._solver_cache_lock:
+            self._solver_cache = {}
+        self.ADMM_workspace.clear()
+        
+        
+    def share_transfer_functions(self):
+        
+        '''
+    
+        move the transfer functions into named shared memory blocks (multiprocessing.shared_memory, Python 3.8 or later), 
+        such that worker processes run against a single copy of them
+        
+        the transfer functions not computed yet (lazy=True) are computed first, and the attributes then become views
+        of the shared blocks; pickling the microscope (e.g. for the workers of parallel_reconstruction) only passes the names 
+        of the blocks, which the unpickled copy attaches to read-only, and forked workers inherit the shared mapping
+        the blocks are owned by this microscope and released with unshare_transfer_functions
+        
+        Returns
+        -------
+            handle : dict
+                     {attribute name: (shared memory name, shape, dtype)} of the shared transfer functions,
+                     to be passed to attach_transfer_functions of a microscope in another process
+                              
+        '''
+        
+        shared_memory = _import_shared_memory()
+        
+        self.prepare()
+        
+        for names in self._transfer_function_attrs.values():
+            for name in names:
+                array = getattr(self, name, None)
+                if not isinstance(array, np.ndarray) or array.size == 0 or name in self._shared_tf_handle:
+                    continue
+                
+                shm = shared_memory.SharedMemory(create=True, size=array.nbytes)
+                shared_array = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+                shared_array[...] = array
+                shared_array.flags.writeable = False
+                
+                setattr(self, name, shared_array)
+                self._shared_memory[name] = shm
+                self._shared_tf_handle[name] = (shm.name, array.shape, array.dtype.str)
+        
+        self._shared_memory_owner = True
+        
+        return dict(self._shared_tf_handle)
+    
+    
+    def attach_transfer_functions(self, handle):
+        
+        '''
+    
+        attach read-only to transfer functions shared by another process with share_transfer_functions
+        (the attaching process is expected to be a child of the exporting one, e.g. a worker of a process pool,
+        which shares the resource tracker of the exporting process)
+        
+        Parameters
+        ----------
+            handle : dict
+                     {attribute name: (shared memory name, shape, dtype)} returned by share_transfer_functions
+                              
+        '''
+        
+        shared_memory = _import_shared_memory()
+        
+        for name, (shm_name, shape, dtype) in handle.items():
+            shm = shared_memory.SharedMemory(name=shm_name)
+            shared_array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            shared_array.flags.writeable = False
+            
+            setattr(self, name, shared_array)
+            self._shared_memory[name] = shm
+            self._shared_tf_handle[name] = (shm_name, shape, dtype)
+        
+        self._transfer_function_ready.update(tf_type for tf_type, names in self._transfer_function_attrs.items() \
+                                             if any(name in handle for name in names))
+        
+        
+    def unshare_transfer_functions(self):
+        
+        '''
+    
+        copy the shared transfer functions back into the private memory of this process and detach from the shared blocks
+        (the blocks are unlinked if this microscope exported them)
+                              
+        '''
+        
+        for name in self._shared_tf_handle:
+            setattr(self, name, np.array(getattr(self, name)))
+        
+        for shm in self._shared_memory.values():
+            shm.close()
+            if self._shared_memory_owner:
+                shm.unlink()
+        
+        self._shared_memory       = {}
+        self._shared_tf_handle    = {}
+        self._shared_memory_owner = False
+    
+    
+    def __getstate__(self):
+        
+        # shared transfer functions are pickled by the names of their blocks
+        state = self.__dict__.copy()
+        for name in self._shared_tf_handle:
+            state.pop(name, None)
+        state['_shared_memory']       = {}
+        state['_shared_memory_owner'] = False
+        state['ADMM_workspace']       = ADMM_TV_workspace()
+        state.pop('_solver_cache_lock', None)
+        
+        return state
+    
+    
+    def __setstate__(self, state):
+        
+        handle = state.pop('_shared_tf_handle', {})
+        self.__dict__.update(state)
+        self._solver_cache_lock = threading.RLock()
+        self._shared_tf_handle = {}
+        self.attach_transfer_functions(handle)
+        
+
+
     def illumination_setup(self, illu_mode, NA_illu_in, Source, Source_PolState):
         
         '''
@@ -495,7 +864,7 @@ class waveorder_microscopy:
                               
         '''
         
-        if phase_deconv == '2D' or bire_in_plane_deconv == '2D' or inc_recon == '2D-vec-WOTF':
+        if (phase_deconv == '2D' or bire_in_plane_deconv == '2D' or inc_recon == '2D-vec-WOTF') and not hasattr(self, 'Hz_det_2D'):
             
             # generate defocus kernel based on Pupil function and z_defocus
             self.Hz_det_2D = gen_Hz_stack(self.fxx, self.fyy, self.Pupil_support, self.lambda_illu, self.z_defocus)
@@ -512,7 +881,7 @@ class waveorder_microscopy:
             self.Hz_det_semi_3D = gen_Hz_stack(self.fxx, self.fyy, self.Pupil_support, self.lambda_illu, z_deconv)
             self.G_fun_z_semi_3D = gen_Greens_function_z(self.fxx, self.fyy, self.Pupil_support, self.lambda_illu, z_deconv)
         
-        if phase_deconv == '3D' or bire_in_plane_deconv == '3D' or inc_recon == '3D': 
+        if (phase_deconv == '3D' or bire_in_plane_deconv == '3D' or inc_recon == '3D') and not hasattr(self, 'Hz_det_3D'): 
             
             # generate defocus kernel and Green's function
             if self.z_defocus[0] - self.z_defocus[1] >0:
@@ -624,7 +993,7 @@ class waveorder_microscopy:
                 self.gen_2D_vec_WOTF(True)
                 
                 # compute the AHA matrix for later 2D inversion
-                self.inc_AHA_2D_vec = np.zeros((7,7,self.N,self.M),complex)
+                self.inc_AHA_2D_vec = np.zeros((7,7,self.N,self.M),self.backend.complex_dtype)
                 for i,j,p in itertools.product(range(7), range(7), range(self.N_Stokes)):
                     self.inc_AHA_2D_vec[i,j] += np.sum(np.conj(self.H_dyadic_2D_OTF[p,i])*self.H_dyadic_2D_OTF[p,j],axis=2)
 
@@ -633,11 +1002,21 @@ class waveorder_microscopy:
             
             # generate 3D vectorial transfer function for 3D uPTI
             self.gen_3D_vec_WOTF(True)
-            self.inc_AHA_3D_vec = np.zeros((7,7,self.N,self.M,self.N_defocus_3D), dtype='complex64')
             
-            # compute the AHA matrix for later 3D inversion
-            for i,j,p in itertools.product(range(7), range(7), range(self.N_Stokes)):
-                self.inc_AHA_3D_vec[i,j] += np.sum(np.conj(self.H_dyadic_OTF[p,i])*self.H_dyadic_OTF[p,j],axis=0)
+            if self.inc_solver == 'CG':
+                
+                # only the diagonal of the AHA matrix for the matrix-free inversion
+                self.inc_AHA_3D_vec_diag = np.zeros((7,self.N,self.M,self.N_defocus_3D), dtype=self.backend.float_dtype)
+                for i,p in itertools.product(range(7), range(self.N_Stokes)):
+                    self.inc_AHA_3D_vec_diag[i] += np.sum(np.abs(self.H_dyadic_OTF[p,i])**2,axis=0)
+            
+            else:
+                
+                self.inc_AHA_3D_vec = np.zeros((7,7,self.N,self.M,self.N_defocus_3D), dtype=self.backend.complex_dtype)
+                
+                # compute the AHA matrix for later 3D inversion
+                for i,j,p in itertools.product(range(7), range(7), range(self.N_Stokes)):
+                    self.inc_AHA_3D_vec[i,j] += np.sum(np.conj(self.H_dyadic_OTF[p,i])*self.H_dyadic_OTF[p,j],axis=0)
             
                 
     def instrument_matrix_setup(self, A_matrix):
@@ -679,6 +1058,9 @@ class waveorder_microscopy:
 
         self.A_matrix_inv = np.linalg.pinv(self.A_matrix)
         
+        # the backend copy of the inverse is rebuilt from the new instrument matrix on the next Stokes reconstruction
+        self._A_matrix_inv_gpu_array = None
+        
 ##############   constructor asisting function group   ##############
 
     def gen_WOTF(self):
@@ -690,19 +1072,19 @@ class waveorder_microscopy:
                              
         '''
 
-        self.Hu = np.zeros((self.N, self.M, self.N_defocus*self.N_pattern),complex)
-        self.Hp = np.zeros((self.N, self.M, self.N_defocus*self.N_pattern),complex)
+        self.Hu = np.zeros((self.N, self.M, self.N_defocus*self.N_pattern),self.backend.complex_dtype)
+        self.Hp = np.zeros((self.N, self.M, self.N_defocus*self.N_pattern),self.backend.complex_dtype)
         
         if self.N_pattern == 1:
             for i in range(self.N_defocus):
                 self.Hu[:,:,i], self.Hp[:,:,i] = WOTF_2D_compute(self.Source, self.Pupil_obj * self.Hz_det_2D[:,:,i], \
-                                                                 use_gpu=self.use_gpu, gpu_id=self.gpu_id)
+                                                                 use_gpu=self.use_gpu, gpu_id=self.gpu_id, precision=self.precision)
         else:
             
             for i,j in itertools.product(range(self.N_defocus), range(self.N_pattern)):
                 idx = i*self.N_pattern+j
                 self.Hu[:,:,idx], self.Hp[:,:,idx] = WOTF_2D_compute(self.Source[j], self.Pupil_obj * self.Hz_det_2D[:,:,i], \
-                                                                       use_gpu=self.use_gpu, gpu_id=self.gpu_id)
+                                                                       use_gpu=self.use_gpu, gpu_id=self.gpu_id, precision=self.precision)
                 
     def gen_semi_3D_WOTF(self):
         
@@ -713,8 +1095,8 @@ class waveorder_microscopy:
                              
         '''
         
-        self.Hu = np.zeros((self.N, self.M, self.ph_deconv_layer*self.N_pattern),complex)
-        self.Hp = np.zeros((self.N, self.M, self.ph_deconv_layer*self.N_pattern),complex)
+        self.Hu = np.zeros((self.N, self.M, self.ph_deconv_layer*self.N_pattern),self.backend.complex_dtype)
+        self.Hp = np.zeros((self.N, self.M, self.ph_deconv_layer*self.N_pattern),self.backend.complex_dtype)
         
         
         for i,j in itertools.product(range(self.ph_deconv_layer), range(self.N_pattern)):
@@ -727,7 +1109,7 @@ class waveorder_microscopy:
             idx = i*self.N_pattern+j
             self.Hu[:,:,idx], self.Hp[:,:,idx] = WOTF_semi_3D_compute(Source_current, Source_current, self.Pupil_obj, self.Hz_det_semi_3D[:,:,i], \
                                                                       self.G_fun_z_semi_3D[:,:,i]*4*np.pi*1j/self.lambda_illu, \
-                                                                      use_gpu=self.use_gpu, gpu_id=self.gpu_id)
+                                                                      use_gpu=self.use_gpu, gpu_id=self.gpu_id, precision=self.precision)
 
             
     def gen_3D_WOTF(self):
@@ -749,28 +1131,106 @@ class waveorder_microscopy:
                 Source_current = self.Source[i].copy()
             self.H_re[i], self.H_im[i] = WOTF_3D_compute(Source_current.astype('float32'), Source_current.astype('float32'), self.Pupil_obj.astype('complex64'), \
                                                          self.Hz_det_3D.astype('complex64'),  self.G_fun_z_3D.astype('complex64'), self.psz,\
-                                                         use_gpu=self.use_gpu, gpu_id=self.gpu_id)
+                                                         use_gpu=self.use_gpu, gpu_id=self.gpu_id, precision=self.precision)
         
         self.H_re = np.squeeze(self.H_re)
         self.H_im = np.squeeze(self.H_im)
         
             
-    def gen_2D_vec_WOTF(self, inc_option):
+    def gen_vec_WOTF_terms(self, inc_option):
         
         '''
     
-        generate 2D vectorial transfer functions for 2D QUTIPP
+        collect the intermediate transfer function pairings composing the vectorial transfer functions
         
-                             
+        Parameters
+        ----------
+            inc_option : bool
+                         'True' for the transfer functions of the full scattering potential tensor (uPTI)
+                         'False' for the in-plane transfer functions of 2D birefringence deconvolution
+        
+        Returns
+        -------
+            OTF_terms  : dict
+                         lists of (sign, source term, Green's tensor term, part) tuples keyed by (Stokes index, component index)
+                         
         '''
         
         if inc_option == True:
-            self.H_dyadic_2D_OTF = np.zeros((self.N_Stokes, 7, self.N, self.M, self.N_defocus*self.N_pattern),dtype='complex64')
+            OTF_expressions = {key: value for key, value in dyadic_OTF_terms.items() if key[0] < self.N_Stokes}
         else:
-            self.H_dyadic_2D_OTF_in_plane = np.zeros((2, 2, self.N, self.M, self.N_defocus*self.N_pattern),dtype='complex64')
-
+            OTF_expressions = dyadic_OTF_in_plane_terms
+        
+        # the dyadic Green's tensor is symmetric, Gyx, Gzx and Gzy share the transform of Gxy, Gxz and Gyz
+        OTF_terms = {}
+        for key, expression in OTF_expressions.items():
+            OTF_terms[key] = [(sign, source_term, ''.join(sorted(G_term)), part) 
+                              for sign, source_term, G_term, part in parse_OTF_terms(expression)]
+        
+        return OTF_terms
+    
+    def gen_vec_WOTF_sources(self, E_field_factor, Source_current, pattern_idx):
+        
+        '''
+    
+        generate the source terms weighted by the focusing electric field components of one illumination pattern
+        
+        Parameters
+        ----------
+            E_field_factor : numpy.ndarray
+                             angle-dependent electric field factors due to focusing effect with the size of (5, N, M)
+            
+            Source_current : numpy.ndarray
+                             illumination source pattern with the size of (N, M)
+            
+            pattern_idx    : int
+                             index of the illumination pattern
+        
+        Returns
+        -------
+            Source_norm    : numpy.ndarray
+                             source normalization with the size of (N, M)
+            
+            Source_terms   : dict
+                             source terms with the size of (N, M) keyed by the pair of field components
+                         
+        '''
+        
+        # focusing electric field components
+        Ex_field = self.Source_PolState[pattern_idx,0]*E_field_factor[0] + self.Source_PolState[pattern_idx,1]*E_field_factor[1]
+        Ey_field = self.Source_PolState[pattern_idx,0]*E_field_factor[1] + self.Source_PolState[pattern_idx,1]*E_field_factor[2]
+        Ez_field = self.Source_PolState[pattern_idx,0]*E_field_factor[3] + self.Source_PolState[pattern_idx,1]*E_field_factor[4]
+        
+        IF_ExEx = np.abs(Ex_field)**2
+        IF_ExEy = Ex_field * np.conj(Ey_field)
+        IF_ExEz = Ex_field * np.conj(Ez_field)
+        IF_EyEy = np.abs(Ey_field)**2
+        IF_EyEz = Ey_field * np.conj(Ez_field)
+        
+        Source_norm = Source_current*(IF_ExEx + IF_EyEy)
+        
+        Source_terms = {'ExEx': Source_current*IF_ExEx,
+                        'ExEy': Source_current*IF_ExEy,
+                        'EyEx': Source_current*IF_ExEy.conj(),
+                        'ExEz': Source_current*IF_ExEz,
+                        'EyEy': Source_current*IF_EyEy,
+                        'EyEz': Source_current*IF_EyEz}
+        
+        return Source_norm, Source_terms
+    
+    def gen_E_field_factor(self):
+        
+        '''
+    
+        generate the angle-dependent electric field components due to focusing effect
+        
+        Returns
+        -------
+            E_field_factor : numpy.ndarray
+                             electric field factors with the size of (5, N, M)
+                         
+        '''
         
-        # angle-dependent electric field components due to focusing effect
         fr = (self.fxx**2 + self.fyy**2)**(0.5)
         cos_factor = (1-(self.lambda_illu**2)*(fr**2)*self.Pupil_support)**(0.5)*self.Pupil_support
         dc_idx = (fr==0)
@@ -785,142 +1245,79 @@ class waveorder_microscopy:
         E_field_factor[3, nondc_idx] = -self.lambda_illu*self.fxx[nondc_idx]
         E_field_factor[4, nondc_idx] = -self.lambda_illu*self.fyy[nondc_idx]
         
+        return E_field_factor
+            
+    def gen_2D_vec_WOTF(self, inc_option):
+        
+        '''
+    
+        generate 2D vectorial transfer functions for 2D QUTIPP
+        
+                             
+        '''
+        
+        if inc_option == True:
+            self.H_dyadic_2D_OTF = np.zeros((self.N_Stokes, 7, self.N, self.M, self.N_defocus*self.N_pattern),dtype='complex64')
+            H_dyadic = self.H_dyadic_2D_OTF
+        else:
+            self.H_dyadic_2D_OTF_in_plane = np.zeros((2, 2, self.N, self.M, self.N_defocus*self.N_pattern),dtype='complex64')
+            H_dyadic = self.H_dyadic_2D_OTF_in_plane
+
+        
+        # angle-dependent electric field components due to focusing effect
+        E_field_factor = self.gen_E_field_factor()
+        
         # generate dyadic Green's tensor
         G_fun_z = gen_Greens_function_z(self.fxx, self.fyy, self.Pupil_support, self.lambda_illu, self.z_defocus)
         G_tensor_z = gen_dyadic_Greens_tensor_z(self.fxx, self.fyy, G_fun_z, self.Pupil_support, self.lambda_illu)
+        G_terms = {'xx': G_tensor_z[0,0], 'xy': G_tensor_z[0,1], 'xz': G_tensor_z[0,2], 
+                   'yy': G_tensor_z[1,1], 'yz': G_tensor_z[1,2]}
         
+        OTF_terms = self.gen_vec_WOTF_terms(inc_option)
         
-        # compute transfer functions
-        OTF_compute = lambda x, y, z, w: WOTF_semi_3D_compute(x, y, self.Pupil_obj, w, \
-                                                           z, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
-        
-
-        for i,j in itertools.product(range(self.N_defocus), range(self.N_pattern)):
+        # compute transfer functions of all defocus layers with shared FFTs
+        for j in range(self.N_pattern):
             if self.N_pattern == 1:
                 Source_current = self.Source.copy()
             else:
                 Source_current = self.Source[j].copy()
             
-            idx = i*self.N_pattern+j
+            Source_norm, Source_terms = self.gen_vec_WOTF_sources(E_field_factor, Source_current, j)
             
-            # focusing electric field components
-            Ex_field = self.Source_PolState[j,0]*E_field_factor[0] + self.Source_PolState[j,1]*E_field_factor[1]
-            Ey_field = self.Source_PolState[j,0]*E_field_factor[1] + self.Source_PolState[j,1]*E_field_factor[2]
-            Ez_field = self.Source_PolState[j,0]*E_field_factor[3] + self.Source_PolState[j,1]*E_field_factor[4]
-            
-            IF_ExEx = np.abs(Ex_field)**2
-            IF_ExEy = Ex_field * np.conj(Ey_field)
-            IF_ExEz = Ex_field * np.conj(Ez_field)
-            IF_EyEy = np.abs(Ey_field)**2
-            IF_EyEz = Ey_field * np.conj(Ez_field)
-
-            Source_norm = Source_current*(IF_ExEx + IF_EyEy)
-            
-            # intermediate transfer functions
-            ExEx_Gxx_re, ExEx_Gxx_im = OTF_compute(Source_norm, Source_current*IF_ExEx, G_tensor_z[0,0,:,:,i], self.Hz_det_2D[:,:,i]) #
-            ExEy_Gxy_re, ExEy_Gxy_im = OTF_compute(Source_norm, Source_current*IF_ExEy, G_tensor_z[0,1,:,:,i], self.Hz_det_2D[:,:,i]) #
-            EyEx_Gyx_re, EyEx_Gyx_im = OTF_compute(Source_norm, Source_current*IF_ExEy.conj(), G_tensor_z[0,1,:,:,i], self.Hz_det_2D[:,:,i]) #
-            EyEy_Gyy_re, EyEy_Gyy_im = OTF_compute(Source_norm, Source_current*IF_EyEy, G_tensor_z[1,1,:,:,i], self.Hz_det_2D[:,:,i]) #
-            ExEx_Gxy_re, ExEx_Gxy_im = OTF_compute(Source_norm, Source_current*IF_ExEx, G_tensor_z[0,1,:,:,i], self.Hz_det_2D[:,:,i]) #
-            ExEy_Gxx_re, ExEy_Gxx_im = OTF_compute(Source_norm, Source_current*IF_ExEy, G_tensor_z[0,0,:,:,i], self.Hz_det_2D[:,:,i]) #
-            EyEx_Gyy_re, EyEx_Gyy_im = OTF_compute(Source_norm, Source_current*IF_ExEy.conj(), G_tensor_z[1,1,:,:,i], self.Hz_det_2D[:,:,i]) #
-            EyEy_Gyx_re, EyEy_Gyx_im = OTF_compute(Source_norm, Source_current*IF_EyEy, G_tensor_z[0,1,:,:,i], self.Hz_det_2D[:,:,i]) #
-            ExEx_Gyy_re, ExEx_Gyy_im = OTF_compute(Source_norm, Source_current*IF_ExEx, G_tensor_z[1,1,:,:,i], self.Hz_det_2D[:,:,i]) #
-            EyEy_Gxx_re, EyEy_Gxx_im = OTF_compute(Source_norm, Source_current*IF_EyEy, G_tensor_z[0,0,:,:,i], self.Hz_det_2D[:,:,i]) #
-            EyEx_Gxx_re, EyEx_Gxx_im = OTF_compute(Source_norm, Source_current*IF_ExEy.conj(), G_tensor_z[0,0,:,:,i], self.Hz_det_2D[:,:,i]) #
-            ExEy_Gyy_re, ExEy_Gyy_im = OTF_compute(Source_norm, Source_current*IF_ExEy, G_tensor_z[1,1,:,:,i], self.Hz_det_2D[:,:,i]) #
-
-            if inc_option == True:
-                ExEz_Gxz_re, ExEz_Gxz_im = OTF_compute(Source_norm, Source_current*IF_ExEz, G_tensor_z[0,2,:,:,i], self.Hz_det_2D[:,:,i])
-                EyEz_Gyz_re, EyEz_Gyz_im = OTF_compute(Source_norm, Source_current*IF_EyEz, G_tensor_z[1,2,:,:,i], self.Hz_det_2D[:,:,i])
-                ExEx_Gxz_re, ExEx_Gxz_im = OTF_compute(Source_norm, Source_current*IF_ExEx, G_tensor_z[0,2,:,:,i], self.Hz_det_2D[:,:,i])
-                ExEz_Gxx_re, ExEz_Gxx_im = OTF_compute(Source_norm, Source_current*IF_ExEz, G_tensor_z[0,0,:,:,i], self.Hz_det_2D[:,:,i])
-                EyEx_Gyz_re, EyEx_Gyz_im = OTF_compute(Source_norm, Source_current*IF_ExEy.conj(), G_tensor_z[1,2,:,:,i], self.Hz_det_2D[:,:,i])
-                EyEz_Gyx_re, EyEz_Gyx_im = OTF_compute(Source_norm, Source_current*IF_EyEz, G_tensor_z[0,1,:,:,i], self.Hz_det_2D[:,:,i])
-                ExEy_Gxz_re, ExEy_Gxz_im = OTF_compute(Source_norm, Source_current*IF_ExEy, G_tensor_z[0,2,:,:,i], self.Hz_det_2D[:,:,i])
-                ExEz_Gxy_re, ExEz_Gxy_im = OTF_compute(Source_norm, Source_current*IF_ExEz, G_tensor_z[0,1,:,:,i], self.Hz_det_2D[:,:,i])
-                EyEy_Gyz_re, EyEy_Gyz_im = OTF_compute(Source_norm, Source_current*IF_EyEy, G_tensor_z[1,2,:,:,i], self.Hz_det_2D[:,:,i])
-                EyEz_Gyy_re, EyEz_Gyy_im = OTF_compute(Source_norm, Source_current*IF_EyEz, G_tensor_z[1,1,:,:,i], self.Hz_det_2D[:,:,i])
-                ExEz_Gyz_re, ExEz_Gyz_im = OTF_compute(Source_norm, Source_current*IF_ExEz, G_tensor_z[1,2,:,:,i], self.Hz_det_2D[:,:,i])
-                EyEz_Gxz_re, EyEz_Gxz_im = OTF_compute(Source_norm, Source_current*IF_EyEz, G_tensor_z[0,2,:,:,i], self.Hz_det_2D[:,:,i])            
-                EyEx_Gxz_re, EyEx_Gxz_im = OTF_compute(Source_norm, Source_current*IF_ExEy.conj(), G_tensor_z[0,2,:,:,i], self.Hz_det_2D[:,:,i])
-                EyEz_Gxx_re, EyEz_Gxx_im = OTF_compute(Source_norm, Source_current*IF_EyEz, G_tensor_z[0,0,:,:,i], self.Hz_det_2D[:,:,i])
-                ExEy_Gyz_re, ExEy_Gyz_im = OTF_compute(Source_norm, Source_current*IF_ExEy, G_tensor_z[1,2,:,:,i], self.Hz_det_2D[:,:,i])
-                ExEz_Gyy_re, ExEz_Gyy_im = OTF_compute(Source_norm, Source_current*IF_ExEz, G_tensor_z[1,1,:,:,i], self.Hz_det_2D[:,:,i])
-                EyEy_Gxz_re, EyEy_Gxz_im = OTF_compute(Source_norm, Source_current*IF_EyEy, G_tensor_z[0,2,:,:,i], self.Hz_det_2D[:,:,i])
-                ExEx_Gyz_re, ExEx_Gyz_im = OTF_compute(Source_norm, Source_current*IF_ExEx, G_tensor_z[1,2,:,:,i], self.Hz_det_2D[:,:,i])
-
-                # 2D vectorial transfer functions
-                self.H_dyadic_2D_OTF[0,0,:,:,idx] = ExEx_Gxx_re + ExEy_Gxy_re + ExEz_Gxz_re + EyEx_Gyx_re + EyEy_Gyy_re + EyEz_Gyz_re
-                self.H_dyadic_2D_OTF[0,1,:,:,idx] = ExEx_Gxx_im + ExEy_Gxy_im + ExEz_Gxz_im + EyEx_Gyx_im + EyEy_Gyy_im + EyEz_Gyz_im
-                self.H_dyadic_2D_OTF[0,2,:,:,idx] = ExEx_Gxx_re - ExEy_Gxy_re + EyEx_Gyx_re - EyEy_Gyy_re
-                self.H_dyadic_2D_OTF[0,3,:,:,idx] = ExEx_Gxy_re + ExEy_Gxx_re + EyEx_Gyy_re + EyEy_Gyx_re
-                self.H_dyadic_2D_OTF[0,4,:,:,idx] = ExEx_Gxz_re + ExEz_Gxx_re + EyEx_Gyz_re + EyEz_Gyx_re
-                self.H_dyadic_2D_OTF[0,5,:,:,idx] = ExEy_Gxz_re + ExEz_Gxy_re + EyEy_Gyz_re + EyEz_Gyy_re
-                self.H_dyadic_2D_OTF[0,6,:,:,idx] = ExEz_Gxz_re + EyEz_Gyz_re
-
-                self.H_dyadic_2D_OTF[1,0,:,:,idx] = ExEx_Gxx_re + ExEy_Gxy_re + ExEz_Gxz_re - EyEx_Gyx_re - EyEy_Gyy_re - EyEz_Gyz_re
-                self.H_dyadic_2D_OTF[1,1,:,:,idx] = ExEx_Gxx_im + ExEy_Gxy_im + ExEz_Gxz_im - EyEx_Gyx_im - EyEy_Gyy_im - EyEz_Gyz_im
-                self.H_dyadic_2D_OTF[1,2,:,:,idx] = ExEx_Gxx_re - ExEy_Gxy_re - EyEx_Gyx_re + EyEy_Gyy_re
-                self.H_dyadic_2D_OTF[1,3,:,:,idx] = ExEx_Gxy_re + ExEy_Gxx_re - EyEx_Gyy_re - EyEy_Gyx_re
-                self.H_dyadic_2D_OTF[1,4,:,:,idx] = ExEx_Gxz_re + ExEz_Gxx_re - EyEx_Gyz_re - EyEz_Gyx_re
-                self.H_dyadic_2D_OTF[1,5,:,:,idx] = ExEy_Gxz_re + ExEz_Gxy_re - EyEy_Gyz_re - EyEz_Gyy_re
-                self.H_dyadic_2D_OTF[1,6,:,:,idx] = ExEz_Gxz_re - EyEz_Gyz_re
-
-                self.H_dyadic_2D_OTF[2,0,:,:,idx] = ExEx_Gxy_re + ExEy_Gyy_re + ExEz_Gyz_re + EyEx_Gxx_re + EyEy_Gyx_re + EyEz_Gxz_re
-                self.H_dyadic_2D_OTF[2,1,:,:,idx] = ExEx_Gxy_im + ExEy_Gyy_im + ExEz_Gyz_im + EyEx_Gxx_im + EyEy_Gyx_im + EyEz_Gxz_im
-                self.H_dyadic_2D_OTF[2,2,:,:,idx] = ExEx_Gxy_re - ExEy_Gyy_re + EyEx_Gxx_re - EyEy_Gyx_re
-                self.H_dyadic_2D_OTF[2,3,:,:,idx] = ExEx_Gyy_re + ExEy_Gxy_re + EyEx_Gyx_re + EyEy_Gxx_re
-                self.H_dyadic_2D_OTF[2,4,:,:,idx] = ExEx_Gyz_re + ExEz_Gxy_re + EyEx_Gxz_re + EyEz_Gxx_re
-                self.H_dyadic_2D_OTF[2,5,:,:,idx] = ExEy_Gyz_re + ExEz_Gyy_re + EyEy_Gxz_re + EyEz_Gyx_re
-                self.H_dyadic_2D_OTF[2,6,:,:,idx] = ExEz_Gyz_re + EyEz_Gxz_re
-
-                # transfer functions for S3
-                if self.N_Stokes == 4:
-
-                    self.H_dyadic_2D_OTF[3,0,:,:,idx] = -ExEx_Gxy_im - ExEy_Gyy_im - ExEz_Gyz_im + EyEx_Gxx_im + EyEy_Gyx_im + EyEz_Gxz_im
-                    self.H_dyadic_2D_OTF[3,1,:,:,idx] =  ExEx_Gxy_re + ExEy_Gyy_re + ExEz_Gyz_re - EyEx_Gxx_re - EyEy_Gyx_re - EyEz_Gxz_re
-                    self.H_dyadic_2D_OTF[3,2,:,:,idx] = -ExEx_Gxy_im + ExEy_Gyy_im + EyEx_Gxx_im - EyEy_Gyx_im
-                    self.H_dyadic_2D_OTF[3,3,:,:,idx] = -ExEx_Gyy_im - ExEy_Gxy_im + EyEx_Gyx_im + EyEy_Gxx_im
-                    self.H_dyadic_2D_OTF[3,4,:,:,idx] = -ExEx_Gyz_im - ExEz_Gxy_im + EyEx_Gxz_im + EyEz_Gxx_im
-                    self.H_dyadic_2D_OTF[3,5,:,:,idx] = -ExEy_Gyz_im - ExEz_Gyy_im + EyEy_Gxz_im + EyEz_Gyx_im
-                    self.H_dyadic_2D_OTF[3,6,:,:,idx] = -ExEz_Gyz_im + EyEz_Gxz_im
-            else:
-                
-                self.H_dyadic_2D_OTF_in_plane[0,0,:,:,idx] = ExEx_Gxx_re - ExEy_Gxy_re - EyEx_Gyx_re + EyEy_Gyy_re
-                self.H_dyadic_2D_OTF_in_plane[0,1,:,:,idx] = ExEx_Gxy_re + ExEy_Gxx_re - EyEx_Gyy_re - EyEy_Gyx_re
-                self.H_dyadic_2D_OTF_in_plane[1,0,:,:,idx] = ExEx_Gxy_re - ExEy_Gyy_re + EyEx_Gxx_re - EyEy_Gyx_re
-                self.H_dyadic_2D_OTF_in_plane[1,1,:,:,idx] = ExEx_Gyy_re + ExEy_Gxy_re + EyEx_Gyx_re + EyEy_Gxx_re
+            # layer i of pattern j is stored at index i*N_pattern+j
+            WOTF_vec_compute(Source_norm, Source_terms, self.Pupil_obj, self.Hz_det_2D, G_terms, OTF_terms, 
+                             H_dyadic[...,j::self.N_pattern], use_gpu=self.use_gpu, gpu_id=self.gpu_id, precision=self.precision)
             
-    def gen_3D_vec_WOTF(self, inc_option):
+    def gen_3D_vec_WOTF(self, inc_option, pattern_out=None):
         
         '''
     
         generate 3D vectorial transfer functions for 3D QUTIPP
         
+        Parameters
+        ----------
+            inc_option  : bool
+                          'True' for the transfer functions of the full scattering potential tensor (H_dyadic_OTF)
+                          'False' for the in-plane transfer functions of 3D birefringence deconvolution (H_dyadic_OTF_in_plane)
+            
+            pattern_out : callable
+                          pattern_out(i) returns the array-like the (N, M, N_defocus_3D) transfer functions of pattern i are written into,
+                          indexed by (Stokes index, component index) (e.g. to stream them to disk), None to store them in the attributes
                              
         '''
         
-        if inc_option == True:
-            self.H_dyadic_OTF = np.zeros((self.N_Stokes, 7, self.N_pattern, self.N, self.M, self.N_defocus_3D),dtype='complex64')
-        else:
-            self.H_dyadic_OTF_in_plane = np.zeros((2, 2, self.N_pattern, self.N, self.M, self.N_defocus_3D),dtype='complex64')
+        if pattern_out is None:
+            if inc_option == True:
+                self.H_dyadic_OTF = np.zeros((self.N_Stokes, 7, self.N_pattern, self.N, self.M, self.N_defocus_3D),dtype='complex64')
+                H_dyadic = self.H_dyadic_OTF
+            else:
+                self.H_dyadic_OTF_in_plane = np.zeros((2, 2, self.N_pattern, self.N, self.M, self.N_defocus_3D),dtype='complex64')
+                H_dyadic = self.H_dyadic_OTF_in_plane
+            pattern_out = lambda i: H_dyadic[:,:,i]
 
         
         # angle-dependent electric field components due to focusing effect
-        fr = (self.fxx**2 + self.fyy**2)**(0.5)
-        cos_factor = (1-(self.lambda_illu**2)*(fr**2)*self.Pupil_support)**(0.5)*self.Pupil_support
-        dc_idx = (fr==0)
-        nondc_idx = (fr!=0)
-        E_field_factor = np.zeros((5, self.N, self.M))
-        
-        E_field_factor[0, nondc_idx] = ((self.fxx[nondc_idx]**2)*cos_factor[nondc_idx]+ self.fyy[nondc_idx]**2) / fr[nondc_idx]**2
-        E_field_factor[0, dc_idx] = 1
-        E_field_factor[1, nondc_idx] = (self.fxx[nondc_idx]*self.fyy[nondc_idx] * (cos_factor[nondc_idx]-1)) / fr[nondc_idx]**2
-        E_field_factor[2, nondc_idx] = ((self.fyy[nondc_idx]**2)*cos_factor[nondc_idx] + self.fxx[nondc_idx]**2) / fr[nondc_idx]**2
-        E_field_factor[2, dc_idx] = 1
-        E_field_factor[3, nondc_idx] = -self.lambda_illu*self.fxx[nondc_idx]
-        E_field_factor[4, nondc_idx] = -self.lambda_illu*self.fyy[nondc_idx]
+        E_field_factor = self.gen_E_field_factor()
         
 
         
@@ -935,176 +1332,127 @@ class waveorder_microscopy:
 
         G_real = fftshift(ifft2(G_fun_z, axes=(0,1))/self.ps**2)
         G_tensor = gen_dyadic_Greens_tensor(G_real, self.ps, psz, self.lambda_illu, space='Fourier')
-        G_tensor_z = (ifft(G_tensor, axis=4)/psz)[...,::np.int(self.G_tensor_z_upsampling)]
+        G_tensor_z = (ifft(G_tensor, axis=4)/psz)[...,::int(self.G_tensor_z_upsampling)]
+        G_terms = {'xx': G_tensor_z[0,0].astype('complex64'), 'xy': G_tensor_z[0,1].astype('complex64'), 
+                   'xz': G_tensor_z[0,2].astype('complex64'), 'yy': G_tensor_z[1,1].astype('complex64'), 
+                   'yz': G_tensor_z[1,2].astype('complex64')}
+        
+        OTF_terms = self.gen_vec_WOTF_terms(inc_option)
         
 
-        # compute transfer functions
-        OTF_compute = lambda x, y, z: WOTF_3D_compute(x.astype('float32'), y.astype('complex64'), 
-                                                      self.Pupil_obj.astype('complex64'), self.Hz_det_3D.astype('complex64'), \
-                                                      z.astype('complex64'), self.psz,\
-                                                      use_gpu=self.use_gpu, gpu_id=self.gpu_id)
-
+        # compute transfer functions with shared FFTs
         for i in range(self.N_pattern):
             if self.N_pattern == 1:
                 Source_current = self.Source.copy()
             else:
                 Source_current = self.Source[i].copy()
             
-            # focusing electric field components
-            Ex_field = self.Source_PolState[i,0]*E_field_factor[0] + self.Source_PolState[i,1]*E_field_factor[1]
-            Ey_field = self.Source_PolState[i,0]*E_field_factor[1] + self.Source_PolState[i,1]*E_field_factor[2]
-            Ez_field = self.Source_PolState[i,0]*E_field_factor[3] + self.Source_PolState[i,1]*E_field_factor[4]
-            
-            IF_ExEx = np.abs(Ex_field)**2
-            IF_ExEy = Ex_field * np.conj(Ey_field)
-            IF_ExEz = Ex_field * np.conj(Ez_field)
-            IF_EyEy = np.abs(Ey_field)**2
-            IF_EyEz = Ey_field * np.conj(Ez_field)
-            
-            Source_norm = Source_current*(IF_ExEx + IF_EyEy)
-            
-            # intermediate transfer functions
-            ExEx_Gxx_re, ExEx_Gxx_im = OTF_compute(Source_norm, Source_current*IF_ExEx, G_tensor_z[0,0]) #
-            ExEy_Gxy_re, ExEy_Gxy_im = OTF_compute(Source_norm, Source_current*IF_ExEy, G_tensor_z[0,1]) #            
-            EyEx_Gyx_re, EyEx_Gyx_im = OTF_compute(Source_norm, Source_current*IF_ExEy.conj(), G_tensor_z[0,1]) #
-            EyEy_Gyy_re, EyEy_Gyy_im = OTF_compute(Source_norm, Source_current*IF_EyEy, G_tensor_z[1,1]) #            
-            ExEx_Gxy_re, ExEx_Gxy_im = OTF_compute(Source_norm, Source_current*IF_ExEx, G_tensor_z[0,1]) #
-            ExEy_Gxx_re, ExEy_Gxx_im = OTF_compute(Source_norm, Source_current*IF_ExEy, G_tensor_z[0,0]) #
-            EyEx_Gyy_re, EyEx_Gyy_im = OTF_compute(Source_norm, Source_current*IF_ExEy.conj(), G_tensor_z[1,1]) #
-            EyEy_Gyx_re, EyEy_Gyx_im = OTF_compute(Source_norm, Source_current*IF_EyEy, G_tensor_z[0,1]) #
-            ExEy_Gyy_re, ExEy_Gyy_im = OTF_compute(Source_norm, Source_current*IF_ExEy, G_tensor_z[1,1]) #
-            EyEx_Gxx_re, EyEx_Gxx_im = OTF_compute(Source_norm, Source_current*IF_ExEy.conj(), G_tensor_z[0,0]) #
-            ExEx_Gyy_re, ExEx_Gyy_im = OTF_compute(Source_norm, Source_current*IF_ExEx, G_tensor_z[1,1]) #
-            EyEy_Gxx_re, EyEy_Gxx_im = OTF_compute(Source_norm, Source_current*IF_EyEy, G_tensor_z[0,0]) #
+            Source_norm, Source_terms = self.gen_vec_WOTF_sources(E_field_factor, Source_current, i)
+            Source_terms = {name: Source_term.astype('complex64') for name, Source_term in Source_terms.items()}
             
-            if inc_option == True:
-                ExEz_Gxz_re, ExEz_Gxz_im = OTF_compute(Source_norm, Source_current*IF_ExEz, G_tensor_z[0,2])
-                EyEz_Gyz_re, EyEz_Gyz_im = OTF_compute(Source_norm, Source_current*IF_EyEz, G_tensor_z[1,2])
-                ExEx_Gxz_re, ExEx_Gxz_im = OTF_compute(Source_norm, Source_current*IF_ExEx, G_tensor_z[0,2])
-                ExEz_Gxx_re, ExEz_Gxx_im = OTF_compute(Source_norm, Source_current*IF_ExEz, G_tensor_z[0,0])
-                EyEx_Gyz_re, EyEx_Gyz_im = OTF_compute(Source_norm, Source_current*IF_ExEy.conj(), G_tensor_z[1,2])
-                EyEz_Gyx_re, EyEz_Gyx_im = OTF_compute(Source_norm, Source_current*IF_EyEz, G_tensor_z[0,1])
-                ExEy_Gxz_re, ExEy_Gxz_im = OTF_compute(Source_norm, Source_current*IF_ExEy, G_tensor_z[0,2])
-                ExEz_Gxy_re, ExEz_Gxy_im = OTF_compute(Source_norm, Source_current*IF_ExEz, G_tensor_z[0,1])
-                EyEy_Gyz_re, EyEy_Gyz_im = OTF_compute(Source_norm, Source_current*IF_EyEy, G_tensor_z[1,2])
-                EyEz_Gyy_re, EyEz_Gyy_im = OTF_compute(Source_norm, Source_current*IF_EyEz, G_tensor_z[1,1])            
-                ExEz_Gyz_re, ExEz_Gyz_im = OTF_compute(Source_norm, Source_current*IF_ExEz, G_tensor_z[1,2])            
-                EyEz_Gxz_re, EyEz_Gxz_im = OTF_compute(Source_norm, Source_current*IF_EyEz, G_tensor_z[0,2])            
-                EyEx_Gxz_re, EyEx_Gxz_im = OTF_compute(Source_norm, Source_current*IF_ExEy.conj(), G_tensor_z[0,2])
-                EyEz_Gxx_re, EyEz_Gxx_im = OTF_compute(Source_norm, Source_current*IF_EyEz, G_tensor_z[0,0])
-                ExEy_Gyz_re, ExEy_Gyz_im = OTF_compute(Source_norm, Source_current*IF_ExEy, G_tensor_z[1,2])
-                ExEz_Gyy_re, ExEz_Gyy_im = OTF_compute(Source_norm, Source_current*IF_ExEz, G_tensor_z[1,1])
-                EyEy_Gxz_re, EyEy_Gxz_im = OTF_compute(Source_norm, Source_current*IF_EyEy, G_tensor_z[0,2])
-                ExEx_Gyz_re, ExEx_Gyz_im = OTF_compute(Source_norm, Source_current*IF_ExEx, G_tensor_z[1,2])
-
-                # 3D vectorial transfer functions
-                self.H_dyadic_OTF[0,0,i] = ExEx_Gxx_re + ExEy_Gxy_re + ExEz_Gxz_re + EyEx_Gyx_re + EyEy_Gyy_re + EyEz_Gyz_re
-                self.H_dyadic_OTF[0,1,i] = ExEx_Gxx_im + ExEy_Gxy_im + ExEz_Gxz_im + EyEx_Gyx_im + EyEy_Gyy_im + EyEz_Gyz_im
-                self.H_dyadic_OTF[0,2,i] = ExEx_Gxx_re - ExEy_Gxy_re + EyEx_Gyx_re - EyEy_Gyy_re
-                self.H_dyadic_OTF[0,3,i] = ExEx_Gxy_re + ExEy_Gxx_re + EyEx_Gyy_re + EyEy_Gyx_re
-                self.H_dyadic_OTF[0,4,i] = ExEx_Gxz_re + ExEz_Gxx_re + EyEx_Gyz_re + EyEz_Gyx_re
-                self.H_dyadic_OTF[0,5,i] = ExEy_Gxz_re + ExEz_Gxy_re + EyEy_Gyz_re + EyEz_Gyy_re
-                self.H_dyadic_OTF[0,6,i] = ExEz_Gxz_re + EyEz_Gyz_re
-
-                self.H_dyadic_OTF[1,0,i] = ExEx_Gxx_re + ExEy_Gxy_re + ExEz_Gxz_re - EyEx_Gyx_re - EyEy_Gyy_re - EyEz_Gyz_re
-                self.H_dyadic_OTF[1,1,i] = ExEx_Gxx_im + ExEy_Gxy_im + ExEz_Gxz_im - EyEx_Gyx_im - EyEy_Gyy_im - EyEz_Gyz_im
-                self.H_dyadic_OTF[1,2,i] = ExEx_Gxx_re - ExEy_Gxy_re - EyEx_Gyx_re + EyEy_Gyy_re
-                self.H_dyadic_OTF[1,3,i] = ExEx_Gxy_re + ExEy_Gxx_re - EyEx_Gyy_re - EyEy_Gyx_re
-                self.H_dyadic_OTF[1,4,i] = ExEx_Gxz_re + ExEz_Gxx_re - EyEx_Gyz_re - EyEz_Gyx_re
-                self.H_dyadic_OTF[1,5,i] = ExEy_Gxz_re + ExEz_Gxy_re - EyEy_Gyz_re - EyEz_Gyy_re
-                self.H_dyadic_OTF[1,6,i] = ExEz_Gxz_re - EyEz_Gyz_re
-
-                self.H_dyadic_OTF[2,0,i] = ExEx_Gxy_re + ExEy_Gyy_re + ExEz_Gyz_re + EyEx_Gxx_re + EyEy_Gyx_re + EyEz_Gxz_re
-                self.H_dyadic_OTF[2,1,i] = ExEx_Gxy_im + ExEy_Gyy_im + ExEz_Gyz_im + EyEx_Gxx_im + EyEy_Gyx_im + EyEz_Gxz_im
-                self.H_dyadic_OTF[2,2,i] = ExEx_Gxy_re - ExEy_Gyy_re + EyEx_Gxx_re - EyEy_Gyx_re
-                self.H_dyadic_OTF[2,3,i] = ExEx_Gyy_re + ExEy_Gxy_re + EyEx_Gyx_re + EyEy_Gxx_re
-                self.H_dyadic_OTF[2,4,i] = ExEx_Gyz_re + ExEz_Gxy_re + EyEx_Gxz_re + EyEz_Gxx_re
-                self.H_dyadic_OTF[2,5,i] = ExEy_Gyz_re + ExEz_Gyy_re + EyEy_Gxz_re + EyEz_Gyx_re
-                self.H_dyadic_OTF[2,6,i] = ExEz_Gyz_re + EyEz_Gxz_re
-
-                # transfer functions for S3
-                if self.N_Stokes == 4:
-
-                    self.H_dyadic_OTF[3,0,i] = -ExEx_Gxy_im - ExEy_Gyy_im - ExEz_Gyz_im + EyEx_Gxx_im + EyEy_Gyx_im + EyEz_Gxz_im
-                    self.H_dyadic_OTF[3,1,i] =  ExEx_Gxy_re + ExEy_Gyy_re + ExEz_Gyz_re - EyEx_Gxx_re - EyEy_Gyx_re - EyEz_Gxz_re
-                    self.H_dyadic_OTF[3,2,i] = -ExEx_Gxy_im + ExEy_Gyy_im + EyEx_Gxx_im - EyEy_Gyx_im
-                    self.H_dyadic_OTF[3,3,i] = -ExEx_Gyy_im - ExEy_Gxy_im + EyEx_Gyx_im + EyEy_Gxx_im
-                    self.H_dyadic_OTF[3,4,i] = -ExEx_Gyz_im - ExEz_Gxy_im + EyEx_Gxz_im + EyEz_Gxx_im
-                    self.H_dyadic_OTF[3,5,i] = -ExEy_Gyz_im - ExEz_Gyy_im + EyEy_Gxz_im + EyEz_Gyx_im
-                    self.H_dyadic_OTF[3,6,i] = -ExEz_Gyz_im + EyEz_Gxz_im
-            else:
-                
-                self.H_dyadic_OTF_in_plane[0,0,i] = ExEx_Gxx_re - ExEy_Gxy_re - EyEx_Gyx_re + EyEy_Gyy_re
-                self.H_dyadic_OTF_in_plane[0,1,i] = ExEx_Gxy_re + ExEy_Gxx_re - EyEx_Gyy_re - EyEy_Gyx_re
-                self.H_dyadic_OTF_in_plane[1,0,i] = ExEx_Gxy_re - ExEy_Gyy_re + EyEx_Gxx_re - EyEy_Gyx_re
-                self.H_dyadic_OTF_in_plane[1,1,i] = ExEx_Gyy_re + ExEy_Gxy_re + EyEx_Gyx_re + EyEy_Gxx_re
+            WOTF_vec_compute(Source_norm.astype('float32'), Source_terms, self.Pupil_obj.astype('complex64'), 
+                             self.Hz_det_3D.astype('complex64'), G_terms, OTF_terms, pattern_out(i), psz=self.psz, 
+                             use_gpu=self.use_gpu, gpu_id=self.gpu_id, precision=self.precision)
             
                 
     
 ##############   polarization computing function group   ##############
 
-    def Stokes_recon(self, I_meas):
+    def Stokes_recon(self, I_meas, layout='CYXZ', output_layout=None, out=None):
         
         '''
     
         reconstruct Stokes parameters from polarization-sensitive intensity images
         
+        the Stokes parameters are contracted directly along the channel axis of I_meas (no reshaped copy of the input),
+        so the native (..., C, Z, Y, X) layout of the readers can be passed without transposing it first
+        
         Parameters
         ----------
             I_meas        : numpy.ndarray
                             polarization-sensitive intensity images with the size of (N_channel, ..., N, M) or
-                            (N_channel, ..., N, M, N_defocus)
-                          
-        Returns
+                            (N_channel, ..., N, M, N_defocus) for layout 'CYXZ', or 
+                            (..., N_channel, N_defocus, N, M) for layout 'CZYX'
+                            
+            layout        : str
+                            'CYXZ' for the waveorder layout (N_channel, ..., N, M[, N_defocus]) (default)
+                            'CZYX' for the (..., N_channel, N_defocus, N, M) layout returned by the readers
+                            
+            output_layout : str
+                            layout of the Stokes parameters ('CYXZ' or 'CZYX'), None to use the layout of I_meas
+                            
+            out           : numpy.ndarray
+                            optional array the Stokes parameters are written into, it must have the output size
+                          
+        Returns
         -------
             S_image_recon : numpy.ndarray
                             reconstructed Stokes parameters with the size of (N_Stokes, ..., N, M), or
-                            (N_Stokes, ..., N, M, N_defocus)
+                            (N_Stokes, ..., N, M, N_defocus) for output layout 'CYXZ', or
+                            (..., N_Stokes, N_defocus, N, M) for output layout 'CZYX'
                        
                               
         '''
 
+        if output_layout is None:
+            output_layout = layout
+        if layout not in ('CYXZ', 'CZYX') or output_layout not in ('CYXZ', 'CZYX'):
+            raise ValueError("layout and output_layout must be 'CYXZ' or 'CZYX'")
 
         data_dims = I_meas.shape
-        if data_dims[0] != self.N_channel:
-            raise ValueError(f'Unsupported image data size. Provide image data is of size: {data_dims}. '
-                             f'Image data must be of size (N_channel, ..., N, M) or (N_channel, ..., N, M, N_defocus)')
-        if not (data_dims[-2:] != (self.N, self.M) or data_dims[-3:] != (self.N, self.M, self.N_defocus)):
-            raise ValueError(f'Unsupported image data size. Provide image data is of size: {data_dims}. '
-                             f'Image data must be of size (N_channel, ..., N, M) or (N_channel, ..., N, M, N_defocus)')
-
-        # append dummy z dimension (N_defocus=1) if input data is 2D
-        single_plane = False
-        if data_dims[-2:] == (self.N, self.M):
-            single_plane = True
-            I_meas = I_meas[..., np.newaxis]
-
-        # reshape image data into (N, M, N_channel, ...)
-        img_data = np.moveaxis(I_meas, (-3, -2), (0, 1))
-        data_dims2 = img_data.shape
-        img_data = np.reshape(img_data, (self.N, self.M, self.N_channel, -1))
+        if layout == 'CYXZ':
+            if data_dims[0] != self.N_channel:
+                raise ValueError(f'Unsupported image data size. Provide image data is of size: {data_dims}. '
+                                 f'Image data must be of size (N_channel, ..., N, M) or (N_channel, ..., N, M, N_defocus)')
+            if not (data_dims[-2:] != (self.N, self.M) or data_dims[-3:] != (self.N, self.M, self.N_defocus)):
+                raise ValueError(f'Unsupported image data size. Provide image data is of size: {data_dims}. '
+                                 f'Image data must be of size (N_channel, ..., N, M) or (N_channel, ..., N, M, N_defocus)')
+
+            # 2D input data has no z axis
+            single_plane = data_dims[-2:] == (self.N, self.M)
+            in_subscripts = 'c...yx' if single_plane else 'c...yxz'
+            extra_dims = data_dims[1:-2] if single_plane else data_dims[1:-3]
+            z_dims = () if single_plane else data_dims[-1:]
+        else:
+            if len(data_dims) < 4 or data_dims[-4] != self.N_channel or data_dims[-2:] != (self.N, self.M):
+                raise ValueError(f'Unsupported image data size. Provide image data is of size: {data_dims}. '
+                                 f'Image data must be of size (..., N_channel, N_defocus, N, M)')
+
+            single_plane = False
+            in_subscripts = '...czyx'
+            extra_dims = data_dims[:-4]
+            z_dims = data_dims[-3:-2]
+
+        if output_layout == 'CYXZ':
+            out_subscripts = 's...yx' if single_plane else 's...yxz'
+            out_dims = (self.N_Stokes,) + extra_dims + (self.N, self.M) + z_dims
+        else:
+            out_subscripts = '...syx' if single_plane else '...szyx'
+            out_dims = extra_dims + (self.N_Stokes,) + z_dims + (self.N, self.M)
+
+        if out is not None and out.shape != out_dims:
+            raise ValueError(f'out must be of size {out_dims}')
 
         # compute Stokes parameters
         # A_matrix_inv is shape (N_Stokes, N_channel) or (N, M, N_Stokes, N_channel)
-        # img_data is shape (N, M, N_channel, ...)
-        # S_image_recon is shape (N, M, N_stokes, ...)
-        if self.use_gpu:
-            if self._A_matrix_inv_gpu_array is None:
-                self._A_matrix_inv_gpu_array = cp.array(self.A_matrix_inv)
-            img_gpu_array = cp.array(img_data)
-            S_image_recon = cp.asnumpy(cp.matmul(self._A_matrix_inv_gpu_array, img_gpu_array))
-        else:
-            S_image_recon = np.matmul(self.A_matrix_inv, img_data)
+        if self._A_matrix_inv_gpu_array is None:
+            self._A_matrix_inv_gpu_array = self.backend.cast(self.backend.asarray(self.A_matrix_inv))
+        A_subscripts = 'sc' if self.A_matrix_inv.ndim == 2 else 'yxsc'
+        subscripts = A_subscripts + ',' + in_subscripts + '->' + out_subscripts
 
-        # reshape Stokes parameters into (N_Stokes, ..., N, M, N_defocus)
-        S_image_recon = np.reshape(S_image_recon, (self.N, self.M, self.N_Stokes)+data_dims2[3:])
-        S_image_recon = np.moveaxis(S_image_recon, (0, 1), (-3, -2))
+        img_data = self.backend.cast(self.backend.asarray(I_meas))
 
-        # if input data was 2D, remove dummy z dimension
-        if single_plane:
-            return S_image_recon[..., 0]
+        if self.use_gpu:
+            S_image_recon = self.backend.asnumpy(self.backend.xp.einsum(subscripts, self._A_matrix_inv_gpu_array, img_data))
+            if out is not None:
+                out[...] = S_image_recon
+                S_image_recon = out
         else:
-            return S_image_recon
+            if out is None:
+                out = np.empty(out_dims, dtype=np.result_type(self._A_matrix_inv_gpu_array, img_data))
+            S_image_recon = np.einsum(subscripts, self._A_matrix_inv_gpu_array, img_data, out=out, casting='same_kind')
+
+        return S_image_recon
     
     
     def Stokes_transform(self, S_image_recon):
@@ -1126,17 +1474,11 @@ class waveorder_microscopy:
                               
         '''
         
-        if self.use_gpu:
-            S_image_recon = cp.array(S_image_recon)
-            if self.N_Stokes == 4:
-                S_transformed = cp.zeros((5,)+S_image_recon.shape[1:])
-            elif self.N_Stokes == 3:
-                S_transformed = cp.zeros((3,)+S_image_recon.shape[1:])
-        else:
-            if self.N_Stokes == 4:
-                S_transformed = np.zeros((5,)+S_image_recon.shape[1:])
-            elif self.N_Stokes == 3:
-                S_transformed = np.zeros((3,)+S_image_recon.shape[1:])
+        S_image_recon = self.backend.cast(self.backend.asarray(S_image_recon))
+        if self.N_Stokes == 4:
+            S_transformed = self.backend.xp.zeros((5,)+S_image_recon.shape[1:], dtype=self.backend.float_dtype)
+        elif self.N_Stokes == 3:
+            S_transformed = self.backend.xp.zeros((3,)+S_image_recon.shape[1:], dtype=self.backend.float_dtype)
         
         S_transformed[0] = S_image_recon[0]
         
@@ -1148,12 +1490,8 @@ class waveorder_microscopy:
         elif self.N_Stokes == 3:
             S_transformed[1] = S_image_recon[1] / S_image_recon[0]
             S_transformed[2] = S_image_recon[2] / S_image_recon[0]
-            
         
-        if self.use_gpu:
-            S_transformed = cp.asnumpy(S_transformed)
-        
-        return S_transformed
+        return self.backend.asnumpy(S_transformed)
     
     
     def Polscope_bg_correction(self, S_image_tm, S_bg_tm, kernel_size=400, poly_order=2):
@@ -1184,9 +1522,11 @@ class waveorder_microscopy:
                               
         '''
         
-        if self.use_gpu:
-            S_image_tm = cp.array(S_image_tm)
-            S_bg_tm = cp.array(S_bg_tm)
+        xp = self.backend.xp
+        
+        # on CPU the input is corrected in place
+        S_image_tm = self.backend.asarray(S_image_tm)
+        S_bg_tm = self.backend.asarray(S_bg_tm)
         
         dim = S_image_tm.ndim
         if dim == 3:
@@ -1212,12 +1552,8 @@ class waveorder_microscopy:
                 S_image_tm[1] -= uniform_filter_2D(S_image_tm[1], size=kernel_size, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
                 S_image_tm[2] -= uniform_filter_2D(S_image_tm[2], size=kernel_size, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
             else:
-                if self.use_gpu:
-                    S1_bg = uniform_filter_2D(cp.mean(S_image_tm[1],axis=-1), size=kernel_size, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
-                    S2_bg = uniform_filter_2D(cp.mean(S_image_tm[2],axis=-1), size=kernel_size, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
-                else:
-                    S1_bg = uniform_filter_2D(np.mean(S_image_tm[1],axis=-1), size=kernel_size, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
-                    S2_bg = uniform_filter_2D(np.mean(S_image_tm[2],axis=-1), size=kernel_size, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
+                S1_bg = uniform_filter_2D(xp.mean(S_image_tm[1],axis=-1), size=kernel_size, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
+                S2_bg = uniform_filter_2D(xp.mean(S_image_tm[2],axis=-1), size=kernel_size, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
                     
                 
                 for i in range(self.N_defocus):
@@ -1227,14 +1563,12 @@ class waveorder_microscopy:
         elif self.bg_option == 'local_fit':
             if self.use_gpu:
                 bg_estimator = BackgroundEstimator2D_GPU(gpu_id=self.gpu_id)
-                if dim != 3:
-                    S1_bg = bg_estimator.get_background(cp.mean(S_image_tm[1],axis=-1), order=poly_order, normalize=False)
-                    S2_bg = bg_estimator.get_background(cp.mean(S_image_tm[2],axis=-1), order=poly_order, normalize=False)
             else:
                 bg_estimator = BackgroundEstimator2D()
-                if dim != 3:
-                    S1_bg = bg_estimator.get_background(np.mean(S_image_tm[1],axis=-1), order=poly_order, normalize=False)
-                    S2_bg = bg_estimator.get_background(np.mean(S_image_tm[2],axis=-1), order=poly_order, normalize=False)
+            
+            if dim != 3:
+                S1_bg = bg_estimator.get_background(xp.mean(S_image_tm[1],axis=-1), order=poly_order, normalize=False)
+                S2_bg = bg_estimator.get_background(xp.mean(S_image_tm[2],axis=-1), order=poly_order, normalize=False)
                     
             if dim ==3:
                 S_image_tm[1] -= bg_estimator.get_background(S_image_tm[1], order=poly_order, normalize=False)
@@ -1246,10 +1580,7 @@ class waveorder_microscopy:
                     S_image_tm[2,:,:,i] -= S2_bg
                 
         
-        if self.use_gpu:
-            S_image_tm = cp.asnumpy(S_image_tm)
-        
-        return S_image_tm
+        return self.backend.asnumpy(S_image_tm)
     
     
     
@@ -1277,40 +1608,21 @@ class waveorder_microscopy:
                               
         '''
         
-        if self.use_gpu:
-            S_image_recon = cp.array(S_image_recon)
-            Recon_para = cp.zeros((self.N_Stokes,)+S_image_recon.shape[1:])
-        else:
-            Recon_para = np.zeros((self.N_Stokes,)+S_image_recon.shape[1:])
-
-        if self.use_gpu:
-            
-            if self.N_Stokes == 4:
-                ret_wrapped = cp.arctan2((S_image_recon[1]**2 + S_image_recon[2]**2)**(1/2) * \
-                                         S_image_recon[3], S_image_recon[3])  # retardance
-            elif self.N_Stokes == 3:
-                ret_wrapped = cp.arcsin(cp.minimum((S_image_recon[1]**2 + S_image_recon[2]**2)**(0.5),1))
-
+        xp = self.backend.xp
+        
+        S_image_recon = self.backend.cast(self.backend.asarray(S_image_recon))
+        Recon_para = xp.zeros((self.N_Stokes,)+S_image_recon.shape[1:], dtype=self.backend.float_dtype)
             
-            if self.cali == True:
-                sa_wrapped = 0.5*cp.arctan2(-S_image_recon[1], -S_image_recon[2]) % np.pi # slow-axis
-            else:
-                sa_wrapped = 0.5*cp.arctan2(-S_image_recon[1], S_image_recon[2]) % np.pi # slow-axis
+        if self.N_Stokes == 4:
+            ret_wrapped = xp.arctan2((S_image_recon[1]**2 + S_image_recon[2]**2)**(1/2) * \
+                                     S_image_recon[3], S_image_recon[3])  # retardance
+        elif self.N_Stokes == 3:
+            ret_wrapped = xp.arcsin(xp.minimum((S_image_recon[1]**2 + S_image_recon[2]**2)**(0.5),1))
         
+        if self.cali == True:
+            sa_wrapped = 0.5*xp.arctan2(-S_image_recon[1], -S_image_recon[2]) % np.pi # slow-axis
         else:
-            
-            if self.N_Stokes == 4:
-                ret_wrapped = np.arctan2((S_image_recon[1]**2 + S_image_recon[2]**2)**(1/2) * \
-                                           S_image_recon[3], S_image_recon[3])  # retardance
-            elif self.N_Stokes == 3:
-                ret_wrapped = np.arcsin(np.minimum((S_image_recon[1]**2 + S_image_recon[2]**2)**(0.5),1))
-            
-            
-            
-            if self.cali == True:
-                sa_wrapped = 0.5*np.arctan2(-S_image_recon[1], -S_image_recon[2]) % np.pi # slow-axis
-            else:
-                sa_wrapped = 0.5*np.arctan2(-S_image_recon[1], S_image_recon[2]) % np.pi # slow-axis
+            sa_wrapped = 0.5*xp.arctan2(-S_image_recon[1], S_image_recon[2]) % np.pi # slow-axis
                 
         sa_wrapped[ret_wrapped<0] += np.pi/2
         ret_wrapped[ret_wrapped<0] += np.pi
@@ -1321,11 +1633,123 @@ class waveorder_microscopy:
         if self.N_Stokes == 4:
             Recon_para[3] = S_image_recon[4] # DoP
         
+        return self.backend.asnumpy(Recon_para)
+    
+    
+    
+    def Polarization_recon_fused(self, I_meas, S_bg_tm=None, chunk_size=64, out=None):
         
-        if self.use_gpu:
-            Recon_para = cp.asnumpy(Recon_para)
+        '''
+    
+        QLIPP polarization reconstruction from polarization-sensitive intensity images in a single pass over the data,
+        fusing Stokes_recon, Stokes_transform, Polscope_bg_correction (global background) and Polarization_recon
+        
+        the image is processed in chunks of rows, so that the intermediate Stokes parameters of only one chunk are held in memory
+        (the 'local' and 'local_fit' background options need the full frame and fall back to the unfused chain)
+        
+        Parameters
+        ----------
+            I_meas     : numpy.ndarray
+                         polarization-sensitive intensity images with the size of (N_channel, N, M) or (N_channel, N, M, N_defocus)
+            
+            S_bg_tm    : numpy.ndarray
+                         normalized background Stokes parameters with the size of (3, N, M) or (5, N, M)
+                         None to skip the background correction
+            
+            chunk_size : int
+                         number of rows (y) processed at once
+            
+            out        : numpy.ndarray
+                         array with the size of (N_Stokes, N, M) or (N_Stokes, N, M, N_defocus) to write the reconstruction into
+                         None to allocate a new array
+                          
+        Returns
+        -------
+            Recon_para : numpy.ndarray
+                         reconstructed polarization-related physical properties
+                         channel 0 is retardance
+                         channel 1 is in-plane orientation
+                         channel 2 is brightfield
+                         channel 3 is degree of polarization
+                              
+        '''
+        
+        if I_meas.shape[0] != self.N_channel or I_meas.shape[1:3] != (self.N, self.M) or I_meas.ndim not in (3, 4):
+            raise ValueError(f'Unsupported image data size. Provide image data is of size: {I_meas.shape}. '
+                             f'Image data must be of size (N_channel, N, M) or (N_channel, N, M, N_defocus)')
+        
+        if out is None:
+            out = np.zeros((self.N_Stokes,)+I_meas.shape[1:], dtype=self.backend.float_dtype)
+        elif out.shape != (self.N_Stokes,)+I_meas.shape[1:]:
+            raise ValueError(f'out must be of size {(self.N_Stokes,)+I_meas.shape[1:]}')
+        
+        if S_bg_tm is not None and self.bg_option in ('local', 'local_fit'):
+            S_image_tm = self.Stokes_transform(self.Stokes_recon(I_meas))
+            out[...] = self.Polarization_recon(self.Polscope_bg_correction(S_image_tm, S_bg_tm))
+            return out
+        
+        xp = self.backend.xp
+        
+        if self._A_matrix_inv_gpu_array is None:
+            self._A_matrix_inv_gpu_array = self.backend.cast(self.backend.asarray(self.A_matrix_inv))
+        A_matrix_inv = self._A_matrix_inv_gpu_array
+        
+        # background Stokes parameters broadcast over the defocus axis
+        if S_bg_tm is not None:
+            S_bg_tm = self.backend.cast(self.backend.asarray(S_bg_tm))
+            if I_meas.ndim == 4:
+                S_bg_tm = S_bg_tm[..., np.newaxis]
+        
+        for y0 in range(0, self.N, chunk_size):
+            
+            y1 = min(y0+chunk_size, self.N)
+            I_chunk = self.backend.cast(self.backend.asarray(I_meas[:, y0:y1]))
+            
+            # Stokes parameters (N_Stokes, chunk, M, ...)
+            if A_matrix_inv.ndim == 2:
+                S = xp.tensordot(A_matrix_inv, I_chunk, axes=1)
+            else:
+                S = xp.einsum('yxsc,cyx...->syx...', A_matrix_inv[y0:y1], I_chunk)
+            
+            # normalized Stokes parameters
+            if self.N_Stokes == 4:
+                s1 = S[1] / S[3]
+                s2 = S[2] / S[3]
+                DoP = (S[1]**2 + S[2]**2 + S[3]**2)**(1/2) / S[0]
+            else:
+                s1 = S[1] / S[0]
+                s2 = S[2] / S[0]
+            BF = S[0]
+            
+            # global background correction
+            if S_bg_tm is not None:
+                BF = BF / S_bg_tm[0, y0:y1]
+                s1 -= S_bg_tm[1, y0:y1]
+                s2 -= S_bg_tm[2, y0:y1]
+                if self.N_Stokes == 4:
+                    DoP /= S_bg_tm[4, y0:y1]
+            
+            # retardance and slow axis
+            if self.N_Stokes == 4:
+                ret_wrapped = xp.arctan2((s1**2 + s2**2)**(1/2) * S[3], S[3])
+            else:
+                ret_wrapped = xp.arcsin(xp.minimum((s1**2 + s2**2)**(0.5),1))
+            
+            if self.cali == True:
+                sa_wrapped = 0.5*xp.arctan2(-s1, -s2) % np.pi
+            else:
+                sa_wrapped = 0.5*xp.arctan2(-s1, s2) % np.pi
+            
+            sa_wrapped[ret_wrapped<0] += np.pi/2
+            ret_wrapped[ret_wrapped<0] += np.pi
+            
+            out[0, y0:y1] = self.backend.asnumpy(ret_wrapped)
+            out[1, y0:y1] = self.backend.asnumpy(sa_wrapped%np.pi)
+            out[2, y0:y1] = self.backend.asnumpy(BF)
+            if self.N_Stokes == 4:
+                out[3, y0:y1] = self.backend.asnumpy(DoP)
         
-        return Recon_para
+        return out
     
     
     
@@ -1333,45 +1757,38 @@ class waveorder_microscopy:
         
         # Birefringence deconvolution with slowly varying transmission approximation
         
-        if self.use_gpu:
-            
-            
+        self.transfer_function_setup('phase')
+        
+        xp = self.backend.xp
+        
+        Hu = self.backend.asarray(self.Hu)
+        Hp = self.backend.asarray(self.Hp)
+        
+        def AHA_setup():
             
-            Hu = cp.array(self.Hu, copy=True)
-            Hp = cp.array(self.Hp, copy=True)
+            AHA = [xp.sum(xp.abs(Hu)**2 + xp.abs(Hp)**2, axis=2) + reg, \
+                   xp.sum(Hu*xp.conj(Hp) - xp.conj(Hu)*Hp, axis=2), \
+                   -xp.sum(Hu*xp.conj(Hp) - xp.conj(Hu)*Hp, axis=2), \
+                   xp.sum(xp.abs(Hu)**2 + xp.abs(Hp)**2, axis=2) + reg]
             
-            AHA = [cp.sum(cp.abs(Hu)**2 + cp.abs(Hp)**2, axis=2) + reg, \
-                   cp.sum(Hu*cp.conj(Hp) - cp.conj(Hu)*Hp, axis=2), \
-                   -cp.sum(Hu*cp.conj(Hp) - cp.conj(Hu)*Hp, axis=2), \
-                   cp.sum(cp.abs(Hu)**2 + cp.abs(Hp)**2, axis=2) + reg]
+            return AHA, AHA[0]*AHA[3] - AHA[1]*AHA[2]
+        
+        AHA, determinant = self.solver_cache_lookup('bire_QLIPP', ('Tikhonov', reg), AHA_setup)
 
-            S1_stack_f = cp.fft.fft2(cp.array(S1_stack), axes=(0,1))
-            if self.cali:
-                S2_stack_f = cp.fft.fft2(-cp.array(S2_stack), axes=(0,1))
-            else:
-                S2_stack_f = cp.fft.fft2(cp.array(S2_stack), axes=(0,1))
+        fft2_xp = self.backend.fft.rfft2 if self.real_fft else self.backend.fft.fft2
 
-            b_vec = [cp.sum(-cp.conj(Hu)*S1_stack_f + cp.conj(Hp)*S2_stack_f, axis=2), \
-                     cp.sum(cp.conj(Hp)*S1_stack_f + cp.conj(Hu)*S2_stack_f, axis=2)]
-        
+        S1_stack_f = fft2_xp(self.backend.cast(self.backend.asarray(S1_stack)), axes=(0,1))
+        if self.cali:
+            S2_stack_f = fft2_xp(-self.backend.cast(self.backend.asarray(S2_stack)), axes=(0,1))
         else:
-        
-            AHA = [np.sum(np.abs(self.Hu)**2 + np.abs(self.Hp)**2, axis=2) + reg, \
-                   np.sum(self.Hu*np.conj(self.Hp) - np.conj(self.Hu)*self.Hp, axis=2), \
-                   -np.sum(self.Hu*np.conj(self.Hp) - np.conj(self.Hu)*self.Hp, axis=2), \
-                   np.sum(np.abs(self.Hu)**2 + np.abs(self.Hp)**2, axis=2) + reg]
+            S2_stack_f = fft2_xp(self.backend.cast(self.backend.asarray(S2_stack)), axes=(0,1))
 
-            S1_stack_f = fft2(S1_stack, axes=(0,1))
-            if self.cali:
-                S2_stack_f = fft2(-S2_stack, axes=(0,1))
-            else:
-                S2_stack_f = fft2(S2_stack, axes=(0,1))
-
-            b_vec = [np.sum(-np.conj(self.Hu)*S1_stack_f + np.conj(self.Hp)*S2_stack_f, axis=2), \
-                     np.sum(np.conj(self.Hp)*S1_stack_f + np.conj(self.Hu)*S2_stack_f, axis=2)]
+        b_vec = [xp.sum(-xp.conj(Hu)*S1_stack_f + xp.conj(Hp)*S2_stack_f, axis=2), \
+                 xp.sum(xp.conj(Hp)*S1_stack_f + xp.conj(Hu)*S2_stack_f, axis=2)]
 
     
-        del_phi_s, del_phi_c = Dual_variable_Tikhonov_deconv_2D(AHA, b_vec, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
+        del_phi_s, del_phi_c = Dual_variable_Tikhonov_deconv_2D(AHA, b_vec, determinant=determinant, use_gpu=self.use_gpu, gpu_id=self.gpu_id, 
+                                                                rfft_shape=(self.N, self.M) if self.real_fft else None, precision=self.precision)
         
         Retardance = 2*(del_phi_s**2 + del_phi_c**2)**(1/2) 
         slowaxis = 0.5*np.arctan2(del_phi_s, del_phi_c)%np.pi
@@ -1380,7 +1797,7 @@ class waveorder_microscopy:
         return Retardance, slowaxis
     
     def Birefringence_recon_2D(self, S1_stack, S2_stack, method='Tikhonov', reg_br = 1,\
-                               rho = 1e-5, lambda_br=1e-3, itr = 20, verbose=True):
+                               rho = 1e-5, lambda_br=1e-3, itr = 20, verbose=True, tol=None, adaptive_rho=False, output_stats=False, state=None):
     
         '''
     
@@ -1398,6 +1815,7 @@ class waveorder_microscopy:
                          denoiser for 2D birefringence deconvolution
                          'Tikhonov' for Tikhonov denoiser
                          'TV'       for TV denoiser
+                         'TV-PD'    for TV denoiser with the primal-dual (Chambolle-Pock) solver, 2 FFTs per variable and iteration
             
             reg_br     : float
                          Tikhonov regularization parameter
@@ -1406,7 +1824,7 @@ class waveorder_microscopy:
                          TV regularization parameter
                              
             rho        : float
-                         augmented Lagrange multiplier for 2D ADMM algorithm
+                         augmented Lagrange multiplier for 2D ADMM algorithm (dual step size of 'TV-PD')
                              
             itr        : int
                          number of iterations for 2D ADMM algorithm
@@ -1414,6 +1832,18 @@ class waveorder_microscopy:
             verbose    : bool
                          option to display detailed progress of computations or not
                              
+            tol        : float
+                         relative tolerance of the ADMM primal and dual residuals to stop the iterations early, None to run itr iterations
+                             
+            adaptive_rho : bool
+                           option to balance the ADMM primal and dual residuals by adapting rho
+                             
+            output_stats : bool
+                           option to return the ADMM iteration statistics as well (see Dual_variable_ADMM_TV_deconv_2D)
+            
+            state        : dict
+                           solver state of the TV iterations carried from one time point to the next (warm start), None to start cold;
+                           pass the same (initially empty) dict for every time point of a time series
                           
         Returns
         -------
@@ -1422,10 +1852,15 @@ class waveorder_microscopy:
                          
             azimuth    : numpy.ndarray
                          2D orientation reconstruction with the size of (N, M)
+                         
+            stats      : dict
+                         iteration statistics of the TV reconstruction (if output_stats is True, None for Tikhonov)
                                       
                                           
         '''
         
+        self.transfer_function_setup('bire_in_plane')
+        
         if self.N_defocus == 1:
             S1_stack = np.reshape(S1_stack, (self.N, self.M, 1))
             S2_stack = np.reshape(S2_stack, (self.N, self.M, 1))
@@ -1435,48 +1870,76 @@ class waveorder_microscopy:
         H_2_1c = self.H_dyadic_2D_OTF_in_plane[1,0]
         H_2_1s = self.H_dyadic_2D_OTF_in_plane[1,1]
 
-        S1_stack_f = fft2(S1_stack, axes=(0,1))
-        S2_stack_f = fft2(S2_stack, axes=(0,1))
+        fft2_np = rfft2 if self.real_fft else fft2
+        
+        S1_stack_f = self.backend.cast(fft2_np(S1_stack, axes=(0,1)))
+        S2_stack_f = self.backend.cast(fft2_np(S2_stack, axes=(0,1)))
 
-        cross_term = np.sum(np.conj(H_1_1c)*H_1_1s + np.conj(H_2_1c)*H_2_1s, axis=2)
+        def AHA_setup():
+            
+            cross_term = np.sum(np.conj(H_1_1c)*H_1_1s + np.conj(H_2_1c)*H_2_1s, axis=2)
 
-        AHA = [np.sum(np.abs(H_1_1c)**2 + np.abs(H_2_1c)**2, axis=2), cross_term,\
-               np.conj(cross_term)                         , np.sum(np.abs(H_1_1s)**2 + np.abs(H_2_1s)**2, axis=2)]
+            AHA = [np.sum(np.abs(H_1_1c)**2 + np.abs(H_2_1c)**2, axis=2), cross_term,\
+                   np.conj(cross_term)                         , np.sum(np.abs(H_1_1s)**2 + np.abs(H_2_1s)**2, axis=2)]
 
-        AHA[0] += np.mean(np.abs(AHA[0]))*reg_br
-        AHA[3] += np.mean(np.abs(AHA[3]))*reg_br
+            if self.real_fft:
+                AHA[0] += half_spectrum_mean(np.abs(AHA[0]), self.M)*reg_br
+                AHA[3] += half_spectrum_mean(np.abs(AHA[3]), self.M)*reg_br
+            else:
+                AHA[0] += np.mean(np.abs(AHA[0]))*reg_br
+                AHA[3] += np.mean(np.abs(AHA[3]))*reg_br
+            
+            AHA = [self.backend.asarray(A) for A in AHA]
+            
+            determinant = AHA[0]*AHA[3] - AHA[1]*AHA[2] if method == 'Tikhonov' else None
+            
+            return AHA, determinant
+        
+        AHA, determinant = self.solver_cache_lookup('bire_in_plane_2D', (method, reg_br), AHA_setup)
 
         b_vec = [np.sum(np.conj(H_1_1c)*S1_stack_f + np.conj(H_2_1c)*S2_stack_f, axis=2), \
                  np.sum(np.conj(H_1_1s)*S1_stack_f + np.conj(H_2_1s)*S2_stack_f, axis=2)]
 
 
-        if self.use_gpu:
-            AHA = cp.array(AHA)
-            b_vec = cp.array(b_vec)
+        b_vec = [self.backend.asarray(b) for b in b_vec]
 
 
         if method == 'Tikhonov':
 
             # Deconvolution with Tikhonov regularization
 
-            g_1c, g_1s = Dual_variable_Tikhonov_deconv_2D(AHA, b_vec, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
+            g_1c, g_1s = Dual_variable_Tikhonov_deconv_2D(AHA, b_vec, determinant=determinant, use_gpu=self.use_gpu, gpu_id=self.gpu_id, 
+                                                          rfft_shape=(self.N, self.M) if self.real_fft else None, precision=self.precision)
+            stats = None
 
         elif method == 'TV':
 
             # ADMM deconvolution with anisotropic TV regularization
 
-            g_1c, g_1s = Dual_variable_ADMM_TV_deconv_2D(AHA, b_vec, rho, lambda_br, lambda_br, itr, verbose, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
+            g_1c, g_1s, stats = Dual_variable_ADMM_TV_deconv_2D(list(AHA), b_vec, rho, lambda_br, lambda_br, itr, verbose, use_gpu=self.use_gpu, gpu_id=self.gpu_id, 
+                                                                rfft_shape=(self.N, self.M) if self.real_fft else None, precision=self.precision, 
+                                                                tol=tol, adaptive_rho=adaptive_rho, output_stats=True, workspace=self.ADMM_workspace, state=state)
+
+        elif method == 'TV-PD':
+
+            # primal-dual deconvolution with anisotropic TV regularization
+
+            g_1c, g_1s, stats = Dual_variable_PD_TV_deconv_2D(AHA, b_vec, rho, lambda_br, lambda_br, itr, verbose, use_gpu=self.use_gpu, gpu_id=self.gpu_id, 
+                                                              rfft_shape=(self.N, self.M) if self.real_fft else None, precision=self.precision, 
+                                                              tol=tol, adaptive_rho=adaptive_rho, output_stats=True, workspace=self.ADMM_workspace, state=state)
 
 
 
         azimuth = (np.arctan2(-g_1s, -g_1c)/2)%np.pi
         retardance = ((np.abs(g_1s)**2 + np.abs(g_1c)**2)**(1/2))/(2*np.pi/self.lambda_illu)
 
+        if output_stats:
+            return retardance, azimuth, stats
 
         return retardance, azimuth
     
     def Birefringence_recon_3D(self, S1_stack, S2_stack, method='Tikhonov', reg_br = 1,\
-                               rho = 1e-5, lambda_br=1e-3, itr = 20, verbose=True):
+                               rho = 1e-5, lambda_br=1e-3, itr = 20, verbose=True, tol=None, adaptive_rho=False, output_stats=False, state=None):
     
         
         '''
@@ -1495,12 +1958,13 @@ class waveorder_microscopy:
                                denoiser for 3D phase reconstruction
                                'Tikhonov' for Tikhonov denoiser
                                'TV'       for TV denoiser
+                               'TV-PD'    for TV denoiser with the primal-dual (Chambolle-Pock) solver, 2 FFTs per variable and iteration
                              
             reg_br           : float
                                Tikhonov regularization parameter
                                
             rho              : float
-                               augmented Lagrange multiplier for 3D ADMM algorithm
+                               augmented Lagrange multiplier for 3D ADMM algorithm (dual step size of 'TV-PD')
                                
             lambda_br        : float        
                                TV regularization parameter
@@ -1511,6 +1975,18 @@ class waveorder_microscopy:
             verbose          : bool
                                option to display detailed progress of computations or not
                              
+            tol              : float
+                               relative tolerance of the ADMM primal and dual residuals to stop the iterations early, None to run itr iterations
+                             
+            adaptive_rho     : bool
+                               option to balance the ADMM primal and dual residuals by adapting rho
+                             
+            output_stats     : bool
+                               option to return the ADMM iteration statistics as well (see Dual_variable_ADMM_TV_deconv_2D)
+            
+            state            : dict
+                               solver state of the TV iterations carried from one time point to the next (warm start), None to start cold;
+                               pass the same (initially empty) dict for every time point of a time series
                           
         Returns
         -------
@@ -1520,10 +1996,15 @@ class waveorder_microscopy:
             azimuth          : numpy.ndarray
                                3D reconstruction of 2D orientation with the size of (N, M, N_defocus)
                   
+            stats            : dict
+                               iteration statistics of the TV reconstruction (if output_stats is True, None for Tikhonov)
+                  
                       
                                           
         '''
         
+        self.transfer_function_setup('bire_in_plane')
+        
         if self.pad_z != 0:
             S1_pad = np.pad(S1_stack,((0,0),(0,0),(self.pad_z,self.pad_z)), mode='constant',constant_values=S1_stack.mean())
             S2_pad = np.pad(S2_stack,((0,0),(0,0),(self.pad_z,self.pad_z)), mode='constant',constant_values=S2_stack.mean())
@@ -1545,37 +2026,63 @@ class waveorder_microscopy:
         H_2_1c = self.H_dyadic_OTF_in_plane[1,0,0]
         H_2_1s = self.H_dyadic_OTF_in_plane[1,1,0]
 
-        S1_stack_f = fftn(S1_stack)
-        S2_stack_f = fftn(S2_stack)
+        fftn_np = rfftn if self.real_fft else fftn
+        
+        S1_stack_f = self.backend.cast(fftn_np(S1_stack))
+        S2_stack_f = self.backend.cast(fftn_np(S2_stack))
 
-        cross_term = np.conj(H_1_1c)*H_1_1s + np.conj(H_2_1c)*H_2_1s
+        def AHA_setup():
+            
+            cross_term = np.conj(H_1_1c)*H_1_1s + np.conj(H_2_1c)*H_2_1s
 
-        AHA = [np.abs(H_1_1c)**2 + np.abs(H_2_1c)**2, cross_term,\
-               np.conj(cross_term)                  , np.abs(H_1_1s)**2 + np.abs(H_2_1s)**2]
+            AHA = [np.abs(H_1_1c)**2 + np.abs(H_2_1c)**2, cross_term,\
+                   np.conj(cross_term)                  , np.abs(H_1_1s)**2 + np.abs(H_2_1s)**2]
 
-        AHA[0] += np.mean(np.abs(AHA[0]))*reg_br
-        AHA[3] += np.mean(np.abs(AHA[3]))*reg_br
+            if self.real_fft:
+                AHA[0] += half_spectrum_mean(np.abs(AHA[0]), self.N_defocus_3D)*reg_br
+                AHA[3] += half_spectrum_mean(np.abs(AHA[3]), self.N_defocus_3D)*reg_br
+            else:
+                AHA[0] += np.mean(np.abs(AHA[0]))*reg_br
+                AHA[3] += np.mean(np.abs(AHA[3]))*reg_br
+            
+            AHA = [self.backend.asarray(A) for A in AHA]
+            
+            determinant = AHA[0]*AHA[3] - AHA[1]*AHA[2] if method == 'Tikhonov' else None
+            
+            return AHA, determinant
+        
+        AHA, determinant = self.solver_cache_lookup('bire_in_plane_3D', (method, reg_br), AHA_setup)
 
         b_vec = [np.conj(H_1_1c)*S1_stack_f + np.conj(H_2_1c)*S2_stack_f, \
                  np.conj(H_1_1s)*S1_stack_f + np.conj(H_2_1s)*S2_stack_f]
 
 
-        if self.use_gpu:
-            AHA = cp.array(AHA)
-            b_vec = cp.array(b_vec)
+        b_vec = [self.backend.asarray(b) for b in b_vec]
 
 
         if method == 'Tikhonov':
 
             # Deconvolution with Tikhonov regularization
 
-            f_1c, f_1s = Dual_variable_Tikhonov_deconv_3D(AHA, b_vec, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
+            f_1c, f_1s = Dual_variable_Tikhonov_deconv_3D(AHA, b_vec, determinant=determinant, use_gpu=self.use_gpu, gpu_id=self.gpu_id, 
+                                                          rfft_shape=(self.N, self.M, self.N_defocus_3D) if self.real_fft else None, precision=self.precision)
+            stats = None
 
         elif method == 'TV':
 
             # ADMM deconvolution with anisotropic TV regularization
 
-            f_1c, f_1s = Dual_variable_ADMM_TV_deconv_3D(AHA, b_vec, rho, lambda_br, lambda_br, itr, verbose, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
+            f_1c, f_1s, stats = Dual_variable_ADMM_TV_deconv_3D(list(AHA), b_vec, rho, lambda_br, lambda_br, itr, verbose, use_gpu=self.use_gpu, gpu_id=self.gpu_id, 
+                                                                rfft_shape=(self.N, self.M, self.N_defocus_3D) if self.real_fft else None, precision=self.precision, 
+                                                                tol=tol, adaptive_rho=adaptive_rho, output_stats=True, workspace=self.ADMM_workspace, state=state)
+
+        elif method == 'TV-PD':
+
+            # primal-dual deconvolution with anisotropic TV regularization
+
+            f_1c, f_1s, stats = Dual_variable_PD_TV_deconv_3D(AHA, b_vec, rho, lambda_br, lambda_br, itr, verbose, use_gpu=self.use_gpu, gpu_id=self.gpu_id, 
+                                                              rfft_shape=(self.N, self.M, self.N_defocus_3D) if self.real_fft else None, precision=self.precision, 
+                                                              tol=tol, adaptive_rho=adaptive_rho, output_stats=True, workspace=self.ADMM_workspace, state=state)
 
 
 
@@ -1587,6 +2094,9 @@ class waveorder_microscopy:
             azimuth = azimuth[:,:,self.pad_z:-(self.pad_z)]
             retardance = retardance[:,:,self.pad_z:-(self.pad_z)]
 
+        if output_stats:
+            return retardance, azimuth, stats
+
         return retardance, azimuth
     
     
@@ -1625,6 +2135,8 @@ class waveorder_microscopy:
                               
         '''
         
+        self.transfer_function_setup('inc')
+        
         
         retardance_on_axis = retardance[:,:,on_axis_idx].copy()
         orientation_on_axis = orientation[:,:,on_axis_idx].copy()
@@ -1647,7 +2159,46 @@ class waveorder_microscopy:
     
     
     
-    def scattering_potential_tensor_recon_2D_vec(self, S_image_recon, reg_inc=1e-1*np.ones((7,)), cupy_det=False):
+    def inc_AHA_factorize(self, reg_inc=1e-1*np.ones((7,))):
+        
+        '''
+    
+        compute the Cholesky factors of the Tikhonov-regularized AHA of the vectorial uPTI model (inc_recon: '2D-vec-WOTF' or '3D')
+        the factors are cached for the given reg_inc (see solver_cache_size), and can also be passed to scattering_potential_tensor_recon_2D_vec/3D_vec to reuse them across timepoints
+        
+        Parameters
+        ----------
+            reg_inc    : numpy.ndarray
+                         Tikhonov regularization parameters for 7 scattering potential tensor components with the size of (7,)
+                                                  
+        Returns
+        -------
+            AHA_factor : numpy.ndarray
+                         packed Cholesky factors with the size of (28, N, M) for '2D-vec-WOTF' or (28, N, M, N_defocus_3D) for '3D'
+            
+                              
+        '''
+        
+        self.transfer_function_setup('inc')
+        
+        if self.inc_recon == '2D-vec-WOTF':
+            AHA = self.inc_AHA_2D_vec
+        elif self.inc_recon == '3D' and self.inc_solver == 'CG':
+            raise ValueError('inc_AHA_factorize requires the AHA matrices, which are not formed with inc_solver=\'CG\'')
+        elif self.inc_recon == '3D':
+            AHA = self.inc_AHA_3D_vec
+        else:
+            raise ValueError('inc_AHA_factorize requires inc_recon to be \'2D-vec-WOTF\' or \'3D\'')
+        
+        def factorize():
+            reg_diag = np.array([np.mean(np.abs(AHA[i,i]))*reg_inc[i] for i in range(7)])
+            return Hermitian_batched_cholesky(AHA, reg_diag)
+        
+        return self.solver_cache_lookup('inc', tuple(np.asarray(reg_inc, dtype=float).ravel()), factorize)
+    
+    
+    
+    def scattering_potential_tensor_recon_2D_vec(self, S_image_recon, reg_inc=1e-1*np.ones((7,)), cupy_det=False, AHA_factor=None):
         
         '''
     
@@ -1663,6 +2214,10 @@ class waveorder_microscopy:
                             
             cupy_det      : bool
                             option to use the determinant algorithm from cupy package (cupy v9 has very fast determinant calculation compared to array-based determinant calculation)
+                            
+            AHA_factor    : numpy.ndarray
+                            precomputed Cholesky factors of the regularized AHA from inc_AHA_factorize (reused across timepoints, reg_inc is then ignored)
+                            if given, the Cholesky solver is used also in the GPU mode
                                                   
         Returns
         -------
@@ -1672,16 +2227,13 @@ class waveorder_microscopy:
                               
         '''
         
+        self.transfer_function_setup('inc')
+        
         start_time = time.time()
 
-        S_stack_f = fft2(S_image_recon, axes=(1,2))
-        
-        AHA = self.inc_AHA_2D_vec.copy()
-        
-        for i in range(7):
-            AHA[i,i] += np.mean(np.abs(AHA[i,i]))*reg_inc[i]
+        S_stack_f = self.backend.cast(fft2(S_image_recon, axes=(1,2)))
 
-        b_vec = np.zeros((7,self.N,self.M), complex)
+        b_vec = np.zeros((7,self.N,self.M), self.backend.complex_dtype)
 
         for i,j in itertools.product(range(7), range(self.N_Stokes)):
             b_vec[i] += np.sum(np.conj(self.H_dyadic_2D_OTF[j,i])*S_stack_f[j],axis=2)
@@ -1689,40 +2241,58 @@ class waveorder_microscopy:
         
         print('Finished preprocess, elapsed time: %.2f'%(time.time()-start_time))
         
-        if self.use_gpu:
+        if self.use_gpu and AHA_factor is None:
+            
+            xp = self.backend.xp
+            
+            def AHA_setup():
+                
+                AHA = self.inc_AHA_2D_vec.copy()
+            
+                for i in range(7):
+                    AHA[i,i] += np.mean(np.abs(AHA[i,i]))*reg_inc[i]
+                
+                if cupy_det:
+                    AHA = xp.transpose(self.backend.asarray(AHA), (2,3,0,1))
+                    determinant = xp.linalg.det(AHA)
+                else:
+                    AHA = self.backend.asarray(AHA)
+                    determinant = array_based_7x7_det(AHA)
+                
+                return AHA, determinant
+            
+            # the regularized AHA and its determinant stay on the device across calls with the same regularization
+            AHA, determinant = self.solver_cache_lookup('inc_2D_det', (cupy_det,)+tuple(np.asarray(reg_inc, dtype=float).ravel()), AHA_setup)
             
             if cupy_det:
-                AHA = cp.transpose(cp.array(AHA), (2,3,0,1))
-                b_vec = cp.transpose(cp.array(b_vec), (1,2,0))
+                b_vec = xp.transpose(self.backend.asarray(b_vec), (1,2,0))
                 
-                determinant = cp.linalg.det(AHA)
-                f_tensor = cp.zeros((7, self.N, self.M), dtype='float32')
+                f_tensor = xp.zeros((7, self.N, self.M), dtype=self.backend.float_dtype)
                 
                 for i in range(7):
                     AHA_b_vec = AHA.copy()
                     AHA_b_vec[:,:,:,i] = b_vec.copy()
-                    f_tensor[i] = cp.real(cp.fft.ifftn(cp.linalg.det(AHA_b_vec) / determinant))
+                    f_tensor[i] = xp.real(self.backend.fft.ifftn(xp.linalg.det(AHA_b_vec) / determinant))
                 
             else:
         
-                AHA = cp.array(AHA)
-                b_vec = cp.array(b_vec)
+                b_vec = self.backend.asarray(b_vec)
 
-                determinant = array_based_7x7_det(AHA)
-
-                f_tensor = cp.zeros((7, self.N, self.M))
+                f_tensor = xp.zeros((7, self.N, self.M), dtype=self.backend.float_dtype)
 
                 for i in range(7):
                     AHA_b_vec = AHA.copy()
                     AHA_b_vec[:,i] = b_vec.copy()
-                    f_tensor[i] = cp.real(cp.fft.ifft2(array_based_7x7_det(AHA_b_vec) / determinant))
+                    f_tensor[i] = xp.real(self.backend.fft.ifft2(array_based_7x7_det(AHA_b_vec) / determinant))
 
-            f_tensor = cp.asnumpy(f_tensor)
+            f_tensor = self.backend.asnumpy(f_tensor)
 
         else:
             
-            AHA_pinv = np.linalg.pinv(np.transpose(AHA,(2,3,0,1)))
-            f_tensor = np.real(ifft2(np.transpose(np.squeeze(np.matmul(AHA_pinv, np.transpose(b_vec,(1,2,0))[...,np.newaxis])),(2,0,1)),axes=(1,2)))
+            if AHA_factor is None:
+                AHA_factor = self.inc_AHA_factorize(reg_inc)
+                
+            f_tensor = self.backend.cast(np.real(ifft2(Hermitian_batched_cholesky_solve(AHA_factor, b_vec), axes=(1,2))))
             
         
         print('Finished reconstruction, elapsed time: %.2f'%(time.time()-start_time))
@@ -1731,7 +2301,7 @@ class waveorder_microscopy:
     
     
     
-    def scattering_potential_tensor_recon_3D_vec(self, S_image_recon, reg_inc=1e-1*np.ones((7,)), cupy_det=False):
+    def scattering_potential_tensor_recon_3D_vec(self, S_image_recon, reg_inc=1e-1*np.ones((7,)), cupy_det=False, AHA_factor=None, cg_tol=1e-4, cg_itr=30):
         
         '''
     
@@ -1747,6 +2317,16 @@ class waveorder_microscopy:
                             
             cupy_det      : bool
                             option to use the determinant algorithm from cupy package (cupy v9 has very fast determinant calculation compared to array-based determinant calculation)
+                            
+            AHA_factor    : numpy.ndarray
+                            precomputed Cholesky factors of the regularized AHA from inc_AHA_factorize (reused across timepoints, reg_inc is then ignored)
+                            if given, the Cholesky solver is used also in the GPU mode
+            
+            cg_tol        : float
+                            relative tolerance of the residual of the 7x7 system of each spatial frequency for inc_solver = 'CG'
+            
+            cg_itr        : int
+                            maximum number of conjugate gradient iterations for inc_solver = 'CG'
                                                   
         Returns
         -------
@@ -1756,67 +2336,112 @@ class waveorder_microscopy:
                               
         '''
         
+        self.transfer_function_setup('inc')
+        
         start_time = time.time()
         
         if self.pad_z != 0:
             S_pad = np.pad(S_image_recon,((0,0),(0,0),(0,0),(0,0),(self.pad_z,self.pad_z)), mode='constant',constant_values=0)
             if self.pad_z < self.N_defocus:
-                S_pad[...,:self.pad_z] = (S_image_recon[...,:self.pad_z])[:,:,::-1]
-                S_pad[...,-self.pad_z:] = (S_image_recon[...,-self.pad_z:])[:,:,::-1]
+                S_pad[...,:self.pad_z] = (S_image_recon[...,:self.pad_z])[...,::-1]
+                S_pad[...,-self.pad_z:] = (S_image_recon[...,-self.pad_z:])[...,::-1]
 
             else:
                 print('pad_z is larger than number of z-slices, use zero padding (not effective) instead of reflection padding')
             
             S_image_recon = S_pad.copy()
         
-        S_stack_f = fftn(S_image_recon,axes=(-3,-2,-1))
-
-
-        AHA = self.inc_AHA_3D_vec.copy()
-        
-        for i in range(7):
-            AHA[i,i] += np.mean(np.abs(AHA[i,i]))*reg_inc[i]
+        S_stack_f = self.backend.cast(fftn(S_image_recon,axes=(-3,-2,-1)))
 
-        b_vec = np.zeros((7,self.N,self.M,self.N_defocus_3D), dtype='complex64')
+        b_vec = np.zeros((7,self.N,self.M,self.N_defocus_3D), dtype=self.backend.complex_dtype)
 
         for i,j in itertools.product(range(7), range(self.N_Stokes)):
             b_vec[i] += np.sum(np.conj(self.H_dyadic_OTF[j,i])*S_stack_f[j],axis=0)
         
         print('Finished preprocess, elapsed time: %.2f'%(time.time()-start_time))
         
-        if self.use_gpu:
+        if self.inc_solver == 'CG':
+            
+            # matrix-free preconditioned CG, AHA*x = sum_p H_p^H*(H_p*x) + reg*x is applied through H_dyadic_OTF in each iteration
+            
+            xp           = self.backend.xp
+            H_dyadic_OTF = self.backend.asarray(self.H_dyadic_OTF)
+            AHA_diag     = self.backend.asarray(self.inc_AHA_3D_vec_diag)
+            
+            reg_diag = xp.array([float(xp.mean(AHA_diag[i]))*reg_inc[i] for i in range(7)], dtype=AHA_diag.dtype)[:,np.newaxis,np.newaxis,np.newaxis]
+            
+            def AHA_operator(x_vec):
+                
+                AHA_x = reg_diag*x_vec
+                
+                for p in range(self.N_Stokes):
+                    H_x = H_dyadic_OTF[p,0]*x_vec[0]
+                    for j in range(1,7):
+                        H_x += H_dyadic_OTF[p,j]*x_vec[j]
+                    for i in range(7):
+                        AHA_x[i] += xp.sum(xp.conj(H_dyadic_OTF[p,i])*H_x,axis=0)
+                
+                return AHA_x
+            
+            f_tensor_f, stats = Hermitian_batched_CG_solve(AHA_operator, b_vec, preconditioner=1/(AHA_diag + reg_diag), tol=cg_tol, itr=cg_itr, 
+                                                           use_gpu=self.use_gpu, gpu_id=self.gpu_id, output_stats=True)
+            
+            print('Finished CG iterations (%d), largest relative residual: %.2e, elapsed time: %.2f'\
+                  %(stats['iterations'], stats['residual'][-1] if stats['residual'] else 0, time.time()-start_time))
+            
+            f_tensor = self.backend.cast(self.backend.asnumpy(xp.real(self.backend.fft.ifftn(f_tensor_f, axes=(1,2,3)))))
+        
+        elif self.use_gpu and AHA_factor is None:
+            
+            xp = self.backend.xp
+            
+            def AHA_setup():
+                
+                AHA = self.inc_AHA_3D_vec.copy()
+            
+                for i in range(7):
+                    AHA[i,i] += np.mean(np.abs(AHA[i,i]))*reg_inc[i]
+                
+                if cupy_det:
+                    AHA = xp.transpose(self.backend.asarray(AHA), (2,3,4,0,1))
+                    determinant = xp.linalg.det(AHA)
+                else:
+                    AHA = self.backend.asarray(AHA)
+                    determinant = array_based_7x7_det(AHA)
+                
+                return AHA, determinant
+            
+            # the regularized AHA and its determinant stay on the device across calls with the same regularization
+            AHA, determinant = self.solver_cache_lookup('inc_3D_det', (cupy_det,)+tuple(np.asarray(reg_inc, dtype=float).ravel()), AHA_setup)
             
             if cupy_det:
-                AHA = cp.transpose(cp.array(AHA), (2,3,4,0,1))
-                b_vec = cp.transpose(cp.array(b_vec), (1,2,3,0))
+                b_vec = xp.transpose(self.backend.asarray(b_vec), (1,2,3,0))
                 
-                determinant = cp.linalg.det(AHA)
-                f_tensor = cp.zeros((7, self.N, self.M, self.N_defocus_3D), dtype='float32')
+                f_tensor = xp.zeros((7, self.N, self.M, self.N_defocus_3D), dtype=self.backend.float_dtype)
                 
                 for i in range(7):
                     AHA_b_vec = AHA.copy()
                     AHA_b_vec[:,:,:,:,i] = b_vec.copy()
-                    f_tensor[i] = cp.real(cp.fft.ifftn(cp.linalg.det(AHA_b_vec) / determinant))
+                    f_tensor[i] = xp.real(self.backend.fft.ifftn(xp.linalg.det(AHA_b_vec) / determinant))
             else:
         
-                AHA = cp.array(AHA)
-                b_vec = cp.array(b_vec)
-
-                determinant = array_based_7x7_det(AHA)
+                b_vec = self.backend.asarray(b_vec)
 
-                f_tensor = cp.zeros((7, self.N, self.M, self.N_defocus_3D), dtype='float32')
+                f_tensor = xp.zeros((7, self.N, self.M, self.N_defocus_3D), dtype=self.backend.float_dtype)
 
                 for i in range(7):
                     AHA_b_vec = AHA.copy()
                     AHA_b_vec[:,i] = b_vec.copy()
-                    f_tensor[i] = cp.real(cp.fft.ifftn(array_based_7x7_det(AHA_b_vec) / determinant))
+                    f_tensor[i] = xp.real(self.backend.fft.ifftn(array_based_7x7_det(AHA_b_vec) / determinant))
 
-            f_tensor = cp.asnumpy(f_tensor)
+            f_tensor = self.backend.asnumpy(f_tensor)
 
         else:
             
-            AHA_pinv = np.linalg.pinv(np.transpose(AHA,(2,3,4,0,1)))
-            f_tensor = np.real(ifftn(np.transpose(np.squeeze(np.matmul(AHA_pinv, np.transpose(b_vec,(1,2,3,0))[...,np.newaxis])),(3,0,1,2)),axes=(1,2,3)))
+            if AHA_factor is None:
+                AHA_factor = self.inc_AHA_factorize(reg_inc)
+                
+            f_tensor = self.backend.cast(np.real(ifftn(Hermitian_batched_cholesky_solve(AHA_factor, b_vec), axes=(1,2,3))))
         
         
         if self.pad_z != 0:
@@ -1830,7 +2455,211 @@ class waveorder_microscopy:
     
     
     
-    def scattering_potential_tensor_to_3D_orientation(self, f_tensor, S_image_recon=None, material_type='positive', reg_ret_pr = 1e-2, itr=20, step_size=0.3,verbose=True,fast_gpu_mode=False):
+    def scattering_potential_tensor_recon_3D_vec_out_of_core(self, S_image_recon, ooc_dir, reg_inc=1e-1*np.ones((7,)), kz_slab=4, 
+                                                              n_threads=1, out=None, verbose=True):
+        
+        '''
+    
+        out-of-core Tikhonov reconstruction of 3D scattering potential tensor components with vectorial model in QUTIPP
+        
+        the independent 7x7 systems of the spatial frequencies are solved slab by slab along kz: the transfer functions (H_dyadic_OTF, 
+        inc_AHA_3D_vec) are stored once in ooc_dir as kz-major memory-mapped .npy files (contiguous kz slabs), 
+        the spectrum of the Stokes parameters and the spectral solution are kept in temporary memory-mapped files of this call,
+        and only kz_slab frequency planes per thread are resident in memory at a time
+        
+        construct the microscope with lazy=True: the first call then streams the export to disk pattern by pattern and kz slab by kz slab
+        without ever building the in-core H_dyadic_OTF and inc_AHA_3D_vec (with lazy=False the in-core transfer functions
+        already built by the constructor are transposed instead)
+        
+        Parameters
+        ----------
+            S_image_recon : numpy.ndarray
+                            background corrected Stokes parameters normalized with S0's mean with the size of (3, N_pattern, N, M, N_defocus)
+                            (a memory-mapped array is read in chunks of rows)
+                            
+            ooc_dir       : str
+                            directory of the kz-major transfer functions (exported on the first call, in a subdirectory named by
+                            the transfer function key of the microscope) and of the temporary spectra (in a subdirectory
+                            removed at the end of the call, such that concurrent reconstructions can share ooc_dir)
+                            
+            reg_inc       : numpy.ndarray
+                            Tikhonov regularization parameters for 7 scattering potential tensor components with the size of (7,)
+                            
+            kz_slab       : int
+                            number of kz planes solved at once by each thread
+                            
+            n_threads     : int
+                            number of threads solving kz slabs concurrently
+                            
+            out           : numpy.ndarray
+                            preallocated output with the size of (7, N, M, N_defocus) (e.g. a memory-mapped array), allocated if None
+                            
+            verbose       : bool
+                            option to print the progress of the reconstruction
+                                                  
+        Returns
+        -------
+            f_tensor      : numpy.ndarray
+                            3D scattering potential tensor components with the size of (7, N, M, N_defocus)
+            
+                              
+        '''
+        
+        if self.inc_recon != '3D':
+            raise ValueError('scattering_potential_tensor_recon_3D_vec_out_of_core requires inc_recon to be \'3D\'')
+        if self.inc_solver == 'CG':
+            raise ValueError('scattering_potential_tensor_recon_3D_vec_out_of_core requires inc_solver to be \'direct\'')
+        
+        start_time = time.time()
+        
+        # the kz-major transfer functions of microscopes with different parameters are kept apart by the transfer function key
+        os.makedirs(ooc_dir, exist_ok=True)
+        tf_dir = os.path.join(ooc_dir, self.tf_cache_key)
+        
+        N_kz = self.N_defocus_3D
+        N_rows = max(1, kz_slab*self.N//N_kz)
+        
+        if not os.path.isdir(tf_dir):
+            self._export_kz_major_transfer_functions(tf_dir, kz_slab, N_rows)
+            if verbose:
+                print('Exported the kz-major transfer functions, elapsed time: %.2f'%(time.time()-start_time))
+        
+        H_kz = np.load(os.path.join(tf_dir, 'H_dyadic_OTF_kz.npy'), mmap_mode='r')
+        AHA_kz = np.load(os.path.join(tf_dir, 'inc_AHA_3D_vec_kz.npy'), mmap_mode='r')
+        reg_diag = np.load(os.path.join(tf_dir, 'inc_AHA_3D_vec_diag_mean.npy'))*np.asarray(reg_inc)
+        
+        # spectra of this call in their own scratch directory (reconstructions may share ooc_dir)
+        scratch_dir = tempfile.mkdtemp(prefix='.scratch_', dir=ooc_dir)
+        S_f_path = os.path.join(scratch_dir, 'S_stack_f_kz.npy')
+        f_f_path = os.path.join(scratch_dir, 'f_tensor_f_kz.npy')
+        
+        try:
+            
+            # spectrum of the (z-padded) Stokes parameters: FFT along z in chunks of rows, then FFT along (y, x) in kz slabs
+            S_f_kz = np.lib.format.open_memmap(S_f_path, mode='w+', dtype='complex64', 
+                                               shape=(N_kz, self.N_Stokes, self.N_pattern, self.N, self.M))
+            for y0 in range(0, self.N, N_rows):
+                rows = slice(y0, min(y0+N_rows, self.N))
+                S_rows = np.asarray(S_image_recon[..., rows, :, :])
+                
+                if self.pad_z != 0:
+                    S_pad = np.pad(S_rows,((0,0),(0,0),(0,0),(0,0),(self.pad_z,self.pad_z)), mode='constant',constant_values=0)
+                    if self.pad_z < self.N_defocus:
+                        S_pad[...,:self.pad_z] = (S_rows[...,:self.pad_z])[...,::-1]
+                        S_pad[...,-self.pad_z:] = (S_rows[...,-self.pad_z:])[...,::-1]
+                    elif y0 == 0 and verbose:
+                        print('pad_z is larger than number of z-slices, use zero padding (not effective) instead of reflection padding')
+                    S_rows = S_pad
+                
+                S_f_kz[..., rows, :] = np.moveaxis(fft(S_rows, axis=-1), -1, 0)
+            
+            for k0 in range(0, N_kz, kz_slab):
+                kz = slice(k0, min(k0+kz_slab, N_kz))
+                S_f_kz[kz] = fft2(S_f_kz[kz], axes=(-2,-1))
+            
+            if verbose:
+                print('Finished preprocess, elapsed time: %.2f'%(time.time()-start_time))
+            
+            # per-frequency 7x7 solves of the kz slabs
+            f_f_kz = np.lib.format.open_memmap(f_f_path, mode='w+', dtype='complex64', shape=(N_kz, 7, self.N, self.M))
+            
+            def solve_slab(kz):
+                H_slab = np.asarray(H_kz[kz])
+                S_slab = np.asarray(S_f_kz[kz])
+                
+                b_vec = np.zeros((7, kz.stop-kz.start, self.N, self.M), dtype='complex64')
+                for i,j in itertools.product(range(7), range(self.N_Stokes)):
+                    b_vec[i] += np.sum(np.conj(H_slab[:,j,i])*S_slab[:,j],axis=1)
+                
+                AHA_factor = Hermitian_batched_cholesky(np.moveaxis(np.asarray(AHA_kz[kz]), 0, 2), reg_diag)
+                f_f_kz[kz] = ifft2(np.moveaxis(Hermitian_batched_cholesky_solve(AHA_factor, b_vec), 1, 0), axes=(-2,-1))
+                
+                return kz
+            
+            with ThreadPoolExecutor(n_threads) as executor:
+                for kz in executor.map(solve_slab, [slice(k0, min(k0+kz_slab, N_kz)) for k0 in range(0, N_kz, kz_slab)]):
+                    if verbose:
+                        print('Solved kz planes %d-%d, elapsed time: %.2f'%(kz.start, kz.stop-1, time.time()-start_time))
+            
+            # inverse FFT along z in chunks of rows
+            if out is None:
+                out = np.zeros((7, self.N, self.M, self.N_defocus), dtype='float32')
+            
+            z_crop = slice(self.pad_z, N_kz-self.pad_z)
+            for y0 in range(0, self.N, N_rows):
+                rows = slice(y0, min(y0+N_rows, self.N))
+                f_rows = np.real(ifft(np.asarray(f_f_kz[:, :, rows]), axis=0))
+                out[:, rows] = np.moveaxis(f_rows[z_crop], 0, -1)
+            
+            del S_f_kz, f_f_kz
+        
+        finally:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+        
+        if verbose:
+            print('Finished reconstruction, elapsed time: %.2f'%(time.time()-start_time))
+        
+        return out
+    
+    
+    def _export_kz_major_transfer_functions(self, tf_dir, kz_slab, N_rows):
+        
+        # export H_dyadic_OTF and inc_AHA_3D_vec as kz-major .npy files (with the mean magnitudes of the AHA diagonal) into tf_dir
+        # the files are written into a temporary directory renamed to tf_dir once complete, such that concurrent reconstructions
+        # never read a partial export; transfer functions already in memory are transposed in chunks of rows, otherwise
+        # H_dyadic_OTF is streamed to disk one (N, M, N_defocus_3D) volume at a time and AHA is accumulated in kz slabs
+        
+        N_kz = self.N_defocus_3D
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp_', dir=os.path.dirname(tf_dir))
+        
+        try:
+            H_kz = np.lib.format.open_memmap(os.path.join(tmp_dir, 'H_dyadic_OTF_kz.npy'), mode='w+', dtype='complex64', 
+                                             shape=(N_kz, self.N_Stokes, 7, self.N_pattern, self.N, self.M))
+            AHA_kz = np.lib.format.open_memmap(os.path.join(tmp_dir, 'inc_AHA_3D_vec_kz.npy'), mode='w+', dtype='complex64', 
+                                               shape=(N_kz, 7, 7, self.N, self.M))
+            
+            if 'inc' in self._transfer_function_ready:
+                for y0 in range(0, self.N, N_rows):
+                    rows = slice(y0, min(y0+N_rows, self.N))
+                    H_kz[..., rows, :] = np.moveaxis(self.H_dyadic_OTF[..., rows, :, :], -1, 0)
+                    AHA_kz[..., rows, :] = np.moveaxis(self.inc_AHA_3D_vec[..., rows, :, :], -1, 0)
+                AHA_diag_mean = np.array([np.mean(np.abs(self.inc_AHA_3D_vec[i,i])) for i in range(7)])
+            
+            else:
+                self.Hz_det_setup(None, self.ph_deconv_layer, None, self.inc_recon)
+                self.gen_3D_vec_WOTF(True, pattern_out=lambda i: _kz_major_writer(H_kz, i))
+                
+                AHA_diag_sum = np.zeros((7,))
+                for k0 in range(0, N_kz, kz_slab):
+                    kz = slice(k0, min(k0+kz_slab, N_kz))
+                    H_slab = np.asarray(H_kz[kz])
+                    AHA_slab = np.zeros((kz.stop-kz.start, 7, 7, self.N, self.M), dtype='complex64')
+                    for i,j,p in itertools.product(range(7), range(7), range(self.N_Stokes)):
+                        AHA_slab[:,i,j] += np.sum(np.conj(H_slab[:,p,i])*H_slab[:,p,j],axis=1)
+                    AHA_kz[kz] = AHA_slab
+                    AHA_diag_sum += [np.sum(np.abs(AHA_slab[:,i,i])) for i in range(7)]
+                AHA_diag_mean = AHA_diag_sum/(N_kz*self.N*self.M)
+            
+            H_kz.flush()
+            AHA_kz.flush()
+            del H_kz, AHA_kz
+            np.save(os.path.join(tmp_dir, 'inc_AHA_3D_vec_diag_mean.npy'), AHA_diag_mean)
+            
+            os.rename(tmp_dir, tf_dir)
+        
+        except OSError:
+            # another reconstruction completed the same export first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not os.path.isdir(tf_dir):
+                raise
+        
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+    
+    
+    
+    def scattering_potential_tensor_to_3D_orientation(self, f_tensor, S_image_recon=None, material_type='positive', reg_ret_pr = 1e-2, itr=20, step_size=0.3,verbose=True,fast_gpu_mode=False, state=None):
         
         '''
     
@@ -1863,6 +2692,10 @@ class waveorder_microscopy:
                             
             fast_gpu_mode : bool
                             option to use faster gpu computation mode (all arrays in gpu, it may consume more memory)
+            
+            state         : dict
+                            state of the optic sign retrieval carried from one time point to the next (warm start), None to start from zero material maps;
+                            the iterations start from the material maps ('x_map', 'y_map') of a filled state and store the final ones in it
                                                   
         Returns
         -------
@@ -1889,15 +2722,17 @@ class waveorder_microscopy:
                               
         '''
         
+        self.transfer_function_setup('inc')
+        
         
         if self.pad_z != 0 and material_type == 'unknown':
             S_pad = np.pad(S_image_recon,((0,0),(0,0),(0,0),(0,0),(self.pad_z,self.pad_z)), mode='constant',constant_values=0)
             f_tensor_pad = np.pad(f_tensor,((0,0),(0,0),(0,0),(self.pad_z,self.pad_z)), mode='constant',constant_values=0)
             if self.pad_z < self.N_defocus:
-                S_pad[...,:self.pad_z] = (S_image_recon[...,:self.pad_z])[:,:,::-1]
-                S_pad[...,-self.pad_z:] = (S_image_recon[...,-self.pad_z:])[:,:,::-1]
-                f_tensor_pad[...,:self.pad_z] = (f_tensor[...,:self.pad_z])[:,:,::-1]
-                f_tensor_pad[...,-self.pad_z:] = (f_tensor[...,-self.pad_z:])[:,:,::-1]
+                S_pad[...,:self.pad_z] = (S_image_recon[...,:self.pad_z])[...,::-1]
+                S_pad[...,-self.pad_z:] = (S_image_recon[...,-self.pad_z:])[...,::-1]
+                f_tensor_pad[...,:self.pad_z] = (f_tensor[...,:self.pad_z])[...,::-1]
+                f_tensor_pad[...,-self.pad_z:] = (f_tensor[...,-self.pad_z:])[...,::-1]
 
             else:
                 print('pad_z is larger than number of z-slices, use zero padding (not effective) instead of reflection padding')
@@ -1955,8 +2790,12 @@ class waveorder_microscopy:
 
             f_vec  = f_tensor.copy()
 
-            x_map = np.zeros(f_tensor.shape[1:])
-            y_map = np.zeros(f_tensor.shape[1:])
+            if state is not None and state.get('x_map') is not None and state['x_map'].shape == f_tensor.shape[1:]:
+                x_map = state['x_map'].copy()
+                y_map = state['y_map'].copy()
+            else:
+                x_map = np.zeros(f_tensor.shape[1:])
+                y_map = np.zeros(f_tensor.shape[1:])
             
             
             if f_tensor.ndim == 4:
@@ -1975,12 +2814,19 @@ class waveorder_microscopy:
                      S_est_vec[p] += self.H_dyadic_2D_OTF[p,q]*f_vec_f[q,:,:,np.newaxis]
                         
                         
-            if self.use_gpu:
-                f_tensor_p = cp.array(f_tensor_p)
-                f_tensor_n = cp.array(f_tensor_n)
-                f_vec = cp.array(f_vec)
-                if fast_gpu_mode:
-                    S_stack_f = cp.array(S_stack_f)
+            # the material maps and the tensor components are on the device, the Stokes spectra only in fast_gpu_mode
+            xp = self.backend.xp
+            
+            f_tensor_p = self.backend.asarray(f_tensor_p)
+            f_tensor_n = self.backend.asarray(f_tensor_n)
+            f_vec = self.backend.asarray(f_vec)
+            
+            if fast_gpu_mode:
+                S_stack_f = self.backend.asarray(S_stack_f)
+                S_est_vec = self.backend.asarray(S_est_vec)
+                S_xp, to_S = xp, lambda x: x
+            else:
+                S_xp, to_S = np, self.backend.asnumpy
                 
             
             # iterative optic sign estimation algorithm
@@ -1995,142 +2841,66 @@ class waveorder_microscopy:
             
             for i in range(itr):
                 
-                if self.use_gpu:
-                    x_map = cp.array(x_map)
-                    y_map = cp.array(y_map)
+                x_map = self.backend.asarray(x_map)
+                y_map = self.backend.asarray(y_map)
                 
 
                 for j in range(5):
                     f_vec[j+2] = x_map*f_tensor_p[j] + y_map*f_tensor_n[j]
                 
                 S_est_vec_update = S_est_vec.copy()
-                
-                if self.use_gpu:
-                    
-                    if fast_gpu_mode:
-                        
-                        S_est_vec_update = cp.array(S_est_vec_update)
-                        
-                        if f_tensor.ndim == 4:
-                            f_vec_f = cp.fft.fftn(f_vec, axes=(1,2,3))
-
-                            for p,q in itertools.product(range(self.N_Stokes), range(5)):
-                                 S_est_vec_update[p] += cp.array(self.H_dyadic_OTF[p,q+2])*f_vec_f[np.newaxis,q+2]
-
-                        elif f_tensor.ndim == 3:
-                            f_vec_f = cp.fft.fft2(f_vec, axes=(1,2))
-
-                            for p,q in itertools.product(range(self.N_Stokes), range(5)):
-                                 S_est_vec_update[p] += cp.array(self.H_dyadic_2D_OTF[p,q+2])*f_vec_f[q+2,:,:,np.newaxis]
-                    
-                    else:
-                    
-                        if f_tensor.ndim == 4:
-                            f_vec_f = cp.fft.fftn(f_vec, axes=(1,2,3))
-
-                            for p,q in itertools.product(range(self.N_Stokes), range(5)):
-                                 S_est_vec_update[p] += cp.asnumpy(cp.array(self.H_dyadic_OTF[p,q+2])*f_vec_f[np.newaxis,q+2])
-
-                        elif f_tensor.ndim == 3:
-                            f_vec_f = cp.fft.fft2(f_vec, axes=(1,2))
-
-                            for p,q in itertools.product(range(self.N_Stokes), range(5)):
-                                 S_est_vec_update[p] += cp.asnumpy(cp.array(self.H_dyadic_2D_OTF[p,q+2])*f_vec_f[q+2,:,:,np.newaxis])
-                
-                else:
-                    
-                    if f_tensor.ndim == 4:
-                        f_vec_f = fftn(f_vec, axes=(1,2,3))
+                
+                if f_tensor.ndim == 4:
+                    f_vec_f = self.backend.fft.fftn(f_vec, axes=(1,2,3))
 
-                        for p,q in itertools.product(range(self.N_Stokes), range(5)):
-                             S_est_vec_update[p] += self.H_dyadic_OTF[p,q+2]*f_vec_f[np.newaxis,q+2]
+                    for p,q in itertools.product(range(self.N_Stokes), range(5)):
+                         S_est_vec_update[p] += to_S(self.backend.asarray(self.H_dyadic_OTF[p,q+2])*f_vec_f[np.newaxis,q+2])
 
-                    elif f_tensor.ndim == 3:
-                        f_vec_f = fft2(f_vec, axes=(1,2))
+                elif f_tensor.ndim == 3:
+                    f_vec_f = self.backend.fft.fft2(f_vec, axes=(1,2))
 
-                        for p,q in itertools.product(range(self.N_Stokes), range(5)):
-                             S_est_vec_update[p] += self.H_dyadic_2D_OTF[p,q+2]*f_vec_f[q+2,:,:,np.newaxis]
+                    for p,q in itertools.product(range(self.N_Stokes), range(5)):
+                         S_est_vec_update[p] += to_S(self.backend.asarray(self.H_dyadic_2D_OTF[p,q+2])*f_vec_f[q+2,:,:,np.newaxis])
 
 
                 S_diff = S_stack_f-S_est_vec_update
 
 
-
-                if fast_gpu_mode and self.use_gpu:
-                    err[i+1] = cp.asnumpy(cp.sum(cp.abs(S_diff)**2))
-                else:
-                    err[i+1] = np.sum(np.abs(S_diff)**2)
+                err[i+1] = float(S_xp.sum(S_xp.abs(S_diff)**2))
                     
                 if err[i+1]>err[i] and i>0:
-                    if self.use_gpu:
-                        x_map = cp.asnumpy(x_map)
-                        y_map = cp.asnumpy(y_map)
+                    x_map = self.backend.asnumpy(x_map)
+                    y_map = self.backend.asnumpy(y_map)
                     break
                     
-                if self.use_gpu:
-                    
-                    AH_S_diff = cp.zeros((5,)+f_tensor.shape[1:], complex)
-
-                    if f_tensor.ndim == 4:
-                        
-                        for p,q in itertools.product(range(5), range(self.N_Stokes)):
-                            if fast_gpu_mode:
-                                AH_S_diff[p] += cp.sum(cp.conj(cp.array(self.H_dyadic_OTF[q,p+2]))*S_diff[q],axis=0)
-                            else:
-                                AH_S_diff[p] += cp.sum(cp.conj(cp.array(self.H_dyadic_OTF[q,p+2]))*cp.array(S_diff[q]),axis=0)
-
-
-                        grad_x_map = -cp.real(cp.sum(f_tensor_p*cp.fft.ifftn(AH_S_diff,axes=(1,2,3)),axis=0))
-                        grad_y_map = -cp.real(cp.sum(f_tensor_n*cp.fft.ifftn(AH_S_diff,axes=(1,2,3)),axis=0))
-
-                    elif f_tensor.ndim == 3:
-
-                        for p,q in itertools.product(range(5), range(self.N_Stokes)):
-                            if fast_gpu_mode:
-                                AH_S_diff[p] += cp.sum(cp.conj(cp.array(self.H_dyadic_2D_OTF[q,p+2]))*S_diff[q],axis=2)
-                            else:
-                                AH_S_diff[p] += cp.sum(cp.conj(cp.array(self.H_dyadic_2D_OTF[q,p+2]))*cp.array(S_diff[q]),axis=2)
-
-
-                        grad_x_map = -cp.real(cp.sum(f_tensor_p*cp.fft.ifft2(AH_S_diff,axes=(1,2)),axis=0))
-                        grad_y_map = -cp.real(cp.sum(f_tensor_n*cp.fft.ifft2(AH_S_diff,axes=(1,2)),axis=0))
-
+                AH_S_diff = xp.zeros((5,)+f_tensor.shape[1:], complex)
 
-
-
-                    x_map -= grad_x_map/cp.max(cp.abs(grad_x_map))*step_size
-                    y_map -= grad_y_map/cp.max(cp.abs(grad_y_map))*step_size
+                if f_tensor.ndim == 4:
                     
-                    x_map = cp.asnumpy(x_map)
-                    y_map = cp.asnumpy(y_map)
-                    
-                else:
-
-                    AH_S_diff = np.zeros((5,)+f_tensor.shape[1:], complex)
-
-                    if f_tensor.ndim == 4:
-
-                        for p,q in itertools.product(range(5), range(self.N_Stokes)):
-                            AH_S_diff[p] += np.sum(np.conj(self.H_dyadic_OTF[q,p+2])*S_diff[q],axis=0)
+                    for p,q in itertools.product(range(5), range(self.N_Stokes)):
+                        AH_S_diff[p] += xp.sum(xp.conj(self.backend.asarray(self.H_dyadic_OTF[q,p+2]))*self.backend.asarray(S_diff[q]),axis=0)
 
 
-                        grad_x_map = -np.real(np.sum(f_tensor_p*ifftn(AH_S_diff,axes=(1,2,3)),axis=0))
-                        grad_y_map = -np.real(np.sum(f_tensor_n*ifftn(AH_S_diff,axes=(1,2,3)),axis=0))
+                    grad_x_map = -xp.real(xp.sum(f_tensor_p*self.backend.fft.ifftn(AH_S_diff,axes=(1,2,3)),axis=0))
+                    grad_y_map = -xp.real(xp.sum(f_tensor_n*self.backend.fft.ifftn(AH_S_diff,axes=(1,2,3)),axis=0))
 
-                    elif f_tensor.ndim == 3:
+                elif f_tensor.ndim == 3:
 
-                        for p,q in itertools.product(range(5), range(self.N_Stokes)):
-                            AH_S_diff[p] += np.sum(np.conj(self.H_dyadic_2D_OTF[q,p+2])*S_diff[q],axis=2)
+                    for p,q in itertools.product(range(5), range(self.N_Stokes)):
+                        AH_S_diff[p] += xp.sum(xp.conj(self.backend.asarray(self.H_dyadic_2D_OTF[q,p+2]))*self.backend.asarray(S_diff[q]),axis=2)
 
 
-                        grad_x_map = -np.real(np.sum(f_tensor_p*ifft2(AH_S_diff,axes=(1,2)),axis=0))
-                        grad_y_map = -np.real(np.sum(f_tensor_n*ifft2(AH_S_diff,axes=(1,2)),axis=0))
+                    grad_x_map = -xp.real(xp.sum(f_tensor_p*self.backend.fft.ifft2(AH_S_diff,axes=(1,2)),axis=0))
+                    grad_y_map = -xp.real(xp.sum(f_tensor_n*self.backend.fft.ifft2(AH_S_diff,axes=(1,2)),axis=0))
 
 
 
 
-                    x_map -= grad_x_map/np.max(np.abs(grad_x_map))*0.3
-                    y_map -= grad_y_map/np.max(np.abs(grad_y_map))*0.3
+                x_map -= grad_x_map/xp.max(xp.abs(grad_x_map))*step_size
+                y_map -= grad_y_map/xp.max(xp.abs(grad_y_map))*step_size
+                
+                x_map = self.backend.asnumpy(x_map)
+                y_map = self.backend.asnumpy(y_map)
 
                 if verbose:
                     print('|  %d  |  %.2e  |   %.2f   |'%(i+1,err[i+1],time.time()-tic_time))
@@ -2158,6 +2928,10 @@ class waveorder_microscopy:
             azimuth       = np.stack([azimuth_p, azimuth_n])
             theta         = np.stack([theta_p, theta_n]) 
             mat_map       = np.stack([x_map, y_map])
+            
+            if state is not None:
+                state['x_map'] = x_map.copy()
+                state['y_map'] = y_map.copy()
             print('Finish optic sign estimation, elapsed time: %.2f'%(time.time()-tic_time))
             
             
@@ -2176,7 +2950,8 @@ class waveorder_microscopy:
         
     
     def Phase_recon(self, S0_stack, method='Tikhonov', reg_u = 1e-6, reg_p = 1e-6, \
-                    rho = 1e-5, lambda_u = 1e-3, lambda_p = 1e-3, itr = 20, verbose=True, bg_filter=True):
+                    rho = 1e-5, lambda_u = 1e-3, lambda_p = 1e-3, itr = 20, verbose=True, bg_filter=True, \
+                    tol=None, adaptive_rho=False, output_stats=False, state=None):
         
         '''
     
@@ -2191,6 +2966,7 @@ class waveorder_microscopy:
                         denoiser for 2D phase reconstruction
                         'Tikhonov' for Tikhonov denoiser
                         'TV'       for TV denoiser
+                        'TV-PD'    for TV denoiser with the primal-dual (Chambolle-Pock) solver, 2 FFTs per variable and iteration
             
             reg_u     : float
                         Tikhonov regularization parameter for 2D absorption
@@ -2205,7 +2981,7 @@ class waveorder_microscopy:
                         TV regularization parameter for 2D absorption
                              
             rho       : float
-                        augmented Lagrange multiplier for 2D ADMM algorithm
+                        augmented Lagrange multiplier for 2D ADMM algorithm (dual step size of 'TV-PD')
                              
             itr       : int
                         number of iterations for 2D ADMM algorithm
@@ -2215,6 +2991,19 @@ class waveorder_microscopy:
                              
             bg_filter : bool
                         option for slow-varying 2D background normalization with uniform filter
+                             
+            tol       : float
+                        relative tolerance of the ADMM primal and dual residuals to stop the iterations early, None to run itr iterations
+                             
+            adaptive_rho : bool
+                           option to balance the ADMM primal and dual residuals by adapting rho
+                             
+            output_stats : bool
+                           option to return the ADMM iteration statistics as well (see Dual_variable_ADMM_TV_deconv_2D)
+            
+            state        : dict
+                           solver state of the TV iterations carried from one time point to the next (warm start), None to start cold;
+                           pass the same (initially empty) dict for every time point of a time series
                           
         Returns
         -------
@@ -2223,58 +3012,78 @@ class waveorder_microscopy:
                   
             phi_sample : numpy.ndarray
                          2D phase reconstruction (in the unit of rad) with the size of (N, M)
+                  
+            stats      : dict
+                         iteration statistics of the TV reconstruction (if output_stats is True, None for Tikhonov)
                       
                                           
         '''
         
+        self.transfer_function_setup('phase')
         
-        S0_stack = inten_normalization(S0_stack, bg_filter=bg_filter, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
         
-        if self.use_gpu:
-            
-            Hu = cp.array(self.Hu)
-            Hp = cp.array(self.Hp)
-            
-            S0_stack_f = cp.fft.fft2(S0_stack, axes=(0,1))
-            
-            AHA = [cp.sum(cp.abs(Hu)**2, axis=2) + reg_u, cp.sum(cp.conj(Hu)*Hp, axis=2),\
-                   cp.sum(cp.conj(Hp)*Hu, axis=2), cp.sum(cp.abs(Hp)**2, axis=2) + reg_p]
-            
-            b_vec = [cp.sum(cp.conj(Hu)*S0_stack_f, axis=2), \
-                     cp.sum(cp.conj(Hp)*S0_stack_f, axis=2)]
-            
-        else:
+        S0_stack = inten_normalization(self.backend.cast(S0_stack), bg_filter=bg_filter, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
+        
+        xp = self.backend.xp
+        
+        Hu = self.backend.asarray(self.Hu)
+        Hp = self.backend.asarray(self.Hp)
+        
+        def AHA_setup():
             
-            S0_stack_f = fft2(S0_stack,axes=(0,1))
+            AHA = [xp.sum(xp.abs(Hu)**2, axis=2) + reg_u, xp.sum(xp.conj(Hu)*Hp, axis=2),\
+                   xp.sum(xp.conj(Hp)*Hu, axis=2), xp.sum(xp.abs(Hp)**2, axis=2) + reg_p]
             
-            AHA = [np.sum(np.abs(self.Hu)**2, axis=2) + reg_u, np.sum(np.conj(self.Hu)*self.Hp, axis=2),\
-                   np.sum(np.conj(self.Hp)*self.Hu, axis=2), np.sum(np.abs(self.Hp)**2, axis=2) + reg_p]
+            determinant = AHA[0]*AHA[3] - AHA[1]*AHA[2] if method == 'Tikhonov' else None
             
-            b_vec = [np.sum(np.conj(self.Hu)*S0_stack_f, axis=2), \
-                     np.sum(np.conj(self.Hp)*S0_stack_f, axis=2)]
+            return AHA, determinant
+        
+        AHA, determinant = self.solver_cache_lookup('phase_2D', (method, reg_u, reg_p), AHA_setup)
+        
+        S0_stack_f = self.backend.fft.rfft2(S0_stack, axes=(0,1)) if self.real_fft else self.backend.fft.fft2(S0_stack, axes=(0,1))
+        
+        b_vec = [xp.sum(xp.conj(Hu)*S0_stack_f, axis=2), \
+                 xp.sum(xp.conj(Hp)*S0_stack_f, axis=2)]
         
         
         if method == 'Tikhonov':
             
             # Deconvolution with Tikhonov regularization
             
-            mu_sample, phi_sample = Dual_variable_Tikhonov_deconv_2D(AHA, b_vec, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
+            mu_sample, phi_sample = Dual_variable_Tikhonov_deconv_2D(AHA, b_vec, determinant=determinant, use_gpu=self.use_gpu, gpu_id=self.gpu_id, 
+                                                                     rfft_shape=(self.N, self.M) if self.real_fft else None, precision=self.precision)
+            stats = None
             
         elif method == 'TV':
             
             # ADMM deconvolution with anisotropic TV regularization
             
-            mu_sample, phi_sample = Dual_variable_ADMM_TV_deconv_2D(AHA, b_vec, rho, lambda_u, lambda_p, itr, verbose, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
+            mu_sample, phi_sample, stats = Dual_variable_ADMM_TV_deconv_2D(list(AHA), b_vec, rho, lambda_u, lambda_p, itr, verbose, use_gpu=self.use_gpu, gpu_id=self.gpu_id, 
+                                                                           rfft_shape=(self.N, self.M) if self.real_fft else None, precision=self.precision, 
+                                                                           tol=tol, adaptive_rho=adaptive_rho, output_stats=True, workspace=self.ADMM_workspace, state=state)
+            
+        elif method == 'TV-PD':
+            
+            # primal-dual deconvolution with anisotropic TV regularization
+            
+            mu_sample, phi_sample, stats = Dual_variable_PD_TV_deconv_2D(AHA, b_vec, rho, lambda_u, lambda_p, itr, verbose, use_gpu=self.use_gpu, gpu_id=self.gpu_id, 
+                                                                         rfft_shape=(self.N, self.M) if self.real_fft else None, precision=self.precision, 
+                                                                         tol=tol, adaptive_rho=adaptive_rho, output_stats=True, workspace=self.ADMM_workspace, state=state)
             
         
         phi_sample -= phi_sample.mean()
         
+        if output_stats:
+            return mu_sample, phi_sample, stats
+        
         return mu_sample, phi_sample
     
     
     def Phase_recon_semi_3D(self, S0_stack, method='Tikhonov', reg_u = 1e-6, reg_p = 1e-6, \
                     rho = 1e-5, lambda_u = 1e-3, lambda_p = 1e-3, itr = 20, verbose=False):
         
+        self.transfer_function_setup('phase')
+        
         mu_sample = np.zeros((self.N, self.M, self.N_defocus))
         phi_sample = np.zeros((self.N, self.M, self.N_defocus))
 
@@ -2298,38 +3107,27 @@ class waveorder_microscopy:
                   %(tf_start_idx,tf_end_idx, obj_start_idx, obj_end_idx, (obj_end_idx-obj_start_idx)==(tf_end_idx-tf_start_idx)))
             
         
-            if self.use_gpu:
-                S0_stack_sub = self.inten_normalization(cp.array(S0_stack[:,:,obj_start_idx:obj_end_idx]))
-                Hu = cp.array(self.Hu[:,:,tf_start_idx:tf_end_idx], copy=True)
-                Hp = cp.array(self.Hp[:,:,tf_start_idx:tf_end_idx], copy=True)
-
-                S0_stack_f = cp.fft.fft2(S0_stack_sub, axes=(0,1))
-
-                AHA = [cp.sum(cp.abs(Hu)**2, axis=2) + reg_u, cp.sum(cp.conj(Hu)*Hp, axis=2),\
-                       cp.sum(cp.conj(Hp)*Hu, axis=2), cp.sum(cp.abs(Hp)**2, axis=2) + reg_p]
-
-                b_vec = [cp.sum(cp.conj(Hu)*S0_stack_f, axis=2), \
-                         cp.sum(cp.conj(Hp)*S0_stack_f, axis=2)]
-
-            else:
-                S0_stack_sub = self.inten_normalization(S0_stack[:,:,obj_start_idx:obj_end_idx])
-                S0_stack_f = fft2(S0_stack_sub,axes=(0,1))
-                
-                Hu = self.Hu[:,:,tf_start_idx:tf_end_idx]
-                Hp = self.Hp[:,:,tf_start_idx:tf_end_idx]
+            xp = self.backend.xp
+            
+            S0_stack_sub = self.inten_normalization(self.backend.asarray(S0_stack[:,:,obj_start_idx:obj_end_idx]))
+            S0_stack_f = self.backend.fft.rfft2(S0_stack_sub, axes=(0,1)) if self.real_fft else self.backend.fft.fft2(S0_stack_sub, axes=(0,1))
+            
+            Hu = self.backend.asarray(self.Hu[:,:,tf_start_idx:tf_end_idx])
+            Hp = self.backend.asarray(self.Hp[:,:,tf_start_idx:tf_end_idx])
 
-                AHA = [np.sum(np.abs(Hu)**2, axis=2) + reg_u, np.sum(np.conj(Hu)*Hp, axis=2),\
-                       np.sum(np.conj(Hp)*Hu, axis=2), np.sum(np.abs(Hp)**2, axis=2) + reg_p]
+            AHA = [xp.sum(xp.abs(Hu)**2, axis=2) + reg_u, xp.sum(xp.conj(Hu)*Hp, axis=2),\
+                   xp.sum(xp.conj(Hp)*Hu, axis=2), xp.sum(xp.abs(Hp)**2, axis=2) + reg_p]
 
-                b_vec = [np.sum(np.conj(Hu)*S0_stack_f, axis=2), \
-                         np.sum(np.conj(Hp)*S0_stack_f, axis=2)]
+            b_vec = [xp.sum(xp.conj(Hu)*S0_stack_f, axis=2), \
+                     xp.sum(xp.conj(Hp)*S0_stack_f, axis=2)]
                 
                 
             if method == 'Tikhonov':
 
                 # Deconvolution with Tikhonov regularization
 
-                mu_sample_temp, phi_sample_temp = Dual_variable_Tikhonov_deconv_2D(AHA, b_vec, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
+                mu_sample_temp, phi_sample_temp = Dual_variable_Tikhonov_deconv_2D(AHA, b_vec, use_gpu=self.use_gpu, gpu_id=self.gpu_id, 
+                                                                                  rfft_shape=(self.N, self.M) if self.real_fft else None, precision=self.precision)
 
 
 
@@ -2337,7 +3135,9 @@ class waveorder_microscopy:
 
                 # ADMM deconvolution with anisotropic TV regularization
 
-                mu_sample_temp, phi_sample_temp = Dual_variable_ADMM_TV_deconv_2D(AHA, b_vec, rho, lambda_u, lambda_p, itr, verbose, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
+                mu_sample_temp, phi_sample_temp = Dual_variable_ADMM_TV_deconv_2D(AHA, b_vec, rho, lambda_u, lambda_p, itr, verbose, use_gpu=self.use_gpu, gpu_id=self.gpu_id, 
+                                                                                 rfft_shape=(self.N, self.M) if self.real_fft else None, precision=self.precision, 
+                                                                                 workspace=self.ADMM_workspace)
 
 
             mu_sample[:,:,i] = mu_sample_temp.copy()
@@ -2349,7 +3149,7 @@ class waveorder_microscopy:
         
     
     def Phase_recon_3D(self, S0_stack, absorption_ratio=0.0, method='Tikhonov', reg_re = 1e-4, autotune_re=False, reg_im = 1e-4,\
-                       rho = 1e-5, lambda_re = 1e-3, lambda_im = 1e-3, itr = 20, verbose=True):
+                       rho = 1e-5, lambda_re = 1e-3, lambda_im = 1e-3, itr = 20, verbose=True, tol=None, adaptive_rho=False, output_stats=False, state=None):
         
         '''
     
@@ -2367,6 +3167,7 @@ class waveorder_microscopy:
                                denoiser for 3D phase reconstruction
                                'Tikhonov' for Tikhonov denoiser
                                'TV'       for TV denoiser
+                               'TV-PD'    for TV denoiser with the primal-dual (Chambolle-Pock) solver, 2 FFTs per variable and iteration
                              
             reg_re           : float
                                Tikhonov regularization parameter for 3D phase
@@ -2378,7 +3179,7 @@ class waveorder_microscopy:
                                Tikhonov regularization parameter for 3D absorption
                                
             rho              : float
-                               augmented Lagrange multiplier for 3D ADMM algorithm
+                               augmented Lagrange multiplier for 3D ADMM algorithm (dual step size of 'TV-PD')
                                
             lambda_re        : float        
                                TV regularization parameter for 3D absorption
@@ -2392,6 +3193,18 @@ class waveorder_microscopy:
             verbose          : bool
                                option to display detailed progress of computations or not
                              
+            tol              : float
+                               relative tolerance of the ADMM primal and dual residuals to stop the iterations early, None to run itr iterations
+                             
+            adaptive_rho     : bool
+                               option to balance the ADMM primal and dual residuals by adapting rho
+                             
+            output_stats     : bool
+                               option to return the ADMM iteration statistics as well (see Dual_variable_ADMM_TV_deconv_2D)
+            
+            state            : dict
+                               solver state of the TV iterations carried from one time point to the next (warm start), None to start cold;
+                               pass the same (initially empty) dict for every time point of a time series
                           
         Returns
         -------
@@ -2401,9 +3214,14 @@ class waveorder_microscopy:
                   
             scaled f_imag    : numpy.ndarray
                                3D reconstruction of absorption with the size of (N, M, N_defocus)
+                  
+            stats            : dict
+                               iteration statistics of the TV reconstruction (if output_stats is True, None for Tikhonov)
                       
                                           
         '''
+        
+        self.transfer_function_setup('phase')
                 
         
         
@@ -2430,15 +3248,28 @@ class waveorder_microscopy:
 
             if method == 'Tikhonov':
 
-                f_real = Single_variable_Tikhonov_deconv_3D(S0_stack, H_eff, reg_re, use_gpu=self.use_gpu, gpu_id=self.gpu_id, autotune=autotune_re, verbose=verbose)
+                f_real = Single_variable_Tikhonov_deconv_3D(S0_stack, H_eff, reg_re, use_gpu=self.use_gpu, gpu_id=self.gpu_id, autotune=autotune_re, verbose=verbose, 
+                                                            real_fft=self.real_fft, precision=self.precision)
+                stats = None
 
             elif method == 'TV':
 
-                f_real = Single_variable_ADMM_TV_deconv_3D(S0_stack, H_eff, rho, reg_re, lambda_re, itr, verbose, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
+                f_real, stats = Single_variable_ADMM_TV_deconv_3D(S0_stack, H_eff, rho, reg_re, lambda_re, itr, verbose, use_gpu=self.use_gpu, gpu_id=self.gpu_id, 
+                                                                  real_fft=self.real_fft, precision=self.precision, 
+                                                                  tol=tol, adaptive_rho=adaptive_rho, output_stats=True, workspace=self.ADMM_workspace, state=state)
+
+            elif method == 'TV-PD':
+
+                f_real, stats = Single_variable_PD_TV_deconv_3D(S0_stack, H_eff, rho, reg_re, lambda_re, itr, verbose, use_gpu=self.use_gpu, gpu_id=self.gpu_id, 
+                                                                real_fft=self.real_fft, precision=self.precision, 
+                                                                tol=tol, adaptive_rho=adaptive_rho, output_stats=True, workspace=self.ADMM_workspace, state=state)
             
             if self.pad_z != 0:
                 f_real = f_real[...,self.pad_z:-(self.pad_z)]
             
+            if output_stats:
+                return -f_real*self.psz/4/np.pi*self.lambda_illu, stats
+            
             return -f_real*self.psz/4/np.pi*self.lambda_illu
         
         else:
@@ -2456,48 +3287,345 @@ class waveorder_microscopy:
                 S0_stack = inten_normalization_3D(S0_pad)
             
             
-            if self.use_gpu:
+            xp = self.backend.xp
             
-                H_re = cp.array(self.H_re)
-                H_im = cp.array(self.H_im)
-
-                S0_stack_f = cp.fft.fftn(cp.array(S0_stack).astype('float32'), axes=(-3,-2,-1))
-
-                AHA = [cp.sum(cp.abs(H_re)**2, axis=0) + reg_re, cp.sum(cp.conj(H_re)*H_im, axis=0),\
-                       cp.sum(cp.conj(H_im)*H_re, axis=0), cp.sum(cp.abs(H_im)**2, axis=0) + reg_im]
-
-                b_vec = [cp.sum(cp.conj(H_re)*S0_stack_f, axis=0), \
-                         cp.sum(cp.conj(H_im)*S0_stack_f, axis=0)]
-
-            else:
-
-                S0_stack_f = fftn(S0_stack,axes=(-3,-2,-1))
-
-                AHA = [np.sum(np.abs(self.H_re)**2, axis=0) + reg_re, np.sum(np.conj(self.H_re)*self.H_im, axis=0),\
-                       np.sum(np.conj(self.H_im)*self.H_re, axis=0), np.sum(np.abs(self.H_im)**2, axis=0) + reg_im]
+            H_re = self.backend.asarray(self.H_re)
+            H_im = self.backend.asarray(self.H_im)
+            
+            def AHA_setup():
+                
+                AHA = [xp.sum(xp.abs(H_re)**2, axis=0) + reg_re, xp.sum(xp.conj(H_re)*H_im, axis=0),\
+                       xp.sum(xp.conj(H_im)*H_re, axis=0), xp.sum(xp.abs(H_im)**2, axis=0) + reg_im]
+                
+                determinant = AHA[0]*AHA[3] - AHA[1]*AHA[2] if method == 'Tikhonov' else None
+                
+                return AHA, determinant
+            
+            AHA, determinant = self.solver_cache_lookup('phase_3D', (method, reg_re, reg_im), AHA_setup)
+            
+            fftn_xp = self.backend.fft.rfftn if self.real_fft else self.backend.fft.fftn
+            S0_stack_f = fftn_xp(self.backend.cast(self.backend.asarray(S0_stack, dtype='float32' if self.use_gpu else None)), axes=(-3,-2,-1))
 
-                b_vec = [np.sum(np.conj(self.H_re)*S0_stack_f, axis=0), \
-                         np.sum(np.conj(self.H_im)*S0_stack_f, axis=0)]
+            b_vec = [xp.sum(xp.conj(H_re)*S0_stack_f, axis=0), \
+                     xp.sum(xp.conj(H_im)*S0_stack_f, axis=0)]
 
 
             if method == 'Tikhonov':
 
                 # Deconvolution with Tikhonov regularization
                 
-                f_real, f_imag = Dual_variable_Tikhonov_deconv_3D(AHA, b_vec, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
+                f_real, f_imag = Dual_variable_Tikhonov_deconv_3D(AHA, b_vec, determinant=determinant, use_gpu=self.use_gpu, gpu_id=self.gpu_id, 
+                                                                  rfft_shape=(self.N, self.M, self.N_defocus_3D) if self.real_fft else None, precision=self.precision)
+                stats = None
 
             elif method == 'TV':
 
                 # ADMM deconvolution with anisotropic TV regularization
 
-                f_real, f_imag = Dual_variable_ADMM_TV_deconv_3D(AHA, b_vec, rho, lambda_re, lambda_im, itr, verbose, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
+                f_real, f_imag, stats = Dual_variable_ADMM_TV_deconv_3D(list(AHA), b_vec, rho, lambda_re, lambda_im, itr, verbose, use_gpu=self.use_gpu, gpu_id=self.gpu_id, 
+                                                                        rfft_shape=(self.N, self.M, self.N_defocus_3D) if self.real_fft else None, precision=self.precision, 
+                                                                        tol=tol, adaptive_rho=adaptive_rho, output_stats=True, workspace=self.ADMM_workspace, state=state)
+
+            elif method == 'TV-PD':
+
+                # primal-dual deconvolution with anisotropic TV regularization
+
+                f_real, f_imag, stats = Dual_variable_PD_TV_deconv_3D(AHA, b_vec, rho, lambda_re, lambda_im, itr, verbose, use_gpu=self.use_gpu, gpu_id=self.gpu_id, 
+                                                                      rfft_shape=(self.N, self.M, self.N_defocus_3D) if self.real_fft else None, precision=self.precision, 
+                                                                      tol=tol, adaptive_rho=adaptive_rho, output_stats=True, workspace=self.ADMM_workspace, state=state)
                 
             
             if self.pad_z != 0:
                 f_real = f_real[...,self.pad_z:-(self.pad_z)]
                 f_imag = f_imag[...,self.pad_z:-(self.pad_z)]
             
+            if output_stats:
+                return -f_real*self.psz/4/np.pi*self.lambda_illu, f_imag*self.psz/4/np.pi*self.lambda_illu, stats
+            
             return -f_real*self.psz/4/np.pi*self.lambda_illu, f_imag*self.psz/4/np.pi*self.lambda_illu
+    
+    
+    def Phase_recon_3D_multi_reg(self, S0_stack, reg_re_list, absorption_ratio=0.0, out=None, stream=False):
+        
+        '''
+    
+        conduct 3D phase reconstruction with Tikhonov regularization for a list of regularization parameters (e.g. for regularization sweeps)
+        the normalization, padding, forward FFT and |H|^2 terms are shared by all the regularization parameters
+        
+        Parameters
+        ----------
+            S0_stack         : numpy.ndarray
+                               defocused stack of S0 intensity images with the size of (N, M, N_defocus) (N_pattern == 1 only)
+                        
+            reg_re_list      : list or numpy.ndarray
+                               Tikhonov regularization parameters for 3D phase with the size of (N_reg,)
+                        
+            absorption_ratio : float
+                               assumption of correlation between phase and absorption (0 means absorption = phase*0)
+                               
+            out              : numpy.ndarray
+                               preallocated output with the size of (N_reg, N, M, N_defocus) (e.g. a memory-mapped array), allocated if None
+                               
+            stream           : bool
+                               option to return a generator yielding (reg_re, phase) one by one instead of the stacked output
+                          
+        Returns
+        -------
+            phase            : numpy.ndarray
+                               3D reconstructions of phase (in the unit of rad) with the size of (N_reg, N, M, N_defocus)
+                               (a generator of (reg_re, phase with the size of (N, M, N_defocus)) if stream is True)
+                  
+                                          
+        '''
+        
+        if self.N_pattern != 1:
+            raise ValueError('Phase_recon_3D_multi_reg only supports a single illumination pattern (N_pattern == 1)')
+        
+        self.transfer_function_setup('phase')
+        
+        if self.pad_z == 0:
+            S0_stack = inten_normalization_3D(S0_stack)
+        else:
+            S0_pad = np.pad(S0_stack,((0,0),(0,0),(self.pad_z,self.pad_z)), mode='constant',constant_values=0)
+            if self.pad_z < self.N_defocus:
+                S0_pad[:,:,:self.pad_z] = (S0_stack[:,:,:self.pad_z])[:,:,::-1]
+                S0_pad[:,:,-self.pad_z:] = (S0_stack[:,:,-self.pad_z:])[:,:,::-1]
+            else:
+                print('pad_z is larger than number of z-slices, use zero padding (not effective) instead of reflection padding')
+
+            S0_stack = inten_normalization_3D(S0_pad)
+        
+        H_eff = self.H_re + absorption_ratio*self.H_im
+        
+        def sweep():
+            for reg_re, f_real in zip(reg_re_list, Single_variable_Tikhonov_deconv_3D_multi_reg(S0_stack, H_eff, reg_re_list, 
+                                                                                                  use_gpu=self.use_gpu, gpu_id=self.gpu_id, 
+                                                                                                  real_fft=self.real_fft, precision=self.precision)):
+                if self.pad_z != 0:
+                    f_real = f_real[...,self.pad_z:-(self.pad_z)]
+                
+                yield reg_re, -f_real*self.psz/4/np.pi*self.lambda_illu
+        
+        if stream:
+            return sweep()
+        
+        if out is None:
+            out = np.zeros((len(reg_re_list), self.N, self.M, self.N_defocus), dtype='float32')
+        
+        for i, (_, phase) in enumerate(sweep()):
+            out[i] = phase
+        
+        return out
+    
+    
+    
+##############   large field-of-view function group   ##############
+
+    def Tiled_recon(self, I_full, recon_func, out, overlap, in_index=(), out_index=(), in_yx_axes=(-2, -1), out_yx_axes=(-2, -1), 
+                    n_workers=1, verbose=True):
+        
+        '''
+    
+        reconstruct a field of view larger than the transfer functions of the microscope with overlapping tiles of size (N, M)
+        
+        the transfer functions are built once at the tile size (img_dim of the microscope), the tiles are read from I_full,
+        reconstructed with recon_func (on n_workers threads) and alpha-blended directly into out, 
+        so the memory is bounded by the size of the tiles in flight instead of the full field of view
+        
+        Parameters
+        ----------
+            I_full      : numpy.ndarray, zarr.Array or any array supporting slicing
+                          full field-of-view data, e.g. reader.get_zarr(p) of a WaveorderReader (read one tile at a time)
+                          
+            recon_func  : callable
+                          recon_func(I_tile) reconstructs one tile of the data (with the size of (N, M) along in_yx_axes) 
+                          and returns the reconstruction (with the size of (N, M) along out_yx_axes), 
+                          e.g. lambda I_tile: setup.Phase_recon_3D(I_tile, ...) 
+                          
+            out         : numpy.ndarray, zarr.Array or any array supporting slicing
+                          full field-of-view output the blended reconstruction is written into, e.g. a zarr array of a WaveorderWriter
+                          
+            overlap     : int or tuple
+                          minimal number of overlapping pixels between neighboring tiles (in y and x directions)
+                          
+            in_index    : tuple
+                          leading indices of I_full selecting the data to reconstruct, e.g. (t,) for a (T, C, Z, Y, X) reader array
+                          
+            out_index   : tuple
+                          leading indices of out selecting where the reconstruction is written, e.g. (t,) for a (T, C, Z, Y, X) array
+                          
+            in_yx_axes  : tuple
+                          y and x axes of the data I_full[in_index]
+                          
+            out_yx_axes : tuple
+                          y and x axes of the reconstruction returned by recon_func (and of out[out_index])
+                          
+            n_workers   : int
+                          number of threads reading and reconstructing tiles concurrently
+                          
+            verbose     : bool
+                          option to print the progress of the reconstruction
+                          
+        Returns
+        -------
+            out         : numpy.ndarray, zarr.Array or any array supporting slicing
+                          the blended reconstruction of the full field of view
+                          
+                              
+        '''
+        
+        if np.isscalar(overlap):
+            overlap = (overlap, overlap)
+        
+        in_ndim = len(I_full.shape) - len(in_index)
+        in_yx_axes = tuple(axis % in_ndim for axis in in_yx_axes)
+        N_full, M_full = I_full.shape[len(in_index)+in_yx_axes[0]], I_full.shape[len(in_index)+in_yx_axes[1]]
+        
+        out_ndim = len(out.shape) - len(out_index)
+        out_yx_axes = tuple(axis % out_ndim for axis in out_yx_axes)
+        if (out.shape[len(out_index)+out_yx_axes[0]], out.shape[len(out_index)+out_yx_axes[1]]) != (N_full, M_full):
+            raise ValueError('the output must have the same (y, x) size as the input (%d, %d)'%(N_full, M_full))
+        
+        ns, ms = generate_tile_coordinates((N_full, M_full), (self.N, self.M), overlap)
+        
+        # separable blending weights, normalized such that the weights of all the tiles add up to one at every pixel
+        y_weights = tile_blending_weights(ns, self.N, N_full, overlap[0])
+        x_weights = tile_blending_weights(ms, self.M, M_full, overlap[1])
+        
+        weight_shape_y = [1]*out_ndim
+        weight_shape_y[out_yx_axes[0]] = self.N
+        weight_shape_x = [1]*out_ndim
+        weight_shape_x[out_yx_axes[1]] = self.M
+        
+        def region(index, ndim, yx_axes, n_start, m_start):
+            region_slices = [slice(None)]*ndim
+            region_slices[yx_axes[0]] = slice(n_start, n_start+self.N)
+            region_slices[yx_axes[1]] = slice(m_start, m_start+self.M)
+            return tuple(index) + tuple(region_slices)
+        
+        def recon_tile(n_start, m_start):
+            I_tile = np.asarray(I_full[region(in_index, in_ndim, in_yx_axes, n_start, m_start)])
+            return np.asarray(recon_func(I_tile))
+        
+        # the transfer functions of a lazy microscope are built before the worker threads start
+        self.prepare()
+        
+        out[tuple(out_index) + (Ellipsis,)] = 0
+        
+        tiles = [(i, j) for i in range(len(ns)) for j in range(len(ms))]
+        t0 = time.time()
+        
+        with ThreadPoolExecutor(n_workers) as executor:
+            pending = {}
+            next_tile = 0
+            
+            while next_tile < len(tiles) or pending:
+                
+                # at most 2*n_workers tiles in flight
+                while next_tile < len(tiles) and len(pending) < 2*n_workers:
+                    i, j = tiles[next_tile]
+                    pending[executor.submit(recon_tile, ns[i], ms[j])] = (i, j)
+                    next_tile += 1
+                
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i, j = pending.pop(future)
+                    tile_recon = future.result()
+                    
+                    weights = np.reshape(y_weights[i], weight_shape_y)*np.reshape(x_weights[j], weight_shape_x)
+                    out_region = region(out_index, out_ndim, out_yx_axes, ns[i], ms[j])
+                    out[out_region] = out[out_region] + weights*tile_recon
+                    
+                    if verbose:
+                        print('Finished tile at (y, x) = (%d, %d), elapsed time: %.2f'%(ns[i], ms[j], time.time()-t0))
+        
+        return out
+    
+    
+    def Slab_recon(self, I_full, recon_func, out, overlap, in_index=(), out_index=(), in_z_axis=-1, out_z_axis=-1, verbose=True):
+        
+        '''
+    
+        reconstruct a z-stack taller than the transfer functions of the microscope with overlapping axial slabs of N_defocus slices
+        
+        the microscope is constructed with the defocus positions of one slab (e.g. z_defocus[:N_slab], with the spacing of the stack)
+        such that the 3D transfer functions are computed for the slab depth (N_defocus_3D = N_defocus + 2*pad_z) only,
+        the slab boundaries are padded with the pad_z reflection of the 3D reconstructions, 
+        and the slabs are alpha-blended along z directly into out
+        
+        Parameters
+        ----------
+            I_full      : numpy.ndarray, zarr.Array or any array supporting slicing
+                          full z-stack data, e.g. reader.get_zarr(p) of a WaveorderReader (read one slab at a time)
+                          
+            recon_func  : callable
+                          recon_func(I_slab) reconstructs one slab of the data (with N_defocus slices along in_z_axis)
+                          and returns the reconstruction (with N_defocus slices along out_z_axis), 
+                          e.g. lambda I_slab: setup.Phase_recon_3D(I_slab, ...) 
+                          
+            out         : numpy.ndarray, zarr.Array or any array supporting slicing
+                          full z-stack output the blended reconstruction is written into
+                          
+            overlap     : int
+                          minimal number of overlapping slices between neighboring slabs
+                          
+            in_index    : tuple
+                          leading indices of I_full selecting the data to reconstruct, e.g. (t,) for a (T, C, Z, Y, X) reader array
+                          
+            out_index   : tuple
+                          leading indices of out selecting where the reconstruction is written
+                          
+            in_z_axis   : int
+                          z axis of the data I_full[in_index]
+                          
+            out_z_axis  : int
+                          z axis of the reconstruction returned by recon_func (and of out[out_index])
+                          
+            verbose     : bool
+                          option to print the progress of the reconstruction
+                          
+        Returns
+        -------
+            out         : numpy.ndarray, zarr.Array or any array supporting slicing
+                          the blended reconstruction of the full z-stack
+                          
+                              
+        '''
+        
+        in_ndim = len(I_full.shape) - len(in_index)
+        in_z_axis = in_z_axis % in_ndim
+        N_z_full = I_full.shape[len(in_index)+in_z_axis]
+        
+        out_ndim = len(out.shape) - len(out_index)
+        out_z_axis = out_z_axis % out_ndim
+        if out.shape[len(out_index)+out_z_axis] != N_z_full:
+            raise ValueError('the output must have the same number of slices as the input (%d)'%(N_z_full))
+        
+        z_starts = generate_tile_starts(N_z_full, self.N_defocus, overlap)
+        z_weights = tile_blending_weights(z_starts, self.N_defocus, N_z_full, overlap)
+        
+        weight_shape = [1]*out_ndim
+        weight_shape[out_z_axis] = self.N_defocus
+        
+        def region(index, ndim, z_axis, z_start):
+            region_slices = [slice(None)]*ndim
+            region_slices[z_axis] = slice(z_start, z_start+self.N_defocus)
+            return tuple(index) + tuple(region_slices)
+        
+        out[tuple(out_index) + (Ellipsis,)] = 0
+        t0 = time.time()
+        
+        for z_start, weights in zip(z_starts, z_weights):
+            I_slab = np.asarray(I_full[region(in_index, in_ndim, in_z_axis, z_start)])
+            slab_recon = np.asarray(recon_func(I_slab))
+            
+            out_region = region(out_index, out_ndim, out_z_axis, z_start)
+            out[out_region] = out[out_region] + np.reshape(weights, weight_shape)*slab_recon
+            
+            if verbose:
+                print('Finished slab at z = %d, elapsed time: %.2f'%(z_start, time.time()-t0))
+        
+        return out
 
 
 class fluorescence_microscopy:
@@ -2542,11 +3670,20 @@ class fluorescence_microscopy:
 
         gpu_id               : int
                                number refering to which gpu will be used
+        
+        real_fft             : bool
+                               option to run the deconvolutions with real-to-complex FFTs (rfft2/rfftn)
+                               the OTFs are then stored on the half grid (N_wavelength, N, M//2+1) in 2D and (N_wavelength, N, M, N_defocus_3D//2+1) in 3D
+        
+        precision            : str
+                               'double' to compute in float64/complex128 (default)
+                               'single' to keep the OTFs, the deconvolutions and the outputs in float32/complex64
 
 
     '''
 
-    def __init__(self, img_dim, lambda_emiss, ps, psz, NA_obj, n_media=1, deconv_mode='3D-WF', pad_z=0, use_gpu=False, gpu_id=0):
+    def __init__(self, img_dim, lambda_emiss, ps, psz, NA_obj, n_media=1, deconv_mode='3D-WF', pad_z=0, use_gpu=False, gpu_id=0, real_fft=False,
+                 precision='double'):
 
         '''
 
@@ -2560,10 +3697,9 @@ class fluorescence_microscopy:
 
         self.use_gpu = use_gpu
         self.gpu_id = gpu_id
-
-        if self.use_gpu:
-            globals()['cp'] = __import__("cupy")
-            cp.cuda.Device(self.gpu_id).use()
+        self.precision = precision
+        
+        self.backend = array_backend(self.use_gpu, self.gpu_id, self.precision)
 
         # Basic parameter
         self.N, self.M, self.N_defocus = img_dim
@@ -2575,6 +3711,7 @@ class fluorescence_microscopy:
         self.NA_obj = NA_obj / n_media
         self.N_wavelength = len(lambda_emiss)
         self.deconv_mode = deconv_mode
+        self.real_fft = real_fft
 
         # setup microscocpe variables
         self.xx, self.yy, self.fxx, self.fyy = gen_coordinate((self.N, self.M), ps)
@@ -2632,13 +3769,21 @@ class fluorescence_microscopy:
         
         if deconv_mode == '2D-WF':
             self.PSF_WF_2D = np.abs(ifft2(self.Pupil_obj, axes=(1,2)))**2
-            self.OTF_WF_2D = fft2(self.PSF_WF_2D, axes=(1, 2))
+            if self.real_fft:
+                self.OTF_WF_2D = rfft2(self.PSF_WF_2D, axes=(1, 2))
+            else:
+                self.OTF_WF_2D = fft2(self.PSF_WF_2D, axes=(1, 2))
             self.OTF_WF_2D /= (np.max(np.abs(self.OTF_WF_2D),axis=(1,2)))[:,np.newaxis,np.newaxis]
+            self.OTF_WF_2D = self.backend.cast(self.OTF_WF_2D)
         
         if deconv_mode == '3D-WF':
             self.PSF_WF_3D = np.abs(ifft2(self.Hz_det, axes=(1,2)))**2
-            self.OTF_WF_3D = fftn(self.PSF_WF_3D, axes=(1, 2, 3))
+            if self.real_fft:
+                self.OTF_WF_3D = rfftn(self.PSF_WF_3D, axes=(1, 2, 3))
+            else:
+                self.OTF_WF_3D = fftn(self.PSF_WF_3D, axes=(1, 2, 3))
             self.OTF_WF_3D /= (np.max(np.abs(self.OTF_WF_3D),axis=(1,2,3)))[:,np.newaxis,np.newaxis,np.newaxis]
+            self.OTF_WF_3D = self.backend.cast(self.OTF_WF_3D)
             
     def deconvolve_fluor_2D(self, I_fluor, bg_level, reg):
         """
@@ -2671,23 +3816,27 @@ class fluorescence_microscopy:
         elif I_fluor.ndim == 3:
             I_fluor_process = I_fluor.copy()
             
-        I_fluor_process = I_fluor_process.astype('float')
+        I_fluor_process = I_fluor_process.astype(self.backend.float_dtype)
             
         I_fluor_deconv = np.zeros_like(I_fluor_process)
         
+        xp, xp_fft = self.backend.xp, self.backend.fft
+        
         for i in range(self.N_wavelength):
             
             I_fluor_minus_bg = np.maximum(0, I_fluor_process[i] - bg_level[i])
             
-            if self.use_gpu:
-
-                I_fluor_f = cp.fft.fft2(cp.array(I_fluor_minus_bg.astype('float32')), axes=(-2,-1))
-                H_eff      = cp.array(self.OTF_WF_2D[i].astype('complex64'))
-
-                I_fluor_deconv[i] = cp.asnumpy(np.maximum(cp.real(cp.fft.ifft2(I_fluor_f * cp.conj(H_eff) / (cp.abs(H_eff)**2 + reg[i]),axes=(-2,-1))),0))
+            H_eff = self.backend.asarray(self.OTF_WF_2D[i], dtype='complex64' if self.use_gpu else None)
+            I_fluor_minus_bg = self.backend.asarray(I_fluor_minus_bg, dtype='float32' if self.use_gpu else None)
+            
+            if self.real_fft:
+                I_fluor_f = xp_fft.rfft2(I_fluor_minus_bg, axes=(-2,-1))
+                I_fluor_deconv_i = xp_fft.irfft2(I_fluor_f * xp.conj(H_eff) / (xp.abs(H_eff)**2 + reg[i]), s=(self.N, self.M), axes=(-2,-1))
             else:
-                I_fluor_f = fft2(I_fluor_minus_bg, axes=(-2,-1))
-                I_fluor_deconv[i] = np.maximum(np.real(ifftn(I_fluor_f * np.conj(self.OTF_WF_2D[i]) / (np.abs(self.OTF_WF_2D[i])**2 + reg[i]),axes=(-2,-1))),0)
+                I_fluor_f = xp_fft.fft2(I_fluor_minus_bg, axes=(-2,-1))
+                I_fluor_deconv_i = xp.real(xp_fft.ifft2(I_fluor_f * xp.conj(H_eff) / (xp.abs(H_eff)**2 + reg[i]), axes=(-2,-1)))
+            
+            I_fluor_deconv[i] = self.backend.asnumpy(xp.maximum(I_fluor_deconv_i, 0))
                                                
         return np.squeeze(I_fluor_deconv)
         
@@ -2747,11 +3896,11 @@ class fluorescence_microscopy:
         else:
             I_fluor_pad = I_fluor_process
         
-        I_fluor_process = I_fluor_process.astype('float')
+        I_fluor_process = I_fluor_process.astype(self.backend.float_dtype)
         
         if autotune:
             N, M, Z = I_fluor_process.shape[1:]
-            I_fluor_deconv = np.zeros((self.N_wavelength, 3, N, M, Z))
+            I_fluor_deconv = np.zeros((self.N_wavelength, 3, N, M, Z), dtype=self.backend.float_dtype)
         else:
             I_fluor_deconv = np.zeros_like(I_fluor_process)
             
@@ -2764,7 +3913,8 @@ class fluorescence_microscopy:
 
             I_fluor_deconv_pad = Single_variable_Tikhonov_deconv_3D(I_fluor_minus_bg, self.OTF_WF_3D[i], reg[i], 
                                                                     use_gpu=self.use_gpu, gpu_id=self.gpu_id, 
-                                                                    autotune=autotune, verbose=verbose, search_range_auto=search_range_auto)
+                                                                    autotune=autotune, verbose=verbose, search_range_auto=search_range_auto,
+                                                                    real_fft=self.real_fft, precision=self.precision)
 
                 
             if self.pad_z != 0:
@@ -2774,6 +3924,86 @@ class fluorescence_microscopy:
             
 
         return np.squeeze(I_fluor_deconv)
+    
+    
+    def deconvolve_fluor_3D_multi_reg(self, I_fluor, bg_level, reg_list, out=None, stream=False):
+        """
+
+        Performs deconvolution with Tikhonov regularization on raw fluorescence stack for a list of regularization parameters.
+        The padding, background subtraction, forward FFT and |OTF|^2 terms are shared by all the regularization parameters.
+
+        Parameters
+        ----------
+            I_fluor         : numpy.ndarray
+                              Raw fluorescence intensity stack in dimensions (N_wavelength, N, M, Z) or (N, M, Z)
+                              the order of the first index of I_fluor should match the order of the emission wavelengths
+
+            bg_level        : list or numpy.ndarray
+                              Estimated background intensity level in dimensions (N_wavelength,)
+                              the order of the bg value should match the order of the first index of I_fluor
+
+            reg_list        : list or numpy.ndarray
+                              Tikhonov regularization parameters in dimensions (N_reg,) shared by all channels 
+                              or (N_wavelength, N_reg) for each channel
+                              
+            out             : numpy.ndarray
+                              preallocated output in dimensions (N_wavelength, N_reg, N, M, Z) (e.g. a memory-mapped array), allocated if None
+                              
+            stream          : bool
+                              option to return a generator yielding (wavelength index, reg, deconvolved stack) one by one instead of the stacked output
+                              
+
+        Returns
+        -------
+            I_fluor_deconv  : numpy.ndarray 
+                              3D deconvolved fluoresence stacks in dimensions (N_wavelength, N_reg, N, M, Z) 
+                              or (N_reg, N, M, Z) if I_fluor is of dimensions (N, M, Z)
+                              (a generator of (wavelength index, reg, deconvolved stack in dimensions (N, M, Z)) if stream is True)
+
+        """
+        
+        if I_fluor.ndim == 3:
+            I_fluor_process = I_fluor[np.newaxis,:,:,:]
+        elif I_fluor.ndim == 4:
+            I_fluor_process = I_fluor
+        
+        reg_list = np.array(reg_list)
+        if reg_list.ndim == 1:
+            reg_list = np.tile(reg_list[np.newaxis], (self.N_wavelength, 1))
+        
+        def sweep():
+            for i in range(self.N_wavelength):
+                
+                I_fluor_pad = I_fluor_process[i]
+                if self.pad_z != 0:
+                    I_fluor_pad = np.pad(I_fluor_process[i],((0,0),(0,0),(self.pad_z,self.pad_z)), mode='constant',constant_values=0)
+                    if self.pad_z < self.N_defocus:
+                        I_fluor_pad[:,:,:self.pad_z] = (I_fluor_process[i,:,:,:self.pad_z])[:,:,::-1]
+                        I_fluor_pad[:,:,-self.pad_z:] = (I_fluor_process[i,:,:,-self.pad_z:])[:,:,::-1]
+                    else:
+                        print('pad_z is larger than number of z-slices, use zero padding (not effective) instead of reflection padding')
+                
+                I_fluor_minus_bg = np.maximum(0, I_fluor_pad - bg_level[i])
+                
+                for reg, I_fluor_deconv_pad in zip(reg_list[i], Single_variable_Tikhonov_deconv_3D_multi_reg(I_fluor_minus_bg, self.OTF_WF_3D[i], reg_list[i], 
+                                                                                                               use_gpu=self.use_gpu, gpu_id=self.gpu_id, 
+                                                                                                               real_fft=self.real_fft, precision=self.precision)):
+                    if self.pad_z != 0:
+                        I_fluor_deconv_pad = I_fluor_deconv_pad[...,self.pad_z:-(self.pad_z)]
+                    
+                    yield i, reg, np.maximum(I_fluor_deconv_pad,0)
+        
+        if stream:
+            return sweep()
+        
+        if out is None:
+            out = np.zeros((self.N_wavelength, reg_list.shape[1])+I_fluor_process.shape[1:], dtype=self.backend.float_dtype)
+        
+        N_reg = reg_list.shape[1]
+        for k, (i, _, I_fluor_deconv) in enumerate(sweep()):
+            out[i, k%N_reg] = I_fluor_deconv
+        
+        return out[0] if I_fluor.ndim == 3 else out
 
 
     def Fluor_anisotropy_recon(self, S1_stack, S2_stack):
@@ -2800,15 +4030,12 @@ class fluorescence_microscopy:
 
         """
 
-        if self.use_gpu:
-            S1_stack = cp.array(S1_stack)
-            S2_stack = cp.array(S2_stack)
-
-            anisotropy = cp.asnumpy(0.5 * cp.sqrt(S1_stack ** 2 + S2_stack ** 2))
-            orientation = cp.asnumpy((0.5 * cp.arctan2(S2_stack, S1_stack)) % np.pi)
+        xp = self.backend.xp
+        
+        S1_stack = self.backend.cast(self.backend.asarray(S1_stack))
+        S2_stack = self.backend.cast(self.backend.asarray(S2_stack))
 
-        else:
-            anisotropy = 0.5 * np.sqrt(S1_stack**2 + S2_stack**2)
-            orientation = (0.5 * np.arctan2(S2_stack, S1_stack)) % np.pi
+        anisotropy = self.backend.asnumpy(0.5 * xp.sqrt(S1_stack**2 + S2_stack**2))
+        orientation = self.backend.asnumpy((0.5 * xp.arctan2(S2_stack, S1_stack)) % np.pi)
 
         return anisotropy, orientation
@@ -3,7 +3,7 @@ import matplotlib.pyplot as plt
 import itertools
 import time
 import os
-from numpy.fft import fft, ifft, fft2, ifft2, fftn, ifftn, fftshift, ifftshift
+from .fft_backend import fft, ifft, fft2, ifft2, fftn, ifftn, fftshift, ifftshift
 from concurrent.futures import ProcessPoolExecutor
 from .util import *
 from .optics import *
@@ -40,6 +40,28 @@ def Jones_PC_forward_model(t_eigen, sa_orientation, fxx, fyy, xx, yy, N_defocus,
     return (Stokes_ang, I_meas_ang)
 
 
+def _SEAGLE_load_state(state, key, shape):
+    
+    # converged field and reference error of the point source key = (pattern, point source) in the state of a previous simulation,
+    # (None, None) to start from the Born approximation
+    
+    if state is None or state.get('fields', {}).get(key) is None or state['fields'][key].shape != shape:
+        return None, None
+    
+    return state['fields'][key], state['err_ref'][key]
+
+
+def _SEAGLE_save_state(state, key, field, err_ref, n_itr):
+    
+    # keep the converged field on the host, with the error of the first iteration from the Born approximation,
+    # so that a warm start stops at the same absolute error as a cold one
+    
+    if state is not None:
+        state.setdefault('fields', {})[key] = field
+        state.setdefault('err_ref', {})[key] = err_ref
+        state.setdefault('iterations', {})[key] = n_itr
+
+
 
 
 class waveorder_microscopy_simulator:
@@ -59,10 +81,7 @@ class waveorder_microscopy_simulator:
         
         self.use_gpu = use_gpu
         self.gpu_id = gpu_id
-        
-        if self.use_gpu:
-            globals()['cp'] = __import__("cupy")
-            cp.cuda.Device(self.gpu_id).use()
+        self.backend = array_backend(self.use_gpu, self.gpu_id)
             
         
         # Basic parameter 
@@ -308,11 +327,13 @@ class waveorder_microscopy_simulator:
         Hz_step = Pupil_prop * np.exp(1j*2*np.pi*self.psz* oblique_factor_prop)
         I_meas = np.zeros((self.N_pattern, self.N, self.M, self.N_defocus))
         
-        if self.use_gpu:
-            Hz_step = cp.array(Hz_step)
-            Hz_defocus = cp.array(Hz_defocus)
-            t_obj = cp.array(t_obj)
-            Pupil_obj = cp.array(self.Pupil_obj)
+        xp = self.backend.xp
+        fft_xp = self.backend.fft
+        
+        Hz_step = self.backend.asarray(Hz_step)
+        Hz_defocus = self.backend.asarray(Hz_defocus)
+        t_obj = self.backend.asarray(t_obj)
+        Pupil_obj = self.backend.asarray(self.Pupil_obj)
 
 
         
@@ -329,68 +350,45 @@ class waveorder_microscopy_simulator:
                 
             N_pt_source = len(idx_y)
             
-            if self.use_gpu:
-                I_temp = cp.zeros((self.N, self.M, self.N_defocus))
-                
-                for j in range(N_pt_source):
-
-
-                    plane_wave = cp.array(Source_current[idx_y[j], idx_x[j]]*np.exp(1j*2*np.pi*(self.fyy[idx_y[j], idx_x[j]] * self.yy +\
-                                                                    self.fxx[idx_y[j], idx_x[j]] * self.xx)))
-
-                    for m in range(self.N_defocus):
-
-                        if m == 0:
-                            f_field = plane_wave.copy()
-
-                        g_field = f_field * t_obj[:,:,m]
-
-                        if m == self.N_defocus-1:
-
-                            f_field_stack_f = cp.fft.fft2(g_field[:,:,cp.newaxis],axes=(0,1))*Hz_defocus
-                            I_temp += cp.abs(cp.fft.ifft2(f_field_stack_f * Pupil_obj[:,:,cp.newaxis], axes=(0,1)))**2
-
-                        else:
-                            f_field = cp.fft.ifft2(cp.fft.fft2(g_field)*Hz_step)
-                    
-
-                    if np.mod(j+1, 100) == 0 or j+1 == N_pt_source:
-                        print('Number of point sources considered (%d / %d) in pattern (%d / %d), elapsed time: %.2f'\
-                              %(j+1, N_pt_source, i+1, self.N_pattern, time.time()-t0))
-                I_meas[i] = cp.asnumpy(I_temp.copy())
-                
-            else:
-                
+            I_temp = xp.zeros((self.N, self.M, self.N_defocus))
             
-                for j in range(N_pt_source):
+            for j in range(N_pt_source):
 
 
-                    plane_wave = Source_current[idx_y[j], idx_x[j]]*np.exp(1j*2*np.pi*(self.fyy[idx_y[j], idx_x[j]] * self.yy +\
-                                                                    self.fxx[idx_y[j], idx_x[j]] * self.xx))
+                plane_wave = self.backend.asarray(Source_current[idx_y[j], idx_x[j]]*np.exp(1j*2*np.pi*(self.fyy[idx_y[j], idx_x[j]] * self.yy +\
+                                                                self.fxx[idx_y[j], idx_x[j]] * self.xx)))
 
-                    for m in range(self.N_defocus):
+                for m in range(self.N_defocus):
 
-                        if m == 0:
-                            f_field = plane_wave
+                    if m == 0:
+                        f_field = plane_wave
 
-                        g_field = f_field * t_obj[:,:,m]
+                    g_field = f_field * t_obj[:,:,m]
 
-                        if m == self.N_defocus-1:
+                    if m == self.N_defocus-1:
 
-                            f_field_stack_f = fft2(g_field[:,:,np.newaxis],axes=(0,1))*Hz_defocus
-                            I_meas[i] += np.abs(ifft2(f_field_stack_f * self.Pupil_obj[:,:,np.newaxis], axes=(0,1)))**2
+                        f_field_stack_f = fft_xp.fft2(g_field[:,:,np.newaxis],axes=(0,1))*Hz_defocus
+                        I_temp += xp.abs(fft_xp.ifft2(f_field_stack_f * Pupil_obj[:,:,np.newaxis], axes=(0,1)))**2
 
-                        else:
-                            f_field = ifft2(fft2(g_field)*Hz_step)
+                    else:
+                        f_field = fft_xp.ifft2(fft_xp.fft2(g_field)*Hz_step)
+                
 
-                    if np.mod(j+1, 100) == 0 or j+1 == N_pt_source:
-                        print('Number of point sources considered (%d / %d) in pattern (%d / %d), elapsed time: %.2f'\
-                              %(j+1, N_pt_source, i+1, self.N_pattern, time.time()-t0))
+                if np.mod(j+1, 100) == 0 or j+1 == N_pt_source:
+                    print('Number of point sources considered (%d / %d) in pattern (%d / %d), elapsed time: %.2f'\
+                          %(j+1, N_pt_source, i+1, self.N_pattern, time.time()-t0))
+            
+            I_meas[i] = self.backend.asnumpy(I_temp)
             
         return np.squeeze(I_meas)
     
     
-    def simulate_3D_scalar_measurements_SEAGLE(self, RI_map, itr_max = 100, tolerance=1e-4, verbose=False):
+    def simulate_3D_scalar_measurements_SEAGLE(self, RI_map, itr_max = 100, tolerance=1e-4, verbose=False, state=None):
+        
+        # state: dict carrying the converged fields of each (pattern, point source) from one time point to the next (warm start),
+        #        pass the same (initially empty) dict for every time point of a time series, None to start from the Born approximation
+        #        memory: one complex128 field of size (N, M, N_defocus) per point source (nonzero pixel of Source) of every pattern,
+        #        i.e. 16*N*M*N_defocus bytes times the total number of point sources, replaced (not accumulated) at every time point
         
         G_real = -gen_Greens_function_real((2*self.N,2*self.M,2*self.N_defocus), self.ps, self.psz, self.lambda_illu)
         G_real_f = fftn(ifftshift(G_real))*(self.ps**2)*(self.psz)
@@ -406,19 +404,17 @@ class waveorder_microscopy_simulator:
         
         I_meas = np.zeros((self.N_pattern, self.N, self.M, self.N_defocus))
         
-        if self.use_gpu:
-            Hz_defocus = cp.array(Hz_defocus)
-            f_scat = cp.array(f_scat)
-            Pupil_obj = cp.array(self.Pupil_obj)
-            G_real_f = cp.array(G_real_f)
-            
-            pad_convolve_G = lambda x, y, z: cp.fft.ifftn(cp.fft.fftn(cp.pad(x,((self.N//2,self.N//2),(self.M//2,self.M//2),(self.N_defocus//2,self.N_defocus//2)), \
-                                                                             mode='constant', constant_values=y))*z\
-                                                         )[self.N//2:-self.N//2,self.M//2:-self.M//2,self.N_defocus//2:-self.N_defocus//2]
-            
-        else:
-            pad_convolve_G = lambda x, y, z: ifftn(fftn(np.pad(x,((self.N//2,),(self.M//2,),(self.N_defocus//2,)), mode='constant', \
-                                                               constant_values=y))*z)[self.N//2:-self.N//2,self.M//2:-self.M//2,self.N_defocus//2:-self.N_defocus//2]
+        xp = self.backend.xp
+        fft_xp = self.backend.fft
+        
+        Hz_defocus = self.backend.asarray(Hz_defocus)
+        f_scat = self.backend.asarray(f_scat)
+        Pupil_obj = self.backend.asarray(self.Pupil_obj)
+        G_real_f = self.backend.asarray(G_real_f)
+        
+        pad_convolve_G = lambda x, y, z: fft_xp.ifftn(fft_xp.fftn(xp.pad(x,((self.N//2,self.N//2),(self.M//2,self.M//2),(self.N_defocus//2,self.N_defocus//2)), \
+                                                                         mode='constant', constant_values=y))*z\
+                                                     )[self.N//2:-self.N//2,self.M//2:-self.M//2,self.N_defocus//2:-self.N_defocus//2]
 
         t0 = time.time()
         for i in range(self.N_pattern):
@@ -433,119 +429,79 @@ class waveorder_microscopy_simulator:
 
             N_pt_source = len(idx_y)
 
-            if self.use_gpu:
-                I_temp = cp.zeros((self.N, self.M, self.N_defocus))
-                
-                for j in range(N_pt_source):
-                    plane_wave = cp.array(Source_current[idx_y[j], idx_x[j]]*np.exp(1j*2*np.pi*(self.fyy[idx_y[j], idx_x[j]] * self.yy +\
-                                                                                       self.fxx[idx_y[j], idx_x[j]] * self.xx))[:,:,np.newaxis]\
-                                                            *np.exp(1j*2*np.pi*oblique_factor_prop[idx_y[j], idx_x[j]]*self.z_defocus[np.newaxis,np.newaxis,:]))
-                    u = plane_wave + pad_convolve_G(plane_wave*f_scat, cp.asnumpy(cp.abs(cp.mean(plane_wave*f_scat))), G_real_f)
-                    err = np.zeros((itr_max+1,))
+            I_temp = xp.zeros((self.N, self.M, self.N_defocus))
+            
+            for j in range(N_pt_source):
+                plane_wave = self.backend.asarray(Source_current[idx_y[j], idx_x[j]]*np.exp(1j*2*np.pi*(self.fyy[idx_y[j], idx_x[j]] * self.yy +\
+                                                                                   self.fxx[idx_y[j], idx_x[j]] * self.xx))[:,:,np.newaxis]\
+                                                        *np.exp(1j*2*np.pi*oblique_factor_prop[idx_y[j], idx_x[j]]*self.z_defocus[np.newaxis,np.newaxis,:]))
+                u, err_ref = _SEAGLE_load_state(state, (i, j), plane_wave.shape)
+                if u is None:
+                    u = plane_wave + pad_convolve_G(plane_wave*f_scat, float(xp.abs(xp.mean(plane_wave*f_scat))), G_real_f)
+                else:
+                    u = xp.array(u)
+                err = np.zeros((itr_max+1,))
 
-                    tic_time = time.time()
+                tic_time = time.time()
 
-                    for m in range(itr_max):
-                        u_in_est = u - pad_convolve_G(u*f_scat, cp.asnumpy(cp.abs(cp.mean(u*f_scat))), G_real_f)
-                        diff_u = u_in_est - plane_wave
-                        err[m+1] = cp.asnumpy(cp.sum(cp.abs(diff_u)**2))
+                for m in range(itr_max):
+                    u_in_est = u - pad_convolve_G(u*f_scat, float(xp.abs(xp.mean(u*f_scat))), G_real_f)
+                    diff_u = u_in_est - plane_wave
+                    err[m+1] = float(xp.sum(xp.abs(diff_u)**2))
+                    if err_ref is None:
+                        err_ref = err[1]
 
-                        if err[m+1]/err[1] < tolerance:
-                            break
+                    if err[m+1]/err_ref < tolerance:
+                        break
 
 
-                        grad_u = diff_u - pad_convolve_G(diff_u, cp.asnumpy(cp.abs(cp.mean(diff_u))), G_real_f.conj())*f_scat.conj()
+                    grad_u = diff_u - pad_convolve_G(diff_u, float(xp.abs(xp.mean(diff_u))), G_real_f.conj())*f_scat.conj()
 
-                        A_grad_u = grad_u - pad_convolve_G(grad_u*f_scat, cp.asnumpy(cp.abs(cp.mean(grad_u*f_scat))), G_real_f)
-                        step_size = cp.sum(cp.abs(grad_u)**2)/cp.sum(cp.abs(A_grad_u)**2)
+                    A_grad_u = grad_u - pad_convolve_G(grad_u*f_scat, float(xp.abs(xp.mean(grad_u*f_scat))), G_real_f)
+                    step_size = xp.sum(xp.abs(grad_u)**2)/xp.sum(xp.abs(A_grad_u)**2)
 
-                        temp = u - step_size*grad_u
+                    temp = u - step_size*grad_u
 
-                        if m == 0:        
+                    if m == 0:        
+                        t = 1
+                        u = temp.copy()
+                        tempp = temp.copy()
+                    else:
+                        if err[m]<err[m+1]:
                             t = 1
                             u = temp.copy()
                             tempp = temp.copy()
                         else:
-                            if err[m]<err[m+1]:
-                                t = 1
-                                u = temp.copy()
-                                tempp = temp.copy()
-                            else:
-                                tp = t
-                                t = (1 + (1 + 4 * tp**2)**(1/2))/2
-
-                                u = temp + (tp - 1) * (temp - tempp) / t
-                                tempp = temp.copy()
-                        if verbose:
-                            print('|  %d  |  %.2e  |   %.2f   |'%(m+1,err[m+1],time.time()-tic_time))
-
-
-
-
-                    I_temp += cp.abs(cp.fft.ifft2(cp.fft.fft2(u[:,:,-1])[:,:,cp.newaxis] * Pupil_obj[:,:,cp.newaxis]*Hz_defocus, axes=(0,1)))**2
-                    if np.mod(j+1, 1) == 0 or j+1 == N_pt_source:
-                        print('Number of point sources considered (%d / %d) in pattern (%d / %d), elapsed time: %.2f'\
-                              %(j+1, N_pt_source, i+1, self.N_pattern, time.time()-t0))
-                I_meas[i] = cp.asnumpy(I_temp.copy())
-                
-            else:
-
-                for j in range(N_pt_source):
-                    plane_wave = Source_current[idx_y[j], idx_x[j]]*np.exp(1j*2*np.pi*(self.fyy[idx_y[j], idx_x[j]] * self.yy +\
-                                                                                       self.fxx[idx_y[j], idx_x[j]] * self.xx))[:,:,np.newaxis]\
-                                                            *np.exp(1j*2*np.pi*oblique_factor_prop[idx_y[j], idx_x[j]]*self.z_defocus[np.newaxis,np.newaxis,:])
-                    u = plane_wave + pad_convolve_G(plane_wave*f_scat, np.abs(np.mean(plane_wave*f_scat)), G_real_f)
-                    err = np.zeros((itr_max+1,))
-
-                    tic_time = time.time()
-
-                    for m in range(itr_max):
-                        u_in_est = u - pad_convolve_G(u*f_scat, np.abs(np.mean(u*f_scat)), G_real_f)
-                        diff_u = u_in_est - plane_wave
-                        err[m+1] = np.sum(np.abs(diff_u)**2)
-
-                        if err[m+1]/err[1] < tolerance:
-                            break
-
-
-                        grad_u = diff_u - pad_convolve_G(diff_u, np.abs(np.mean(diff_u)), G_real_f.conj())*f_scat.conj()
-
-                        A_grad_u = grad_u - pad_convolve_G(grad_u*f_scat, np.abs(np.mean(grad_u*f_scat)), G_real_f)
-                        step_size = np.sum(np.abs(grad_u)**2)/np.sum(np.abs(A_grad_u)**2)
-
-                        temp = u - step_size*grad_u
+                            tp = t
+                            t = (1 + (1 + 4 * tp**2)**(1/2))/2
 
-                        if m == 0:        
-                            t = 1
-                            u = temp.copy()
+                            u = temp + (tp - 1) * (temp - tempp) / t
                             tempp = temp.copy()
-                        else:
-                            if err[m]<err[m+1]:
-                                t = 1
-                                u = temp.copy()
-                                tempp = temp.copy()
-                            else:
-                                tp = t
-                                t = (1 + (1 + 4 * tp**2)**(1/2))/2
+                    if verbose:
+                        print('|  %d  |  %.2e  |   %.2f   |'%(m+1,err[m+1],time.time()-tic_time))
 
-                                u = temp + (tp - 1) * (temp - tempp) / t
-                                tempp = temp.copy()
-                        if verbose:
-                            print('|  %d  |  %.2e  |   %.2f   |'%(m+1,err[m+1],time.time()-tic_time))
 
 
 
+                _SEAGLE_save_state(state, (i, j), self.backend.asnumpy(u), err_ref, m+1)
 
-                    I_meas[i] += np.abs(ifft2(fft2(u[:,:,-1])[:,:,np.newaxis] * self.Pupil_obj[:,:,np.newaxis]*Hz_defocus, axes=(0,1)))**2
-                    if np.mod(j+1, 1) == 0 or j+1 == N_pt_source:
-                        print('Number of point sources considered (%d / %d) in pattern (%d / %d), elapsed time: %.2f'\
-                              %(j+1, N_pt_source, i+1, self.N_pattern, time.time()-t0))
+                I_temp += xp.abs(fft_xp.ifft2(fft_xp.fft2(u[:,:,-1])[:,:,np.newaxis] * Pupil_obj[:,:,np.newaxis]*Hz_defocus, axes=(0,1)))**2
+                if np.mod(j+1, 1) == 0 or j+1 == N_pt_source:
+                    print('Number of point sources considered (%d / %d) in pattern (%d / %d), elapsed time: %.2f'\
+                          %(j+1, N_pt_source, i+1, self.N_pattern, time.time()-t0))
+            
+            I_meas[i] = self.backend.asnumpy(I_temp)
                     
         return np.squeeze(I_meas)
         
         
         
-    def simulate_3D_vectorial_measurements_SEAGLE(self, epsilon_tensor, itr_max = 100, tolerance=1e-4, verbose=False):
+    def simulate_3D_vectorial_measurements_SEAGLE(self, epsilon_tensor, itr_max = 100, tolerance=1e-4, verbose=False, state=None):
+        
+        # state: dict carrying the converged fields of each (pattern, point source) from one time point to the next (warm start),
+        #        pass the same (initially empty) dict for every time point of a time series, None to start from the Born approximation
+        #        memory: one complex128 field of size (3, N, M, N_defocus) per point source (nonzero pixel of Source) of every pattern,
+        #        i.e. 48*N*M*N_defocus bytes times the total number of point sources, replaced (not accumulated) at every time point
         
         G_real = gen_Greens_function_real((2*self.N,2*self.M,2*self.N_defocus), self.ps, self.psz, self.lambda_illu)
         G_tensor = gen_dyadic_Greens_tensor(G_real, self.ps, self.psz, self.lambda_illu, space='Fourier')
@@ -569,11 +525,13 @@ class waveorder_microscopy_simulator:
         Hz_defocus = Pupil_prop[:,:,np.newaxis] * np.exp(1j*2*np.pi*z_defocus_m[np.newaxis,np.newaxis,:]*oblique_factor_prop[:,:,np.newaxis])
         
         
-        if self.use_gpu:
-            Hz_defocus = cp.array(Hz_defocus)
-            f_scat_tensor = cp.array(f_scat_tensor)
-            Pupil_obj = cp.array(self.Pupil_obj)
-            G_tensor = cp.array(G_tensor)
+        xp = self.backend.xp
+        fft_xp = self.backend.fft
+        
+        Hz_defocus = self.backend.asarray(Hz_defocus)
+        f_scat_tensor = self.backend.asarray(f_scat_tensor)
+        Pupil_obj = self.backend.asarray(self.Pupil_obj)
+        G_tensor = self.backend.asarray(G_tensor)
             
         Stokes_SEAGLE = np.zeros((4, self.N_pattern, self.N, self.M, self.N_defocus))
         I_meas_SEAGLE = np.zeros((self.N_channel, self.N_pattern, self.N, self.M, self.N_defocus))
@@ -631,14 +589,13 @@ class waveorder_microscopy_simulator:
                                                              self.fxx[idx_y[j], idx_x[j]] * xx))[:,:,np.newaxis]\
                                          *np.exp(1j*2*np.pi*oblique_factor_prop[idx_y[j], idx_x[j]]*self.z_defocus[np.newaxis,np.newaxis,:])
 
-                if self.use_gpu:
-#                     E_tot = cp.array(E_in.copy())
-                    E_in = cp.array(E_in.copy())
+                E_tot, err_ref = _SEAGLE_load_state(state, (i, j), E_in.shape)
+
+                E_in = self.backend.asarray(E_in)
+                if E_tot is None:
                     E_tot = 2*E_in-SEAGLE_vec_forward(E_in, f_scat_tensor, G_tensor, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
-                    
                 else:
-#                     E_tot = E_in.copy()
-                    E_tot = 2*E_in-SEAGLE_vec_forward(E_in, f_scat_tensor, G_tensor, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
+                    E_tot = xp.array(E_tot)
 
                 err = np.zeros((itr_max+1,))
 
@@ -648,21 +605,17 @@ class waveorder_microscopy_simulator:
 
                     E_in_est = SEAGLE_vec_forward(E_tot, f_scat_tensor, G_tensor, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
                     E_diff = E_in_est - E_in
-                    if self.use_gpu:
-                        err[m+1] = cp.asnumpy(cp.sum(cp.abs(E_diff)**2))
-                    else:
-                        err[m+1] = np.sum(np.abs(E_diff)**2)
+                    err[m+1] = float(xp.sum(xp.abs(E_diff)**2))
+                    if err_ref is None:
+                        err_ref = err[1]
 
-                    if err[m+1]/err[1] < tolerance:
+                    if err[m+1]/err_ref < tolerance:
                         break
                     grad_E = SEAGLE_vec_backward(E_diff, f_scat_tensor, G_tensor, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
 
                     A_grad_E = SEAGLE_vec_forward(grad_E, f_scat_tensor, G_tensor, use_gpu=self.use_gpu, gpu_id=self.gpu_id)
                     
-                    if self.use_gpu:
-                        step_size = cp.sum(cp.abs(grad_E)**2)/cp.sum(cp.abs(A_grad_E)**2)
-                    else:
-                        step_size = np.sum(np.abs(grad_E)**2)/np.sum(np.abs(A_grad_E)**2)
+                    step_size = xp.sum(xp.abs(grad_E)**2)/xp.sum(xp.abs(A_grad_E)**2)
                     
                     temp = E_tot - step_size*grad_E
 
@@ -685,20 +638,13 @@ class waveorder_microscopy_simulator:
                         print('|  %d  |  %.2e  |   %.2f   |'%(m+1,err[m+1],time.time()-tic_time))
 
 
-                if self.use_gpu:
-                    
-                    E_field_out = cp.fft.ifft2(cp.fft.fft2(E_tot[:2,:,:,-1],axes=(1,2))[:,:,:,cp.newaxis] * \
-                                               (Pupil_obj[:,:,cp.newaxis]*Hz_defocus)[cp.newaxis,:,:,:], axes=(1,2))
-                    Stokes_SEAGLE[:,i,:,:,:] += cp.asnumpy(Jones_to_Stokes(E_field_out, use_gpu=self.use_gpu, gpu_id=self.gpu_id))
-                    for n in range(self.N_channel):
-                        I_meas_SEAGLE[n,i,:,:,:] += cp.asnumpy(cp.abs(analyzer_output(E_field_out, self.analyzer_para[n,0], self.analyzer_para[n,1]))**2)
-                    
-                else:
-                
-                    E_field_out = ifft2(fft2(E_tot[:2,:,:,-1],axes=(1,2))[:,:,:,np.newaxis] * (self.Pupil_obj[:,:,np.newaxis]*Hz_defocus)[np.newaxis,:,:,:], axes=(1,2))
-                    Stokes_SEAGLE[:,i,:,:,:] += Jones_to_Stokes(E_field_out)
-                    for n in range(self.N_channel):
-                        I_meas_SEAGLE[n,i,:,:,:] += np.abs(analyzer_output(E_field_out, self.analyzer_para[n,0], self.analyzer_para[n,1]))**2
+                _SEAGLE_save_state(state, (i, j), self.backend.asnumpy(E_tot), err_ref, m+1)
+
+                E_field_out = fft_xp.ifft2(fft_xp.fft2(E_tot[:2,:,:,-1],axes=(1,2))[:,:,:,np.newaxis] * \
+                                           (Pupil_obj[:,:,np.newaxis]*Hz_defocus)[np.newaxis,:,:,:], axes=(1,2))
+                Stokes_SEAGLE[:,i,:,:,:] += self.backend.asnumpy(Jones_to_Stokes(E_field_out, use_gpu=self.use_gpu, gpu_id=self.gpu_id))
+                for n in range(self.N_channel):
+                    I_meas_SEAGLE[n,i,:,:,:] += self.backend.asnumpy(xp.abs(analyzer_output(E_field_out, self.analyzer_para[n,0], self.analyzer_para[n,1]))**2)
 
                 if np.mod(j+1, 1) == 0 or j+1 == N_pt_source:
                     print('Number of point sources considered (%d / %d) in pattern (%d / %d), elapsed time: %.2f'\